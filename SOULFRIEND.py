@@ -46,6 +46,27 @@ except ImportError as e:
     RESEARCH_SYSTEM_AVAILABLE = False
     print("🔬 Research system: DISABLED (graceful fallback)")
 
+# ⏱️ LATENCY INSTRUMENTATION - per page section p50/p95/p99
+from contextlib import nullcontext
+try:
+    from performance.instrumentation import latency_span, timed, get_latency_recorder
+    from storage.sqlite_store import get_store
+    get_latency_recorder().start_exporter(get_store("performance"))
+    LATENCY_INSTRUMENTATION_AVAILABLE = True
+except ImportError:
+    def latency_span(label): return nullcontext()
+    def timed(label=None): return lambda func: func
+    LATENCY_INSTRUMENTATION_AVAILABLE = False
+
+create_consent_agreement_form = timed("page.consent")(create_consent_agreement_form)
+score_dass21_enhanced = timed("page.scoring")(score_dass21_enhanced)
+score_phq9_enhanced = timed("page.scoring")(score_phq9_enhanced)
+score_gad7_enhanced = timed("page.scoring")(score_gad7_enhanced)
+score_epds_enhanced = timed("page.scoring")(score_epds_enhanced)
+score_pss10_enhanced = timed("page.scoring")(score_pss10_enhanced)
+display_enhanced_charts = timed("page.charts")(display_enhanced_charts)
+create_download_button = timed("page.pdf")(create_download_button)
+
 # Setup enhanced logging first
 logging.basicConfig(
     level=logging.INFO,
@@ -85,6 +106,15 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# 🔥 SAMPLING PROFILER - opt-in stack samples of whole reruns (see admin System Monitor)
+try:
+    from performance.sampling_profiler import PROFILE_SESSION_KEY, get_sampling_profiler
+    rerun_profile = get_sampling_profiler().start(
+        "page.rerun", force=st.session_state.get(PROFILE_SESSION_KEY, False)
+    )
+except ImportError:
+    rerun_profile = None
+
 # 🔬 RESEARCH CONSENT SECTION (Optional & Non-blocking)
 if RESEARCH_SYSTEM_AVAILABLE:
     try:
@@ -423,7 +453,7 @@ else:
         current_questionnaire = st.session_state.get("questionnaire_type", "DASS-21")
         form_name = f"{current_questionnaire.lower().replace('-', '_')}_enhanced_form"
         
-        with st.form(form_name):
+        with st.form(form_name), latency_span("page.questionnaire_render"):
             for i, item in enumerate(cfg["items"], 1):
                 # Enhanced question card with context
                 st.markdown(f"""
@@ -594,7 +624,8 @@ else:
                                 
                                 safe_track_questionnaire_completion(
                                     current_questionnaire, 
-                                    total_score
+                                    total_score,
+                                    subscales=getattr(enhanced_result, 'subscales', None)
                                 )
                                 logger.info(f"🔬 Tracked questionnaire completion: {current_questionnaire}")
                             except Exception as e:
@@ -1291,3 +1322,7 @@ st.markdown("""
     💚 <strong>SOULFRIEND V2.0</strong> | Liên hệ: 0938.02.1111 - kendo2605@gmail.com
 </div>
 """, unsafe_allow_html=True)
+
+# Reruns cut short by st.stop()/st.rerun() are closed by the profiler itself
+if rerun_profile is not None:
+    rerun_profile.stop()
@@ -25,6 +25,13 @@ except ImportError:
     ML_AVAILABLE = False
     print("⚠️ ML libraries not available. Install: pip install scikit-learn")
 
+# Optional embedded SQL engine (RESEARCH_ANALYTICS_ENGINE=duckdb)
+try:
+    from research_system.sql_engine import ResearchSQLEngine, engine_requested
+except ImportError:
+    ResearchSQLEngine = None
+    engine_requested = lambda: False
+
 class MentalHealthMLInsights:
     """
     Machine Learning insights engine cho mental health data
@@ -39,6 +46,8 @@ class MentalHealthMLInsights:
         self.models = {}
         self.scalers = {}
         
+        self.sql_engine = ResearchSQLEngine(research_data_path, sqlite_path=self.db_path) if engine_requested() else None
+        
     def _setup_logger(self) -> logging.Logger:
         """Setup logging for ML operations"""
         logger = logging.getLogger("MLInsights")
@@ -61,17 +70,23 @@ class MentalHealthMLInsights:
                 self.logger.warning(f"Database not found: {self.db_path}")
                 return pd.DataFrame()
                 
-            conn = sqlite3.connect(self.db_path)
-            
-            # Load assessment results
-            query = """
-            SELECT * FROM assessment_results 
-            WHERE created_at >= datetime('now', '-30 days')
-            ORDER BY created_at DESC
-            """
-            
-            df = pd.read_sql_query(query, conn)
-            conn.close()
+            if self.sql_engine is not None:
+                # Window predicate is pushed into the SQLite scan
+                cutoff = (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+                df = self.sql_engine.query_sqlite('assessment_results', where='created_at >= ?', params=[cutoff])
+                df = df.sort_values('created_at', ascending=False, ignore_index=True) if not df.empty else df
+            else:
+                conn = sqlite3.connect(self.db_path)
+                
+                # Load assessment results
+                query = """
+                SELECT * FROM assessment_results 
+                WHERE created_at >= datetime('now', '-30 days')
+                ORDER BY created_at DESC
+                """
+                
+                df = pd.read_sql_query(query, conn)
+                conn.close()
             
             if df.empty:
                 self.logger.info("No recent assessment data found")
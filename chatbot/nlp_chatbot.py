@@ -3,7 +3,6 @@ SOULFRIEND V2.0 - Advanced NLP Chatbot
 Chatbot hỗ trợ tâm lý với xử lý ngôn ngữ tự nhiên tiên tiến
 """
 import json
-import sqlite3
 import re
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Any, Tuple
@@ -18,6 +17,8 @@ from underthesea import word_tokenize, pos_tag, ner, sentiment
 from langdetect import detect
 from sentence_transformers import SentenceTransformer
 
+from storage.sqlite_store import get_store
+
 # Download required NLTK data
 try:
     nltk.download('punkt', quiet=True)
@@ -56,7 +57,8 @@ class MentalHealthNLPChatbot:
     """Chatbot hỗ trợ tâm lý với NLP tiên tiến"""
     
     def __init__(self):
-        self.db_path = "/workspaces/Mentalhealth/mental-health-support-app/mental-health-support-app/data/chatbot.db"
+        self.storage = get_store("chatbot")
+        self.db_path = self.storage.db_path
         self.init_database()
         
         # Load NLP models
@@ -121,7 +123,11 @@ class MentalHealthNLPChatbot:
     
     def init_database(self):
         """Khởi tạo cơ sở dữ liệu chatbot"""
-        conn = sqlite3.connect(self.db_path)
+        self.storage.migrate([self._create_schema_v1])
+        logger.info("✅ Chatbot database initialized")
+    
+    def _create_schema_v1(self, conn):
+        """Schema version 1"""
         cursor = conn.cursor()
         
         # Bảng cuộc trò chuyện
@@ -183,10 +189,6 @@ class MentalHealthNLPChatbot:
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        
-        conn.commit()
-        conn.close()
-        logger.info("✅ Chatbot database initialized")
     
     def init_nlp_models(self):
         """Khởi tạo các mô hình NLP"""
@@ -379,7 +381,7 @@ Hãy đến bệnh viện gần nhất hoặc gọi cho người thân tin cậy
                           bot_response: str, intent: str, sentiment: str,
                           confidence: float, risk_level: str) -> int:
         """Lưu cuộc trò chuyện"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -400,7 +402,7 @@ Hãy đến bệnh viện gần nhất hoặc gọi cho người thân tin cậy
     
     def create_crisis_alert(self, user_id: str, session_id: str, message: str, risk_level: str):
         """Tạo cảnh báo khẩn cấp"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -419,7 +421,7 @@ Hãy đến bệnh viện gần nhất hoặc gọi cho người thân tin cậy
     
     def update_session(self, session_id: str, risk_level: str):
         """Cập nhật phiên chat"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         # Check if session exists
@@ -446,7 +448,7 @@ Hãy đến bệnh viện gần nhất hoặc gọi cho người thân tin cậy
     
     def get_conversation_history(self, session_id: str, limit: int = 10) -> List[Dict[str, Any]]:
         """Lấy lịch sử cuộc trò chuyện"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -475,7 +477,7 @@ Hãy đến bệnh viện gần nhất hoặc gọi cho người thân tin cậy
     
     def get_user_statistics(self, user_id: str) -> Dict[str, Any]:
         """Thống kê người dùng"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         # Total conversations
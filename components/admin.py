@@ -13,6 +13,18 @@ from typing import Dict, List, Any
 import plotly.express as px
 import plotly.graph_objects as go
 
+try:
+    from performance.tiered_cache import get_tiered_cache
+    TIERED_CACHE_AVAILABLE = True
+except ImportError:
+    TIERED_CACHE_AVAILABLE = False
+
+try:
+    from storage.sqlite_store import get_query_profiler, profiling_enabled
+    QUERY_PROFILER_AVAILABLE = True
+except ImportError:
+    QUERY_PROFILER_AVAILABLE = False
+
 # Admin credentials (in production, use proper auth system)
 ADMIN_USERS = {
     "admin": "240be518fabd2724ddb6f04eeb1da5967448d7e831c08c8fa822809f74c720a9",  # admin123
@@ -98,6 +110,11 @@ def save_questionnaire_config(questionnaire_type: str, config: Dict):
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(config, f, ensure_ascii=False, indent=2)
         
+        if TIERED_CACHE_AVAILABLE:
+            # Every worker reloads the edited questionnaire
+            from components.questionnaires import QUESTIONNAIRE_CONFIG_NAMESPACE
+            get_tiered_cache().invalidate(QUESTIONNAIRE_CONFIG_NAMESPACE, file_mapping[questionnaire_type])
+        
         return True
     except Exception as e:
         st.error(f"Lỗi lưu cấu hình: {str(e)}")
@@ -396,6 +413,44 @@ def system_settings():
         if st.button("🧹 Dọn dẹp dữ liệu"):
             st.info("Dọn dẹp dữ liệu cũ và log files")
 
+def slow_query_report():
+    """Top-N statements recorded by the SQLite query profiler"""
+    st.markdown("### 🐢 Truy vấn chậm")
+    
+    if not QUERY_PROFILER_AVAILABLE:
+        st.warning("Không tải được bộ phân tích truy vấn")
+        return
+    if not profiling_enabled():
+        st.info("Bật SOULFRIEND_SQL_PROFILE=1 (và SOULFRIEND_SLOW_QUERY_MS) để thu thập dữ liệu truy vấn")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        days = st.number_input("Số ngày:", min_value=1, max_value=90, value=7)
+    with col2:
+        limit = st.slider("Top N:", 5, 50, 10)
+    with col3:
+        order_labels = {"Tổng thời gian": "total_ms", "Lần chậm nhất": "max_ms", "Số lần chậm": "slow_calls"}
+        order = st.selectbox("Sắp xếp theo:", list(order_labels))
+    
+    profiler = get_query_profiler()
+    profiler.flush()
+    queries = profiler.top_queries(limit=limit, days=days, by=order_labels[order])
+    if not queries:
+        st.info("Chưa có dữ liệu truy vấn")
+        return
+    
+    queries_df = pd.DataFrame(queries)
+    st.dataframe(
+        queries_df[["store", "statement", "calls", "total_ms", "avg_ms", "max_ms", "slow_calls", "rows_affected"]].round(2),
+        use_container_width=True
+    )
+    
+    # Query plans of slow statements: full scans here are index candidates
+    for query in queries:
+        if query["query_plan"]:
+            with st.expander(f"📋 {query['store']}: {query['statement'][:90]}"):
+                st.code(query["query_plan"], language="text")
+
 def admin_panel():
     """Main admin panel interface"""
     if not verify_admin_login():
@@ -430,7 +485,7 @@ def admin_panel():
     # Admin navigation
     admin_tab = st.sidebar.selectbox(
         "📋 Chọn chức năng:",
-        ["📊 Thống kê", "📝 Quản lý thang đo", "👥 Người dùng", "⚙️ Cài đặt"]
+        ["📊 Thống kê", "📝 Quản lý thang đo", "👥 Người dùng", "🐢 Truy vấn chậm", "⚙️ Cài đặt"]
     )
     
     # Display selected admin function
@@ -440,6 +495,8 @@ def admin_panel():
         questionnaire_manager()
     elif admin_tab == "👥 Người dùng":
         user_management()
+    elif admin_tab == "🐢 Truy vấn chậm":
+        slow_query_report()
     elif admin_tab == "⚙️ Cài đặt":
         system_settings()
 
@@ -18,6 +18,15 @@ import plotly.graph_objects as go
 from typing import Dict, List, Tuple, Any
 import json
 
+try:
+    from performance.tiered_cache import get_tiered_cache
+    TIERED_CACHE_AVAILABLE = True
+except ImportError:
+    TIERED_CACHE_AVAILABLE = False
+
+# Cache namespace for loaded model artifacts; retraining invalidates it
+MODEL_ARTIFACTS_NAMESPACE = "model_artifacts"
+
 class MentalHealthAI:
     """AI engine for mental health assessment and prediction"""
     
@@ -211,16 +220,27 @@ class MentalHealthAI:
             joblib.dump(self.score_predictor, f"{self.model_path}score_predictor.joblib")
             joblib.dump(self.scaler, f"{self.model_path}scaler.joblib")
             joblib.dump(self.label_encoder, f"{self.model_path}label_encoder.joblib")
+            if TIERED_CACHE_AVAILABLE:
+                get_tiered_cache().invalidate(MODEL_ARTIFACTS_NAMESPACE)
         except Exception as e:
             st.error(f"Lỗi lưu model: {str(e)}")
     
+    def _load_artifact(self, filename: str):
+        """Unpickled model file, kept in process memory until models are retrained in any worker"""
+        path = f"{self.model_path}{filename}"
+        if not TIERED_CACHE_AVAILABLE:
+            return joblib.load(path)
+        # The files are the shared copy, so only the loaded objects are cached (L1)
+        return get_tiered_cache().get_or_load(MODEL_ARTIFACTS_NAMESPACE, path, lambda: joblib.load(path),
+                                                shared=False, ttl=24 * 3600)
+    
     def load_models(self) -> bool:
         """Load trained models from disk"""
         try:
-            self.risk_classifier = joblib.load(f"{self.model_path}risk_classifier.joblib")
-            self.score_predictor = joblib.load(f"{self.model_path}score_predictor.joblib")
-            self.scaler = joblib.load(f"{self.model_path}scaler.joblib")
-            self.label_encoder = joblib.load(f"{self.model_path}label_encoder.joblib")
+            self.risk_classifier = self._load_artifact("risk_classifier.joblib")
+            self.score_predictor = self._load_artifact("score_predictor.joblib")
+            self.scaler = self._load_artifact("scaler.joblib")
+            self.label_encoder = self._load_artifact("label_encoder.joblib")
             self.models_trained = True
             return True
         except:
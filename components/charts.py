@@ -9,7 +9,22 @@ import plotly.express as px
 from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+try:
+    from research_system.norms import get_norms_store
+    NORMS_AVAILABLE = True
+except ImportError:
+    NORMS_AVAILABLE = False
+
+# Reference values from published studies, used until enough local norms exist
+REFERENCE_NORMS = {
+    'DASS-21': {'population': 18, 'ideal': 7},
+    'PHQ-9': {'population': 8, 'ideal': 2},
+    'GAD-7': {'population': 6, 'ideal': 2},
+    'EPDS': {'population': 9, 'ideal': 3},
+    'PSS-10': {'population': 16, 'ideal': 8}
+}
 
 def create_severity_gauge(score: int, max_score: int, title: str, severity_level: str) -> go.Figure:
     """Create a gauge chart showing severity level"""
@@ -237,22 +252,29 @@ def create_progress_timeline(assessment_history: List[Dict] = None) -> go.Figure
     
     return fig
 
-def create_comparison_chart(current_score: int, population_avg: float, questionnaire_type: str) -> go.Figure:
+def get_population_norm(questionnaire_type: str, score: float, subscale: str = 'total') -> Optional[Dict[str, Any]]:
+    """Mean and the user's percentile from the stored research norms, if there are enough"""
+    if not NORMS_AVAILABLE:
+        return None
+    try:
+        store = get_norms_store()
+        summary = store.summary(questionnaire_type, subscale)
+        if summary is None:
+            return None
+        return {**summary, 'percentile': store.percentile(questionnaire_type, score, subscale)}
+    except Exception:
+        return None
+
+def create_comparison_chart(current_score: int, population_avg: Optional[float], questionnaire_type: str,
+                            percentile: Optional[float] = None) -> go.Figure:
     """Create comparison with population average"""
     
     categories = ['Bạn', 'Trung bình dân số', 'Mức lý tưởng']
     
-    # Estimated population averages (these would come from research data)
-    pop_averages = {
-        'DASS-21': {'population': 18, 'ideal': 7},
-        'PHQ-9': {'population': 8, 'ideal': 2},
-        'GAD-7': {'population': 6, 'ideal': 2},
-        'EPDS': {'population': 9, 'ideal': 3},
-        'PSS-10': {'population': 16, 'ideal': 8}
-    }
-    
-    pop_data = pop_averages.get(questionnaire_type, {'population': 15, 'ideal': 5})
-    values = [current_score, pop_data['population'], pop_data['ideal']]
+    pop_data = REFERENCE_NORMS.get(questionnaire_type, {'population': 15, 'ideal': 5})
+    if population_avg is None:
+        population_avg = pop_data['population']
+    values = [current_score, population_avg, pop_data['ideal']]
     
     colors = ['#6366f1', '#94a3b8', '#10b981']
     
@@ -265,7 +287,8 @@ def create_comparison_chart(current_score: int, population_avg: float, questionn
     ))
     
     fig.update_layout(
-        title=f"📊 So sánh với dân số ({questionnaire_type})",
+        title=(f"📊 So sánh với dân số ({questionnaire_type}) - bách phân vị {percentile:.0f}"
+               if percentile is not None else f"📊 So sánh với dân số ({questionnaire_type})"),
         yaxis_title="Điểm số",
         height=350,
         margin=dict(l=50, r=50, t=60, b=40),
@@ -322,17 +345,26 @@ def display_enhanced_charts(enhanced_result, questionnaire_type: str):
     
     with tab3:
         # Comparison chart
+        total_score = enhanced_result.get("total_score", 0)
+        norm = get_population_norm(questionnaire_type, total_score)
         comparison_fig = create_comparison_chart(
-            enhanced_result.get("total_score", 0),
-            15.0,  # This would be real population data
-            questionnaire_type
+            total_score,
+            norm['mean'] if norm else None,
+            questionnaire_type,
+            percentile=norm['percentile'] if norm else None
         )
         st.plotly_chart(comparison_fig, use_container_width=True)
         
-        st.info("""
-        💡 **Lưu ý**: Số liệu so sánh dựa trên nghiên cứu quốc tế. 
-        Kết quả thấp hơn trung bình không có nghĩa là tốt hơn trong tất cả trường hợp.
-        """)
+        if norm:
+            st.info(f"""
+            💡 **Lưu ý**: Điểm của bạn cao hơn {norm['percentile']:.0f}% trong {norm['n']} kết quả đã thu thập. 
+            Kết quả thấp hơn trung bình không có nghĩa là tốt hơn trong tất cả trường hợp.
+            """)
+        else:
+            st.info("""
+            💡 **Lưu ý**: Số liệu so sánh dựa trên nghiên cứu quốc tế. 
+            Kết quả thấp hơn trung bình không có nghĩa là tốt hơn trong tất cả trường hợp.
+            """)
     
     with tab4:
         # Timeline chart
@@ -468,12 +500,14 @@ def create_charts_interface(result_data, questionnaire_type):
         'EPDS': 7.8
     }
     
-    population_avg = population_avgs.get(questionnaire_type, 10.0)
+    norm = get_population_norm(questionnaire_type, total_score)
+    population_avg = norm['mean'] if norm else population_avgs.get(questionnaire_type, 10.0)
     
     comparison_fig = create_comparison_chart(
         current_score=total_score,
         population_avg=population_avg,
-        questionnaire_type=questionnaire_type
+        questionnaire_type=questionnaire_type,
+        percentile=norm['percentile'] if norm else None
     )
     st.plotly_chart(comparison_fig, use_container_width=True)
     
@@ -497,9 +531,12 @@ def create_charts_interface(result_data, questionnaire_type):
         )
     
     with col3:
-        percentile = min(95, max(5, (total_score / max_score) * 100))
+        if norm:
+            percentile = norm['percentile']
+        else:
+            percentile = min(95, max(5, (total_score / max_score) * 100))
         st.metric(
-            label="Phần Trăm",
+            label="Bách Phân Vị" if norm else "Phần Trăm",
             value=f"{percentile:.0f}%",
             delta="Cao" if percentile > 70 else "Thấp"
         )
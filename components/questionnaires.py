@@ -1,5 +1,28 @@
+import copy
 import json, os
 
+try:
+    from performance.tiered_cache import get_tiered_cache
+    TIERED_CACHE_AVAILABLE = True
+except ImportError:
+    TIERED_CACHE_AVAILABLE = False
+
+# Cache namespace for parsed questionnaire files; admin edits invalidate it
+QUESTIONNAIRE_CONFIG_NAMESPACE = "questionnaire_config"
+
+def _read_config(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _load_config(path):
+    """Parsed questionnaire file, shared by all workers through the two-tier cache"""
+    if not TIERED_CACHE_AVAILABLE:
+        return _read_config(path)
+    config = get_tiered_cache().get_or_load(QUESTIONNAIRE_CONFIG_NAMESPACE, os.path.basename(path),
+                                            lambda: _read_config(path))
+    # Callers edit the returned config; the cached copy stays pristine
+    return copy.deepcopy(config)
+
 class QuestionnaireManager:
     """Manages all questionnaire operations"""
     
@@ -60,15 +83,13 @@ def load_questionnaire(questionnaire_type):
 
 def load_dass21_vi():
     path = os.path.join(os.path.dirname(__file__), "..", "data", "dass21_vi.json")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _load_config(path)
 
 def load_dass21_enhanced_vi():
     """Load enhanced DASS-21 questionnaire with improved Vietnamese context"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "dass21_enhanced_vi.json")
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _load_config(path)
     except FileNotFoundError:
         # Fallback to original if enhanced not found
         return load_dass21_vi()
@@ -77,8 +98,7 @@ def load_phq9_enhanced_vi():
     """Load enhanced PHQ-9 questionnaire with improved Vietnamese context"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "phq9_enhanced_vi.json")
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _load_config(path)
     except FileNotFoundError:
         # Fallback to original if enhanced not found
         return load_phq9_vi()
@@ -87,8 +107,7 @@ def load_phq9_enhanced_vi():
     """Load enhanced PHQ-9 questionnaire with improved Vietnamese context"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "phq9_enhanced_vi.json")
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _load_config(path)
     except FileNotFoundError:
         # Fallback to original if enhanced not found
         return load_phq9_vi()
@@ -96,15 +115,13 @@ def load_phq9_enhanced_vi():
 def load_phq9_vi():
     """Load original PHQ-9 questionnaire"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "phq9_vi.json")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _load_config(path)
 
 def load_gad7_enhanced_vi():
     """Load enhanced GAD-7 questionnaire with improved Vietnamese context"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "gad7_enhanced_vi.json")
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _load_config(path)
     except FileNotFoundError:
         # Fallback to original if enhanced not found
         return load_gad7_vi()
@@ -112,15 +129,13 @@ def load_gad7_enhanced_vi():
 def load_gad7_vi():
     """Load original GAD-7 questionnaire"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "gad7_config.json")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _load_config(path)
 
 def load_epds_enhanced_vi():
     """Load enhanced EPDS questionnaire with improved Vietnamese context"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "epds_enhanced_vi.json")
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _load_config(path)
     except FileNotFoundError:
         # Fallback to original if enhanced not found
         return load_epds_vi()
@@ -128,15 +143,13 @@ def load_epds_enhanced_vi():
 def load_epds_vi():
     """Load original EPDS questionnaire"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "epds_config.json")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _load_config(path)
 
 def load_pss10_enhanced_vi():
     """Load enhanced PSS-10 questionnaire with improved Vietnamese context"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "pss10_enhanced_vi.json")
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return _load_config(path)
     except FileNotFoundError:
         # Fallback to original if enhanced not found
         return load_pss10_vi()
@@ -144,5 +157,4 @@ def load_pss10_enhanced_vi():
 def load_pss10_vi():
     """Load original PSS-10 questionnaire"""
     path = os.path.join(os.path.dirname(__file__), "..", "data", "pss10_config.json")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return _load_config(path)
@@ -3,13 +3,14 @@ SOULFRIEND V2.0 - Appointment Scheduling System
 Hệ thống đặt lịch hẹn và quản lý cuộc hẹn tự động
 """
 import json
-import sqlite3
 from datetime import datetime, timedelta, time
 from typing import List, Dict, Optional, Any, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import logging
 
+from storage.sqlite_store import get_store
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -55,7 +56,8 @@ class AppointmentScheduler:
     """Hệ thống đặt lịch hẹn thông minh"""
     
     def __init__(self):
-        self.db_path = "/workspaces/Mentalhealth/mental-health-support-app/mental-health-support-app/data/appointments.db"
+        self.storage = get_store("appointments")
+        self.db_path = self.storage.db_path
         self.init_database()
         self.init_providers()
         
@@ -89,7 +91,11 @@ class AppointmentScheduler:
     
     def init_database(self):
         """Khởi tạo cơ sở dữ liệu lịch hẹn"""
-        conn = sqlite3.connect(self.db_path)
+        self.storage.migrate([self._create_schema_v1])
+        logger.info("✅ Appointment database initialized")
+    
+    def _create_schema_v1(self, conn):
+        """Schema version 1"""
         cursor = conn.cursor()
         
         # Bảng cuộc hẹn
@@ -165,10 +171,6 @@ class AppointmentScheduler:
                 secondary_reminder_hours INTEGER DEFAULT 2
             )
         ''')
-        
-        conn.commit()
-        conn.close()
-        logger.info("✅ Appointment database initialized")
     
     def init_providers(self):
         """Khởi tạo danh sách nhà cung cấp dịch vụ"""
@@ -247,7 +249,7 @@ class AppointmentScheduler:
             }
         ]
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         for provider in providers_data:
@@ -355,7 +357,7 @@ class AppointmentScheduler:
             duration = provider["consultation_duration"] if provider else 30
             
             # Create appointment
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -433,7 +435,7 @@ class AppointmentScheduler:
                 raise ValueError("New time slot is not available")
             
             # Update appointment
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
             old_date = appointment["appointment_date"]
@@ -484,7 +486,7 @@ class AppointmentScheduler:
                 raise ValueError("Appointment not found")
             
             # Update appointment status
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -524,7 +526,7 @@ class AppointmentScheduler:
     
     def get_appointment(self, appointment_id: int) -> Optional[Dict[str, Any]]:
         """Lấy thông tin cuộc hẹn"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -544,7 +546,7 @@ class AppointmentScheduler:
     
     def get_provider(self, provider_id: str) -> Optional[Dict[str, Any]]:
         """Lấy thông tin nhà cung cấp"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM providers WHERE id = ?', (provider_id,))
@@ -558,7 +560,7 @@ class AppointmentScheduler:
     
     def get_appointments_for_date(self, provider_id: str, date: datetime) -> List[Dict[str, Any]]:
         """Lấy danh sách cuộc hẹn trong ngày"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         date_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -617,7 +619,7 @@ class AppointmentScheduler:
     
     def get_upcoming_appointments(self, patient_id: str = None, provider_id: str = None) -> List[Dict[str, Any]]:
         """Lấy danh sách cuộc hẹn sắp tới"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         query = '''
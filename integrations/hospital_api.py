@@ -9,11 +9,14 @@ from typing import List, Dict, Optional, Any
 from fastapi import FastAPI, HTTPException, Depends, Header
 from pydantic import BaseModel, EmailStr
 import requests
-import sqlite3
 import hashlib
 import hmac
 import logging
 
+from storage.sqlite_store import get_store
+from performance.instrumentation import get_latency_recorder, instrument_fastapi
+from performance.sampling_profiler import profile_fastapi
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -42,9 +45,14 @@ class HospitalIntegrationAPI:
     
     def __init__(self):
         self.app = FastAPI(title="SOULFRIEND V2.0 - Hospital Integration API")
-        self.db_path = "/workspaces/Mentalhealth/mental-health-support-app/mental-health-support-app/data/integration.db"
+        self.storage = get_store("integration")
+        self.db_path = self.storage.db_path
         self.init_database()
         self.setup_routes()
+        # Opt-in stack sampling, then per-route latency histograms served at /metrics
+        profile_fastapi(self.app, prefix="hospital_api")
+        instrument_fastapi(self.app, prefix="hospital_api")
+        get_latency_recorder().start_exporter(get_store("performance"))
         
         # Hospital endpoints configuration
         self.hospital_endpoints = {
@@ -67,7 +75,11 @@ class HospitalIntegrationAPI:
     
     def init_database(self):
         """Khởi tạo cơ sở dữ liệu tích hợp"""
-        conn = sqlite3.connect(self.db_path)
+        self.storage.migrate([self._create_schema_v1])
+        logger.info("✅ Database initialized for hospital integrations")
+    
+    def _create_schema_v1(self, conn):
+        """Schema version 1"""
         cursor = conn.cursor()
         
         # Bảng tích hợp bệnh viện
@@ -111,10 +123,6 @@ class HospitalIntegrationAPI:
                 rating REAL DEFAULT 0.0
             )
         ''')
-        
-        conn.commit()
-        conn.close()
-        logger.info("✅ Database initialized for hospital integrations")
     
     def setup_routes(self):
         """Thiết lập các routes API"""
@@ -148,7 +156,7 @@ class HospitalIntegrationAPI:
                 response = await self.send_to_hospital(hospital_id, "patients", integration_data)
                 
                 # Store integration record
-                conn = sqlite3.connect(self.db_path)
+                conn = self.storage.connect()
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO hospital_integrations 
@@ -206,7 +214,7 @@ class HospitalIntegrationAPI:
                 response = await self.send_to_hospital(hospital_id, "appointments", appointment_data)
                 
                 # Store appointment
-                conn = sqlite3.connect(self.db_path)
+                conn = self.storage.connect()
                 cursor = conn.cursor()
                 cursor.execute('''
                     INSERT INTO appointments 
@@ -240,7 +248,7 @@ class HospitalIntegrationAPI:
         @self.app.get("/api/v1/providers/search")
         async def search_providers(specialty: str = None, hospital_id: str = None):
             """Tìm kiếm nhà cung cấp dịch vụ"""
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
             query = "SELECT * FROM healthcare_providers WHERE 1=1"
@@ -278,7 +286,7 @@ class HospitalIntegrationAPI:
         @self.app.get("/api/v1/integration/status/{patient_id}")
         async def get_integration_status(patient_id: str):
             """Kiểm tra trạng thái tích hợp của bệnh nhân"""
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -346,7 +354,7 @@ class HospitalIntegrationAPI:
     
     async def find_available_providers(self, appointment_type: str, preferred_date: datetime) -> List[Dict[str, Any]]:
         """Tìm nhà cung cấp dịch vụ có sẵn"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         # Find providers by specialty
@@ -443,7 +451,7 @@ class HospitalIntegrationAPI:
             }
         ]
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         for provider in sample_providers:
@@ -11,12 +11,13 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
-import sqlite3
 import requests
 from celery import Celery
 from pydantic import BaseModel, EmailStr
 import logging
 
+from storage.sqlite_store import get_store
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -53,7 +54,8 @@ class NotificationSystem:
     """Hệ thống thông báo tổng hợp"""
     
     def __init__(self):
-        self.db_path = "/workspaces/Mentalhealth/mental-health-support-app/mental-health-support-app/data/notifications.db"
+        self.storage = get_store("notifications")
+        self.db_path = self.storage.db_path
         self.init_database()
         
         # Email configuration
@@ -169,7 +171,11 @@ Trân trọng,
     
     def init_database(self):
         """Khởi tạo cơ sở dữ liệu thông báo"""
-        conn = sqlite3.connect(self.db_path)
+        self.storage.migrate([self._create_schema_v1])
+        logger.info("✅ Notification database initialized")
+    
+    def _create_schema_v1(self, conn):
+        """Schema version 1"""
         cursor = conn.cursor()
         
         # Bảng thông báo
@@ -231,14 +237,10 @@ Trân trọng,
                 preferences TEXT
             )
         ''')
-        
-        conn.commit()
-        conn.close()
-        logger.info("✅ Notification database initialized")
     
     def init_templates(self):
         """Khởi tạo templates vào database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         for template_id, template_data in self.templates.items():
@@ -297,7 +299,7 @@ Trân trọng,
     
     def store_notification(self, notification: NotificationRequest) -> int:
         """Lưu thông báo vào database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -403,7 +405,7 @@ Trân trọng,
     
     def get_user_preferences(self, user_id: str) -> Dict[str, Any]:
         """Lấy preferences của user"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -440,7 +442,7 @@ Trân trọng,
     
     def update_notification_status(self, notification_id: int, status: str):
         """Cập nhật trạng thái thông báo"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -454,7 +456,7 @@ Trân trọng,
     
     def log_notification_action(self, notification_id: int, action: str, status: str, details: str):
         """Ghi log hành động thông báo"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.storage.connect()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -472,7 +474,7 @@ Trân trọng,
         """Gửi thông báo bằng template"""
         try:
             # Get template
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
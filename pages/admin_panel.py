@@ -13,6 +13,15 @@ sys.path.append('/workspaces/Mentalhealth')
 from components.admin_auth import admin_auth, require_admin_auth
 from components.ui import load_css, app_header
 
+try:
+    import plotly.graph_objects as go
+    from performance.sampling_profiler import (
+        PROFILE_SESSION_KEY, flamegraph_nodes, get_sampling_profiler, read_collapsed
+    )
+    SAMPLING_PROFILER_AVAILABLE = True
+except ImportError:
+    SAMPLING_PROFILER_AVAILABLE = False
+
 # Page configuration
 st.set_page_config(
     page_title="SOULFRIEND Admin",
@@ -124,7 +133,58 @@ def render_user_management():
 def render_system_monitor():
     """Render system monitoring panel"""
     st.markdown("### 📋 System Monitor")
-    st.info("🔧 System monitoring features đang được phát triển...")
+    render_profiles()
+
+def render_profiles():
+    """Flamegraphs of the stored sampling profiles"""
+    st.markdown("#### 🔥 Profiles (flamegraph)")
+    if not SAMPLING_PROFILER_AVAILABLE:
+        st.warning("⚠️ Sampling profiler không khả dụng")
+        return
+    
+    profiler = get_sampling_profiler()
+    col1, col2 = st.columns(2)
+    with col1:
+        st.session_state[PROFILE_SESSION_KEY] = st.toggle(
+            "Profile mọi lượt chạy của phiên này",
+            value=st.session_state.get(PROFILE_SESSION_KEY, False)
+        )
+    with col2:
+        if st.button("💾 Ghi profiles ra đĩa"):
+            profiler.flush()
+    st.caption(
+        f"Tỷ lệ lấy mẫu: {profiler.sample_rate:.1%} · Routes: {', '.join(profiler.routes) or '—'} · "
+        "Cấu hình qua SOULFRIEND_PROFILE_SAMPLE_RATE / SOULFRIEND_PROFILE_ROUTES; "
+        "API: header X-Soulfriend-Profile: 1"
+    )
+    
+    profiles = profiler.list_profiles()
+    if not profiles:
+        st.info("Chưa có profile nào")
+        return
+    
+    choice = st.selectbox(
+        "Profile:",
+        range(len(profiles)),
+        format_func=lambda i: f"{profiles[i]['window_start']:%Y-%m-%d %H:%M} · {profiles[i]['label']} "
+                              f"({profiles[i]['samples']} mẫu)"
+    )
+    profile = profiles[choice]
+    stacks = read_collapsed(profile["path"])
+    nodes = flamegraph_nodes(stacks, root=profile["label"])
+    
+    fig = go.Figure(go.Icicle(
+        ids=nodes["ids"], labels=nodes["labels"], parents=nodes["parents"], values=nodes["values"],
+        branchvalues="total", tiling=dict(orientation="v"), maxdepth=12
+    ))
+    fig.update_layout(height=600, margin=dict(t=10, l=10, r=10, b=10))
+    st.plotly_chart(fig, use_container_width=True)
+    
+    st.download_button(
+        "📥 Tải collapsed stacks (speedscope / flamegraph.pl)",
+        profile["path"].read_bytes(),
+        file_name=profile["path"].name
+    )
 
 def render_security_panel():
     """Render security management panel"""
@@ -0,0 +1,213 @@
+"""
+SOULFRIEND V2.0 - Thread-safe Caching Primitives
+Bộ nhớ đệm an toàn đa luồng cho PerformanceOptimizer
+
+Canonical cache keys (stable across processes, so Redis entries are shared by
+all workers), lock-striped in-memory LRU/TTL tiers, single-flight
+de-duplication of concurrent misses and atomic statistics counters.
+"""
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import wraps
+from datetime import date, datetime
+from decimal import Decimal
+from enum import Enum
+from pathlib import PurePath
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Returned by the in-memory tiers on a miss, so None can be cached
+MISSING = object()
+
+KEY_VERSION = 1
+
+class UncacheableArgument(TypeError):
+    """An argument has no canonical, process-independent representation"""
+
+def _canonical(value: Any) -> Any:
+    """JSON-ready structure that is equal for equal arguments in every process"""
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        # repr round-trips exactly; distinguishes 1 and 1.0
+        return {"__float__": repr(value)}
+    if isinstance(value, (list, tuple)):
+        return {"__" + type(value).__name__ + "__": [_canonical(v) for v in value]}
+    if isinstance(value, (set, frozenset)):
+        items = [_canonical(v) for v in value]
+        return {"__set__": sorted(items, key=lambda item: json.dumps(item, sort_keys=True))}
+    if isinstance(value, dict):
+        items = [[_canonical(k), _canonical(v)] for k, v in value.items()]
+        return {"__dict__": sorted(items, key=lambda item: json.dumps(item[0], sort_keys=True))}
+    if isinstance(value, (datetime, date)):
+        return {"__" + type(value).__name__ + "__": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    if isinstance(value, Enum):
+        return {"__enum__": f"{type(value).__qualname__}.{value.name}"}
+    if isinstance(value, PurePath):
+        return {"__path__": str(value)}
+    if isinstance(value, bytes):
+        return {"__bytes__": value.hex()}
+    raise UncacheableArgument(f"Cannot build a cache key from {type(value).__name__}")
+
+def function_namespace(func: Callable) -> str:
+    """Per-function key namespace: module and qualified name"""
+    return f"{func.__module__}.{func.__qualname__}"
+
+def make_cache_key(namespace: str, args: Tuple = (), kwargs: Optional[Dict[str, Any]] = None) -> str:
+    """`namespace:digest` of the canonical arguments; raises UncacheableArgument"""
+    payload = json.dumps([KEY_VERSION, _canonical(list(args)), _canonical(kwargs or {})],
+                         sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return f"{namespace}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+class AtomicCounters:
+    """Named integer counters updated under one lock"""
+
+    def __init__(self, names: List[str]):
+        self._lock = threading.Lock()
+        self._counts = {name: 0 for name in names}
+
+    def increment(self, name: str, n: int = 1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts = {name: 0 for name in self._counts}
+
+class StripedCache:
+    """LRU cache with optional per-entry TTL, split into independently locked stripes"""
+
+    def __init__(self, maxsize: int = 1000, ttl: Optional[float] = None, stripes: int = 16):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._stripes = [OrderedDict() for _ in range(stripes)]
+        self._locks = [threading.Lock() for _ in range(stripes)]
+        self._stripe_size = max(1, -(-maxsize // stripes))
+
+    def _stripe(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % len(self._stripes)
+
+    def get(self, key: str) -> Any:
+        index = self._stripe(key)
+        with self._locks[index]:
+            entries = self._stripes[index]
+            entry = entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del entries[key]
+                return MISSING
+            entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        index = self._stripe(key)
+        with self._locks[index]:
+            entries = self._stripes[index]
+            entries[key] = (value, expires_at)
+            entries.move_to_end(key)
+            while len(entries) > self._stripe_size:
+                entries.popitem(last=False)
+
+    def delete(self, key: str):
+        index = self._stripe(key)
+        with self._locks[index]:
+            self._stripes[index].pop(key, None)
+
+    def clear(self):
+        for lock, entries in zip(self._locks, self._stripes):
+            with lock:
+                entries.clear()
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._stripes)
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Concurrent calls for the same key share one execution"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Result of fn for key, and whether it came from another caller's execution"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+def memoize(get: Callable[[str], Any], set_: Callable[[str, Any], None], counters: AtomicCounters,
+            single_flight: Optional[SingleFlight] = None) -> Callable:
+    """Caching decorator over a get/set tier (get returns MISSING on a miss)"""
+    single_flight = single_flight or SingleFlight()
+
+    def decorator(func):
+        namespace = function_namespace(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            counters.increment("requests")
+            try:
+                key = make_cache_key(namespace, args, kwargs)
+            except UncacheableArgument:
+                counters.increment("uncacheable")
+                return func(*args, **kwargs)
+
+            result = get(key)
+            if result is not MISSING:
+                counters.increment("hits")
+                return result
+
+            def load():
+                # Another caller may have filled the entry while we waited to lead
+                value = get(key)
+                if value is MISSING:
+                    value = func(*args, **kwargs)
+                    set_(key, value)
+                return value
+
+            result, shared = single_flight.do(key, load)
+            counters.increment("shared" if shared else "misses")
+            return result
+
+        wrapper.cache_namespace = namespace
+        return wrapper
+    return decorator
@@ -0,0 +1,311 @@
+"""
+SOULFRIEND V2.0 - Request Latency Instrumentation
+Đo độ trễ theo nhãn cho các phần trang Streamlit và route FastAPI
+
+Spans (context managers and decorators) record into HDR-style log-linear
+histograms: microsecond resolution, ~3% relative error, O(1) recording with
+no allocation beyond the span object. Each label reports p50/p95/p99, is
+exposed in Prometheus text format for `/metrics`, and is exported per interval
+to the performance database.
+"""
+import json
+import logging
+import threading
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Coarse bounds for the Prometheus exposition and the compact snapshot
+EXPORT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+QUANTILES = (0.5, 0.95, 0.99)
+
+def create_latency_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS request_latency (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            label TEXT NOT NULL,
+            request_count INTEGER NOT NULL,
+            mean_ms REAL,
+            p50_ms REAL,
+            p95_ms REAL,
+            p99_ms REAL,
+            max_ms REAL,
+            buckets TEXT
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_latency_label_time ON request_latency(label, timestamp)")
+
+class HdrHistogram:
+    """Log-linear histogram of integer microseconds: 2**precision_bits sub-buckets per power of two"""
+
+    def __init__(self, precision_bits: int = 5, max_ms: float = 3_600_000):
+        self.precision_bits = precision_bits
+        self._sub = 1 << precision_bits
+        self._max_us = int(max_ms * 1000)
+        self.counts = [0] * (self._index(self._max_us) + 1)
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+        self._lock = threading.Lock()
+
+    def _index(self, us: int) -> int:
+        if us < self._sub:
+            return us
+        shift = us.bit_length() - self.precision_bits - 1
+        return (shift << self.precision_bits) + (us >> shift)
+
+    def _upper_us(self, index: int) -> int:
+        """Highest value counted in the bucket"""
+        shift = max(0, (index >> self.precision_bits) - 1)
+        return (((index - (shift << self.precision_bits)) + 1) << shift) - 1
+
+    def record_us(self, us: int):
+        if us > self._max_us:
+            us = self._max_us
+        index = self._index(us)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_us += us
+            if us > self.max_us:
+                self.max_us = us
+
+    def observe(self, latency_ms: float):
+        self.record_us(int(latency_ms * 1000))
+
+    def copy(self) -> "HdrHistogram":
+        clone = HdrHistogram.__new__(HdrHistogram)
+        clone.precision_bits, clone._sub, clone._max_us = self.precision_bits, self._sub, self._max_us
+        clone._lock = threading.Lock()
+        with self._lock:
+            clone.counts = list(self.counts)
+            clone.count, clone.total_us, clone.max_us = self.count, self.total_us, self.max_us
+        return clone
+
+    def since(self, earlier: Optional["HdrHistogram"]) -> "HdrHistogram":
+        """Histogram of what was recorded after `earlier` (a copy of this histogram)"""
+        delta = self.copy()
+        if earlier is None:
+            return delta
+        delta.counts = [now - then for now, then in zip(delta.counts, earlier.counts)]
+        delta.count -= earlier.count
+        delta.total_us -= earlier.total_us
+        top = next((i for i in range(len(delta.counts) - 1, -1, -1) if delta.counts[i]), None)
+        delta.max_us = min(delta.max_us, self._upper_us(top)) if top is not None else 0
+        return delta
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at the q-quantile in ms (bucket upper bound, capped at the maximum)"""
+        if not self.count:
+            return None
+        target, running = max(1, q * self.count), 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target:
+                return min(self._upper_us(index), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def cumulative(self, bounds_ms=EXPORT_BUCKETS_MS) -> List[int]:
+        """Counts at or below each bound (Prometheus `le` semantics)"""
+        result, running, index = [], 0, 0
+        for bound in bounds_ms:
+            limit = int(bound * 1000)
+            while index < len(self.counts) and self._upper_us(index) <= limit:
+                running += self.counts[index]
+                index += 1
+            result.append(running)
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean_ms': self.total_us / self.count / 1000 if self.count else None,
+            'max_ms': self.max_us / 1000,
+            **{f"p{int(q * 100)}_ms": self.quantile(q) for q in QUANTILES}
+        }
+
+class _Span:
+    __slots__ = ("histogram", "started")
+
+    def __init__(self, histogram: HdrHistogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.record_us((time.perf_counter_ns() - self.started) // 1000)
+        return False
+
+class LatencyRecorder:
+    """Labelled latency histograms for the whole process"""
+
+    def __init__(self):
+        self._histograms: Dict[str, HdrHistogram] = {}
+        self._lock = threading.Lock()
+        self._exported: Dict[str, HdrHistogram] = {}
+        self._export_lock = threading.Lock()
+        self._exporter: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def histogram(self, label: str) -> HdrHistogram:
+        histogram = self._histograms.get(label)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(label, HdrHistogram())
+        return histogram
+
+    def observe(self, label: str, latency_ms: float):
+        self.histogram(label).observe(latency_ms)
+
+    def span(self, label: str) -> _Span:
+        """`with recorder.span("page.scoring"):` times the block, including when it raises"""
+        return _Span(self.histogram(label))
+
+    def timed(self, label: Optional[str] = None) -> Callable:
+        """Decorator timing every call under label (default: module.qualname)"""
+        def decorator(func):
+            histogram = self.histogram(label or f"{func.__module__}.{func.__qualname__}")
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    histogram.record_us((time.perf_counter_ns() - started) // 1000)
+            return wrapper
+        return decorator
+
+    def totals(self) -> Tuple[int, int]:
+        """Requests recorded and their total microseconds, over every label"""
+        with self._lock:
+            histograms = list(self._histograms.values())
+        return sum(h.count for h in histograms), sum(h.total_us for h in histograms)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            items = list(self._histograms.items())
+        return {label: histogram.copy().snapshot() for label, histogram in items}
+
+    def prometheus(self, metric: str = "soulfriend_request_latency_seconds") -> str:
+        """Prometheus text exposition: a histogram plus p50/p95/p99 gauges per label"""
+        with self._lock:
+            items = sorted(self._histograms.items())
+        lines = [f"# TYPE {metric} histogram"]
+        quantile_lines = [f"# TYPE {metric}_quantile gauge"]
+        for label, live in items:
+            histogram = live.copy()
+            name = label.replace("\\", "\\\\").replace('"', '\\"')
+            for bound, count in zip(EXPORT_BUCKETS_MS, histogram.cumulative()):
+                lines.append(f'{metric}_bucket{{label="{name}",le="{bound / 1000:g}"}} {count}')
+            lines.append(f'{metric}_bucket{{label="{name}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{label="{name}"}} {histogram.total_us / 1e6:.6f}')
+            lines.append(f'{metric}_count{{label="{name}"}} {histogram.count}')
+            for q in QUANTILES:
+                value = histogram.quantile(q)
+                if value is not None:
+                    quantile_lines.append(f'{metric}_quantile{{label="{name}",quantile="{q}"}} {value / 1000:.6f}')
+        return "\n".join(lines + quantile_lines) + "\n"
+
+    def export(self, store) -> int:
+        """Write what each label recorded since the last export to request_latency; returns rows written"""
+        with self._export_lock:
+            with self._lock:
+                items = list(self._histograms.items())
+            rows, exported = [], {}
+            for label, live in items:
+                current = live.copy()
+                delta = current.since(self._exported.get(label))
+                exported[label] = current
+                if not delta.count:
+                    continue
+                snapshot = delta.snapshot()
+                rows.append((label, delta.count, snapshot['mean_ms'], snapshot['p50_ms'], snapshot['p95_ms'],
+                             snapshot['p99_ms'], snapshot['max_ms'],
+                             json.dumps(dict(zip(map(str, EXPORT_BUCKETS_MS), delta.cumulative())))))
+            if rows:
+                with store.connection() as conn:
+                    create_latency_schema(conn)
+                    conn.executemany('''
+                        INSERT INTO request_latency
+                        (label, request_count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms, buckets)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', rows)
+            self._exported.update(exported)
+            return len(rows)
+
+    def start_exporter(self, store, interval_seconds: float = 60.0):
+        """Export to the performance database in a background thread (idempotent)"""
+        if self._exporter and self._exporter.is_alive():
+            return
+        self._stop.clear()
+
+        def loop():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.export(store)
+                except Exception as e:
+                    logger.error(f"Latency export failed: {e}")
+
+        self._exporter = threading.Thread(target=loop, name='latency-exporter', daemon=True)
+        self._exporter.start()
+
+    def stop_exporter(self, store=None):
+        self._stop.set()
+        if self._exporter:
+            self._exporter.join(timeout=5)
+        if store is not None:
+            self.export(store)
+
+def instrument_fastapi(app, recorder: Optional["LatencyRecorder"] = None, prefix: str = "api",
+                       metrics_path: str = "/metrics"):
+    """Time every request under "<prefix> METHOD /route/template" and serve `metrics_path`"""
+    from fastapi.responses import PlainTextResponse
+
+    recorder = recorder or get_latency_recorder()
+
+    @app.middleware("http")
+    async def record_latency(request, call_next):
+        started = time.perf_counter_ns()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            if path != metrics_path:
+                label = f"{prefix} {request.method} {path}" + (" error" if status >= 500 else "")
+                recorder.histogram(label).record_us((time.perf_counter_ns() - started) // 1000)
+
+    @app.get(metrics_path, response_class=PlainTextResponse, include_in_schema=False)
+    async def latency_metrics():
+        return recorder.prometheus()
+
+    return recorder
+
+_recorder: Optional[LatencyRecorder] = None
+_recorder_lock = threading.Lock()
+
+def get_latency_recorder() -> LatencyRecorder:
+    """Process-wide recorder"""
+    global _recorder
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = LatencyRecorder()
+    return _recorder
+
+def latency_span(label: str) -> _Span:
+    """Shortcut for get_latency_recorder().span(label)"""
+    return get_latency_recorder().span(label)
+
+def timed(label: Optional[str] = None) -> Callable:
+    """Shortcut for get_latency_recorder().timed(label)"""
+    return get_latency_recorder().timed(label)
@@ -4,18 +4,23 @@ Hệ thống tối ưu hóa hiệu suất và monitoring
 """
 import time
 import psutil
-import sqlite3
 import json
 import asyncio
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 from dataclasses import dataclass
 import logging
-from functools import wraps
 import threading
 from collections import defaultdict, deque
-import redis
-from cachetools import TTLCache, LRUCache
+
+from storage.sqlite_store import ensure_query_performance_schema, get_store
+from performance.caching import MISSING, AtomicCounters, SingleFlight, StripedCache, memoize
+from performance.tiered_cache import REDIS_AVAILABLE, get_tiered_cache
+from performance.timeseries import MetricsTimeSeries, create_rollup_schema
+from performance.instrumentation import create_latency_schema, get_latency_recorder
+
+if REDIS_AVAILABLE:
+    import redis
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -44,10 +49,21 @@ class PerformanceOptimizer:
     """Hệ thống tối ưu hóa hiệu suất"""
     
     def __init__(self):
-        self.db_path = "/workspaces/Mentalhealth/mental-health-support-app/mental-health-support-app/data/performance.db"
+        self.storage = get_store("performance")
+        self.db_path = self.storage.db_path
         self.init_database()
         
+        # Ring buffer + batched 1m/1h rollups; system_resources keeps the last hour of raw rows
+        self.timeseries = MetricsTimeSeries(
+            self.storage,
+            fields=["cpu_percent", "memory_percent", "disk_usage", "response_time", "active_connections"],
+            raw_table="system_resources",
+            raw_extra_columns=["network_io"]
+        )
+        
         # Performance monitoring
+        self.latency = get_latency_recorder()
+        self._latency_totals = self.latency.totals()
         self.metrics_buffer = deque(maxlen=1000)
         self.monitoring_active = False
         self.monitoring_thread = None
@@ -67,22 +83,21 @@ class PerformanceOptimizer:
             "disk_usage_warning": 85.0
         }
         
-        # Database optimization settings
+        # Database optimization settings (pragma profile shared by all pooled connections)
         self.db_optimizations = {
-            "sqlite_pragmas": [
-                "PRAGMA journal_mode=WAL",
-                "PRAGMA synchronous=NORMAL", 
-                "PRAGMA cache_size=10000",
-                "PRAGMA temp_store=MEMORY",
-                "PRAGMA mmap_size=268435456"  # 256MB
-            ]
+            "sqlite_pragmas": self.storage.pragmas
         }
         
         self.apply_database_optimizations()
     
     def init_database(self):
         """Khởi tạo cơ sở dữ liệu hiệu suất"""
-        conn = sqlite3.connect(self.db_path)
+        self.storage.migrate([self._create_schema_v1, self._create_indexes_v2, create_rollup_schema,
+                              create_latency_schema, ensure_query_performance_schema])
+        logger.info("✅ Performance database initialized")
+    
+    def _create_schema_v1(self, conn):
+        """Schema version 1"""
         cursor = conn.cursor()
         
         # Bảng metrics hiệu suất
@@ -93,9 +108,7 @@ class PerformanceOptimizer:
                 metric_name TEXT NOT NULL,
                 value REAL NOT NULL,
                 unit TEXT,
-                metadata TEXT,
-                INDEX(timestamp),
-                INDEX(metric_name)
+                metadata TEXT
             )
         ''')
         
@@ -154,59 +167,62 @@ class PerformanceOptimizer:
                 optimization_applied TEXT
             )
         ''')
-        
-        conn.commit()
-        conn.close()
-        logger.info("✅ Performance database initialized")
+    
+    def _create_indexes_v2(self, conn):
+        """Schema version 2: time and metric indexes"""
+        cursor = conn.cursor()
+        for index in [
+            "CREATE INDEX IF NOT EXISTS idx_perf_timestamp ON performance_metrics(timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_perf_metric ON performance_metrics(metric_name)",
+            "CREATE INDEX IF NOT EXISTS idx_sys_timestamp ON system_resources(timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_alert_timestamp ON performance_alerts(timestamp)",
+            "CREATE INDEX IF NOT EXISTS idx_query_timestamp ON query_performance(timestamp)"
+        ]:
+            cursor.execute(index)
     
     def init_cache_systems(self):
         """Khởi tạo hệ thống cache"""
-        # Memory caches
-        self.memory_cache = LRUCache(maxsize=1000)
-        self.ttl_cache = TTLCache(maxsize=500, ttl=300)  # 5 minutes TTL
+        # Memory caches (lock-striped, safe to share between threads)
+        self.memory_cache = StripedCache(maxsize=1000)
+        self.ttl_cache = StripedCache(maxsize=500, ttl=300)  # 5 minutes TTL
+        self.redis_prefix = "soulfriend:cache:"
+        self._single_flight = SingleFlight()
         
         # Redis cache (if available)
-        try:
-            self.redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-            self.redis_client.ping()
-            self.redis_available = True
-            logger.info("✅ Redis cache initialized")
-        except:
-            self.redis_available = False
-            logger.warning("⚠️ Redis not available, using memory cache only")
+        self.redis_available = False
+        if REDIS_AVAILABLE:
+            try:
+                self.redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
+                self.redis_client.ping()
+                self.redis_available = True
+                logger.info("✅ Redis cache initialized")
+            except Exception as e:
+                logger.warning(f"⚠️ Redis not available ({e}), using memory cache only")
+        else:
+            logger.warning("⚠️ redis package not installed, using memory cache only")
+        
+        # Two-tier cache shared by all workers (L2: Redis, else SQLite)
+        self.tiered_cache = get_tiered_cache()
+        logger.info(f"Two-tier cache L2 backend: {self.tiered_cache.backend}")
         
         # Cache statistics
-        self.cache_stats = {
-            "memory_cache": {"hits": 0, "misses": 0, "requests": 0},
-            "ttl_cache": {"hits": 0, "misses": 0, "requests": 0},
-            "redis_cache": {"hits": 0, "misses": 0, "requests": 0}
+        self._cache_counters = {
+            name: AtomicCounters(["hits", "misses", "requests", "shared", "uncacheable"])
+            for name in ("memory_cache", "ttl_cache", "redis_cache")
         }
     
+    @property
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Consistent snapshot of the per-tier cache counters"""
+        return {name: counters.snapshot() for name, counters in self._cache_counters.items()}
+    
     def apply_database_optimizations(self):
         """Áp dụng tối ưu hóa cơ sở dữ liệu"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Apply SQLite optimizations
-            for pragma in self.db_optimizations["sqlite_pragmas"]:
-                cursor.execute(pragma)
-                logger.info(f"Applied: {pragma}")
-            
-            # Create indexes for better performance
-            indexes = [
-                "CREATE INDEX IF NOT EXISTS idx_perf_timestamp ON performance_metrics(timestamp)",
-                "CREATE INDEX IF NOT EXISTS idx_perf_metric ON performance_metrics(metric_name)",
-                "CREATE INDEX IF NOT EXISTS idx_sys_timestamp ON system_resources(timestamp)",
-                "CREATE INDEX IF NOT EXISTS idx_alert_timestamp ON performance_alerts(timestamp)",
-                "CREATE INDEX IF NOT EXISTS idx_query_timestamp ON query_performance(timestamp)"
-            ]
-            
-            for index in indexes:
-                cursor.execute(index)
-            
-            conn.commit()
-            conn.close()
+            # Pragmas are applied by the shared store on every pooled connection
+            # and indexes are part of the schema migrations; refresh planner stats here.
+            with self.storage.connection() as conn:
+                conn.execute("PRAGMA optimize")
             logger.info("✅ Database optimizations applied")
             
         except Exception as e:
@@ -231,6 +247,7 @@ class PerformanceOptimizer:
         self.monitoring_active = False
         if self.monitoring_thread:
             self.monitoring_thread.join(timeout=5)
+        self.timeseries.flush()
         logger.info("⏹️ Performance monitoring stopped")
     
     def _monitoring_loop(self, interval: int):
@@ -249,6 +266,9 @@ class PerformanceOptimizer:
                 # Update cache statistics
                 self.update_cache_statistics()
                 
+                # Request latency histograms since the last export
+                self.latency.export(self.storage)
+                
                 time.sleep(interval)
                 
             except Exception as e:
@@ -281,11 +301,11 @@ class PerformanceOptimizer:
             # Active connections (estimate)
             connections = len(psutil.net_connections())
             
-            # Response time (mock measurement)
-            start_time = time.time()
-            # Simulate a lightweight operation
-            time.sleep(0.001)
-            response_time = (time.time() - start_time) * 1000  # ms
+            # Mean latency of the page sections and API requests timed since the last sample
+            count, total_us = self.latency.totals()
+            last_count, last_total_us = self._latency_totals
+            self._latency_totals = (count, total_us)
+            response_time = (total_us - last_total_us) / (count - last_count) / 1000 if count > last_count else 0.0  # ms
             
             return SystemResource(
                 cpu_percent=cpu_percent,
@@ -301,27 +321,15 @@ class PerformanceOptimizer:
             return SystemResource(0, 0, 0, {}, 0, 0)
     
     def store_system_metrics(self, metrics: SystemResource):
-        """Lưu metrics hệ thống"""
+        """Lưu metrics hệ thống (written to the database in batches)"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO system_resources 
-                (cpu_percent, memory_percent, disk_usage, network_io, 
-                 active_connections, response_time)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                metrics.cpu_percent,
-                metrics.memory_percent,
-                metrics.disk_usage,
-                json.dumps(metrics.network_io),
-                metrics.active_connections,
-                metrics.response_time
-            ))
-            
-            conn.commit()
-            conn.close()
+            self.timeseries.record({
+                "cpu_percent": metrics.cpu_percent,
+                "memory_percent": metrics.memory_percent,
+                "disk_usage": metrics.disk_usage,
+                "response_time": metrics.response_time,
+                "active_connections": metrics.active_connections
+            }, network_io=json.dumps(metrics.network_io))
             
             # Also store in buffer for real-time access
             self.metrics_buffer.append({
@@ -368,7 +376,7 @@ class PerformanceOptimizer:
                                threshold_value: float, severity: str):
         """Tạo cảnh báo hiệu suất"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -388,9 +396,10 @@ class PerformanceOptimizer:
     def update_cache_statistics(self):
         """Cập nhật thống kê cache"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
+            cache_sizes = {"memory_cache": len(self.memory_cache), "ttl_cache": len(self.ttl_cache)}
             for cache_name, stats in self.cache_stats.items():
                 if stats["requests"] > 0:
                     hit_rate = stats["hits"] / stats["requests"]
@@ -405,7 +414,7 @@ class PerformanceOptimizer:
                         hit_rate,
                         miss_rate,
                         stats["requests"],
-                        getattr(self, cache_name.replace("_cache", "_cache"), {}).get("maxsize", 0) if hasattr(self, cache_name.replace("_cache", "_cache")) else 0
+                        cache_sizes.get(cache_name, 0)
                     ))
             
             conn.commit()
@@ -416,59 +425,52 @@ class PerformanceOptimizer:
     
     # Cache decorators and utilities
     def cached(self, cache_type: str = "memory", ttl: int = 300):
-        """Decorator để cache kết quả function"""
-        def decorator(func):
-            @wraps(func)
-            def wrapper(*args, **kwargs):
-                # Create cache key
-                key = f"{func.__name__}:{hash(str(args) + str(sorted(kwargs.items())))}"
-                
-                # Try to get from cache
-                result = self.get_from_cache(key, cache_type)
-                if result is not None:
-                    self.cache_stats[f"{cache_type}_cache"]["hits"] += 1
-                    self.cache_stats[f"{cache_type}_cache"]["requests"] += 1
-                    return result
-                
-                # Cache miss - execute function
-                self.cache_stats[f"{cache_type}_cache"]["misses"] += 1
-                self.cache_stats[f"{cache_type}_cache"]["requests"] += 1
-                
-                result = func(*args, **kwargs)
-                
-                # Store in cache
-                self.set_in_cache(key, result, cache_type, ttl)
-                
-                return result
-            return wrapper
-        return decorator
+        """Decorator để cache kết quả function
+        
+        Keys are canonical per function (module.qualname + arguments), so they are
+        the same in every worker process; concurrent misses for one key run the
+        function once and share the result.
+        """
+        return memoize(
+            get=lambda key: self._cache_get(key, cache_type),
+            set_=lambda key, value: self._cache_set(key, value, cache_type, ttl),
+            counters=self._cache_counters[f"{cache_type}_cache"],
+            single_flight=self._single_flight
+        )
     
-    def get_from_cache(self, key: str, cache_type: str = "memory") -> Any:
-        """Lấy dữ liệu từ cache"""
+    def _cache_get(self, key: str, cache_type: str) -> Any:
         try:
             if cache_type == "memory":
                 return self.memory_cache.get(key)
             elif cache_type == "ttl":
                 return self.ttl_cache.get(key)
             elif cache_type == "redis" and self.redis_available:
-                result = self.redis_client.get(key)
-                return json.loads(result) if result else None
+                result = self.redis_client.get(self.redis_prefix + key)
+                return json.loads(result) if result is not None else MISSING
         except Exception as e:
             logger.error(f"Cache get error: {str(e)}")
-        return None
+        return MISSING
     
-    def set_in_cache(self, key: str, value: Any, cache_type: str = "memory", ttl: int = 300):
-        """Lưu dữ liệu vào cache"""
+    def _cache_set(self, key: str, value: Any, cache_type: str, ttl: int):
         try:
             if cache_type == "memory":
-                self.memory_cache[key] = value
+                self.memory_cache.set(key, value)
             elif cache_type == "ttl":
-                self.ttl_cache[key] = value
+                self.ttl_cache.set(key, value, ttl=ttl)
             elif cache_type == "redis" and self.redis_available:
-                self.redis_client.setex(key, ttl, json.dumps(value, default=str))
+                self.redis_client.setex(self.redis_prefix + key, ttl, json.dumps(value, default=str))
         except Exception as e:
             logger.error(f"Cache set error: {str(e)}")
     
+    def get_from_cache(self, key: str, cache_type: str = "memory") -> Any:
+        """Lấy dữ liệu từ cache"""
+        result = self._cache_get(key, cache_type)
+        return None if result is MISSING else result
+    
+    def set_in_cache(self, key: str, value: Any, cache_type: str = "memory", ttl: int = 300):
+        """Lưu dữ liệu vào cache"""
+        self._cache_set(key, value, cache_type, ttl)
+    
     def clear_cache(self, cache_type: str = "all"):
         """Xóa cache"""
         try:
@@ -480,8 +482,14 @@ class PerformanceOptimizer:
                 self.ttl_cache.clear()
                 logger.info("TTL cache cleared")
             
+            if cache_type in ["tiered", "all"]:
+                self.tiered_cache.clear()
+                logger.info("Two-tier cache cleared")
+            
             if cache_type in ["redis", "all"] and self.redis_available:
-                self.redis_client.flushdb()
+                # Only our namespace; the Redis database may be shared
+                for key in self.redis_client.scan_iter(match=self.redis_prefix + "*", count=500):
+                    self.redis_client.delete(key)
                 logger.info("Redis cache cleared")
                 
         except Exception as e:
@@ -490,24 +498,14 @@ class PerformanceOptimizer:
     def get_performance_summary(self, hours: int = 24) -> Dict[str, Any]:
         """Lấy tóm tắt hiệu suất"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
             since = datetime.now() - timedelta(hours=hours)
             
-            # Average metrics
-            cursor.execute('''
-                SELECT 
-                    AVG(cpu_percent) as avg_cpu,
-                    AVG(memory_percent) as avg_memory,
-                    AVG(disk_usage) as avg_disk,
-                    AVG(response_time) as avg_response_time,
-                    COUNT(*) as sample_count
-                FROM system_resources 
-                WHERE timestamp >= ?
-            ''', (since,))
-            
-            avg_metrics = cursor.fetchone()
+            # Average metrics from the finest tier that covers the window
+            resources = self.timeseries.summary(hours=hours)
+            averages = {name: values["avg"] for name, values in resources["metrics"].items()}
             
             # Alert counts
             cursor.execute('''
@@ -539,12 +537,13 @@ class PerformanceOptimizer:
             return {
                 "period_hours": hours,
                 "average_metrics": {
-                    "cpu_percent": avg_metrics[0] or 0,
-                    "memory_percent": avg_metrics[1] or 0,
-                    "disk_usage": avg_metrics[2] or 0,
-                    "response_time_ms": avg_metrics[3] or 0
+                    "cpu_percent": averages.get("cpu_percent", 0),
+                    "memory_percent": averages.get("memory_percent", 0),
+                    "disk_usage": averages.get("disk_usage", 0),
+                    "response_time_ms": averages.get("response_time", 0)
                 },
-                "sample_count": avg_metrics[4],
+                "sample_count": resources["sample_count"],
+                "resolution": resources["resolution"],
                 "alert_counts": alert_counts,
                 "cache_performance": cache_stats,
                 "generated_at": datetime.now().isoformat()
@@ -559,7 +558,7 @@ class PerformanceOptimizer:
         optimizations = []
         
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.storage.connect()
             cursor = conn.cursor()
             
             # Analyze table statistics
@@ -598,7 +597,8 @@ class PerformanceOptimizer:
             "disk_usage": metrics.disk_usage,
             "response_time_ms": metrics.response_time,
             "active_connections": metrics.active_connections,
-            "cache_stats": self.cache_stats
+            "cache_stats": self.cache_stats,
+            "tiered_cache": self.tiered_cache.stats()
         }
 
 # Global instance
@@ -0,0 +1,329 @@
+"""
+SOULFRIEND V2.0 - Sampling Profiler
+Lấy mẫu ngăn xếp theo yêu cầu: flamegraph theo nhãn và khung thời gian
+
+Opt-in only: a run is profiled when its session asks for it, when its label
+matches SOULFRIEND_PROFILE_ROUTES, or with probability
+SOULFRIEND_PROFILE_SAMPLE_RATE. A single daemon thread samples just the
+profiled threads every few milliseconds, so unprofiled runs pay one policy
+check. A sample counts towards a run only while the frame that started it is
+on the stack, which keeps concurrent async requests apart and drops reruns
+aborted by st.stop()/st.rerun(). Stacks are aggregated per label and time
+window into collapsed-stack files (`frame;frame;frame count`, read by
+flamegraph.pl and speedscope), capped by count and total size.
+"""
+import atexit
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, unquote
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# st.session_state flag: profile every rerun of this browser session
+PROFILE_SESSION_KEY = "profile_session"
+# Request header forcing an API call to be profiled
+PROFILE_HEADER = b"x-soulfriend-profile"
+
+class ProfileSession:
+    """One profiled run; a context manager, or call stop() when the run ends"""
+
+    __slots__ = ("profiler", "label", "thread_id", "anchor", "started", "stacks")
+
+    def __init__(self, profiler: "SamplingProfiler", label: str, anchor):
+        self.profiler = profiler
+        self.label = label
+        self.thread_id = threading.get_ident()
+        self.anchor = anchor
+        self.started = time.monotonic()
+        self.stacks: Counter = Counter()
+
+    def stop(self, label: Optional[str] = None):
+        """End the run, optionally under a final label (e.g. the matched route template)"""
+        if label:
+            self.label = label
+        self.profiler._finish(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+class _InactiveSession:
+    """Returned for runs the policy did not pick"""
+
+    def stop(self, label: Optional[str] = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_INACTIVE = _InactiveSession()
+
+class SamplingProfiler:
+    """Samples the stacks of selected runs and stores them as collapsed-stack profiles"""
+
+    def __init__(self, directory: Optional[str] = None, interval_ms: float = 5.0,
+                 window_seconds: int = 300, sample_rate: Optional[float] = None,
+                 routes: Optional[Sequence[str]] = None, min_duration_ms: float = 0.0,
+                 max_duration: float = 30.0, max_profiles: int = 500,
+                 max_bytes: int = 50 * 1024 * 1024, flush_interval: float = 60.0, max_depth: int = 256):
+        self.directory = Path(directory or os.getenv("SOULFRIEND_PROFILE_DIR", PROJECT_ROOT / "data" / "profiles"))
+        self.interval = interval_ms / 1000
+        self.window_seconds = window_seconds
+        if sample_rate is None:
+            sample_rate = float(os.getenv("SOULFRIEND_PROFILE_SAMPLE_RATE", "0") or 0)
+        self.sample_rate = sample_rate
+        if routes is None:
+            routes = [r.strip() for r in os.getenv("SOULFRIEND_PROFILE_ROUTES", "").split(",") if r.strip()]
+        self.routes = tuple(routes)
+        self.min_duration_ms = min_duration_ms
+        self.max_duration = max_duration
+        self.max_profiles = max_profiles
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_depth = max_depth
+
+        self._lock = threading.Lock()
+        self._active: Dict[int, List[ProfileSession]] = {}
+        self._windows: Dict[Tuple[str, int], Counter] = {}
+        self._frame_names: Dict[Any, str] = {}
+        self._wake = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    # Policy
+
+    def should_profile(self, label: str, force: bool = False) -> bool:
+        if force:
+            return True
+        if self.routes and any(route in label for route in self.routes):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self, label: str, force: bool = False):
+        """Begin sampling the calling frame's run if the policy picks it"""
+        if not self.should_profile(label, force):
+            return _INACTIVE
+        session = ProfileSession(self, label, sys._getframe(1))
+        with self._lock:
+            self._active.setdefault(session.thread_id, []).append(session)
+        self._ensure_sampler()
+        self._wake.set()
+        return session
+
+    # Sampling
+
+    def _ensure_sampler(self):
+        if self._sampler and self._sampler.is_alive():
+            return
+        with self._lock:
+            if self._sampler and self._sampler.is_alive():
+                return
+            self._sampler = threading.Thread(target=self._sample_loop, name="stack-sampler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            if not self._active:
+                self._wake.wait(1.0)
+                self._wake.clear()
+                continue
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Stack sampling failed: {e}")
+            time.sleep(self.interval)
+
+    def sample(self):
+        """Take one sample of every profiled thread"""
+        frames = sys._current_frames()
+        now = time.monotonic()
+        with self._lock:
+            active = [(thread_id, list(sessions)) for thread_id, sessions in self._active.items()]
+        expired = []
+        for thread_id, sessions in active:
+            frame = frames.get(thread_id)
+            if frame is None:
+                expired += sessions  # thread is gone
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(frame)
+                frame = frame.f_back
+            for session in sessions:
+                if now - session.started > self.max_duration:
+                    expired.append(session)
+                    continue
+                for depth, candidate in enumerate(stack):
+                    if candidate is session.anchor:
+                        # Root the stack at the frame that started the run
+                        session.stacks[";".join(self._frame_name(f) for f in reversed(stack[:depth + 1]))] += 1
+                        break
+        for session in expired:
+            self._finish(session)
+
+    def _frame_name(self, frame) -> str:
+        code = frame.f_code
+        name = self._frame_names.get(code)
+        if name is None:
+            qualname = getattr(code, "co_qualname", code.co_name)
+            name = self._frame_names[code] = f"{qualname} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+        return name
+
+    def _finish(self, session: ProfileSession):
+        with self._lock:
+            sessions = self._active.get(session.thread_id)
+            if not sessions or session not in sessions:
+                return  # already finished
+            sessions.remove(session)
+            if not sessions:
+                del self._active[session.thread_id]
+            duration_ms = (time.monotonic() - session.started) * 1000
+            if session.stacks and duration_ms >= self.min_duration_ms:
+                window = int(time.time() // self.window_seconds * self.window_seconds)
+                self._windows.setdefault((session.label, window), Counter()).update(session.stacks)
+            session.anchor = None
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error(f"Could not store profiles: {e}")
+
+    # Storage
+
+    def _path(self, label: str, window: int) -> Path:
+        return self.directory / f"{window}_{quote(label, safe='')}.folded"
+
+    def flush(self) -> int:
+        """Merge aggregated stacks into their collapsed-stack files and apply retention; returns files written"""
+        with self._flush_lock:
+            with self._lock:
+                windows, self._windows = self._windows, {}
+                self._last_flush = time.monotonic()
+            if not windows:
+                return 0
+            self.directory.mkdir(parents=True, exist_ok=True)
+            for (label, window), stacks in windows.items():
+                path = self._path(label, window)
+                if path.exists():
+                    stacks = read_collapsed(path) + stacks
+                tmp = path.with_suffix(".tmp")
+                tmp.write_text("".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+                               encoding="utf-8")
+                os.replace(tmp, path)
+            self.enforce_retention()
+            return len(windows)
+
+    def enforce_retention(self) -> int:
+        """Delete the oldest profiles beyond max_profiles or max_bytes; returns files removed"""
+        files = sorted(self.directory.glob("*.folded"), key=lambda p: (p.stat().st_mtime, p.name), reverse=True)
+        kept_bytes, removed = 0, 0
+        for index, path in enumerate(files):
+            kept_bytes += path.stat().st_size
+            if index >= self.max_profiles or kept_bytes > self.max_bytes:
+                path.unlink(missing_ok=True)
+                removed += 1
+        if removed:
+            logger.info(f"🔥 Removed {removed} old profiles")
+        return removed
+
+    def list_profiles(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Stored profiles, newest window first"""
+        profiles = []
+        for path in self.directory.glob("*.folded"):
+            window, _, label = path.stem.partition("_")
+            profiles.append({"label": unquote(label), "window_start": datetime.fromtimestamp(int(window)),
+                             "path": path, "bytes": path.stat().st_size})
+        profiles.sort(key=lambda p: (p["window_start"], p["label"]), reverse=True)
+        for profile in profiles[:limit]:
+            profile["samples"] = sum(read_collapsed(profile["path"]).values())
+        return profiles[:limit]
+
+class ProfilingMiddleware:
+    """ASGI middleware sampling the requests the policy picks; `X-Soulfriend-Profile: 1` forces it
+
+    Add it before other middleware so route handlers run beneath its frame.
+    Samples are stored under "<prefix> METHOD /route/template".
+    """
+
+    def __init__(self, app, profiler: Optional[SamplingProfiler] = None, prefix: str = "api"):
+        self.app = app
+        self.profiler = profiler or get_sampling_profiler()
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        force = (PROFILE_HEADER, b"1") in scope.get("headers", [])
+        session = self.profiler.start(f"{self.prefix} {scope['method']} {scope['path']}", force=force)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            path = getattr(scope.get("route"), "path", None)
+            session.stop(f"{self.prefix} {scope['method']} {path}" if path else None)
+
+def profile_fastapi(app, profiler: Optional[SamplingProfiler] = None, prefix: str = "api"):
+    """Install ProfilingMiddleware; call before instrument_fastapi"""
+    profiler = profiler or get_sampling_profiler()
+    app.add_middleware(ProfilingMiddleware, profiler=profiler, prefix=prefix)
+    return profiler
+
+def read_collapsed(path) -> Counter:
+    """Collapsed-stack file -> Counter of stack -> samples"""
+    stacks: Counter = Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if stack and count.isdigit():
+                stacks[stack] += int(count)
+    return stacks
+
+def flamegraph_nodes(stacks: Counter, root: str = "all", min_fraction: float = 0.005) -> Dict[str, list]:
+    """ids/labels/parents/values for a plotly icicle (branchvalues="total"), dropping frames under min_fraction"""
+    total = sum(stacks.values())
+    values: Counter = Counter({root: total})
+    for stack, count in stacks.items():
+        path = root
+        for frame in stack.split(";"):
+            path = f"{path};{frame}"
+            values[path] += count
+
+    nodes = {"ids": [], "labels": [], "parents": [], "values": []}
+    threshold = total * min_fraction
+    for node_id, value in values.items():
+        if value < threshold:
+            continue
+        parent, _, label = node_id.rpartition(";")
+        nodes["ids"].append(node_id)
+        nodes["labels"].append(label)
+        nodes["parents"].append(parent)
+        nodes["values"].append(value)
+    return nodes
+
+_profiler: Optional[SamplingProfiler] = None
+_profiler_lock = threading.Lock()
+
+def get_sampling_profiler() -> SamplingProfiler:
+    """Process-wide profiler; aggregated stacks are flushed at exit"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = SamplingProfiler()
+            atexit.register(_profiler.flush)
+    return _profiler
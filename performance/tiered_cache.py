@@ -0,0 +1,423 @@
+"""
+SOULFRIEND V2.0 - Two-tier Cache with Cross-process Invalidation
+Bộ nhớ đệm hai tầng (L1 trong tiến trình, L2 dùng chung) với vô hiệu hóa giữa các tiến trình
+
+L1 is a lock-striped LRU/TTL cache private to each Streamlit/uvicorn worker;
+L2 is shared by all workers: Redis when it is reachable, otherwise a local
+SQLite file. Keys carry a per-namespace version, so invalidating a whole
+namespace is one version bump rather than a scan. Invalidations are announced
+on a Redis pub/sub channel or appended to an SQLite log that every process
+polls. Each poll also re-reads the versions of the namespaces in use, so a
+missed announcement delays a namespace bump by at most poll_interval and a
+key invalidation by at most the L1 TTL.
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import deque
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from performance.caching import (
+    MISSING, AtomicCounters, SingleFlight, StripedCache, UncacheableArgument, function_namespace, make_cache_key
+)
+from storage.sqlite_store import SQLiteStore, get_store
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Invalidation log rows and expired entries older than this are pruned
+INVALIDATION_RETENTION_SECONDS = 3600
+PRUNE_EVERY = 500
+
+# (namespace, key); key None means the whole namespace moved to a new version
+Invalidation = Tuple[str, Optional[str]]
+
+def _create_cache_schema_v1(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            namespace TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            namespace TEXT NOT NULL,
+            key TEXT,
+            origin TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+
+class SQLiteL2:
+    """Shared tier in a local SQLite file; invalidations are rows of a log polled by every process"""
+
+    name = "sqlite"
+
+    def __init__(self, store: SQLiteStore, origin: str):
+        self.store = store
+        self.origin = origin
+        self.store.migrate([_create_cache_schema_v1])
+        with self.store.connection() as conn:
+            self._last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM cache_invalidations").fetchone()[0]
+        self._published = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.store.connection() as conn:
+            row = conn.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row[0]
+
+    def set(self, key: str, value: bytes, ttl: Optional[float]):
+        expires_at = time.time() + ttl if ttl else None
+        with self.store.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                         (key, value, expires_at))
+
+    def delete(self, key: str):
+        with self.store.connection() as conn:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def get_version(self, namespace: str) -> int:
+        with self.store.connection() as conn:
+            row = conn.execute("SELECT version FROM cache_versions WHERE namespace = ?", (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def get_versions(self, namespaces: List[str]) -> Dict[str, int]:
+        placeholders = ",".join("?" * len(namespaces))
+        with self.store.connection() as conn:
+            rows = conn.execute(f"SELECT namespace, version FROM cache_versions WHERE namespace IN ({placeholders})",
+                                namespaces).fetchall()
+        versions = dict.fromkeys(namespaces, 0)
+        versions.update(rows)
+        return versions
+
+    def bump_version(self, namespace: str) -> int:
+        with self.store.connection() as conn:
+            conn.execute('''
+                INSERT INTO cache_versions (namespace, version) VALUES (?, 1)
+                ON CONFLICT(namespace) DO UPDATE SET version = version + 1
+            ''', (namespace,))
+            return conn.execute("SELECT version FROM cache_versions WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def publish(self, namespace: str, key: Optional[str]):
+        now = time.time()
+        with self.store.connection() as conn:
+            conn.execute("INSERT INTO cache_invalidations (namespace, key, origin, created_at) VALUES (?, ?, ?, ?)",
+                         (namespace, key, self.origin, now))
+            self._published += 1
+            if self._published % PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM cache_invalidations WHERE created_at < ?",
+                             (now - INVALIDATION_RETENTION_SECONDS,))
+                conn.execute("DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+
+    def poll(self) -> List[Invalidation]:
+        """Invalidations published by other processes since the last poll"""
+        with self.store.connection() as conn:
+            rows = conn.execute(
+                "SELECT seq, namespace, key, origin FROM cache_invalidations WHERE seq > ? ORDER BY seq",
+                (self._last_seq,)
+            ).fetchall()
+        if rows:
+            self._last_seq = rows[-1][0]
+        return [(namespace, key) for _, namespace, key, origin in rows if origin != self.origin]
+
+    def clear(self):
+        with self.store.connection() as conn:
+            conn.execute("DELETE FROM cache_entries")
+
+    def close(self):
+        pass
+
+class RedisL2:
+    """Shared tier in Redis; invalidations are announced on a pub/sub channel"""
+
+    name = "redis"
+
+    def __init__(self, client, origin: str, prefix: str = "soulfriend:l2:"):
+        self.client = client
+        self.origin = origin
+        self.prefix = prefix
+        self.channel = prefix + "invalidations"
+        self._received: deque = deque()
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: self._on_message})
+        self._listener = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def _on_message(self, message):
+        try:
+            origin, namespace, key = message["data"].decode("utf-8").split("\x1f")
+        except (AttributeError, ValueError):
+            return
+        if origin != self.origin:
+            self._received.append((namespace, key or None))
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float]):
+        if ttl:
+            self.client.set(self.prefix + key, value, px=int(ttl * 1000))
+        else:
+            self.client.set(self.prefix + key, value)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def get_version(self, namespace: str) -> int:
+        value = self.client.get(self.prefix + "version:" + namespace)
+        return int(value) if value is not None else 0
+
+    def get_versions(self, namespaces: List[str]) -> Dict[str, int]:
+        values = self.client.mget([self.prefix + "version:" + namespace for namespace in namespaces])
+        return {namespace: int(value) if value is not None else 0 for namespace, value in zip(namespaces, values)}
+
+    def bump_version(self, namespace: str) -> int:
+        return int(self.client.incr(self.prefix + "version:" + namespace))
+
+    def publish(self, namespace: str, key: Optional[str]):
+        self.client.publish(self.channel, "\x1f".join((self.origin, namespace, key or "")))
+
+    def poll(self) -> List[Invalidation]:
+        received = []
+        while self._received:
+            received.append(self._received.popleft())
+        return received
+
+    def clear(self):
+        # Only our entries; the Redis database may be shared and versions must keep increasing
+        versions = (self.prefix + "version:").encode("utf-8")
+        for key in self.client.scan_iter(match=self.prefix + "*", count=500):
+            if not key.startswith(versions):
+                self.client.delete(key)
+
+    def close(self):
+        self._listener.stop()
+        self._pubsub.close()
+
+class TieredCache:
+    """In-process L1 in front of an optional shared L2, with versioned keys"""
+
+    def __init__(self, l2=None, l1_maxsize: int = 1000, l1_ttl: float = 30.0,
+                 poll_interval: float = 1.0, default_ttl: Optional[float] = 3600):
+        self.l1 = StripedCache(maxsize=l1_maxsize, ttl=l1_ttl)
+        self.l2 = l2
+        self.poll_interval = poll_interval
+        self.default_ttl = default_ttl
+        self.counters = AtomicCounters(["l1_hits", "l2_hits", "misses", "l2_errors", "invalidations_received"])
+        self._single_flight = SingleFlight()
+        self._versions: Dict[str, int] = {}
+        self._versions_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._last_poll = 0.0
+
+    @property
+    def backend(self) -> str:
+        return self.l2.name if self.l2 is not None else "memory"
+
+    def _l2_call(self, method: str, *args, default=None):
+        if self.l2 is None:
+            return default
+        try:
+            return getattr(self.l2, method)(*args)
+        except Exception as e:
+            self.counters.increment("l2_errors")
+            logger.warning(f"L2 cache {method} failed: {e}")
+            return default
+
+    def _version(self, namespace: str) -> int:
+        with self._versions_lock:
+            version = self._versions.get(namespace)
+        if version is None:
+            version = self._l2_call("get_version", namespace, default=0)
+            with self._versions_lock:
+                version = self._versions.setdefault(namespace, version)
+        return version
+
+    def versioned_key(self, namespace: str, key: str) -> str:
+        return f"{namespace}:v{self._version(namespace)}:{key}"
+
+    def sync(self, force: bool = False):
+        """Apply invalidations from other processes and refresh namespace versions (at most once per poll_interval)"""
+        if self.l2 is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_poll < self.poll_interval:
+            return
+        if not self._sync_lock.acquire(blocking=force):
+            return  # another thread is polling
+        try:
+            self._last_poll = now
+            for namespace, key in self._l2_call("poll", default=[]):
+                self.counters.increment("invalidations_received")
+                if key is None:
+                    version = self._l2_call("get_version", namespace, default=None)
+                    with self._versions_lock:
+                        if version is None:
+                            self._versions.pop(namespace, None)
+                        else:
+                            self._versions[namespace] = max(version, self._versions.get(namespace, 0))
+                else:
+                    self.l1.delete(self.versioned_key(namespace, key))
+            self._refresh_versions()
+        finally:
+            self._sync_lock.release()
+
+    def _refresh_versions(self):
+        # Bumps whose announcement was lost (pub/sub is fire-and-forget) are picked up here
+        with self._versions_lock:
+            namespaces = list(self._versions)
+        if not namespaces:
+            return
+        versions = self._l2_call("get_versions", namespaces, default={})
+        with self._versions_lock:
+            for namespace, version in versions.items():
+                if namespace in self._versions:
+                    self._versions[namespace] = max(version, self._versions[namespace])
+
+    def get(self, namespace: str, key: str) -> Any:
+        """Cached value, or MISSING"""
+        value = self._lookup(namespace, key)
+        if value is MISSING:
+            self.counters.increment("misses")
+        return value
+
+    def _lookup(self, namespace: str, key: str) -> Any:
+        self.sync()
+        vkey = self.versioned_key(namespace, key)
+        value = self.l1.get(vkey)
+        if value is not MISSING:
+            self.counters.increment("l1_hits")
+            return value
+        blob = self._l2_call("get", vkey)
+        if blob is not None:
+            try:
+                value = pickle.loads(blob)
+            except Exception as e:
+                logger.warning(f"Discarding unreadable L2 entry {vkey}: {e}")
+            else:
+                self.counters.increment("l2_hits")
+                self.l1.set(vkey, value)
+                return value
+        return MISSING
+
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None, shared: bool = True):
+        """Store in L1 and, when shared, in L2 (values must be picklable)
+
+        Shared entries live in L1 for at most the L1 TTL; process-local entries
+        rely on invalidation alone and keep the given ttl.
+        """
+        vkey = self.versioned_key(namespace, key)
+        self.l1.set(vkey, value, ttl=None if shared else ttl)
+        if shared and self.l2 is not None:
+            try:
+                blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                logger.warning(f"Not sharing {vkey}: {e}")
+                return
+            self._l2_call("set", vkey, blob, ttl if ttl is not None else self.default_ttl)
+
+    def get_or_load(self, namespace: str, key: str, loader: Callable[[], Any],
+                    ttl: Optional[float] = None, shared: bool = True) -> Any:
+        """Cached value, loading it once per process on a miss; loader errors are not cached"""
+        value = self.get(namespace, key)
+        if value is not MISSING:
+            return value
+
+        def load():
+            # Another thread may have filled the entry while we waited to lead
+            value = self._lookup(namespace, key)
+            if value is MISSING:
+                value = loader()
+                self.set(namespace, key, value, ttl=ttl, shared=shared)
+            return value
+
+        return self._single_flight.do(self.versioned_key(namespace, key), load)[0]
+
+    def invalidate(self, namespace: str, key: Optional[str] = None):
+        """Drop one key, or the whole namespace by moving it to a new version, in every process"""
+        if key is None:
+            version = self._l2_call("bump_version", namespace, default=None)
+            with self._versions_lock:
+                current = self._versions.get(namespace, 0)
+                self._versions[namespace] = version if version is not None else current + 1
+        else:
+            vkey = self.versioned_key(namespace, key)
+            self.l1.delete(vkey)
+            self._l2_call("delete", vkey)
+        self._l2_call("publish", namespace, key)
+
+    def cached(self, namespace: Optional[str] = None, ttl: Optional[float] = None, shared: bool = True):
+        """Decorator: results keyed by canonical arguments; invalidate(namespace) drops them all"""
+        def decorator(func):
+            cache_namespace = namespace or function_namespace(func)
+
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                try:
+                    key = make_cache_key("args", args, kwargs)
+                except UncacheableArgument:
+                    return func(*args, **kwargs)
+                return self.get_or_load(cache_namespace, key, lambda: func(*args, **kwargs), ttl=ttl, shared=shared)
+
+            wrapper.cache_namespace = cache_namespace
+            return wrapper
+        return decorator
+
+    def clear(self):
+        self.l1.clear()
+        self._l2_call("clear")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "l1_size": len(self.l1), **self.counters.snapshot()}
+
+    def close(self):
+        self._l2_call("close")
+
+def build_l2(origin: str):
+    """Redis when reachable (SOULFRIEND_REDIS_URL), else the shared SQLite cache store"""
+    if REDIS_AVAILABLE:
+        url = os.getenv("SOULFRIEND_REDIS_URL", "redis://localhost:6379/0")
+        try:
+            client = redis.Redis.from_url(url, socket_connect_timeout=0.5, socket_timeout=2)
+            client.ping()
+            logger.info(f"✅ L2 cache using Redis at {url}")
+            return RedisL2(client, origin)
+        except Exception as e:
+            logger.warning(f"⚠️ Redis unavailable at {url} ({e}); L2 cache falls back to SQLite")
+    else:
+        logger.info("redis package not installed; L2 cache uses SQLite")
+
+    try:
+        return SQLiteL2(get_store("cache"), origin)
+    except Exception as e:
+        logger.warning(f"⚠️ SQLite L2 cache unavailable ({e}); caching in process memory only")
+        return None
+
+_tiered_cache: Optional[TieredCache] = None
+_tiered_cache_lock = threading.Lock()
+
+def get_tiered_cache() -> TieredCache:
+    """Process-wide two-tier cache"""
+    global _tiered_cache
+    with _tiered_cache_lock:
+        if _tiered_cache is None:
+            _tiered_cache = TieredCache(l2=build_l2(origin=f"{os.getpid()}-{uuid.uuid4().hex[:8]}"))
+        return _tiered_cache
@@ -0,0 +1,256 @@
+"""
+SOULFRIEND V2.0 - Downsampled Time Series for System Metrics
+Chuỗi thời gian giảm mẫu cho metrics hệ thống: bộ đệm vòng + tổng hợp đa độ phân giải
+
+Samples go into a preallocated ring buffer and a pending batch. Each flush
+writes the batch in one transaction: raw rows plus count/sum/min/max rollups
+at 1-minute and 1-hour resolution, upserted so partial buckets merge. Every
+tier is pruned to its retention (raw 1h, 1m 7d, 1h 1y), so storage stays
+bounded. Summaries read the finest tier that still covers the window.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from storage.sqlite_store import SQLiteStore
+
+@dataclass(frozen=True)
+class Resolution:
+    name: str
+    seconds: int  # bucket width; 0 for raw samples
+    retention: int  # seconds kept
+
+RAW = Resolution("raw", 0, 3600)
+ROLLUPS = (Resolution("1m", 60, 7 * 86400), Resolution("1h", 3600, 365 * 86400))
+
+def create_rollup_schema(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metric_rollups (
+            resolution INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            sample_count INTEGER NOT NULL,
+            value_sum REAL NOT NULL,
+            value_min REAL NOT NULL,
+            value_max REAL NOT NULL,
+            PRIMARY KEY (resolution, metric, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+def _sql_timestamp(epoch: float) -> str:
+    """Same UTC text format as SQLite's CURRENT_TIMESTAMP"""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+class RingBuffer:
+    """Fixed-capacity ring of (timestamp, values) rows in preallocated arrays"""
+
+    def __init__(self, capacity: int, width: int):
+        self.timestamps = np.zeros(capacity)
+        self.values = np.zeros((capacity, width))
+        self._next = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, timestamp: float, row: Sequence[float]):
+        with self._lock:
+            self.timestamps[self._next] = timestamp
+            self.values[self._next] = row
+            self._next = (self._next + 1) % len(self.timestamps)
+            self._count = min(self._count + 1, len(self.timestamps))
+
+    def since(self, start: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows with timestamp >= start, oldest first"""
+        with self._lock:
+            order = np.arange(self._next - self._count, self._next) % len(self.timestamps)
+            timestamps, values = self.timestamps[order], self.values[order]
+        keep = timestamps >= start
+        return timestamps[keep], values[keep]
+
+    @property
+    def capacity(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def oldest(self) -> Optional[float]:
+        with self._lock:
+            if not self._count:
+                return None
+            return float(self.timestamps[(self._next - self._count) % len(self.timestamps)])
+
+    def __len__(self) -> int:
+        return self._count
+
+def rollup(timestamps: np.ndarray, values: np.ndarray, seconds: int) -> List[Tuple[int, int, float, float, float, int]]:
+    """(bucket, count, sum, min, max, column) per bucket and column"""
+    buckets, inverse = np.unique((timestamps // seconds).astype(np.int64) * seconds, return_inverse=True)
+    width = values.shape[1]
+    counts = np.bincount(inverse, minlength=len(buckets))
+    sums = np.zeros((len(buckets), width))
+    mins = np.full((len(buckets), width), np.inf)
+    maxs = np.full((len(buckets), width), -np.inf)
+    np.add.at(sums, inverse, values)
+    np.minimum.at(mins, inverse, values)
+    np.maximum.at(maxs, inverse, values)
+    return [(int(bucket), int(counts[i]), float(sums[i, c]), float(mins[i, c]), float(maxs[i, c]), c)
+            for i, bucket in enumerate(buckets) for c in range(width)]
+
+class MetricsTimeSeries:
+    """Ring buffer + batched multi-resolution rollups for a fixed set of numeric metrics"""
+
+    def __init__(self, store: SQLiteStore, fields: Sequence[str], raw_table: str,
+                 raw_extra_columns: Sequence[str] = (), capacity: int = 3600,
+                 batch_size: int = 100, flush_interval: float = 300.0, prune_interval: float = 600.0):
+        self.store = store
+        self.fields = list(fields)
+        self.raw_table = raw_table
+        self.raw_extra_columns = list(raw_extra_columns)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.prune_interval = prune_interval
+        self.ring = RingBuffer(capacity, len(self.fields))
+        self.started_at = time.time()
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: List[Tuple[float, List[float], List[Any]]] = []
+        self._last_flush = time.monotonic()
+        self._last_prune = 0.0
+
+    def record(self, values: Dict[str, float], timestamp: Optional[float] = None, **extra):
+        """Add one sample; extra values fill raw_extra_columns of the raw row"""
+        timestamp = time.time() if timestamp is None else timestamp
+        row = [float(values.get(field) or 0.0) for field in self.fields]
+        self.ring.append(timestamp, row)
+        with self._lock:
+            self._pending.append((timestamp, row, [extra.get(column) for column in self.raw_extra_columns]))
+            due = (len(self._pending) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush(now=timestamp)
+
+    def flush(self, now: Optional[float] = None) -> int:
+        """Write pending samples (raw rows and rollups) in one transaction; returns the number written"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._last_flush = time.monotonic()
+            now = time.time() if now is None else now
+            prune = now - self._last_prune >= self.prune_interval
+            if not pending and not prune:
+                return 0
+
+            try:
+                with self.store.connection() as conn:
+                    if pending:
+                        self._write(conn, pending)
+                    if prune:
+                        self._prune(conn, now)
+            except Exception:
+                # Keep the samples for the next attempt
+                with self._lock:
+                    self._pending = pending + self._pending
+                raise
+            if prune:
+                self._last_prune = now
+            return len(pending)
+
+    def _write(self, conn, pending):
+        columns = ["timestamp"] + self.fields + self.raw_extra_columns
+        conn.executemany(
+            f"INSERT INTO {self.raw_table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [[_sql_timestamp(timestamp)] + row + extra for timestamp, row, extra in pending]
+        )
+
+        timestamps = np.array([timestamp for timestamp, _, _ in pending])
+        values = np.array([row for _, row, _ in pending])
+        rows = []
+        for resolution in ROLLUPS:
+            rows += [(resolution.seconds, self.fields[column], bucket, count, total, low, high)
+                     for bucket, count, total, low, high, column in rollup(timestamps, values, resolution.seconds)]
+        conn.executemany('''
+            INSERT INTO metric_rollups (resolution, metric, bucket, sample_count, value_sum, value_min, value_max)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(resolution, metric, bucket) DO UPDATE SET
+                sample_count = sample_count + excluded.sample_count,
+                value_sum = value_sum + excluded.value_sum,
+                value_min = MIN(value_min, excluded.value_min),
+                value_max = MAX(value_max, excluded.value_max)
+        ''', rows)
+
+    def _prune(self, conn, now: float):
+        conn.execute(f"DELETE FROM {self.raw_table} WHERE timestamp < ?", (_sql_timestamp(now - RAW.retention),))
+        for resolution in ROLLUPS:
+            conn.execute("DELETE FROM metric_rollups WHERE resolution = ? AND bucket < ?",
+                         (resolution.seconds, int(now - resolution.retention)))
+
+    def resolution_for(self, seconds: float) -> Resolution:
+        """Finest tier whose retention covers a window of this length"""
+        for resolution in (RAW,) + ROLLUPS:
+            if seconds <= resolution.retention:
+                return resolution
+        return ROLLUPS[-1]
+
+    def summary(self, hours: float = 24, now: Optional[float] = None) -> Dict[str, Any]:
+        """Average, minimum and maximum of every metric over the last `hours`"""
+        now = time.time() if now is None else now
+        since = now - hours * 3600
+        resolution = self.resolution_for(hours * 3600)
+        metrics: Dict[str, Dict[str, float]] = {}
+
+        ring_covers = len(self.ring) < self.ring.capacity or (self.ring.oldest or now) <= since
+        if resolution is RAW and self.started_at <= since and ring_covers:
+            # This process has sampled the whole window: answer from memory
+            source = "memory"
+            _, values = self.ring.since(since)
+            sample_count = len(values)
+            for column, field in enumerate(self.fields):
+                if sample_count:
+                    metrics[field] = {"avg": float(values[:, column].mean()),
+                                      "min": float(values[:, column].min()),
+                                      "max": float(values[:, column].max())}
+        else:
+            source = resolution.name
+            self.flush(now=now)
+            with self.store.connection() as conn:
+                if resolution is RAW:
+                    selects = ", ".join(f"AVG({f}), MIN({f}), MAX({f})" for f in self.fields)
+                    row = conn.execute(f"SELECT COUNT(*), {selects} FROM {self.raw_table} WHERE timestamp >= ?",
+                                       (_sql_timestamp(since),)).fetchone()
+                    sample_count = row[0]
+                    for column, field in enumerate(self.fields):
+                        if sample_count:
+                            avg, low, high = row[1 + 3 * column:4 + 3 * column]
+                            metrics[field] = {"avg": avg, "min": low, "max": high}
+                else:
+                    rows = conn.execute('''
+                        SELECT metric, SUM(sample_count), SUM(value_sum), MIN(value_min), MAX(value_max)
+                        FROM metric_rollups
+                        WHERE resolution = ? AND bucket >= ?
+                        GROUP BY metric
+                    ''', (resolution.seconds, int(since // resolution.seconds) * resolution.seconds)).fetchall()
+                    sample_count = 0
+                    for metric, count, total, low, high in rows:
+                        sample_count = max(sample_count, count)
+                        metrics[metric] = {"avg": total / count, "min": low, "max": high}
+
+        return {"resolution": source, "sample_count": sample_count, "metrics": metrics}
+
+    def series(self, metric: str, hours: float = 24, now: Optional[float] = None) -> List[Tuple[int, float]]:
+        """(bucket start, average) points for one metric from the rollup tier covering the window"""
+        now = time.time() if now is None else now
+        resolution = self.resolution_for(hours * 3600)
+        if resolution is RAW:
+            resolution = ROLLUPS[0]
+        self.flush(now=now)
+        since = int((now - hours * 3600) // resolution.seconds) * resolution.seconds
+        with self.store.connection() as conn:
+            rows = conn.execute('''
+                SELECT bucket, value_sum / sample_count FROM metric_rollups
+                WHERE resolution = ? AND metric = ? AND bucket >= ?
+                ORDER BY bucket
+            ''', (resolution.seconds, metric, since)).fetchall()
+        return [(bucket, avg) for bucket, avg in rows]
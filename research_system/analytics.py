@@ -15,46 +15,100 @@ import os
 import logging
 from pathlib import Path
 
+from .analytics_state import AnalyticsState
+from .event_files import PYARROW_AVAILABLE, extract_payload_field, list_event_files, load_events
+from .funnels import build_funnels
+from .parallel_aggregation import aggregate_event_files
+from .window_cache import WindowCache
+from .sql_engine import ResearchSQLEngine, engine_requested
+
+try:
+    from performance.caching import make_cache_key
+    from performance.tiered_cache import get_tiered_cache
+    TIERED_CACHE_AVAILABLE = True
+except ImportError:
+    TIERED_CACHE_AVAILABLE = False
+
+# Dashboard aggregates are shared by all dashboard workers through the two-tier cache
+DASHBOARD_AGGREGATES_NAMESPACE = "dashboard_aggregates"
+DASHBOARD_AGGREGATES_TTL = 300
+
+# Multiplier for the positional journey hash (arithmetic wraps modulo 2**64)
+JOURNEY_HASH_BASE = np.uint64(1099511628211)
+
+def count_session_journeys(df: pd.DataFrame, top_n: int = 10) -> Dict[str, int]:
+    """Most common per-session event sequences, using one sort and array reductions
+
+    Event types are integer-encoded and each session's sequence is reduced to a
+    positional 64-bit hash (mixed with its length); only the top sequences are
+    decoded back to "a -> b -> c" strings.
+    """
+    sort_keys = ['session_id', 'timestamp'] if 'timestamp' in df.columns else ['session_id']
+    ordered = df[sort_keys + ['event_type']].dropna(subset=['session_id', 'event_type'])
+    if ordered.empty:
+        return {}
+    ordered = ordered.sort_values(sort_keys, kind='stable')
+    
+    type_codes, type_labels = pd.factorize(ordered['event_type'])
+    session_codes = pd.factorize(ordered['session_id'])[0]
+    
+    starts = np.flatnonzero(np.r_[True, session_codes[1:] != session_codes[:-1]])
+    lengths = np.diff(np.r_[starts, len(session_codes)])
+    positions = np.arange(len(session_codes)) - np.repeat(starts, lengths)
+    
+    with np.errstate(over='ignore'):
+        powers = np.cumprod(np.full(int(lengths.max()), JOURNEY_HASH_BASE, dtype=np.uint64))
+        terms = (type_codes.astype(np.uint64) + np.uint64(1)) * powers[positions]
+        hashes = np.add.reduceat(terms, starts) ^ (lengths.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15))
+    
+    counts = pd.Series(hashes).value_counts().head(top_n)
+    first_session = pd.Series(np.arange(len(hashes))).groupby(hashes).first()
+    
+    journeys = {}
+    for journey_hash, count in counts.items():
+        session = first_session[journey_hash]
+        codes = type_codes[starts[session]:starts[session] + lengths[session]]
+        journeys[" -> ".join(str(type_labels[code]) for code in codes)] = int(count)
+    return journeys
+
 class ResearchAnalytics:
     """Advanced analytics for research data collection"""
     
-    def __init__(self, data_dir: str = "research_data"):
+    def __init__(self, data_dir: str = "research_data", database=None):
         self.data_dir = Path(data_dir)
+        self.database = database
         self.logger = logging.getLogger(__name__)
+        self.state = AnalyticsState(self.data_dir, window_days=30)
+        # Opt-in DuckDB engine (RESEARCH_ANALYTICS_ENGINE=duckdb); pandas stays the default
+        self.sql_engine = ResearchSQLEngine(self.data_dir) if engine_requested() else None
+        # Shared, memory-mapped copy of the last loaded window for dashboards
+        self.window_cache = WindowCache(self.data_dir) if PYARROW_AVAILABLE else None
         
-    def load_collected_data(self, days_back: int = 30) -> pd.DataFrame:
-        """Load collected research data from files"""
+    def load_collected_data(self, days_back: int = 30, end_date: Optional[datetime] = None) -> pd.DataFrame:
+        """Load collected research data from the daily event files
+
+        Only partitions whose file date overlaps the window are opened, and raw
+        JSONL files are streamed in chunks; session_id/event_type come back as
+        categoricals and the remaining text columns as Arrow-backed strings.
+        """
         try:
-            data_files = list(self.data_dir.glob("events_*.json"))
-            all_events = []
-            
-            cutoff_date = datetime.now() - timedelta(days=days_back)
-            
-            for file_path in data_files:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        events = json.load(f)
-                        
-                    for event in events:
-                        event_time = datetime.fromisoformat(event.get('timestamp', ''))
-                        if event_time >= cutoff_date:
-                            all_events.append(event)
-                            
-                except (json.JSONDecodeError, ValueError) as e:
-                    self.logger.warning(f"Could not parse {file_path}: {e}")
-                    continue
-            
-            if not all_events:
-                return pd.DataFrame()
-                
-            df = pd.DataFrame(all_events)
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            return df
+            cutoff_date = (end_date or datetime.now()) - timedelta(days=days_back)
+            return load_events(self.data_dir, start=cutoff_date, end=end_date)
             
         except Exception as e:
             self.logger.error(f"Error loading data: {e}")
             return pd.DataFrame()
     
+    def load_window(self, days_back: int = 30) -> pd.DataFrame:
+        """The last `days_back` days of events for dashboards, via the Arrow window cache"""
+        if self.window_cache is None:
+            return self.load_collected_data(days_back=days_back)
+        try:
+            return self.window_cache.load(days_back=days_back)
+        except Exception as e:
+            self.logger.warning(f"Window cache unavailable, loading directly: {e}")
+            return self.load_collected_data(days_back=days_back)
+    
     def generate_usage_statistics(self, df: pd.DataFrame) -> Dict[str, Any]:
         """Generate comprehensive usage statistics"""
         if df.empty:
@@ -96,7 +150,7 @@ class ResearchAnalytics:
         
         # Session analysis
         if 'session_id' in df.columns:
-            session_events = df.groupby('session_id').size()
+            session_events = df.groupby('session_id', observed=True).size()
             stats["session_analysis"] = {
                 "avg_events_per_session": float(session_events.mean()) if not session_events.empty else 0,
                 "max_events_per_session": int(session_events.max()) if not session_events.empty else 0,
@@ -117,6 +171,12 @@ class ResearchAnalytics:
                     "completion_rate": (completed / started * 100) if started > 0 else 0
                 }
         
+        # Per instrument and cohort funnels with drop-off per question
+        if 'session_id' in df.columns and 'event_type' in df.columns:
+            funnels = build_funnels(df)
+            if funnels:
+                stats["completion_funnels"] = funnels
+        
         return stats
     
     def analyze_user_behavior_patterns(self, df: pd.DataFrame) -> Dict[str, Any]:
@@ -128,7 +188,7 @@ class ResearchAnalytics:
         
         # Session duration analysis
         if 'session_id' in df.columns and 'timestamp' in df.columns:
-            session_times = df.groupby('session_id')['timestamp'].agg(['min', 'max'])
+            session_times = df.groupby('session_id', observed=True)['timestamp'].agg(['min', 'max'])
             session_durations = (session_times['max'] - session_times['min']).dt.total_seconds() / 60  # in minutes
             
             patterns["session_duration"] = {
@@ -140,40 +200,106 @@ class ResearchAnalytics:
             }
         
         # Most popular questionnaires
-        if 'event_data' in df.columns:
-            questionnaire_types = []
-            for _, row in df.iterrows():
-                if row.get('event_type') == 'questionnaire_started':
-                    try:
-                        event_data = json.loads(row['event_data']) if isinstance(row['event_data'], str) else row['event_data']
-                        questionnaire_types.append(event_data.get('questionnaire_type', 'unknown'))
-                    except:
-                        continue
+        if 'event_type' in df.columns and ('questionnaire_type' in df.columns or 'event_data' in df.columns):
+            started = df[df['event_type'] == 'questionnaire_started']
+            if 'questionnaire_type' in started.columns:
+                # Pre-flattened payload column (event files and database frames)
+                questionnaire_types = started['questionnaire_type']
+            else:
+                questionnaire_types = extract_payload_field(started['event_data'], 'questionnaire_type')
             
-            if questionnaire_types:
-                from collections import Counter
-                questionnaire_counts = Counter(questionnaire_types)
-                patterns["popular_questionnaires"] = dict(questionnaire_counts.most_common())
+            if not started.empty:
+                counts = questionnaire_types.astype(object).fillna('unknown').value_counts()
+                patterns["popular_questionnaires"] = {str(k): int(v) for k, v in counts.items()}
         
         # User journey analysis
         if 'session_id' in df.columns and 'event_type' in df.columns:
-            journey_patterns = {}
-            
-            for session_id in df['session_id'].unique():
-                session_events = df[df['session_id'] == session_id].sort_values('timestamp')
-                journey = " -> ".join(session_events['event_type'].tolist())
-                
-                if journey in journey_patterns:
-                    journey_patterns[journey] += 1
-                else:
-                    journey_patterns[journey] = 1
-            
-            # Get top 10 most common journeys
-            sorted_journeys = sorted(journey_patterns.items(), key=lambda x: x[1], reverse=True)[:10]
-            patterns["common_user_journeys"] = dict(sorted_journeys)
+            patterns["common_user_journeys"] = count_session_journeys(df, top_n=10)
         
         return patterns
     
+    def get_usage_statistics(self, days_back: int = 30, end_date: Optional[datetime] = None) -> Dict[str, Any]:
+        """Usage statistics for a window, computed in SQL when the engine is enabled"""
+        if self.sql_engine is not None:
+            end = end_date or datetime.now()
+            return self.sql_engine.usage_statistics(end - timedelta(days=days_back), end)
+        return self.generate_usage_statistics(self.load_collected_data(days_back=days_back, end_date=end_date))
+    
+    def get_behavior_patterns(self, days_back: int = 30, end_date: Optional[datetime] = None) -> Dict[str, Any]:
+        """Behaviour patterns for a window, computed in SQL when the engine is enabled"""
+        if self.sql_engine is not None:
+            end = end_date or datetime.now()
+            return self.sql_engine.behavior_patterns(end - timedelta(days=days_back), end)
+        return self.analyze_user_behavior_patterns(self.load_collected_data(days_back=days_back, end_date=end_date))
+    
+    def get_dashboard_aggregates(self, days_back: int = 30) -> Dict[str, Any]:
+        """Usage statistics and behaviour patterns of the rolling window ({} when there is no data)
+
+        Results are keyed by the ingest watermark (size and mtime of every
+        partition in the window), so each dashboard worker reuses the first
+        computation until new events arrive or the TTL passes.
+        """
+        def compute():
+            df = self.load_window(days_back=days_back)
+            if df.empty:
+                return {}
+            return {
+                "usage_statistics": self.generate_usage_statistics(df),
+                "behavior_patterns": self.analyze_user_behavior_patterns(df)
+            }
+        
+        if not TIERED_CACHE_AVAILABLE:
+            return compute()
+        try:
+            start = datetime.now() - timedelta(days=days_back)
+            watermark = []
+            for _, path in list_event_files(self.data_dir, start):
+                stat = path.stat()
+                watermark.append([path.name, stat.st_size, stat.st_mtime_ns])
+        except OSError as e:
+            self.logger.warning(f"Could not read the ingest watermark: {e}")
+            return compute()
+        
+        key = make_cache_key("aggregates", (str(self.data_dir.resolve()), days_back, watermark))
+        return get_tiered_cache().get_or_load(DASHBOARD_AGGREGATES_NAMESPACE, key, compute,
+                                              ttl=DASHBOARD_AGGREGATES_TTL)
+    
+    def aggregate_history(self, days_back: int = 365, end_date: Optional[datetime] = None,
+                          workers: Optional[int] = None) -> Dict[str, Any]:
+        """Backfill usage and behaviour aggregates with one worker process per daily file"""
+        end = end_date or datetime.now()
+        return aggregate_event_files(self.data_dir, start=end - timedelta(days=days_back), end=end, workers=workers)
+    
+    def update_state(self) -> int:
+        """Fold newly appended events into the checkpointed aggregates"""
+        return self.state.update()
+    
+    def get_funnels(self, days_back: int = 30) -> Dict[str, Dict[str, Any]]:
+        """Cached per instrument/cohort funnels from the incremental state"""
+        return self.state.funnels.compute(days_back=days_back)
+    
+    def get_reliability(self, instrument: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Cronbach's alpha, item-total correlations and item means from the streaming moments"""
+        return self.state.psychometrics.statistics(instrument)
+    
+    def get_session_statistics(self, days_back: int = 30) -> Dict[str, Any]:
+        """Session durations from research_sessions when a database is attached, else from raw events"""
+        if self.database is not None:
+            return self.database.get_session_statistics(days_back=days_back)
+        
+        patterns = self.get_behavior_patterns(days_back=days_back)
+        return {"session_duration": patterns["session_duration"]} if "session_duration" in patterns else patterns
+    
+    def get_questionnaire_popularity(self, days_back: int = 30) -> Dict[str, int]:
+        """Questionnaire popularity, aggregated by the research database when one is attached"""
+        if self.database is not None:
+            return self.database.get_questionnaire_popularity(days_back=days_back)
+        if self.sql_engine is not None:
+            return self.get_behavior_patterns(days_back=days_back).get("popular_questionnaires", {})
+        
+        df = self.load_collected_data(days_back=days_back)
+        return self.analyze_user_behavior_patterns(df).get("popular_questionnaires", {}) if not df.empty else {}
+    
     def generate_privacy_compliance_report(self, df: pd.DataFrame) -> Dict[str, Any]:
         """Generate privacy compliance report"""
         report = {
@@ -244,24 +370,25 @@ class ResearchAnalytics:
     def export_analytics_report(self, output_file: str = None) -> str:
         """Export comprehensive analytics report"""
         try:
-            # Load data
-            df = self.load_collected_data(days_back=30)
+            # Only events appended since the last checkpoint are read
+            self.update_state()
             
             # Generate all analytics
-            usage_stats = self.generate_usage_statistics(df)
-            behavior_patterns = self.analyze_user_behavior_patterns(df)
-            privacy_report = self.generate_privacy_compliance_report(df)
+            usage_stats = self.state.usage_statistics(days_back=30)
+            behavior_patterns = self.state.behavior_patterns(days_back=30)
+            privacy_report = self.generate_privacy_compliance_report(self.state.privacy_sample(days_back=30))
             
             # Compile full report
             full_report = {
                 "report_metadata": {
                     "generated_at": datetime.now().isoformat(),
                     "data_period_days": 30,
-                    "total_events_analyzed": len(df),
+                    "total_events_analyzed": usage_stats.get("overview", {}).get("total_events", 0),
                     "report_version": "1.0"
                 },
                 "usage_statistics": usage_stats,
                 "behavior_patterns": behavior_patterns,
+                "instrument_reliability": self.get_reliability(),
                 "privacy_compliance": privacy_report
             }
             
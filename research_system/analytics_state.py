@@ -0,0 +1,410 @@
+"""
+Incremental Analytics State
+Trạng thái Phân tích Gia tăng
+
+Mergeable aggregates over the research event files: hourly buckets of event
+counts, fixed-size per-session summaries (first/last, event count, funnel
+stage bitmask, journey id), journey counters and completion funnels. Journeys
+are nodes of a shared prefix trie, so a session's journey is extended in O(1)
+per event. The state is checkpointed (at most every checkpoint_interval
+seconds) together with the byte offset reached in every daily file, so each
+run only folds in new events and the sliding window expires whole buckets
+instead of recomputing.
+Mỗi lần chạy chỉ xử lý các sự kiện mới; cửa sổ trượt loại bỏ các bucket cũ.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from .event_files import (
+    EVENT_COLUMNS, list_event_files, normalize_event, partition_date, read_records_from, records_to_frame
+)
+from .funnels import FunnelEngine
+from .psychometrics import PsychometricsEngine
+
+BUCKET_FORMAT = "%Y-%m-%dT%H"
+
+# Stages of the completion funnel, in order
+FUNNEL_STAGES = ['session_started', 'questionnaire_started', 'questionnaire_completed', 'results_viewed']
+STAGE_BITS = {stage: 1 << i for i, stage in enumerate(FUNNEL_STAGES)}
+
+# Journey id of a session with no events yet (the trie root)
+EMPTY_JOURNEY = ''
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _payload(record: Dict[str, Any]) -> Dict[str, Any]:
+    payload = record.get('payload', record.get('event_data'))
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            return {}
+    return payload if isinstance(payload, dict) else {}
+
+def _extend_journey(journey: str, event_type: str) -> str:
+    """Id of the journey `journey -> event_type`"""
+    return hashlib.blake2b(f"{journey}\x1f{event_type}".encode(), digest_size=8).hexdigest()
+
+class AnalyticsState:
+    """Checkpointed, sliding-window aggregates for ResearchAnalytics"""
+
+    VERSION = 3
+
+    def __init__(self, data_dir: Path, checkpoint_path: Optional[Path] = None, window_days: int = 30,
+                 checkpoint_interval: float = 60.0):
+        self.data_dir = Path(data_dir)
+        self.checkpoint_path = Path(checkpoint_path) if checkpoint_path else self.data_dir / "analytics_state.json"
+        self.window_days = window_days
+        self.checkpoint_interval = checkpoint_interval
+        self._last_checkpoint: Optional[float] = None
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._reset()
+
+    def _reset(self):
+        # file name -> byte offset already folded in
+        self.offsets: Dict[str, int] = {}
+        # hour bucket -> {'events', 'event_types', 'questionnaires_started'}
+        self.buckets: Dict[str, Dict[str, Any]] = {}
+        # session id -> {'first', 'last', 'user_id', 'count', 'stages', 'journey'}
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        # journey id -> [parent journey id, last event type]
+        self.journey_nodes: Dict[str, List[str]] = {}
+        # journey id -> sessions in the window currently on that journey
+        self.journey_counts: Counter = Counter()
+        self.funnels = FunnelEngine()
+        # Cumulative (not windowed) item moments for reliability estimates
+        self.psychometrics = PsychometricsEngine()
+        self.last_event_time: Optional[str] = None
+        self.updated_at: Optional[str] = None
+
+    # Persistence
+
+    def load(self):
+        """Restore the last checkpoint, if there is a compatible one"""
+        with self._lock:
+            self._loaded = True
+            if not self.checkpoint_path.exists():
+                return
+            try:
+                with open(self.checkpoint_path, 'r', encoding='utf-8') as f:
+                    checkpoint = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                self.logger.warning(f"Ignoring unreadable analytics checkpoint {self.checkpoint_path}: {e}")
+                return
+
+            if checkpoint.get('version') != self.VERSION or checkpoint.get('window_days') != self.window_days:
+                self.logger.info("Analytics checkpoint is from a different layout; rebuilding")
+                return
+
+            self.offsets = checkpoint['offsets']
+            self.buckets = checkpoint['buckets']
+            self.sessions = checkpoint['sessions']
+            self.journey_nodes = checkpoint['journey_nodes']
+            self.journey_counts = Counter(checkpoint['journey_counts'])
+            self.funnels.load_dict(checkpoint.get('funnels', {}))
+            self.psychometrics.load_dict(checkpoint.get('psychometrics', {}))
+            self.last_event_time = checkpoint.get('last_event_time')
+            self.updated_at = checkpoint.get('updated_at')
+
+    def checkpoint(self):
+        """Write the state atomically next to the event files"""
+        with self._lock:
+            checkpoint = {
+                'version': self.VERSION,
+                'window_days': self.window_days,
+                'updated_at': self.updated_at,
+                'last_event_time': self.last_event_time,
+                'offsets': self.offsets,
+                'buckets': self.buckets,
+                'sessions': self.sessions,
+                'journey_nodes': self.journey_nodes,
+                'journey_counts': dict(self.journey_counts),
+                'funnels': self.funnels.to_dict(),
+                'psychometrics': self.psychometrics.to_dict()
+            }
+            self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.checkpoint_path.with_suffix('.tmp')
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f, ensure_ascii=False, separators=(',', ':'))
+            temporary.replace(self.checkpoint_path)
+            self._last_checkpoint = time.monotonic()
+
+    # Folding
+
+    def update(self, now: Optional[datetime] = None, force_checkpoint: bool = False) -> int:
+        """Fold in events appended since the last run, expire old buckets and checkpoint when due"""
+        now = now or datetime.now()
+        with self._lock:
+            if not self._loaded:
+                self.load()
+
+            window_start = now - timedelta(days=self.window_days)
+            today = datetime.utcnow().date()
+            folded = 0
+
+            for day, path in list_event_files(self.data_dir, start=window_start, end=now, prefer_raw=True):
+                offset = self.offsets.get(path.name, 0)
+                try:
+                    records, new_offset = read_records_from(path, offset, closed=day < today)
+                except (OSError, ValueError) as e:
+                    self.logger.warning(f"Could not read {path}: {e}")
+                    continue
+
+                if records:
+                    folded += self.fold(records, window_start)
+                    self.funnels.fold(records_to_frame(records))
+                self.offsets[path.name] = new_offset
+
+            self.expire(now)
+            self.updated_at = now.isoformat()
+            # Offsets are saved with the aggregates, so a skipped checkpoint only means re-folding later
+            if (force_checkpoint or self._last_checkpoint is None
+                    or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval):
+                self.checkpoint()
+            return folded
+
+    def fold(self, records: List[Dict[str, Any]], window_start: Optional[datetime] = None) -> int:
+        """Merge raw event records into the aggregates; returns how many were inside the window"""
+        folded = 0
+        with self._lock:
+            for record in records:
+                event_id, timestamp, session_id, user_id, event_type, _, questionnaire_type, _ = normalize_event(record)
+                event_time = _parse_timestamp(timestamp)
+                if event_time is None or not event_type or (window_start and event_time < window_start):
+                    continue
+
+                timestamp = event_time.isoformat()
+                bucket = self.buckets.setdefault(event_time.strftime(BUCKET_FORMAT), {
+                    'events': 0, 'event_types': {}, 'questionnaires_started': {}
+                })
+                bucket['events'] += 1
+                bucket['event_types'][event_type] = bucket['event_types'].get(event_type, 0) + 1
+                if event_type == 'questionnaire_started':
+                    key = questionnaire_type or 'unknown'
+                    bucket['questionnaires_started'][key] = bucket['questionnaires_started'].get(key, 0) + 1
+
+                if session_id:
+                    self._fold_session(session_id, user_id, timestamp, event_type)
+                if event_type in ('question_answered', 'questionnaire_completed'):
+                    self.psychometrics.fold_event(session_id, event_type, _payload(record), timestamp)
+
+                if self.last_event_time is None or timestamp > self.last_event_time:
+                    self.last_event_time = timestamp
+                folded += 1
+        return folded
+
+    def _fold_session(self, session_id: str, user_id: Optional[str], timestamp: str, event_type: str):
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = {
+                'first': timestamp, 'last': timestamp, 'user_id': user_id,
+                'count': 0, 'stages': 0, 'journey': EMPTY_JOURNEY
+            }
+        else:
+            self._decrement_journey(session['journey'])
+
+        # Journeys follow arrival order; late events are appended rather than re-sorted
+        journey = _extend_journey(session['journey'], event_type)
+        if journey not in self.journey_nodes:
+            self.journey_nodes[journey] = [session['journey'], event_type]
+        session['journey'] = journey
+        session['count'] += 1
+        session['stages'] |= STAGE_BITS.get(event_type, 0)
+        session['first'] = min(session['first'], timestamp)
+        session['last'] = max(session['last'], timestamp)
+        session['user_id'] = session['user_id'] or user_id
+        self.journey_counts[journey] += 1
+
+    def _decrement_journey(self, journey: str):
+        self.journey_counts[journey] -= 1
+        if self.journey_counts[journey] <= 0:
+            del self.journey_counts[journey]
+
+    def journey_text(self, journey: str) -> str:
+        """"a -> b -> c" for a journey id"""
+        steps = []
+        while journey != EMPTY_JOURNEY:
+            journey, event_type = self.journey_nodes[journey]
+            steps.append(event_type)
+        return " -> ".join(reversed(steps))
+
+    def _prune_journey_nodes(self):
+        """Keep only the trie nodes on the path of a journey still in the window"""
+        live = set()
+        for journey in self.journey_counts:
+            while journey != EMPTY_JOURNEY and journey not in live:
+                live.add(journey)
+                journey = self.journey_nodes[journey][0]
+        for journey in [j for j in self.journey_nodes if j not in live]:
+            del self.journey_nodes[journey]
+
+    def expire(self, now: Optional[datetime] = None):
+        """Drop buckets, sessions and file offsets that fell out of the sliding window"""
+        now = now or datetime.now()
+        window_start = now - timedelta(days=self.window_days)
+        cutoff_bucket = window_start.strftime(BUCKET_FORMAT)
+        cutoff_timestamp = window_start.isoformat()
+
+        with self._lock:
+            for key in [key for key in self.buckets if key < cutoff_bucket]:
+                del self.buckets[key]
+
+            for session_id in [sid for sid, session in self.sessions.items() if session['last'] < cutoff_timestamp]:
+                self._decrement_journey(self.sessions.pop(session_id)['journey'])
+            self._prune_journey_nodes()
+
+            self.funnels.expire(window_start)
+            self.psychometrics.expire_pending(now)
+
+            oldest_file_day = (window_start - timedelta(days=1)).date()
+            for name in list(self.offsets):
+                day = partition_date(Path(name))
+                if day is not None and day < oldest_file_day:
+                    del self.offsets[name]
+
+    # Reading
+
+    def _window(self, days_back: int, now: Optional[datetime]):
+        start = (now or datetime.now()) - timedelta(days=min(days_back, self.window_days))
+        buckets = {key: bucket for key, bucket in self.buckets.items() if key >= start.strftime(BUCKET_FORMAT)}
+        sessions = [session for session in self.sessions.values() if session['first'] >= start.isoformat()]
+        return start, buckets, sessions
+
+    def events_since(self, since: datetime) -> int:
+        """Events in the hour buckets starting at or after `since`'s hour"""
+        with self._lock:
+            cutoff = since.strftime(BUCKET_FORMAT)
+            return sum(bucket['events'] for key, bucket in self.buckets.items() if key >= cutoff)
+
+    def usage_statistics(self, days_back: int = 30, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Same layout as ResearchAnalytics.generate_usage_statistics, from the aggregates"""
+        with self._lock:
+            _, buckets, sessions = self._window(days_back, now)
+            total_events = sum(bucket['events'] for bucket in buckets.values())
+            if not total_events:
+                return {"error": "No data available"}
+
+            event_types = Counter()
+            daily = Counter()
+            hourly = Counter()
+            for key, bucket in buckets.items():
+                event_types.update(bucket['event_types'])
+                daily[key[:10]] += bucket['events']
+                hourly[int(key[11:13])] += bucket['events']
+
+            first = min(session['first'] for session in sessions) if sessions else None
+            last = max(session['last'] for session in sessions) if sessions else None
+            session_sizes = np.array([session['count'] for session in sessions])
+
+            stats = {
+                "overview": {
+                    "total_events": total_events,
+                    "unique_sessions": len(sessions),
+                    "unique_users": len({s['user_id'] for s in sessions if s['user_id']}),
+                    "date_range": {"start": first, "end": last},
+                    "data_collection_days": (_parse_timestamp(last) - _parse_timestamp(first)).days if first else 0
+                },
+                "event_distribution": dict(event_types.most_common()),
+                "daily_usage": dict(sorted(daily.items())),
+                "hourly_patterns": dict(sorted(hourly.items()))
+            }
+
+            if len(session_sizes):
+                stats["session_analysis"] = {
+                    "avg_events_per_session": float(session_sizes.mean()),
+                    "max_events_per_session": int(session_sizes.max()),
+                    "min_events_per_session": int(session_sizes.min()),
+                    "total_sessions": len(session_sizes)
+                }
+
+            started = event_types.get('questionnaire_started', 0)
+            completed = event_types.get('questionnaire_completed', 0)
+            if started or completed:
+                stats["completion_rates"] = {
+                    "questionnaires_started": started,
+                    "questionnaires_completed": completed,
+                    "completion_rate": (completed / started * 100) if started > 0 else 0
+                }
+            return stats
+
+    def behavior_patterns(self, days_back: int = 30, now: Optional[datetime] = None,
+                          top_n: int = 10) -> Dict[str, Any]:
+        """Same layout as ResearchAnalytics.analyze_user_behavior_patterns, plus a completion funnel"""
+        with self._lock:
+            _, buckets, sessions = self._window(days_back, now)
+            if not sessions and not buckets:
+                return {"error": "No data available"}
+
+            patterns = {}
+            if sessions:
+                durations = pd.Series([
+                    (_parse_timestamp(s['last']) - _parse_timestamp(s['first'])).total_seconds() / 60
+                    for s in sessions
+                ])
+                patterns["session_duration"] = {
+                    "avg_duration_minutes": float(durations.mean()),
+                    "median_duration_minutes": float(durations.median()),
+                    "max_duration_minutes": float(durations.max()),
+                    "sessions_over_5_min": int((durations > 5).sum()),
+                    "sessions_over_15_min": int((durations > 15).sum())
+                }
+
+            popularity = Counter()
+            for bucket in buckets.values():
+                popularity.update(bucket['questionnaires_started'])
+            if popularity:
+                patterns["popular_questionnaires"] = dict(popularity.most_common())
+
+            if days_back >= self.window_days:
+                journeys = self.journey_counts
+            else:
+                journeys = Counter(session['journey'] for session in sessions)
+            patterns["common_user_journeys"] = {
+                self.journey_text(journey): count for journey, count in journeys.most_common(top_n)
+            }
+
+            patterns["completion_funnel"] = {
+                stage: sum(1 for session in sessions if session['stages'] & STAGE_BITS[stage])
+                for stage in FUNNEL_STAGES
+            }
+            return patterns
+
+    def privacy_sample(self, days_back: int = 30, now: Optional[datetime] = None, size: int = 5) -> pd.DataFrame:
+        """Small frame with the event layout, oldest timestamp and sample session ids for privacy checks"""
+        with self._lock:
+            start = self._window(days_back, now)[0].isoformat()
+            items = [(sid, session) for sid, session in self.sessions.items() if session['first'] >= start]
+            if not items:
+                return pd.DataFrame()
+            sample = dict(items[:size])
+            oldest_id, oldest = min(items, key=lambda item: item[1]['first'])
+            sample[oldest_id] = oldest
+
+        frame = pd.DataFrame(
+            [{'session_id': sid, 'timestamp': s['first'], 'user_id': s['user_id']} for sid, s in sample.items()],
+            columns=EVENT_COLUMNS
+        )
+        frame['timestamp'] = pd.to_datetime(frame['timestamp'])
+        return frame.sort_values('timestamp').reset_index(drop=True)
@@ -14,6 +14,19 @@ import uuid
 from datetime import datetime
 import logging
 
+from .metrics import EVENTS_INGESTED, INGEST_ERRORS, get_metrics_registry
+from .norms import NormsStore
+from .database import ResearchDatabase
+from .sessionizer import api_record_event
+
+try:
+    from performance.instrumentation import get_latency_recorder, instrument_fastapi
+    from performance.sampling_profiler import profile_fastapi
+    from storage.sqlite_store import get_store
+    INSTRUMENTATION_AVAILABLE = True
+except ImportError:
+    INSTRUMENTATION_AVAILABLE = False
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -31,6 +44,22 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "research_data")
 # Ensure data directory exists
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Population norms are updated as completed questionnaires arrive
+norms_store = NormsStore(os.path.join(DATA_DIR, "norms.json"))
+# research_sessions is kept up to date from the events this service writes
+research_db = ResearchDatabase()
+metrics = get_metrics_registry()
+
+# Opt-in stack sampling, then per-route latency histograms served at /metrics
+if INSTRUMENTATION_AVAILABLE:
+    profile_fastapi(app, prefix="research_api")
+    instrument_fastapi(app, prefix="research_api")
+
+@app.on_event("startup")
+async def start_latency_export():
+    if INSTRUMENTATION_AVAILABLE:
+        get_latency_recorder().start_exporter(get_store("performance"))
+
 class ResearchEvent(BaseModel):
     client_ts: str
     session_id: str
@@ -82,12 +111,25 @@ def save_event_safely(event_data: Dict[str, Any]) -> str:
         
         # Append to JSONL file
         with open(file_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(anonymized_event, ensure_ascii=False) + "\\n")
+            f.write(json.dumps(anonymized_event, ensure_ascii=False) + "\n")
+        
+        metrics.increment(EVENTS_INGESTED)
+        
+        try:
+            norms_store.record_event(anonymized_event)
+        except Exception as e:
+            logger.warning(f"Failed to update population norms: {e}")
+        
+        try:
+            research_db.sessionize([api_record_event(anonymized_event)])
+        except Exception as e:
+            logger.warning(f"Failed to update research sessions: {e}")
         
         return event_id
         
     except Exception as e:
         logger.error(f"Failed to save event: {e}")
+        metrics.increment(INGEST_ERRORS)
         raise HTTPException(status_code=500, detail="Failed to save event")
 
 @app.post("/collect", response_model=ResearchEventResponse)
@@ -112,13 +154,22 @@ async def collect_event(event: ResearchEvent, request: Request):
         logger.error(f"Collection error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.on_event("shutdown")
+async def flush_norms():
+    """Persist norms and sessions accumulated since the last flush"""
+    norms_store.flush()
+    research_db.close()
+    if INSTRUMENTATION_AVAILABLE:
+        get_latency_recorder().stop_exporter(get_store("performance"))
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "service": "research_collector",
-        "timestamp": datetime.utcnow().isoformat()
+        "timestamp": datetime.utcnow().isoformat(),
+        "metrics": metrics.snapshot()
     }
 
 @app.get("/stats")
@@ -130,6 +130,17 @@ def collect_session_started(session_id: str, user_info: Dict[str, Any]):
         session_id
     )
 
+def collect_consent_given(session_id: str, consent_version: str = "v1"):
+    """Thu thập event đồng ý tham gia nghiên cứu"""
+    collect_research_event(
+        "consent_given",
+        {
+            "consent_version": consent_version,
+            "timestamp": datetime.utcnow().isoformat()
+        },
+        session_id
+    )
+
 def collect_questionnaire_started(session_id: str, questionnaire_type: str):
     """Thu thập event bắt đầu questionnaire"""
     collect_research_event(
@@ -165,19 +176,19 @@ def collect_questionnaire_completed(
     session_id: str, 
     questionnaire_type: str, 
     total_score: int,
-    completion_time_seconds: Optional[int] = None
+    completion_time_seconds: Optional[int] = None,
+    subscale_scores: Optional[Dict[str, float]] = None
 ):
     """Thu thập event hoàn thành questionnaire"""
-    collect_research_event(
-        "questionnaire_completed",
-        {
-            "questionnaire_type": questionnaire_type,
-            "total_score": total_score,
-            "completion_time_seconds": completion_time_seconds,
-            "timestamp": datetime.utcnow().isoformat()
-        },
-        session_id
-    )
+    payload = {
+        "questionnaire_type": questionnaire_type,
+        "total_score": total_score,
+        "completion_time_seconds": completion_time_seconds,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+    if subscale_scores:
+        payload["subscale_scores"] = subscale_scores
+    collect_research_event("questionnaire_completed", payload, session_id)
 
 def collect_results_viewed(session_id: str, results_data: Dict[str, Any]):
     """Thu thập event xem kết quả"""
@@ -74,7 +74,16 @@ def get_research_consent_status() -> Optional[bool]:
 
 def set_research_consent_status(status: Optional[bool]):
     """Lưu trạng thái đồng ý nghiên cứu vào session state"""
+    previous = st.session_state.get("research_consent")
     st.session_state["research_consent"] = status
+    
+    # Ghi nhận bước đồng ý cho phễu nghiên cứu (chỉ một lần mỗi phiên)
+    if status is True and previous is not True:
+        try:
+            from research_system.integration import safe_track_consent_given
+            safe_track_consent_given()
+        except ImportError:
+            pass
 
 def is_research_enabled() -> bool:
     """Kiểm tra xem research collection có được bật không"""
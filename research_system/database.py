@@ -10,12 +10,35 @@ import os
 import json
 import asyncio
 import sqlite3
+from functools import partial
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 import logging
 from pathlib import Path
 import hashlib
 import hmac
+import time
+import atexit
+import threading
+
+from .metrics import EVENTS_INGESTED, INGEST_ERRORS, get_metrics_registry
+from .sessionizer import Sessionizer, replay_event_files
+from .integrity import (
+    LEAF_COLUMNS,
+    GENESIS_CHAIN_HASH,
+    IntegrityVerifier,
+    compute_leaf_hash,
+    compute_chain_hash,
+    merkle_root,
+    write_chain_head
+)
+
+# Opt-in query profiling (SOULFRIEND_SQL_PROFILE=1) from the shared storage layer
+try:
+    from storage.sqlite_store import connect as profiled_connect
+    QUERY_PROFILER_AVAILABLE = True
+except ImportError:
+    QUERY_PROFILER_AVAILABLE = False
 
 # Try to import asyncpg, but make it optional
 try:
@@ -42,6 +65,15 @@ class DatabaseConfig:
         # Security settings
         self.encryption_key = os.getenv('RESEARCH_ENCRYPTION_KEY', self._generate_default_key())
         
+        # Retention purge settings
+        self.purge_batch_size = int(os.getenv('RESEARCH_PURGE_BATCH_SIZE', 5000))
+        self.purge_pause_seconds = float(os.getenv('RESEARCH_PURGE_PAUSE_SECONDS', 0.05))
+        self.vacuum_budget_seconds = float(os.getenv('RESEARCH_VACUUM_BUDGET_SECONDS', 2.0))
+        
+        # Live events are buffered and sealed as one integrity batch per flush
+        self.seal_batch_size = int(os.getenv('RESEARCH_SEAL_BATCH_SIZE', 500))
+        self.seal_interval_seconds = float(os.getenv('RESEARCH_SEAL_INTERVAL_SECONDS', 2.0))
+        
     def _generate_default_key(self) -> str:
         """Generate a default encryption key"""
         return hashlib.sha256(b'research_system_default_key').hexdigest()
@@ -51,20 +83,107 @@ class DatabaseConfig:
         """Get PostgreSQL connection URL"""
         return f"postgresql://{self.pg_username}:{self.pg_password}@{self.pg_host}:{self.pg_port}/{self.pg_database}"
 
+# Hot payload fields promoted out of the event_data JSON blob into typed columns.
+# Each entry maps column -> (SQLite type, SQLite JSON1 expression used for backfill).
+PAYLOAD_COLUMNS = {
+    'questionnaire_type': ('TEXT', "json_extract(event_data, '$.questionnaire_type')"),
+    'item_id': ('TEXT', "json_extract(event_data, '$.item_id')"),
+    'question_index': (
+        'INTEGER',
+        "COALESCE(json_extract(event_data, '$.question_index'), "
+        "CASE WHEN instr(json_extract(event_data, '$.item_id'), '_Q') > 0 "
+        "THEN CAST(substr(json_extract(event_data, '$.item_id'), "
+        "instr(json_extract(event_data, '$.item_id'), '_Q') + 2) AS INTEGER) END)"
+    ),
+    'score': (
+        'REAL',
+        "COALESCE(json_extract(event_data, '$.response_value'), "
+        "json_extract(event_data, '$.total_score'), json_extract(event_data, '$.score'))"
+    ),
+}
+
+# Schema versions tracked through PRAGMA user_version
+SCHEMA_VERSION_PAYLOAD_COLUMNS = 1
+
+# PostgreSQL generated columns for the same fields. Every cast is guarded so a
+# malformed client payload ("N/A", "2.5" as an index) yields NULL instead of
+# failing the INSERT, as extract_payload_columns tolerates it on SQLite.
+_PG_QUESTION_INDEX = "btrim(event_data->>'question_index')"
+_PG_SCORE = "btrim(COALESCE(event_data->>'response_value', event_data->>'total_score', event_data->>'score'))"
+PG_PAYLOAD_COLUMNS = {
+    'questionnaire_type': ('TEXT', "event_data->>'questionnaire_type'"),
+    'item_id': ('TEXT', "event_data->>'item_id'"),
+    'question_index': (
+        'INTEGER',
+        f"CASE WHEN {_PG_QUESTION_INDEX} ~ '^-?[0-9]{{1,9}}([.]0*)?$' THEN {_PG_QUESTION_INDEX}::numeric::int "
+        "WHEN event_data->>'item_id' ~ '_Q[0-9]{1,9}$' "
+        "THEN substring(event_data->>'item_id' from '_Q([0-9]{1,9})$')::int END"
+    ),
+    'score': (
+        'DOUBLE PRECISION',
+        f"CASE WHEN {_PG_SCORE} ~ '^[-+]?([0-9]+([.][0-9]*)?|[.][0-9]+)([eE][-+]?[0-9]{{1,3}})?$' "
+        f"THEN {_PG_SCORE}::double precision END"
+    ),
+}
+
+def extract_payload_columns(payload: Any) -> Dict[str, Any]:
+    """Extract the typed payload columns from an event_data dict (mirrors PAYLOAD_COLUMNS)"""
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
+    
+    item_id = payload.get('item_id')
+    question_index = payload.get('question_index')
+    if question_index is None and isinstance(item_id, str) and '_Q' in item_id:
+        try:
+            question_index = int(item_id[item_id.index('_Q') + 2:])
+        except ValueError:
+            question_index = None
+    
+    score = None
+    for key in ('response_value', 'total_score', 'score'):
+        if payload.get(key) is not None:
+            score = payload[key]
+            break
+    
+    return {
+        'questionnaire_type': payload.get('questionnaire_type'),
+        'item_id': item_id,
+        'question_index': question_index,
+        'score': score
+    }
+
 class SQLiteDatabase:
     """SQLite database implementation for research data"""
     
-    def __init__(self, db_path: str):
+    # Pages released per PRAGMA incremental_vacuum step
+    VACUUM_PAGES_PER_STEP = 256
+    
+    def __init__(self, db_path: str, integrity_key: Optional[str] = None):
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self.logger = logging.getLogger(__name__)
+        # Every stored event is sealed with this key (see integrity.py)
+        self.integrity_key = integrity_key or DatabaseConfig().encryption_key
+        self.last_purge_stats: Dict[str, Any] = {}
+        # Profiled when SOULFRIEND_SQL_PROFILE is set; plain sqlite3 otherwise
+        self._connect = partial(profiled_connect, store_name="research") if QUERY_PROFILER_AVAILABLE else sqlite3.connect
         self._initialize_database()
     
     def _initialize_database(self):
         """Initialize database schema"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect(self.db_path) as conn:
             cursor = conn.cursor()
             
+            # auto_vacuum only takes effect on a fresh file (or after a full VACUUM);
+            # WAL lets readers and the ingest path keep working during purges.
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            cursor.execute('PRAGMA journal_mode = WAL')
+            
             # Events table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS research_events (
@@ -81,9 +200,15 @@ class SQLiteDatabase:
             ''')
             
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_session_id ON research_events(session_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_type ON research_events(event_type)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_timestamp ON research_events(timestamp)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_user_id ON research_events(anonymized_user_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_type_timestamp ON research_events(event_type, timestamp)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_user_timestamp ON research_events(anonymized_user_id, timestamp)')
+            
+            # Superseded by the composite indexes above (kept prefixes only cost write time)
+            cursor.execute('DROP INDEX IF EXISTS idx_events_type')
+            cursor.execute('DROP INDEX IF EXISTS idx_events_user_id')
+            
+            self._migrate_payload_columns(conn)
             
             # Sessions table
             cursor.execute('''
@@ -96,6 +221,7 @@ class SQLiteDatabase:
                     questionnaire_types TEXT,
                     completion_status TEXT,
                     data_hash TEXT,
+                    event_count INTEGER NOT NULL DEFAULT 0,
                     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
@@ -103,6 +229,26 @@ class SQLiteDatabase:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON research_sessions(anonymized_user_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start_time ON research_sessions(start_time)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_consent ON research_sessions(consent_status)')
+            self._migrate_session_columns(conn)
+            
+            # Integrity seals: one Merkle root per ingest batch, chained to the previous batch
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS integrity_batches (
+                    batch_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    first_event_id INTEGER NOT NULL,
+                    last_event_id INTEGER NOT NULL,
+                    event_count INTEGER NOT NULL,
+                    min_timestamp DATETIME NOT NULL,
+                    max_timestamp DATETIME NOT NULL,
+                    merkle_root TEXT NOT NULL,
+                    previous_chain_hash TEXT NOT NULL,
+                    chain_hash TEXT NOT NULL,
+                    sealed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_integrity_time ON integrity_batches(min_timestamp, max_timestamp)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_integrity_events ON integrity_batches(first_event_id, last_event_id)')
             
             # Aggregated data table for analytics
             cursor.execute('''
@@ -138,39 +284,197 @@ class SQLiteDatabase:
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_consent_action ON consent_audit(consent_action)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_consent_timestamp ON consent_audit(timestamp)')
             
+            # A new, empty table has nothing to backfill
+            if (cursor.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION_PAYLOAD_COLUMNS
+                    and cursor.execute('SELECT 1 FROM research_events LIMIT 1').fetchone() is None):
+                cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION_PAYLOAD_COLUMNS}')
+            
             conn.commit()
     
+    def payload_backfill_pending(self) -> bool:
+        """Whether rows from before the typed payload columns may still need backfill_payload_columns()"""
+        return self._get_schema_version() < SCHEMA_VERSION_PAYLOAD_COLUMNS
+    
+    def _migrate_payload_columns(self, conn: sqlite3.Connection):
+        """Add the typed payload columns and their composite indexes if missing"""
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA table_info(research_events)')
+        existing = {row[1] for row in cursor.fetchall()}
+        
+        for column, (column_type, _) in PAYLOAD_COLUMNS.items():
+            if column not in existing:
+                cursor.execute(f'ALTER TABLE research_events ADD COLUMN {column} {column_type}')
+        
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_events_type_questionnaire_time
+                          ON research_events(event_type, questionnaire_type, timestamp)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS idx_events_questionnaire_question
+                          ON research_events(questionnaire_type, question_index)''')
+    
+    def _migrate_session_columns(self, conn: sqlite3.Connection):
+        """Add the sessionizer's event_count column if missing"""
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA table_info(research_sessions)')
+        if 'event_count' not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute('ALTER TABLE research_sessions ADD COLUMN event_count INTEGER NOT NULL DEFAULT 0')
+    
+    def _get_schema_version(self) -> int:
+        with self._connect(self.db_path) as conn:
+            return conn.execute('PRAGMA user_version').fetchone()[0]
+    
+    def backfill_payload_columns(self, batch_size: int = 5000) -> int:
+        """Populate typed payload columns for rows written before they existed
+        
+        Runs in id-range batches so the write lock is released between batches, and
+        records its position with each batch so an interrupted run resumes there.
+        Not run on open: ResearchDatabase starts it in a background thread.
+        """
+        assignments = ', '.join(f'{column} = {expression}' for column, (_, expression) in PAYLOAD_COLUMNS.items())
+        updated = 0
+        
+        try:
+            with self._connect(self.db_path, timeout=30) as conn:
+                conn.execute('''CREATE TABLE IF NOT EXISTS schema_backfill (
+                                    name TEXT PRIMARY KEY, next_id INTEGER NOT NULL)''')
+                low_id, high_id = conn.execute(
+                    'SELECT MIN(id), MAX(id) FROM research_events'
+                ).fetchone()
+                resume = conn.execute(
+                    "SELECT next_id FROM schema_backfill WHERE name = 'payload_columns'"
+                ).fetchone()
+            
+            if low_id is not None:
+                if resume:
+                    low_id = max(low_id, resume[0])
+                for batch_start in range(low_id, high_id + 1, batch_size):
+                    with self._connect(self.db_path, timeout=30) as conn:
+                        cursor = conn.execute(
+                            f'''UPDATE research_events SET {assignments}
+                                WHERE id >= ? AND id < ? AND event_data IS NOT NULL
+                                AND questionnaire_type IS NULL AND score IS NULL''',
+                            (batch_start, batch_start + batch_size)
+                        )
+                        updated += cursor.rowcount
+                        conn.execute(
+                            "INSERT OR REPLACE INTO schema_backfill (name, next_id) VALUES ('payload_columns', ?)",
+                            (batch_start + batch_size,)
+                        )
+                        conn.commit()
+            
+            with self._connect(self.db_path) as conn:
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION_PAYLOAD_COLUMNS}')
+            
+            self.logger.info(f"Backfilled payload columns for {updated} events")
+            
+        except Exception as e:
+            self.logger.error(f"Error backfilling payload columns: {e}")
+        
+        return updated
+    
     def store_event(self, event_data: Dict[str, Any]) -> bool:
-        """Store a research event"""
+        """Store a research event as its own sealed batch"""
+        return self.store_events([event_data]) == 1
+    
+    def store_events(self, events: List[Dict[str, Any]], integrity_key: Optional[str] = None) -> int:
+        """Bulk insert events as one sealed batch
+        
+        Each row's data_hash is its HMAC leaf hash; the batch Merkle root is chained to
+        the previous batch inside the same write transaction so event ids are contiguous.
+        Leaves are computed over the rows as read back from SQLite, so column affinity
+        (e.g. a string question_index stored as INTEGER) matches what verification reads.
+        """
+        if not events:
+            return 0
+        integrity_key = integrity_key or self.integrity_key
+        
+        rows = []
+        for event in events:
+            payload = event.get('event_data', {})
+            columns = extract_payload_columns(payload)
+            timestamp = event.get('timestamp')
+            if isinstance(timestamp, datetime):
+                timestamp = timestamp.isoformat()
+            score = columns['score']
+            rows.append((
+                event.get('session_id'),
+                event.get('event_type'),
+                json.dumps(payload),
+                timestamp,
+                event.get('anonymized_user_id'),
+                event.get('consent_status'),
+                columns['questionnaire_type'],
+                columns['item_id'],
+                columns['question_index'],
+                float(score) if score is not None else None
+            ))
+        
+        timestamps = [row[3] for row in rows]
+        placeholders = ', '.join('?' for _ in LEAF_COLUMNS)
+        
+        conn = self._connect(self.db_path, timeout=30, isolation_level=None)
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                cursor.execute('''
-                    INSERT INTO research_events 
-                    (session_id, event_type, event_data, timestamp, anonymized_user_id, consent_status, data_hash)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    event_data.get('session_id'),
-                    event_data.get('event_type'),
-                    json.dumps(event_data.get('event_data', {})),
-                    event_data.get('timestamp'),
-                    event_data.get('anonymized_user_id'),
-                    event_data.get('consent_status'),
-                    event_data.get('data_hash')
-                ))
-                
-                conn.commit()
-                return True
-                
+            conn.execute('BEGIN IMMEDIATE')
+            
+            previous = conn.execute(
+                'SELECT chain_hash FROM integrity_batches ORDER BY batch_id DESC LIMIT 1'
+            ).fetchone()
+            previous_chain_hash = previous[0] if previous else GENESIS_CHAIN_HASH
+            
+            conn.executemany(
+                f"INSERT INTO research_events ({', '.join(LEAF_COLUMNS)}) VALUES ({placeholders})",
+                rows
+            )
+            last_event_id = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'research_events'"
+            ).fetchone()[0]
+            
+            stored = conn.execute(
+                f"SELECT id, {', '.join(LEAF_COLUMNS)} FROM research_events WHERE id >= ? AND id <= ? ORDER BY id",
+                (last_event_id - len(rows) + 1, last_event_id)
+            ).fetchall()
+            leaves = [compute_leaf_hash(integrity_key, row[1:]) for row in stored]
+            conn.executemany(
+                'UPDATE research_events SET data_hash = ? WHERE id = ?',
+                [(leaf, row[0]) for leaf, row in zip(leaves, stored)]
+            )
+            
+            root = merkle_root(leaves)
+            chain_hash = compute_chain_hash(integrity_key, previous_chain_hash, root)
+            batch_id = conn.execute('''
+                INSERT INTO integrity_batches
+                (first_event_id, last_event_id, event_count, min_timestamp, max_timestamp,
+                 merkle_root, previous_chain_hash, chain_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                last_event_id - len(rows) + 1,
+                last_event_id,
+                len(rows),
+                min(timestamps),
+                max(timestamps),
+                root,
+                previous_chain_hash,
+                chain_hash
+            )).lastrowid
+            
+            conn.execute('COMMIT')
+            
         except Exception as e:
-            self.logger.error(f"Error storing event: {e}")
-            return False
+            conn.execute('ROLLBACK')
+            self.logger.error(f"Error storing event batch: {e}")
+            return 0
+        finally:
+            conn.close()
+        
+        try:
+            write_chain_head(self.db_path, batch_id, chain_hash)
+        except OSError as e:
+            # The batch is committed; a stale head only weakens truncation detection
+            self.logger.warning(f"Could not record integrity chain head: {e}")
+        return len(rows)
     
     def store_session(self, session_data: Dict[str, Any]) -> bool:
         """Store session information"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 cursor.execute('''
@@ -196,14 +500,135 @@ class SQLiteDatabase:
             self.logger.error(f"Error storing session: {e}")
             return False
     
+    def upsert_sessions(self, sessions: List[Dict[str, Any]]) -> int:
+        """Merge sessionizer delta rows into research_sessions in one transaction
+        
+        Start/end widen, event counts add up, questionnaire types are unioned and
+        the completion status keeps the furthest stage, so deltas can be replayed
+        in any order.
+        """
+        if not sessions:
+            return 0
+        
+        rows = [(
+            session['session_id'],
+            session.get('anonymized_user_id'),
+            session['start_time'],
+            session.get('end_time'),
+            session.get('consent_status') or 'unknown',
+            json.dumps(session.get('questionnaire_types', [])),
+            session.get('completion_status'),
+            int(session.get('event_count', 0))
+        ) for session in sessions]
+        
+        try:
+            with self._connect(self.db_path, timeout=30) as conn:
+                conn.executemany('''
+                    INSERT INTO research_sessions
+                    (session_id, anonymized_user_id, start_time, end_time, consent_status,
+                     questionnaire_types, completion_status, event_count)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(session_id) DO UPDATE SET
+                        anonymized_user_id = COALESCE(research_sessions.anonymized_user_id, excluded.anonymized_user_id),
+                        start_time = MIN(research_sessions.start_time, excluded.start_time),
+                        end_time = MAX(COALESCE(research_sessions.end_time, excluded.end_time), excluded.end_time),
+                        consent_status = CASE WHEN excluded.consent_status = 'unknown'
+                                              THEN research_sessions.consent_status ELSE excluded.consent_status END,
+                        questionnaire_types = (
+                            SELECT json_group_array(value) FROM (
+                                SELECT value FROM json_each(COALESCE(research_sessions.questionnaire_types, '[]'))
+                                UNION
+                                SELECT value FROM json_each(excluded.questionnaire_types)
+                            )
+                        ),
+                        completion_status = CASE
+                            WHEN 'completed' IN (research_sessions.completion_status, excluded.completion_status)
+                                THEN 'completed'
+                            WHEN 'in_progress' IN (research_sessions.completion_status, excluded.completion_status)
+                                THEN 'in_progress'
+                            ELSE excluded.completion_status END,
+                        event_count = research_sessions.event_count + excluded.event_count
+                ''', rows)
+                conn.commit()
+                return len(rows)
+                
+        except Exception as e:
+            self.logger.error(f"Error upserting sessions: {e}")
+            return 0
+    
+    def iter_events_ordered(self, batch_size: int = 5000):
+        """Yield stored events in timestamp order, in batches, for session replays"""
+        with self._connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute('''
+                SELECT session_id, event_type, timestamp, anonymized_user_id, consent_status, questionnaire_type
+                FROM research_events ORDER BY timestamp, id
+            ''')
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield [dict(row) for row in batch]
+    
+    def get_session_statistics(self,
+                               start_date: Optional[datetime] = None,
+                               end_date: Optional[datetime] = None) -> Dict[str, Any]:
+        """Session durations, sizes and completion from research_sessions (no raw-event scan)"""
+        try:
+            with self._connect(self.db_path) as conn:
+                query = '''SELECT start_time, end_time, event_count, completion_status
+                           FROM research_sessions WHERE end_time IS NOT NULL'''
+                params = []
+                
+                if start_date:
+                    query += " AND start_time >= ?"
+                    params.append(start_date.isoformat())
+                
+                if end_date:
+                    query += " AND start_time <= ?"
+                    params.append(end_date.isoformat())
+                
+                rows = [
+                    ((datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds() / 60, count, status)
+                    for start, end, count, status in conn.execute(query, params)
+                ]
+            
+            if not rows:
+                return {"error": "No data available"}
+            
+            durations = sorted(row[0] for row in rows)
+            middle = len(durations) // 2
+            median = durations[middle] if len(durations) % 2 else (durations[middle - 1] + durations[middle]) / 2
+            completion: Dict[str, int] = {}
+            for _, _, status in rows:
+                completion[status or 'unknown'] = completion.get(status or 'unknown', 0) + 1
+            
+            return {
+                "total_sessions": len(rows),
+                "avg_events_per_session": sum(row[1] for row in rows) / len(rows),
+                "session_duration": {
+                    "avg_duration_minutes": sum(durations) / len(durations),
+                    "median_duration_minutes": median,
+                    "max_duration_minutes": durations[-1],
+                    "sessions_over_5_min": sum(1 for d in durations if d > 5),
+                    "sessions_over_15_min": sum(1 for d in durations if d > 15)
+                },
+                "completion_status": completion
+            }
+            
+        except Exception as e:
+            self.logger.error(f"Error retrieving session statistics: {e}")
+            return {"error": str(e)}
+    
     def get_events(self, 
                    start_date: Optional[datetime] = None,
                    end_date: Optional[datetime] = None,
                    event_types: Optional[List[str]] = None,
+                   questionnaire_types: Optional[List[str]] = None,
                    limit: int = 1000) -> List[Dict[str, Any]]:
         """Retrieve events with filtering"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 query = "SELECT * FROM research_events WHERE 1=1"
@@ -222,6 +647,11 @@ class SQLiteDatabase:
                     query += f" AND event_type IN ({placeholders})"
                     params.extend(event_types)
                 
+                if questionnaire_types:
+                    placeholders = ','.join(['?' for _ in questionnaire_types])
+                    query += f" AND questionnaire_type IN ({placeholders})"
+                    params.extend(questionnaire_types)
+                
                 query += " ORDER BY timestamp DESC LIMIT ?"
                 params.append(limit)
                 
@@ -236,12 +666,62 @@ class SQLiteDatabase:
             self.logger.error(f"Error retrieving events: {e}")
             return []
     
+    def get_questionnaire_popularity(self,
+                                     start_date: Optional[datetime] = None,
+                                     end_date: Optional[datetime] = None) -> Dict[str, int]:
+        """Count questionnaire starts per instrument, aggregated in SQL"""
+        try:
+            with self._connect(self.db_path) as conn:
+                query = '''SELECT COALESCE(questionnaire_type, 'unknown'), COUNT(*)
+                           FROM research_events
+                           WHERE event_type = 'questionnaire_started' '''
+                params = []
+                
+                if start_date:
+                    query += " AND timestamp >= ?"
+                    params.append(start_date.isoformat())
+                
+                if end_date:
+                    query += " AND timestamp <= ?"
+                    params.append(end_date.isoformat())
+                
+                query += " GROUP BY questionnaire_type ORDER BY COUNT(*) DESC"
+                return {name: count for name, count in conn.execute(query, params)}
+                
+        except Exception as e:
+            self.logger.error(f"Error retrieving questionnaire popularity: {e}")
+            return {}
+    
+    def get_item_statistics(self, questionnaire_type: str,
+                            start_date: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Per-question answer count and mean score for one instrument, aggregated in SQL"""
+        try:
+            with self._connect(self.db_path) as conn:
+                query = '''SELECT question_index, COUNT(*), AVG(score)
+                           FROM research_events
+                           WHERE event_type = 'question_answered' AND questionnaire_type = ?'''
+                params: List[Any] = [questionnaire_type]
+                
+                if start_date:
+                    query += " AND timestamp >= ?"
+                    params.append(start_date.isoformat())
+                
+                query += " GROUP BY question_index ORDER BY question_index"
+                return [
+                    {'question_index': index, 'answers': count, 'mean_score': mean}
+                    for index, count, mean in conn.execute(query, params)
+                ]
+                
+        except Exception as e:
+            self.logger.error(f"Error retrieving item statistics: {e}")
+            return []
+    
     def get_analytics_data(self, 
                           metric_names: Optional[List[str]] = None,
                           period: str = 'daily') -> List[Dict[str, Any]]:
         """Get analytics data"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
                 query = "SELECT * FROM research_analytics WHERE aggregation_period = ?"
@@ -264,37 +744,138 @@ class SQLiteDatabase:
             self.logger.error(f"Error retrieving analytics data: {e}")
             return []
     
-    def cleanup_old_data(self, retention_days: int = 90) -> int:
+    def cleanup_old_data(self, retention_days: int = 90,
+                         batch_size: int = 5000,
+                         pause_seconds: float = 0.05,
+                         vacuum_budget_seconds: float = 2.0) -> int:
         """Clean up old data beyond retention period"""
+        stats = self.purge_old_events(
+            retention_days=retention_days,
+            batch_size=batch_size,
+            pause_seconds=pause_seconds,
+            vacuum_budget_seconds=vacuum_budget_seconds
+        )
+        return stats.get('deleted_rows', 0)
+    
+    def purge_old_events(self, retention_days: int = 90,
+                         batch_size: int = 5000,
+                         pause_seconds: float = 0.05,
+                         vacuum_budget_seconds: float = 2.0) -> Dict[str, Any]:
+        """Delete expired events in bounded rowid batches, then reclaim space incrementally
+        
+        Each batch is its own short write transaction so concurrent ingestion only ever
+        waits for one batch, never for the whole purge.
+        """
+        cutoff_date = datetime.now() - timedelta(days=retention_days)
+        stats = {
+            'cutoff': cutoff_date.isoformat(),
+            'deleted_rows': 0,
+            'batches': 0,
+            'delete_seconds': 0.0,
+            'rows_per_second': 0.0,
+            'vacuum_pages_freed': 0,
+            'vacuum_seconds': 0.0
+        }
+        
         try:
-            cutoff_date = datetime.now() - timedelta(days=retention_days)
-            
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect(self.db_path, timeout=30) as conn:
                 cursor = conn.cursor()
-                
-                # Delete old events
                 cursor.execute(
-                    "DELETE FROM research_events WHERE timestamp < ?",
+                    "SELECT MIN(id), MAX(id) FROM research_events WHERE timestamp < ?",
                     (cutoff_date.isoformat(),)
                 )
-                
-                deleted_count = cursor.rowcount
-                conn.commit()
-                
-                self.logger.info(f"Cleaned up {deleted_count} old records")
-                return deleted_count
-                
+                low_id, high_id = cursor.fetchone()
+            
+            started = time.perf_counter()
+            if low_id is not None:
+                batch_start = low_id
+                while batch_start <= high_id:
+                    batch_end = batch_start + batch_size
+                    with self._connect(self.db_path, timeout=30) as conn:
+                        cursor = conn.cursor()
+                        cursor.execute(
+                            "DELETE FROM research_events WHERE id >= ? AND id < ? AND timestamp < ?",
+                            (batch_start, batch_end, cutoff_date.isoformat())
+                        )
+                        deleted = cursor.rowcount
+                        stats['deleted_rows'] += deleted
+                        conn.commit()
+                        
+                        if not deleted:
+                            # Sparse id range: seek straight to the next expired row
+                            cursor.execute(
+                                "SELECT MIN(id) FROM research_events WHERE id >= ? AND timestamp < ?",
+                                (batch_end, cutoff_date.isoformat())
+                            )
+                            next_id = cursor.fetchone()[0]
+                            batch_end = next_id if next_id is not None else high_id + 1
+                    
+                    stats['batches'] += 1
+                    batch_start = batch_end
+                    
+                    # Yield the write lock to live ingestion between batches
+                    if pause_seconds > 0 and batch_start <= high_id:
+                        time.sleep(pause_seconds)
+            
+            stats['delete_seconds'] = time.perf_counter() - started
+            if stats['delete_seconds'] > 0:
+                stats['rows_per_second'] = stats['deleted_rows'] / stats['delete_seconds']
+            
+            if stats['deleted_rows'] and vacuum_budget_seconds > 0:
+                stats.update(self._incremental_vacuum(vacuum_budget_seconds))
+            
+            self.logger.info(
+                f"Cleaned up {stats['deleted_rows']} old records in {stats['batches']} batches "
+                f"({stats['rows_per_second']:.0f} rows/s), freed {stats['vacuum_pages_freed']} pages"
+            )
+            
         except Exception as e:
             self.logger.error(f"Error cleaning up old data: {e}")
-            return 0
+        
+        self.last_purge_stats = stats
+        return stats
+    
+    def _incremental_vacuum(self, budget_seconds: float) -> Dict[str, Any]:
+        """Release free pages in small steps until the freelist is empty or the budget runs out"""
+        result = {'vacuum_pages_freed': 0, 'vacuum_seconds': 0.0}
+        started = time.perf_counter()
+        
+        with self._connect(self.db_path, timeout=30) as conn:
+            cursor = conn.cursor()
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] != 2:
+                self.logger.info("auto_vacuum is not INCREMENTAL; skipping space reclamation")
+                return result
+            
+            while time.perf_counter() - started < budget_seconds:
+                cursor.execute('PRAGMA freelist_count')
+                free_before = cursor.fetchone()[0]
+                if free_before == 0:
+                    break
+                
+                cursor.execute(f'PRAGMA incremental_vacuum({self.VACUUM_PAGES_PER_STEP})')
+                cursor.fetchall()
+                
+                cursor.execute('PRAGMA freelist_count')
+                result['vacuum_pages_freed'] += free_before - cursor.fetchone()[0]
+        
+        result['vacuum_seconds'] = time.perf_counter() - started
+        return result
+    
+    def explain_query_plan(self, query: str, params: Tuple = ()) -> List[str]:
+        """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+        with self._connect(self.db_path) as conn:
+            return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
     
     def health_check(self) -> bool:
-        """Check database health"""
+        """Check database health with a read-only connection (never writes)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("SELECT 1")
+            conn = sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True, timeout=2)
+            try:
+                conn.execute("SELECT 1 FROM research_events LIMIT 1").fetchall()
                 return True
+            finally:
+                conn.close()
         except Exception as e:
             self.logger.error(f"Database health check failed: {e}")
             return False
@@ -333,9 +914,32 @@ class PostgreSQLDatabase:
             
             # Create indexes
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_events_session_id ON research_events(session_id)')
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_events_type ON research_events(event_type)')
             await conn.execute('CREATE INDEX IF NOT EXISTS idx_events_timestamp ON research_events(timestamp)')
-            await conn.execute('CREATE INDEX IF NOT EXISTS idx_events_user_id ON research_events(anonymized_user_id)')
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_events_type_timestamp ON research_events(event_type, timestamp)')
+            await conn.execute('CREATE INDEX IF NOT EXISTS idx_events_user_timestamp ON research_events(anonymized_user_id, timestamp)')
+            await conn.execute('DROP INDEX IF EXISTS idx_events_type')
+            await conn.execute('DROP INDEX IF EXISTS idx_events_user_id')
+            
+            # Typed payload columns generated from JSONB (PostgreSQL 12+ backfills them on ADD COLUMN).
+            # Columns generated with the earlier unguarded casts are recreated once.
+            guarded = await conn.fetchval('''
+                SELECT generation_expression LIKE '%CASE%' FROM information_schema.columns
+                WHERE table_name = 'research_events' AND column_name = 'score'
+            ''')
+            if guarded is False:
+                await conn.execute(
+                    'ALTER TABLE research_events '
+                    + ', '.join(f'DROP COLUMN {column}' for column in PG_PAYLOAD_COLUMNS)
+                )
+            await conn.execute(
+                'ALTER TABLE research_events '
+                + ', '.join(f'ADD COLUMN IF NOT EXISTS {column} {column_type} GENERATED ALWAYS AS ({expression}) STORED'
+                            for column, (column_type, expression) in PG_PAYLOAD_COLUMNS.items())
+            )
+            await conn.execute('''CREATE INDEX IF NOT EXISTS idx_events_type_questionnaire_time
+                                  ON research_events(event_type, questionnaire_type, timestamp)''')
+            await conn.execute('''CREATE INDEX IF NOT EXISTS idx_events_questionnaire_question
+                                  ON research_events(questionnaire_type, question_index)''')
             
             # Sessions table
             await conn.execute('''
@@ -348,6 +952,7 @@ class PostgreSQLDatabase:
                     questionnaire_types JSONB,
                     completion_status TEXT,
                     data_hash TEXT,
+                    event_count INTEGER NOT NULL DEFAULT 0,
                     created_at TIMESTAMPTZ DEFAULT NOW()
                 )
             ''')
@@ -405,6 +1010,31 @@ class PostgreSQLDatabase:
             return False
         finally:
             await conn.close()
+    
+    async def health_check(self) -> bool:
+        """Check database health"""
+        try:
+            conn = await self._get_connection()
+            try:
+                await conn.fetchval('SELECT 1')
+                return True
+            finally:
+                await conn.close()
+        except Exception as e:
+            self.logger.error(f"Database health check failed: {e}")
+            return False
+
+class _SealBatch:
+    """Events buffered for one sealed batch and the outcome their waiting callers read"""
+    
+    __slots__ = ('events', 'waited', 'done', 'stored')
+    
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        # Parallel to events: whether the caller is waiting for the outcome
+        self.waited: List[bool] = []
+        self.done = threading.Event()
+        self.stored = False
 
 class ResearchDatabase:
     """Main database interface for research system"""
@@ -418,30 +1048,136 @@ class ResearchDatabase:
         else:
             if self.config.db_type == 'postgresql' and not ASYNCPG_AVAILABLE:
                 self.logger.warning("PostgreSQL requested but asyncpg not available, falling back to SQLite")
-            self.db = SQLiteDatabase(self.config.db_path)
+            self.db = SQLiteDatabase(self.config.db_path, self.config.encryption_key)
+        
+        # Rows from before the typed payload columns are filled in without delaying startup
+        if isinstance(self.db, SQLiteDatabase) and self.db.payload_backfill_pending():
+            threading.Thread(target=self.db.backfill_payload_columns, name='payload-backfill', daemon=True).start()
+        
+        # Streaming sessionization of ingested events into research_sessions
+        self.sessionizer = Sessionizer(self.db.upsert_sessions) if isinstance(self.db, SQLiteDatabase) else None
+        self.metrics = get_metrics_registry()
+        
+        # Single events wait here and are sealed together (see store_event)
+        self._pending = _SealBatch()
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self.close)
     
-    def store_event(self, event_data: Dict[str, Any]) -> bool:
-        """Store event with encryption and anonymization"""
+    def store_event(self, event_data: Dict[str, Any], wait: bool = True) -> bool:
+        """Store event with encryption and anonymization
+        
+        On SQLite the event is sealed in a batch with events buffered alongside it.
+        With wait (the default) the call returns once that batch is written, with the
+        real outcome; concurrent callers share one batch (group commit). With
+        wait=False True only means accepted: the batch is written when full or after
+        seal_interval_seconds, and kept for the next flush if the write fails.
+        """
         try:
-            # Add data integrity hash
-            event_data['data_hash'] = self._calculate_hash(event_data)
-            
             # Store in database
             if isinstance(self.db, SQLiteDatabase):
-                return self.db.store_event(event_data)
+                with self._pending_lock:
+                    batch = self._pending
+                    batch.events.append(event_data)
+                    batch.waited.append(wait)
+                    full = len(batch.events) >= self.config.seal_batch_size
+                    if not wait and not full:
+                        self._schedule_flush()
+                if wait or full:
+                    self.flush_events()
+                if not wait:
+                    return True
+                # Sealed by this flush or an earlier one that took the same batch
+                batch.done.wait()
+                return batch.stored
             else:
+                # Add data integrity hash
+                event_data['data_hash'] = self._calculate_hash(event_data)
+                
                 # For PostgreSQL, run async method
                 loop = asyncio.get_event_loop()
-                return loop.run_until_complete(self.db.store_event(event_data))
+                stored = loop.run_until_complete(self.db.store_event(event_data))
+            
+            self.metrics.increment(EVENTS_INGESTED if stored else INGEST_ERRORS)
+            return stored
                 
         except Exception as e:
             self.logger.error(f"Error in store_event: {e}")
+            self.metrics.increment(INGEST_ERRORS)
             return False
     
+    def _schedule_flush(self):
+        """Arm the seal timer (caller holds _pending_lock)"""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.config.seal_interval_seconds, self.flush_events)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+    
+    def flush_events(self) -> int:
+        """Seal buffered events as one batch; returns the number stored"""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, _SealBatch()
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+            stored = self.store_events(batch.events) if batch.events else 0
+            batch.stored = stored == len(batch.events)
+            if not batch.stored:
+                # Waiting callers are told it failed; accepted events go back for the next flush
+                retry = [event for event, waited in zip(batch.events, batch.waited) if not waited]
+                if retry:
+                    with self._pending_lock:
+                        self._pending.events[:0] = retry
+                        self._pending.waited[:0] = [False] * len(retry)
+                        self._schedule_flush()
+                    self.logger.warning(f"Sealing failed; {len(retry)} buffered events kept for the next flush")
+            batch.done.set()
+            return stored
+    
+    def store_events(self, events: List[Dict[str, Any]]) -> int:
+        """Bulk-store events as one integrity-sealed batch"""
+        try:
+            if isinstance(self.db, SQLiteDatabase):
+                stored = self.db.store_events(events, self.config.encryption_key)
+                if stored:
+                    self.sessionizer.feed(events)
+                self.metrics.increment(EVENTS_INGESTED, stored)
+                self.metrics.increment(INGEST_ERRORS, len(events) - stored)
+                return stored
+            else:
+                # store_event counts each event itself
+                return sum(1 for event in events if self.store_event(event))
+                
+        except Exception as e:
+            self.logger.error(f"Error in store_events: {e}")
+            self.metrics.increment(INGEST_ERRORS, len(events))
+            return 0
+    
+    def verify_integrity(self,
+                         start_date: Optional[datetime] = None,
+                         end_date: Optional[datetime] = None,
+                         workers: Optional[int] = None,
+                         retention_days: int = 90) -> Dict[str, Any]:
+        """Verify sealed batches in a date range in parallel and list tampered rows"""
+        if not isinstance(self.db, SQLiteDatabase):
+            return {'valid': False, 'error': 'Integrity verification is only available for SQLite'}
+        
+        self.flush_events()
+        verifier = IntegrityVerifier(self.db.db_path, self.config.encryption_key)
+        return verifier.verify_range(
+            start_date=start_date,
+            end_date=end_date,
+            workers=workers,
+            expired_before=datetime.now() - timedelta(days=retention_days)
+        )
+    
     def get_events(self, **kwargs) -> List[Dict[str, Any]]:
         """Get events with filtering"""
         try:
             if isinstance(self.db, SQLiteDatabase):
+                self.flush_events()
                 return self.db.get_events(**kwargs)
             else:
                 # For PostgreSQL, implement async version
@@ -451,6 +1187,79 @@ class ResearchDatabase:
             self.logger.error(f"Error in get_events: {e}")
             return []
     
+    def health_check(self) -> bool:
+        """Read-only connectivity check for monitoring"""
+        if isinstance(self.db, SQLiteDatabase):
+            return self.db.health_check()
+        return asyncio.run(self.db.health_check())
+    
+    def flush_sessions(self, final: bool = False) -> int:
+        """Write pending session changes; final=True also closes every open session"""
+        if not self.sessionizer:
+            return 0
+        self.flush_events()
+        return self.sessionizer.flush(final=final)
+    
+    def sessionize(self, events: List[Dict[str, Any]]) -> int:
+        """Feed events stored elsewhere (the collection API's JSONL partitions) into research_sessions"""
+        return self.sessionizer.feed(events) if self.sessionizer else 0
+    
+    def close(self):
+        """Seal buffered events and close every open session (registered to run at exit)"""
+        self.flush_events()
+        self.flush_sessions(final=True)
+    
+    def rebuild_sessions(self, data_dir: Optional[str] = None) -> int:
+        """Recompute research_sessions (backfill or repair)
+        
+        From the daily event partitions in data_dir when given, else from research_events.
+        """
+        if not isinstance(self.db, SQLiteDatabase):
+            return 0
+        self.flush_events()
+        with self.db._connect(self.db.db_path) as conn:
+            conn.execute('DELETE FROM research_sessions')
+        
+        if data_dir is not None:
+            replay = Sessionizer(self.db.upsert_sessions)
+            replay_event_files(replay, Path(data_dir))
+        else:
+            replay = Sessionizer(self.db.upsert_sessions, allowed_lateness=timedelta(0))
+            for batch in self.db.iter_events_ordered():
+                replay.feed(batch)
+        replay.flush(final=True)
+        return replay.stats['sessions_closed']
+    
+    def get_session_statistics(self, days_back: int = 30) -> Dict[str, Any]:
+        """Session-level statistics from the compact research_sessions table"""
+        try:
+            if isinstance(self.db, SQLiteDatabase):
+                self.flush_sessions()
+                return self.db.get_session_statistics(start_date=datetime.now() - timedelta(days=days_back))
+            else:
+                # For PostgreSQL, implement async version
+                return {}
+                
+        except Exception as e:
+            self.logger.error(f"Error in get_session_statistics: {e}")
+            return {}
+    
+    def get_questionnaire_popularity(self, days_back: int = 30) -> Dict[str, int]:
+        """Questionnaire start counts per instrument over the last N days"""
+        try:
+            if isinstance(self.db, SQLiteDatabase):
+                self.flush_events()
+                return self.db.get_questionnaire_popularity(
+                    start_date=datetime.now() - timedelta(days=days_back)
+                )
+            else:
+                # For PostgreSQL, implement async version
+                return {}
+                
+        except Exception as e:
+            self.logger.error(f"Error in get_questionnaire_popularity: {e}")
+            return {}
+    
     def _calculate_hash(self, data: Dict[str, Any]) -> str:
         """Calculate HMAC hash for data integrity"""
         data_str = json.dumps(data, sort_keys=True)
@@ -464,7 +1273,12 @@ class ResearchDatabase:
         """Clean up old data"""
         try:
             if isinstance(self.db, SQLiteDatabase):
-                return self.db.cleanup_old_data(retention_days)
+                return self.db.cleanup_old_data(
+                    retention_days,
+                    batch_size=self.config.purge_batch_size,
+                    pause_seconds=self.config.purge_pause_seconds,
+                    vacuum_budget_seconds=self.config.vacuum_budget_seconds
+                )
             else:
                 # For PostgreSQL, implement async version
                 return 0
@@ -0,0 +1,194 @@
+"""
+Asynchronous Event Dispatch for the Research Manager
+Phân phối sự kiện bất đồng bộ cho bộ quản lý nghiên cứu
+
+System events are queued and handled by a bounded pool of workers, so a slow
+alert handler never delays the monitoring thread. Each handler call has a
+timeout; handlers that fail or time out are written to a dead-letter log.
+A timed-out call that cannot be cancelled keeps its thread, so the handler
+pool has max_stuck spare threads; once that many calls are stuck, new jobs
+are dead-lettered instead of queued behind them.
+Repeats of the same alert within a coalescing window are counted instead of
+dispatched again, and the next dispatch carries the number suppressed.
+Trình xử lý chậm không làm trễ các lần kiểm tra sức khỏe tiếp theo.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+from .metrics import LatencyHistogram
+
+class EventDispatcher:
+    """Bounded queue + worker pool for manager event handlers"""
+
+    def __init__(self, max_workers: int = 4, handler_timeout: float = 30.0,
+                 coalesce_seconds: float = 300.0, max_queue: int = 1000,
+                 dead_letter_path: Optional[Path] = None, max_stuck: Optional[int] = None):
+        self.handler_timeout = handler_timeout
+        self.max_stuck = max_stuck if max_stuck is not None else max_workers
+        self.coalesce_seconds = coalesce_seconds
+        self.dead_letter_path = Path(dead_letter_path) if dead_letter_path else None
+        self.logger = logging.getLogger(__name__)
+
+        self.handlers: Dict[str, List[Callable]] = {}
+        # Called with (event_type, data) for every event
+        self.listeners: List[Callable[[str, Dict[str, Any]], Any]] = []
+
+        self._queue: "queue.Queue[Optional[Tuple[str, Dict[str, Any], Callable, bool]]]" = queue.Queue(max_queue)
+        # Handlers run here so a worker can give up on one after its timeout;
+        # the spare threads absorb calls still running after their timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers + self.max_stuck,
+                                            thread_name_prefix='event-handler')
+        self._stuck: set = set()
+        self._lock = threading.Lock()
+        # coalescing key -> [last dispatch (monotonic), suppressed since]
+        self._recent: Dict[Tuple[str, str], List[float]] = {}
+        self.dead_letters: deque = deque(maxlen=100)
+        self.latencies: Dict[str, LatencyHistogram] = {}
+        self.counters = {'dispatched': 0, 'coalesced': 0, 'completed': 0, 'failed': 0, 'timed_out': 0, 'dropped': 0,
+                         'rejected': 0}
+        self._in_flight = 0
+
+        self._workers = [threading.Thread(target=self._work, name=f'event-dispatch-{i}', daemon=True)
+                         for i in range(max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def register(self, event_type: str, handler: Callable):
+        self.handlers.setdefault(event_type, []).append(handler)
+
+    def dispatch(self, event_type: str, data: Dict[str, Any]) -> bool:
+        """Queue the event for its handlers; returns False if coalesced or dropped"""
+        key = (event_type, str(data.get('type', '')))
+        now = time.monotonic()
+        with self._lock:
+            recent = self._recent.get(key)
+            if recent and now - recent[0] < self.coalesce_seconds:
+                recent[1] += 1
+                self.counters['coalesced'] += 1
+                return False
+            suppressed = int(recent[1]) if recent else 0
+            self._recent[key] = [now, 0]
+            self.counters['dispatched'] += 1
+
+        if suppressed:
+            data = {**data, 'coalesced_count': suppressed}
+        jobs = [(event_type, data, handler, False) for handler in self.handlers.get(event_type, [])]
+        jobs += [(event_type, data, listener, True) for listener in self.listeners]
+        for job in jobs:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                with self._lock:
+                    self.counters['dropped'] += 1
+                self._dead_letter(job, 'queue full')
+        return True
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                self._in_flight += 1
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._queue.task_done()
+
+    def _run(self, job: Tuple[str, Dict[str, Any], Callable, bool]):
+        event_type, data, handler, listener = job
+        name = getattr(handler, '__qualname__', repr(handler))
+        with self._lock:
+            stuck = len(self._stuck)
+            if stuck >= self.max_stuck:
+                self.counters['rejected'] += 1
+        if stuck >= self.max_stuck:
+            self._dead_letter(job, f"rejected: {stuck} timed-out handlers still running")
+            return
+
+        started = time.perf_counter()
+        future = self._executor.submit(handler, event_type, data) if listener else self._executor.submit(handler, data)
+        try:
+            future.result(timeout=self.handler_timeout)
+            outcome = 'completed'
+        except FutureTimeoutError:
+            outcome = 'timed_out'
+            if not future.cancel():
+                # Already running: its thread stays taken until the handler returns
+                with self._lock:
+                    self._stuck.add(future)
+                future.add_done_callback(self._release_stuck)
+            self._dead_letter(job, f"timed out after {self.handler_timeout:.1f}s")
+        except Exception as e:
+            outcome = 'failed'
+            self._dead_letter(job, str(e))
+
+        with self._lock:
+            self.counters[outcome] += 1
+            histogram = self.latencies.get(name)
+            if histogram is None:
+                histogram = self.latencies[name] = LatencyHistogram()
+        histogram.observe((time.perf_counter() - started) * 1000)
+
+    def _release_stuck(self, future):
+        with self._lock:
+            self._stuck.discard(future)
+
+    def _dead_letter(self, job: Tuple[str, Dict[str, Any], Callable, bool], error: str):
+        event_type, data, handler, _ = job
+        entry = {
+            'timestamp': datetime.now().isoformat(),
+            'event_type': event_type,
+            'handler': getattr(handler, '__qualname__', repr(handler)),
+            'error': error,
+            'data': data
+        }
+        self.dead_letters.append(entry)
+        self.logger.error(f"Event handler {entry['handler']} failed for {event_type}: {error}")
+        if self.dead_letter_path:
+            try:
+                self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.dead_letter_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            except OSError as e:
+                self.logger.warning(f"Could not write dead letter: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'in_flight': self._in_flight,
+                'stuck': len(self._stuck),
+                **self.counters,
+                'dead_letters': len(self.dead_letters),
+                'handler_latency': {name: histogram.snapshot() for name, histogram in self.latencies.items()}
+            }
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the queue is drained; returns False on timeout"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self, timeout: float = 5.0):
+        self.join(timeout)
+        for _ in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+        self._executor.shutdown(wait=False, cancel_futures=True)
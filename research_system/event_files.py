@@ -0,0 +1,310 @@
+"""
+Research Event Files
+Tệp Sự kiện Nghiên cứu
+
+Reads the daily event partitions written by the collection API
+(events_YYYYMMDD.jsonl), legacy JSON array files (events_YYYYMMDD.json) and
+compacted columnar partitions (events_YYYYMMDD.parquet). Files are pruned by
+the date in their name and read in bounded chunks, so only the requested
+window is ever materialised.
+Đọc các tệp sự kiện theo ngày, lọc theo ngày trong tên tệp và đọc theo từng khối.
+"""
+
+import json
+import logging
+import re
+from datetime import datetime, date, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Iterator, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    PYARROW_AVAILABLE = False
+    STRING_DTYPE = "string"
+
+logger = logging.getLogger(__name__)
+
+EVENT_FILE_PATTERN = re.compile(r"^events_(\d{8})\.(jsonl|json|parquet)$")
+
+# Normalised frame layout shared by every file format
+EVENT_COLUMNS = [
+    'event_id', 'timestamp', 'session_id', 'user_id', 'event_type',
+    'event_data', 'questionnaire_type', 'cohort_version'
+]
+CATEGORICAL_COLUMNS = ['session_id', 'event_type', 'questionnaire_type', 'cohort_version']
+
+# Prefer a parquet partition over the raw file of the same day
+FORMAT_PRIORITY = {'parquet': 0, 'jsonl': 1, 'json': 2}
+RAW_PRIORITY = {'.jsonl': 0, '.json': 1, '.parquet': 2}
+
+# Files written before the newline fix separate records with a literal "\n"
+_LEGACY_SEPARATOR = re.compile(r'(?<=\})\\n(?=\{)')
+
+DEFAULT_CHUNK_SIZE = 50000
+
+def partition_date(path: Path) -> Optional[date]:
+    """Date encoded in an event file name, or None for unrelated files"""
+    match = EVENT_FILE_PATTERN.match(path.name)
+    if not match:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%Y%m%d").date()
+    except ValueError:
+        return None
+
+def list_event_files(data_dir: Path, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None, prefer_raw: bool = False) -> List[Tuple[date, Path]]:
+    """One file per day overlapping [start, end], oldest first
+
+    Partitions are named after the UTC receive date, so one day of slack is
+    kept on each side of the window; rows are filtered exactly when read.
+    With prefer_raw the append-only raw file is chosen whenever it exists, so
+    byte offsets into it stay meaningful for incremental readers.
+    """
+    data_dir = Path(data_dir)
+    if not data_dir.exists():
+        return []
+
+    first_day = (start - timedelta(days=1)).date() if start else None
+    last_day = (end + timedelta(days=1)).date() if end else None
+
+    by_day: Dict[date, Path] = {}
+    for path in data_dir.iterdir():
+        day = partition_date(path)
+        if day is None:
+            continue
+        if (first_day and day < first_day) or (last_day and day > last_day):
+            continue
+
+        current = by_day.get(day)
+        if prefer_raw:
+            replace = current is None or RAW_PRIORITY[path.suffix] < RAW_PRIORITY[current.suffix]
+        else:
+            replace = current is None or _prefer(path, current)
+        if replace:
+            by_day[day] = path
+
+    return sorted(by_day.items())
+
+def _prefer(candidate: Path, current: Path) -> bool:
+    """Whether candidate should replace current as the file read for its day"""
+    candidate_rank = FORMAT_PRIORITY[candidate.suffix.lstrip('.')]
+    current_rank = FORMAT_PRIORITY[current.suffix.lstrip('.')]
+
+    if candidate_rank < current_rank:
+        # A compacted partition is stale if the raw file was appended to afterwards
+        return candidate.stat().st_mtime >= current.stat().st_mtime
+    if current.suffix == '.parquet' and candidate_rank > current_rank:
+        return candidate.stat().st_mtime > current.stat().st_mtime
+    return False
+
+def normalize_event(record: Dict[str, Any]) -> Tuple:
+    """Map a collection API record (or a legacy analytics record) onto EVENT_COLUMNS"""
+    payload = record.get('payload', record.get('event_data'))
+    if isinstance(payload, str):
+        event_data = payload
+        questionnaire_type = None
+    else:
+        payload = payload or {}
+        event_data = json.dumps(payload, ensure_ascii=False, separators=(',', ':'))
+        questionnaire_type = payload.get('questionnaire_type')
+
+    return (
+        record.get('event_id'),
+        record.get('timestamp') or record.get('client_ts') or record.get('received_at'),
+        record.get('session_id'),
+        record.get('user_id') or record.get('user_pseudo_id'),
+        record.get('event_type') or record.get('event_name'),
+        event_data,
+        record.get('questionnaire_type', questionnaire_type),
+        record.get('cohort_version')
+    )
+
+def _parse_line(line: str) -> List[Dict[str, Any]]:
+    line = line.strip()
+    if not line:
+        return []
+    try:
+        return [json.loads(line)]
+    except json.JSONDecodeError:
+        line = line[:-2] if line.endswith('\\n') else line
+        return [json.loads(part) for part in _LEGACY_SEPARATOR.split(line) if part]
+
+def _iter_raw_records(path: Path) -> Iterator[Dict[str, Any]]:
+    if path.suffix == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            records = json.load(f)
+        yield from (records if isinstance(records, list) else [records])
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            try:
+                yield from _parse_line(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping malformed line {line_number} in {path}: {e}")
+
+def read_records_from(path: Path, offset: int = 0, closed: bool = False) -> Tuple[List[Dict[str, Any]], int]:
+    """Records appended to a JSONL file since byte `offset`, and the offset to resume from
+
+    A trailing line without a newline may still be being written and is left
+    for the next call, unless the partition is closed. JSON array and parquet
+    partitions are not append-only and are returned whole on the first call.
+    """
+    path = Path(path)
+    size = path.stat().st_size
+    if path.suffix != '.jsonl':
+        if offset:
+            return [], offset
+        if path.suffix == '.parquet':
+            frame = pd.read_parquet(path, columns=EVENT_COLUMNS)
+            frame['timestamp'] = frame['timestamp'].map(lambda ts: ts.isoformat() if pd.notna(ts) else None)
+            return frame.astype(object).where(frame.notna(), None).to_dict('records'), size
+        return list(_iter_raw_records(path)), size
+
+    records = []
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n') and not closed:
+                break
+            try:
+                records.extend(_parse_line(line.decode('utf-8')))
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                logger.warning(f"Skipping malformed line at byte {offset} in {path}: {e}")
+            offset += len(line)
+    return records, offset
+
+def extract_payload_field(event_data: pd.Series, field: str) -> pd.Series:
+    """Vectorised lookup of one top-level string or number field from JSON text or dict payloads"""
+    if event_data.empty:
+        return pd.Series(index=event_data.index, dtype=object)
+
+    dtype = event_data.dtype
+    if PYARROW_AVAILABLE and isinstance(dtype, pd.StringDtype) and dtype.storage == "pyarrow":
+        return _extract_payload_field_arrow(event_data, field)
+
+    values = event_data.astype(object)
+    is_text = values.map(lambda value: isinstance(value, str))
+    result = values.map(lambda value: value.get(field) if isinstance(value, dict) else None)
+    if is_text.any():
+        pattern = r'"%s"\s*:\s*(?:"((?:[^"\\]|\\.)*)"|(-?\d+(?:\.\d+)?))' % re.escape(field)
+        extracted = values[is_text].astype(str).str.extract(pattern)
+        numbers = pd.to_numeric(extracted[1], errors='coerce')
+        result = result.astype(object)
+        result[is_text] = extracted[0].astype(object).where(extracted[0].notna(), numbers)
+    return result
+
+def _extract_payload_field_arrow(event_data: pd.Series, field: str) -> pd.Series:
+    """extract_payload_field for Arrow-backed JSON text, using the pyarrow regex kernel"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    pattern = r'"%s"\s*:\s*(?:"(?P<text>(?:[^"\\]|\\.)*)"|(?P<number>-?\d+(?:\.\d+)?))' % re.escape(field)
+    matches = pc.extract_regex(pa.array(event_data.array), pattern)
+    text = pd.Series(matches.field('text').to_numpy(zero_copy_only=False), index=event_data.index).astype(object)
+    number = pd.to_numeric(pd.Series(matches.field('number').to_numpy(zero_copy_only=False), index=event_data.index), errors='coerce')
+    # Unmatched alternatives come back as empty strings
+    return text.where(text.notna() & (text != ''), number.astype(object).where(number.notna(), None))
+
+def records_to_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Normalised frame for a list of raw event records"""
+    return _rows_to_frame([normalize_event(record) for record in records])
+
+def _rows_to_frame(rows: List[Tuple]) -> pd.DataFrame:
+    columns = list(zip(*rows)) if rows else [[] for _ in EVENT_COLUMNS]
+    frame = pd.DataFrame({
+        name: pd.array(values, dtype=STRING_DTYPE)
+        for name, values in zip(EVENT_COLUMNS, columns)
+        if name != 'timestamp'
+    })
+    frame.insert(1, 'timestamp', _parse_timestamps(columns[1]))
+    return frame
+
+def _parse_timestamps(values) -> pd.Series:
+    # Client timestamps mix naive and offset forms: read both as UTC, then drop the zone
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', format='ISO8601', utc=True)
+    return parsed.dt.tz_localize(None)
+
+def _filter_window(frame: pd.DataFrame, start: Optional[datetime], end: Optional[datetime]) -> pd.DataFrame:
+    mask = frame['timestamp'].notna()
+    if start is not None:
+        mask &= frame['timestamp'] >= start
+    if end is not None:
+        mask &= frame['timestamp'] <= end
+    return frame[mask] if not mask.all() else frame
+
+def iter_event_chunks(path: Path, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Normalised frames of at most chunk_size rows from one event file, filtered to the window"""
+    path = Path(path)
+
+    if path.suffix == '.parquet':
+        filters = [('timestamp', '>=', start)] if start is not None else []
+        filters += [('timestamp', '<=', end)] if end is not None else []
+        # Row groups outside the window are skipped using the parquet statistics
+        frame = pd.read_parquet(path, columns=EVENT_COLUMNS, filters=filters or None)
+        frame = frame.astype({name: STRING_DTYPE for name in EVENT_COLUMNS if name != 'timestamp'})
+        yield _filter_window(frame, start, end)
+        return
+
+    rows = []
+    for record in _iter_raw_records(path):
+        rows.append(normalize_event(record))
+        if len(rows) >= chunk_size:
+            yield _filter_window(_rows_to_frame(rows), start, end)
+            rows = []
+    if rows:
+        yield _filter_window(_rows_to_frame(rows), start, end)
+
+def finalize_frame(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate chunks and encode the low-cardinality columns as categoricals"""
+    chunks = [chunk for chunk in chunks if not chunk.empty]
+    if not chunks:
+        return pd.DataFrame()
+
+    frame = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0].reset_index(drop=True)
+    for name in CATEGORICAL_COLUMNS:
+        frame[name] = frame[name].astype('category')
+    return frame
+
+def load_events(data_dir: Path, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                chunk_size: int = DEFAULT_CHUNK_SIZE) -> pd.DataFrame:
+    """All events in [start, end] from the pruned set of daily partitions"""
+    chunks = []
+    for _, path in list_event_files(data_dir, start, end):
+        try:
+            chunks.extend(iter_event_chunks(path, start, end, chunk_size))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read {path}: {e}")
+    return finalize_frame(chunks)
+
+def compact_event_file(path: Path) -> Path:
+    """Rewrite one closed daily partition as a columnar parquet file next to it"""
+    if not PYARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is required to compact event files")
+
+    path = Path(path)
+    frame = finalize_frame(list(iter_event_chunks(path)))
+    if frame.empty:
+        frame = _rows_to_frame([])
+
+    target = path.with_suffix('.parquet')
+    temporary = target.with_suffix('.parquet.tmp')
+    frame.to_parquet(temporary, index=False)
+    temporary.replace(target)
+    return target
+
+def compact_event_files(data_dir: Path, before: Optional[date] = None) -> List[Path]:
+    """Compact every raw partition older than `before` (default: today, UTC)"""
+    before = before or datetime.utcnow().date()
+    compacted = []
+    for day, path in list_event_files(data_dir):
+        if day < before and path.suffix != '.parquet':
+            compacted.append(compact_event_file(path))
+    return compacted
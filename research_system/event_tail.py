@@ -0,0 +1,143 @@
+"""
+Tail-following Feed of Recent Events
+Luồng theo dõi đuôi tệp cho các sự kiện gần đây
+
+Remembers the byte offset reached in every daily JSONL partition and parses
+only lines appended since the last poll, keeping a bounded in-memory window
+of the last N minutes. A poll whose files have not grown costs one stat per
+partition. Pollers can run it in the background and subscribers are pushed
+each batch of new events, so the dashboard waits for updates instead of
+re-reading a day of data on every refresh.
+Mỗi lần làm mới chỉ đọc các dòng mới được ghi thêm.
+"""
+
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Callable
+
+import pandas as pd
+
+from .event_files import list_event_files, read_records_from, records_to_frame
+
+class EventTail:
+    """Bounded window of recent events fed from the appended tail of the event files"""
+
+    def __init__(self, data_dir: Path, window: timedelta = timedelta(hours=4), max_events: int = 200000):
+        self.data_dir = Path(data_dir)
+        self.window = window
+        self.max_events = max_events
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._poll_lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+        self.offsets: Dict[str, int] = {}
+        # (newest timestamp, frame) per poll that found events; whole chunks expire
+        self._chunks: deque = deque()
+        self._size = 0
+        self._merged: pd.DataFrame = records_to_frame([])
+        self._merged_version = 0
+        self.version = 0
+        self.subscribers: List[Callable[[pd.DataFrame], Any]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def poll(self, now: Optional[datetime] = None) -> int:
+        """Read appended lines from every partition in the window; returns the number of new events"""
+        with self._poll_lock:
+            return self._poll(now or datetime.now())
+
+    def _poll(self, now: datetime) -> int:
+        cutoff = now - self.window
+        files = list_event_files(self.data_dir, cutoff, prefer_raw=True)
+        chunks = []
+        for _, path in files:
+            offset = self.offsets.get(path.name, 0)
+            try:
+                size = path.stat().st_size
+                if size == offset:
+                    continue
+                if size < offset:
+                    # Truncated or rewritten partition: read it again from the start
+                    offset = 0
+                records, end = read_records_from(path, offset)
+                frame = records_to_frame(records) if records else None
+            except Exception as e:
+                # The offset is left alone so the same lines are retried next poll
+                self.logger.warning(f"Could not tail {path}: {e}")
+                continue
+            self.offsets[path.name] = end
+            if frame is not None:
+                chunks.append(frame[frame['timestamp'].notna() & (frame['timestamp'] >= cutoff)])
+
+        new_events = pd.concat(chunks, ignore_index=True) if chunks else None
+        with self._lock:
+            # Partitions that have left the window are forgotten
+            live = {path.name for _, path in files}
+            self.offsets = {name: offset for name, offset in self.offsets.items() if name in live}
+            changed = False
+            if new_events is not None and not new_events.empty:
+                self._chunks.append((new_events['timestamp'].max(), new_events))
+                self._size += len(new_events)
+                changed = True
+            while self._chunks and (self._chunks[0][0] < cutoff or self._size - len(self._chunks[0][1]) >= self.max_events):
+                self._size -= len(self._chunks.popleft()[1])
+                changed = True
+            if changed:
+                self.version += 1
+                self._updated.notify_all()
+            if new_events is None or new_events.empty:
+                return 0
+
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber(new_events)
+            except Exception as e:
+                self.logger.error(f"Event tail subscriber failed: {e}")
+        return len(new_events)
+
+    def recent(self, minutes: int = 60, now: Optional[datetime] = None) -> pd.DataFrame:
+        """Events of the last `minutes` held in memory, newest first (no file access)"""
+        cutoff = (now or datetime.now()) - timedelta(minutes=minutes)
+        with self._lock:
+            if self._merged_version != self.version:
+                frames = [frame for _, frame in self._chunks]
+                self._merged = pd.concat(frames, ignore_index=True) if frames else records_to_frame([])
+                self._merged_version = self.version
+            frame = self._merged
+        return frame[frame['timestamp'] >= cutoff].sort_values('timestamp', ascending=False)
+
+    def wait_for_update(self, version: int, timeout: float) -> int:
+        """Block until the window changes past `version` (or timeout); returns the current version"""
+        with self._updated:
+            self._updated.wait_for(lambda: self.version != version, timeout=timeout)
+            return self.version
+
+    def subscribe(self, callback: Callable[[pd.DataFrame], Any]):
+        """Push each batch of new events to callback"""
+        self.subscribers.append(callback)
+
+    def start(self, interval_seconds: float = 2.0):
+        """Poll in a background thread, pushing to subscribers and waiters"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def follow():
+            while not self._stop.is_set():
+                try:
+                    self.poll()
+                except Exception as e:
+                    self.logger.error(f"Event tail poll failed: {e}")
+                self._stop.wait(interval_seconds)
+
+        self._thread = threading.Thread(target=follow, name='event-tail', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
@@ -0,0 +1,240 @@
+"""
+Questionnaire Funnel Engine
+Bộ máy Phễu Bảng hỏi
+
+Per instrument and cohort_version funnels:
+session_started -> consent -> questionnaire_started -> question 1..N ->
+questionnaire_completed -> results_viewed, with drop-off per question.
+
+Events are folded in vectorised passes into a small per-session table, so the
+funnels can be updated incrementally and are cached until new events arrive.
+Phễu theo từng bảng hỏi và phiên bản cohort, cập nhật gia tăng và có bộ nhớ đệm.
+"""
+
+import re
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from .event_files import extract_payload_field
+
+CONSENT_EVENTS = ('consent_given',)
+QUESTION_EVENT = 'question_answered'
+UNKNOWN_COHORT = 'unknown'
+
+_ITEM_INDEX_PATTERN = re.compile(r'_Q(\d+)$')
+
+def prepare_funnel_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Columns the funnel needs, flattening them from event_data where they are missing"""
+    frame = pd.DataFrame({
+        'session_id': df['session_id'].astype(object),
+        'event_type': df['event_type'].astype(object),
+        'timestamp': pd.to_datetime(df['timestamp']) if 'timestamp' in df.columns else pd.NaT,
+        'cohort_version': (df['cohort_version'].astype(object) if 'cohort_version' in df.columns
+                           else UNKNOWN_COHORT)
+    }, index=df.index)
+    frame['cohort_version'] = frame['cohort_version'].fillna(UNKNOWN_COHORT)
+
+    has_payload = 'event_data' in df.columns
+    if 'questionnaire_type' in df.columns:
+        frame['questionnaire_type'] = df['questionnaire_type'].astype(object)
+    else:
+        frame['questionnaire_type'] = extract_payload_field(df['event_data'], 'questionnaire_type') if has_payload else None
+
+    answered = frame['event_type'] == QUESTION_EVENT
+    if 'question_index' in df.columns:
+        question_index = pd.to_numeric(df['question_index'], errors='coerce')
+    elif has_payload:
+        question_index = pd.Series(np.nan, index=df.index)
+        payload = df.loc[answered, 'event_data']
+        explicit = pd.to_numeric(extract_payload_field(payload, 'question_index'), errors='coerce')
+        from_item = pd.to_numeric(
+            extract_payload_field(payload, 'item_id').astype(str).str.extract(_ITEM_INDEX_PATTERN, expand=False),
+            errors='coerce'
+        )
+        question_index.loc[answered] = explicit.fillna(from_item)
+    else:
+        question_index = pd.Series(np.nan, index=df.index)
+    frame['question_index'] = question_index.where(answered)
+
+    return frame.dropna(subset=['session_id', 'event_type'])
+
+def _timestamp_text(values: pd.Series) -> pd.Series:
+    return values.astype(str).where(values.notna(), '')
+
+class FunnelEngine:
+    """Incremental funnel aggregates with a cached result per look-back window"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # "cohort|session" -> [consented, results_viewed, last_seen]
+        self.sessions: Dict[str, List[Any]] = {}
+        # "cohort|instrument|session" -> [max_question_index, completed, last_seen]
+        self.pairs: Dict[str, List[Any]] = {}
+        self._cache: Dict[Any, Dict[str, Any]] = {}
+
+    def fold(self, df: pd.DataFrame) -> int:
+        """Merge a frame of events; one groupby per level, then a per-group merge"""
+        if df is None or df.empty:
+            return 0
+        frame = prepare_funnel_frame(df)
+        if frame.empty:
+            return 0
+
+        frame['is_consent'] = frame['event_type'].isin(CONSENT_EVENTS)
+        frame['is_results'] = frame['event_type'] == 'results_viewed'
+        frame['is_completed'] = frame['event_type'] == 'questionnaire_completed'
+        per_session = frame.groupby(['cohort_version', 'session_id'], sort=False).agg(
+            consented=('is_consent', 'any'), results=('is_results', 'any'), last_seen=('timestamp', 'max')
+        )
+        instrument_events = frame[frame['questionnaire_type'].notna()]
+        per_pair = instrument_events.groupby(['cohort_version', 'questionnaire_type', 'session_id'], sort=False).agg(
+            max_question=('question_index', 'max'), completed=('is_completed', 'any'), last_seen=('timestamp', 'max')
+        )
+        # Timestamps are kept as sortable strings so the state stays JSON-serialisable
+        per_session['last_seen'] = _timestamp_text(per_session['last_seen'])
+        per_pair['last_seen'] = _timestamp_text(per_pair['last_seen'])
+
+        with self._lock:
+            for (cohort, session_id), consented, results, last_seen in zip(
+                    per_session.index, per_session['consented'], per_session['results'], per_session['last_seen']):
+                key = f"{cohort}|{session_id}"
+                current = self.sessions.get(key)
+                if current is None:
+                    self.sessions[key] = [bool(consented), bool(results), last_seen]
+                else:
+                    self.sessions[key] = [current[0] or bool(consented), current[1] or bool(results),
+                                          max(current[2], last_seen)]
+
+            for (cohort, instrument, session_id), max_question, completed, last_seen in zip(
+                    per_pair.index, per_pair['max_question'], per_pair['completed'], per_pair['last_seen']):
+                key = f"{cohort}|{instrument}|{session_id}"
+                max_question = 0 if pd.isna(max_question) else int(max_question)
+                current = self.pairs.get(key)
+                if current is None:
+                    self.pairs[key] = [max_question, bool(completed), last_seen]
+                else:
+                    self.pairs[key] = [max(current[0], max_question), current[1] or bool(completed),
+                                       max(current[2], last_seen)]
+
+            self._cache.clear()
+        return len(frame)
+
+    def expire(self, before: datetime):
+        """Forget sessions last seen before `before`"""
+        cutoff = str(pd.Timestamp(before))
+        with self._lock:
+            self.sessions = {k: v for k, v in self.sessions.items() if v[2] >= cutoff}
+            self.pairs = {k: v for k, v in self.pairs.items() if v[2] >= cutoff}
+            self._cache.clear()
+
+    def compute(self, days_back: Optional[int] = None, now: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        """Funnels as {cohort_version: {instrument: funnel}}, cached until the next fold"""
+        cache_key = (days_back, (now or datetime.now()).strftime('%Y-%m-%dT%H') if days_back else None)
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+            cutoff = str(pd.Timestamp((now or datetime.now()) - timedelta(days=days_back))) if days_back else ''
+            sessions = pd.DataFrame(
+                [key.split('|', 1) + value for key, value in self.sessions.items() if value[2] >= cutoff],
+                columns=['cohort_version', 'session_id', 'consented', 'results', 'last_seen']
+            )
+            pairs = pd.DataFrame(
+                [key.split('|', 2) + value for key, value in self.pairs.items() if value[2] >= cutoff],
+                columns=['cohort_version', 'instrument', 'session_id', 'max_question', 'completed', 'last_seen']
+            )
+            result = compute_funnels(sessions, pairs)
+            self._cache[cache_key] = result
+            return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'sessions': self.sessions, 'pairs': self.pairs}
+
+    def load_dict(self, data: Dict[str, Any]):
+        with self._lock:
+            self.sessions = data.get('sessions', {})
+            self.pairs = data.get('pairs', {})
+            self._cache.clear()
+
+def _stage(name: str, count: int, previous: Optional[int]) -> Dict[str, Any]:
+    drop_off = (previous - count) if previous is not None else 0
+    return {
+        'stage': name,
+        'count': count,
+        'drop_off': drop_off,
+        'drop_off_rate': (drop_off / previous * 100) if previous else 0.0
+    }
+
+def compute_funnels(sessions: pd.DataFrame, pairs: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """Funnels from per-session and per-(session, instrument) tables
+
+    Each (session, instrument) pair gets the depth of the furthest stage it
+    reached; stage counts are the number of pairs at that depth or deeper, so
+    every funnel is monotone and drop-off at a stage is exactly the number of
+    pairs that stopped there. The session_started and consent stages are
+    cohort-wide (sessions that never opened an instrument are counted there).
+    """
+    funnels: Dict[str, Dict[str, Any]] = {}
+    if pairs.empty:
+        return funnels
+
+    sessions = sessions.set_index(['cohort_version', 'session_id'])
+    session_flags = sessions.reindex(pd.MultiIndex.from_arrays([pairs['cohort_version'], pairs['session_id']]))
+    results_viewed = session_flags['results'].fillna(False).to_numpy(dtype=bool)
+
+    cohort_sessions = sessions.groupby(level='cohort_version').size()
+    # Sessions that opened an instrument passed the consent gate even without a consent event
+    instrument_sessions = pairs.drop_duplicates(['cohort_version', 'session_id']).set_index(['cohort_version', 'session_id'])
+    consented_flags = sessions['consented'].copy()
+    consented_flags.loc[consented_flags.index.isin(instrument_sessions.index)] = True
+    cohort_consented = consented_flags.groupby(level='cohort_version').sum()
+
+    questions = pairs.groupby(['cohort_version', 'instrument'])['max_question'].transform('max').to_numpy(dtype=int)
+    max_question = pairs['max_question'].to_numpy(dtype=int)
+    completed = pairs['completed'].to_numpy(dtype=bool)
+
+    # Depth: 2 = questionnaire_started, 2 + i = question i, questions + 3 = completed, + 4 = results
+    depth = np.where(completed & results_viewed, questions + 4,
+                     np.where(completed, questions + 3, 2 + max_question))
+    pairs = pairs.assign(depth=depth, questions=questions)
+
+    for (cohort, instrument), group in pairs.groupby(['cohort_version', 'instrument'], sort=True):
+        n_questions = int(group['questions'].iloc[0])
+        reached = np.bincount(group['depth'].to_numpy(), minlength=n_questions + 5)[::-1].cumsum()[::-1]
+
+        stage_names = (['questionnaire_started'] + [f"question_{i}" for i in range(1, n_questions + 1)]
+                       + ['questionnaire_completed', 'results_viewed'])
+        stages = [
+            _stage('session_started', int(cohort_sessions.get(cohort, 0)), None),
+            _stage('consent', int(cohort_consented.get(cohort, 0)), int(cohort_sessions.get(cohort, 0)))
+        ]
+        previous = stages[-1]['count']
+        for offset, name in enumerate(stage_names, start=2):
+            count = int(reached[offset])
+            stages.append(_stage(name, count, previous))
+            previous = count
+
+        started = int(reached[2])
+        completed_count = int(reached[n_questions + 3])
+        funnels.setdefault(cohort, {})[instrument] = {
+            'stages': stages,
+            'question_drop_off': {
+                i: stages[2 + i]['drop_off'] for i in range(1, n_questions + 1)
+            },
+            'started': started,
+            'completed': completed_count,
+            'completion_rate': (completed_count / started * 100) if started else 0.0
+        }
+    return funnels
+
+def build_funnels(df: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """One-shot funnels for a frame of events"""
+    engine = FunnelEngine()
+    engine.fold(df)
+    return engine.compute()
@@ -0,0 +1,111 @@
+"""
+Concurrent, Cached Health Probes
+Kiểm tra sức khỏe đồng thời có bộ nhớ đệm
+
+Each probe runs on a small thread pool with its own timeout. Results are
+cached for a jittered TTL so probes of many monitors do not line up, and a
+probe that is still running from an earlier cycle is not started again: a
+slow dependency shows up as a timed-out probe instead of stalling the
+monitoring thread. Probe latencies are kept in per-probe histograms.
+Các kiểm tra chỉ đọc, không ghi dữ liệu vào bảng nghiên cứu.
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+from .metrics import LatencyHistogram
+
+# A check returns (status, details, metrics); status is 'healthy', 'warning', 'error' or 'offline'
+ProbeCheck = Callable[[], Tuple[str, Dict[str, Any], Dict[str, Any]]]
+
+@dataclass
+class ProbeResult:
+    """Outcome of one probe run"""
+    status: str
+    details: Dict[str, Any]
+    metrics: Dict[str, Any]
+    checked_at: datetime = field(default_factory=datetime.now)
+    latency_ms: Optional[float] = None
+
+@dataclass
+class HealthProbe:
+    """A named check with its timeout, cache TTL and jitter (fraction of the TTL)"""
+    name: str
+    check: ProbeCheck
+    timeout: float = 5.0
+    ttl: float = 60.0
+    jitter: float = 0.2
+    timeout_status: str = 'warning'
+
+class HealthMonitor:
+    """Runs due probes concurrently and serves cached results in between"""
+
+    def __init__(self, probes: List[HealthProbe], max_workers: Optional[int] = None):
+        self.probes = {probe.name: probe for probe in probes}
+        self.logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or max(1, len(probes)),
+                                            thread_name_prefix='health-probe')
+        self._lock = threading.Lock()
+        self._results: Dict[str, ProbeResult] = {}
+        self._due: Dict[str, float] = {}
+        self._in_flight: Dict[str, Any] = {}
+        self.latencies: Dict[str, LatencyHistogram] = {name: LatencyHistogram() for name in self.probes}
+
+    def run(self, force: bool = False) -> Dict[str, ProbeResult]:
+        """Start every due probe, wait for each up to its timeout, return all cached results"""
+        now = time.monotonic()
+        started = {}
+        with self._lock:
+            for name, probe in self.probes.items():
+                if name in self._in_flight:
+                    continue  # still running from an earlier cycle
+                if not force and now < self._due.get(name, 0.0):
+                    continue
+                future = self._executor.submit(self._execute, probe)
+                self._in_flight[name] = future
+                started[name] = (future, now + probe.timeout)
+
+        for name, (future, deadline) in started.items():
+            try:
+                future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                probe = self.probes[name]
+                with self._lock:
+                    if not future.done():
+                        self._results[name] = ProbeResult(
+                            status=probe.timeout_status,
+                            details={'error': f"timed out after {probe.timeout:.1f}s"},
+                            metrics={}
+                        )
+        return self.results()
+
+    def _execute(self, probe: HealthProbe):
+        started = time.perf_counter()
+        try:
+            status, details, metrics = probe.check()
+        except Exception as e:
+            status, details, metrics = 'error', {'error': str(e)}, {}
+        latency_ms = (time.perf_counter() - started) * 1000
+        self.latencies[probe.name].observe(latency_ms)
+
+        with self._lock:
+            self._results[probe.name] = ProbeResult(status, details, metrics, latency_ms=latency_ms)
+            ttl = probe.ttl * (1 + random.uniform(-probe.jitter, probe.jitter))
+            self._due[probe.name] = time.monotonic() + ttl
+            self._in_flight.pop(probe.name, None)
+
+    def results(self) -> Dict[str, ProbeResult]:
+        with self._lock:
+            return dict(self._results)
+
+    def latency_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {name: histogram.snapshot() for name, histogram in self.latencies.items()}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
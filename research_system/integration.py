@@ -12,6 +12,7 @@ from datetime import datetime
 try:
     from research_system.collector import (
         collect_session_started,
+        collect_consent_given,
         collect_questionnaire_started, 
         collect_question_answered,
         collect_questionnaire_completed,
@@ -59,6 +60,16 @@ class SafeResearchIntegration:
         except Exception:
             pass  # Silent fail
     
+    def track_consent_given(self):
+        """Track research consent - an toàn"""
+        if not self._should_collect():
+            return
+            
+        try:
+            collect_consent_given(self.session_id)
+        except Exception:
+            pass  # Silent fail
+    
     def track_questionnaire_start(self, questionnaire_type: str):
         """Track questionnaire start - an toàn"""
         if not self._should_collect():
@@ -96,7 +107,8 @@ class SafeResearchIntegration:
         self, 
         questionnaire_type: str, 
         total_score: int,
-        completion_time: Optional[int] = None
+        completion_time: Optional[int] = None,
+        subscale_scores: Optional[Dict[str, float]] = None
     ):
         """Track questionnaire completion - an toàn"""
         if not self._should_collect():
@@ -107,7 +119,8 @@ class SafeResearchIntegration:
                 self.session_id,
                 questionnaire_type,
                 total_score,
-                completion_time
+                completion_time,
+                subscale_scores
             )
         except Exception:
             pass  # Silent fail
@@ -140,6 +153,13 @@ def safe_track_session_start(**kwargs):
     except Exception:
         pass
 
+def safe_track_consent_given():
+    """Convenience function - completely safe"""
+    try:
+        get_research_integration().track_consent_given()
+    except Exception:
+        pass
+
 def safe_track_questionnaire_start(questionnaire_type: str, test_mode: bool = False, session_id: str = None):
     """Convenience function - completely safe"""
     try:
@@ -154,10 +174,29 @@ def safe_track_question_answer(questionnaire_type: str, question_idx: int, answe
     except Exception:
         pass
 
-def safe_track_questionnaire_completion(questionnaire_type: str, score: int, test_mode: bool = False, session_id: str = None):
+def _subscale_scores(subscales: Any) -> Dict[str, float]:
+    """Numeric subscale scores from enhanced-result subscales (objects or dicts)"""
+    scores = {}
+    for name, subscale in (subscales or {}).items():
+        value = subscale
+        if isinstance(subscale, dict):
+            value = subscale.get('adjusted', subscale.get('score', subscale.get('raw')))
+        elif hasattr(subscale, 'adjusted'):
+            value = subscale.adjusted
+        if isinstance(value, (int, float)):
+            scores[name] = value
+    return scores
+
+def safe_track_questionnaire_completion(questionnaire_type: str, score: int, test_mode: bool = False,
+                                        session_id: str = None, subscales: Any = None):
     """Convenience function - completely safe"""
     try:
-        get_research_integration().track_questionnaire_complete(questionnaire_type, score)
+        if isinstance(score, dict):
+            subscales = subscales or score.get('subscales')
+            score = score.get('total_score', score.get('score'))
+        get_research_integration().track_questionnaire_complete(
+            questionnaire_type, score, subscale_scores=_subscale_scores(subscales) or None
+        )
     except Exception:
         pass
 
@@ -10,7 +10,7 @@ import os
 import json
 import asyncio
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, List, Any, Optional, Callable
 from pathlib import Path
 import threading
@@ -22,6 +22,9 @@ from .analytics import ResearchAnalytics
 from .database import ResearchDatabase
 from .security import ResearchSecurity
 from .collector import SafeResearchCollector
+from .dispatch import EventDispatcher
+from .health import HealthMonitor, HealthProbe
+from .metrics import EVENTS_INGESTED, INGEST_ERRORS, MetricsRegistry, get_metrics_registry
 from .integration import (
     safe_track_session_start,
     safe_track_questionnaire_start,
@@ -47,8 +50,8 @@ class ResearchSystemManager:
         self.config = self._load_configuration()
         
         # Initialize components
-        self.analytics = ResearchAnalytics()
         self.database = ResearchDatabase()
+        self.analytics = ResearchAnalytics(database=self.database)
         self.security = ResearchSecurity()
         self.collector = SafeResearchCollector()
         
@@ -64,6 +67,15 @@ class ResearchSystemManager:
             'security_alert': [],
             'system_error': []
         }
+        # Handlers and automated responses run off the monitoring thread
+        self.dispatcher = EventDispatcher(
+            max_workers=int(self.config.get('event_handler_workers', 4)),
+            handler_timeout=float(self.config.get('event_handler_timeout', 30)),
+            coalesce_seconds=float(self.config.get('alert_coalesce_seconds', 300)),
+            dead_letter_path=Path("research_data") / "dead_letters.jsonl"
+        )
+        self.dispatcher.handlers = self.event_handlers
+        self.dispatcher.listeners.append(self._handle_automated_response)
         
         # Performance metrics
         self.metrics = {
@@ -72,6 +84,11 @@ class ResearchSystemManager:
             'error_rate': 0,
             'last_activity': None
         }
+        # Ingest counters of this process, plus the collection API's as reported by /health
+        self.metrics_registry = get_metrics_registry()
+        self._api_metrics: Dict[str, Dict[str, Any]] = {}
+        self._last_compliance_check: Optional[float] = None
+        self.health = self._build_health_monitor()
         
         self._initialize_system()
     
@@ -81,12 +98,17 @@ class ResearchSystemManager:
         default_config = {
             "monitoring_interval": 30,
             "health_check_timeout": 5,
+            "health_probe_ttl": 60,
+            "health_probe_jitter": 0.2,
             "auto_cleanup_enabled": True,
             "compliance_validation_interval": 3600,
             "performance_alert_threshold": 100,
             "max_error_rate": 0.05,
             "enable_real_time_monitoring": True,
             "enable_automated_responses": True,
+            "event_handler_workers": 4,
+            "event_handler_timeout": 30,
+            "alert_coalesce_seconds": 300,
             "log_level": "INFO"
         }
         
@@ -155,140 +177,90 @@ class ResearchSystemManager:
                 self.logger.error(f"Error in monitoring loop: {e}")
                 time.sleep(5)  # Brief pause before retrying
     
+    def _build_health_monitor(self) -> HealthMonitor:
+        """Probes for every component; each runs concurrently with its own timeout and TTL"""
+        timeout = float(self.config.get('health_check_timeout', 5))
+        ttl = float(self.config.get('health_probe_ttl', 60))
+        jitter = float(self.config.get('health_probe_jitter', 0.2))
+        return HealthMonitor([
+            # Counters only, so it is cheap enough to refresh every cycle
+            HealthProbe('analytics', self._probe_analytics, timeout=timeout, ttl=0, jitter=0),
+            HealthProbe('database', self._probe_database, timeout=timeout, ttl=ttl, jitter=jitter),
+            # The key material does not change while running
+            HealthProbe('security', self._probe_security, timeout=timeout, ttl=ttl * 10, jitter=jitter),
+            HealthProbe('collector', self._probe_collector, timeout=timeout, ttl=ttl, jitter=jitter),
+            HealthProbe('api', self._probe_api, timeout=timeout, ttl=ttl, jitter=jitter, timeout_status='offline')
+        ])
+    
     def _perform_health_checks(self):
-        """Perform health checks on all components"""
-        # Check analytics component
-        try:
-            df = self.analytics.load_collected_data(days_back=1)
-            self.component_status['analytics'] = SystemStatus(
-                component='analytics',
-                status='healthy',
-                last_check=datetime.now(),
-                details={'data_available': not df.empty},
-                metrics={'records_loaded': len(df)}
-            )
-        except Exception as e:
-            self.component_status['analytics'] = SystemStatus(
-                component='analytics',
-                status='error',
-                last_check=datetime.now(),
-                details={'error': str(e)},
-                metrics={}
-            )
-        
-        # Check database component
-        try:
-            test_event = {
-                'session_id': 'health_check',
-                'event_type': 'health_check',
-                'timestamp': datetime.now().isoformat(),
-                'anonymized_user_id': 'health_check_user',
-                'consent_status': 'given'
-            }
-            success = self.database.store_event(test_event)
-            
-            self.component_status['database'] = SystemStatus(
-                component='database',
-                status='healthy' if success else 'warning',
-                last_check=datetime.now(),
-                details={'write_test': success},
-                metrics={}
-            )
-        except Exception as e:
-            self.component_status['database'] = SystemStatus(
-                component='database',
-                status='error',
-                last_check=datetime.now(),
-                details={'error': str(e)},
-                metrics={}
-            )
-        
-        # Check security component
-        try:
-            # Test encryption
-            test_data = "health_check_data"
-            encrypted = self.security.encryption.encrypt_data(test_data)
-            decrypted = self.security.encryption.decrypt_data(encrypted)
-            encryption_ok = (test_data == decrypted)
-            
-            self.component_status['security'] = SystemStatus(
-                component='security',
-                status='healthy' if encryption_ok else 'error',
-                last_check=datetime.now(),
-                details={'encryption_test': encryption_ok},
-                metrics={}
-            )
-        except Exception as e:
-            self.component_status['security'] = SystemStatus(
-                component='security',
-                status='error',
-                last_check=datetime.now(),
-                details={'error': str(e)},
-                metrics={}
-            )
-        
-        # Check collector component
-        try:
-            # Test collector functionality
-            collector_status = self.collector.get_collection_status()
-            
-            self.component_status['collector'] = SystemStatus(
-                component='collector',
-                status='healthy',
-                last_check=datetime.now(),
-                details=collector_status,
-                metrics={'events_collected': collector_status.get('total_events', 0)}
-            )
-        except Exception as e:
-            self.component_status['collector'] = SystemStatus(
-                component='collector',
-                status='error',
-                last_check=datetime.now(),
-                details={'error': str(e)},
-                metrics={}
+        """Run due health probes and record their (possibly cached) results"""
+        for component, result in self.health.run().items():
+            self.component_status[component] = SystemStatus(
+                component=component,
+                status=result.status,
+                last_check=result.checked_at,
+                details=result.details,
+                metrics={**result.metrics, 'probe_latency_ms': result.latency_ms}
             )
-        
-        # Check API component (if running)
+    
+    def _probe_analytics(self):
+        # Reads the ingest counters only, no event files
+        events_today = self._counter_total(EVENTS_INGESTED, '24h')
+        return 'healthy', {'data_available': events_today > 0}, {
+            'records_loaded': events_today, 'events_last_hour': self._counter_total(EVENTS_INGESTED, '1h')
+        }
+    
+    def _probe_database(self):
+        # Read-only: no rows are written into research_events
+        readable = self.database.health_check()
+        return ('healthy' if readable else 'error'), {'read_test': readable}, {}
+    
+    def _probe_security(self):
+        test_data = "health_check_data"
+        encrypted = self.security.encryption.encrypt_data(test_data)
+        encryption_ok = self.security.encryption.decrypt_data(encrypted) == test_data
+        return ('healthy' if encryption_ok else 'error'), {'encryption_test': encryption_ok}, {}
+    
+    def _probe_collector(self):
+        enabled = self.collector.enabled
+        return 'healthy', {'enabled': enabled, 'collection_url': self.collector.collection_url}, {}
+    
+    def _probe_api(self):
+        import requests
         try:
-            import requests
-            response = requests.get('http://localhost:8502/health', timeout=5)
-            api_healthy = response.status_code == 200
-            
-            self.component_status['api'] = SystemStatus(
-                component='api',
-                status='healthy' if api_healthy else 'warning',
-                last_check=datetime.now(),
-                details={'response_code': response.status_code if api_healthy else 'timeout'},
-                metrics={'response_time_ms': response.elapsed.total_seconds() * 1000 if api_healthy else 0}
-            )
+            response = requests.get('http://localhost:8502/health',
+                                    timeout=float(self.config.get('health_check_timeout', 5)))
         except Exception as e:
-            self.component_status['api'] = SystemStatus(
-                component='api',
-                status='offline',
-                last_check=datetime.now(),
-                details={'error': str(e)},
-                metrics={}
-            )
+            self._api_metrics = {}
+            return 'offline', {'error': str(e)}, {}
+        api_healthy = response.status_code == 200
+        self._api_metrics = response.json().get('metrics', {}) if api_healthy else {}
+        return ('healthy' if api_healthy else 'warning'), {'response_code': response.status_code}, {
+            'response_time_ms': response.elapsed.total_seconds() * 1000
+        }
+    
+    def _counter_total(self, name: str, window: str) -> int:
+        """Counter total over '1h' or '24h', local ingest plus the collection API"""
+        local = self.metrics_registry.total(name, MetricsRegistry.WINDOWS[window])
+        return local + int(self._api_metrics.get(name, {}).get(window, 0))
     
     def _update_performance_metrics(self):
         """Update system performance metrics"""
         try:
-            # Load recent data
-            df = self.analytics.load_collected_data(days_back=1)
+            # Constant-time reads of the sliding-window ingest counters
+            events_last_hour = self._counter_total(EVENTS_INGESTED, '1h')
+            errors_last_hour = self._counter_total(INGEST_ERRORS, '1h')
+            attempts = events_last_hour + errors_last_hour
             
-            if not df.empty:
-                # Calculate events per hour
-                now = datetime.now()
-                hour_ago = now - timedelta(hours=1)
-                recent_events = len(df[df['timestamp'] >= hour_ago])
-                self.metrics['events_per_hour'] = recent_events
-                
-                # Update total events
-                self.metrics['total_events_processed'] = len(df)
-                self.metrics['last_activity'] = df['timestamp'].max().isoformat()
-                
-                # Calculate error rate (placeholder - would need error tracking)
-                self.metrics['error_rate'] = 0.01  # 1% placeholder
+            self.metrics['events_per_hour'] = events_last_hour
+            self.metrics['total_events_processed'] = self._counter_total(EVENTS_INGESTED, '24h')
+            self.metrics['error_rate'] = errors_last_hour / attempts if attempts else 0
+            
+            local_activity = self.metrics_registry.last_update(EVENTS_INGESTED)
+            activity = [local_activity.isoformat() if local_activity else None,
+                        self._api_metrics.get(EVENTS_INGESTED, {}).get('last_update')]
+            if any(activity):
+                self.metrics['last_activity'] = max(a for a in activity if a)
             
             # Check for performance alerts
             if self.metrics['events_per_hour'] > self.config.get('performance_alert_threshold', 100):
@@ -307,10 +279,17 @@ class ResearchSystemManager:
             self.logger.error(f"Error updating performance metrics: {e}")
     
     def _check_compliance(self):
-        """Check compliance status"""
+        """Check compliance status (at most once per compliance_validation_interval)"""
+        now = time.monotonic()
+        if self._last_compliance_check is not None and \
+                now - self._last_compliance_check < self.config.get('compliance_validation_interval', 3600):
+            return
+        self._last_compliance_check = now
+        
         try:
-            # Get recent events for compliance checking
-            df = self.analytics.load_collected_data(days_back=7)
+            # Oldest event and sample sessions of the last week, from the incremental state
+            self.analytics.update_state()
+            df = self.analytics.state.privacy_sample(days_back=7)
             
             if not df.empty:
                 # Generate compliance report
@@ -323,27 +302,21 @@ class ResearchSystemManager:
             self.logger.error(f"Error checking compliance: {e}")
     
     def _trigger_event(self, event_type: str, data: Dict[str, Any]):
-        """Trigger system events"""
+        """Trigger system events (queued; handlers run on the dispatcher's workers)"""
         try:
-            # Log the event
-            self.logger.info(f"System event triggered: {event_type}")
-            
-            # Call registered handlers
-            for handler in self.event_handlers.get(event_type, []):
-                try:
-                    handler(data)
-                except Exception as e:
-                    self.logger.error(f"Error in event handler: {e}")
-            
-            # Auto-responses if enabled
-            if self.config.get('enable_automated_responses', True):
-                self._handle_automated_response(event_type, data)
+            if self.dispatcher.dispatch(event_type, data):
+                self.logger.info(f"System event triggered: {event_type}")
+            else:
+                self.logger.debug(f"System event coalesced: {event_type}")
                 
         except Exception as e:
             self.logger.error(f"Error triggering event: {e}")
     
     def _handle_automated_response(self, event_type: str, data: Dict[str, Any]):
         """Handle automated responses to system events"""
+        if not self.config.get('enable_automated_responses', True):
+            return
+        
         if event_type == 'compliance_violation':
             # Auto-cleanup if privacy issues detected
             if self.config.get('auto_cleanup_enabled', True):
@@ -373,6 +346,8 @@ class ResearchSystemManager:
             'timestamp': datetime.now().isoformat(),
             'components': {},
             'metrics': self.metrics,
+            'probe_latency': self.health.latency_snapshot(),
+            'event_dispatch': self.dispatcher.stats(),
             'alerts': []
         }
         
@@ -475,10 +450,13 @@ class ResearchSystemManager:
         
         try:
             # Add analytics data
-            df = self.analytics.load_collected_data(days_back=30)
-            if not df.empty:
-                report['analytics_summary'] = self.analytics.generate_usage_statistics(df)
-                report['compliance_status'] = self.analytics.generate_privacy_compliance_report(df)
+            self.analytics.update_state()
+            usage_stats = self.analytics.state.usage_statistics(days_back=30)
+            if 'error' not in usage_stats:
+                report['analytics_summary'] = usage_stats
+                report['compliance_status'] = self.analytics.generate_privacy_compliance_report(
+                    self.analytics.state.privacy_sample(days_back=30)
+                )
             
             # Export to file
             if output_path is None:
@@ -505,6 +483,8 @@ class ResearchSystemManager:
         try:
             # Stop monitoring
             self.stop_monitoring()
+            self.health.shutdown()
+            self.dispatcher.shutdown()
             
             # Perform final maintenance
             self.perform_maintenance()
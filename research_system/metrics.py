@@ -0,0 +1,199 @@
+"""
+Sliding-window In-process Metrics
+Chỉ số trượt theo thời gian trong tiến trình
+
+Counters that ingest paths increment directly and monitors only read. Each
+counter keeps a per-second ring (last hour) and a per-minute ring (last day),
+so reading a window costs the same at any event volume. Every thread writes
+to its own shard, which makes increments lock-free and exact; readers sum the
+shards and fold the shards of finished threads into a retired one.
+Giám sát chỉ đọc bộ đếm, không phân tích lại tệp sự kiện.
+"""
+
+import threading
+import time
+import weakref
+from array import array
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+# Counter names used by the ingest paths
+EVENTS_INGESTED = 'events_ingested'
+INGEST_ERRORS = 'ingest_errors'
+
+SECOND_BUCKETS = 3600  # one hour of 1s buckets
+MINUTE_BUCKETS = 1440  # one day of 60s buckets
+MAX_WINDOW_SECONDS = MINUTE_BUCKETS * 60
+
+class _Ring:
+    """Fixed-size ring of time buckets; a bucket is reset when its slot comes round again"""
+
+    __slots__ = ('width', 'stamps', 'counts')
+
+    def __init__(self, size: int, width: int):
+        self.width = width
+        self.stamps = array('q', [-1]) * size
+        self.counts = array('q', [0]) * size
+
+    def add(self, now: float, n: int):
+        slot = int(now // self.width)
+        index = slot % len(self.stamps)
+        if self.stamps[index] != slot:
+            self.counts[index] = 0
+            self.stamps[index] = slot
+        self.counts[index] += n
+
+    def total(self, now: float, window_seconds: float) -> int:
+        newest = int(now // self.width)
+        oldest = newest - max(1, int(-(-window_seconds // self.width))) + 1
+        return sum(count for stamp, count in zip(self.stamps, self.counts) if oldest <= stamp <= newest)
+
+    def absorb(self, other: '_Ring'):
+        for index, (stamp, count) in enumerate(zip(other.stamps, other.counts)):
+            if stamp < 0 or stamp < self.stamps[index]:
+                continue
+            if stamp > self.stamps[index]:
+                self.stamps[index], self.counts[index] = stamp, 0
+            self.counts[index] += count
+
+class _Shard:
+    """One writer thread's buckets"""
+
+    __slots__ = ('owner', 'seconds', 'minutes')
+
+    def __init__(self, owner: Optional[threading.Thread] = None):
+        self.owner = weakref.ref(owner) if owner is not None else None
+        self.seconds = _Ring(SECOND_BUCKETS, 1)
+        self.minutes = _Ring(MINUTE_BUCKETS, 60)
+
+    def add(self, now: float, n: int):
+        self.seconds.add(now, n)
+        self.minutes.add(now, n)
+
+    def finished(self) -> bool:
+        owner = self.owner() if self.owner else None
+        return owner is None or not owner.is_alive()
+
+    def total(self, now: float, window_seconds: float) -> int:
+        ring = self.seconds if window_seconds <= SECOND_BUCKETS else self.minutes
+        return ring.total(now, window_seconds)
+
+class SlidingCounter:
+    """Event counter readable over any window up to one day"""
+
+    def __init__(self):
+        self._local = threading.local()
+        # Appends and removes are atomic; writers never take a lock
+        self._shards: List[_Shard] = []
+        self._retired = _Shard()
+        self._read_lock = threading.Lock()
+        self.last_update: Optional[float] = None
+
+    def increment(self, n: int = 1, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            self._shards.append(shard)
+        shard.add(now, n)
+        self.last_update = now
+
+    def total(self, window_seconds: float, now: Optional[float] = None) -> int:
+        """Events in the last `window_seconds` (second resolution up to an hour, minute beyond)"""
+        now = time.time() if now is None else now
+        window_seconds = min(window_seconds, MAX_WINDOW_SECONDS)
+        with self._read_lock:
+            for shard in [shard for shard in self._shards if shard.finished()]:
+                self._retired.seconds.absorb(shard.seconds)
+                self._retired.minutes.absorb(shard.minutes)
+                self._shards.remove(shard)
+            shards = [self._retired] + list(self._shards)
+        return sum(shard.total(now, window_seconds) for shard in shards)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with count, sum and max"""
+
+    def __init__(self, bounds_ms=LATENCY_BUCKETS_MS):
+        self.bounds_ms = tuple(bounds_ms)
+        self.counts = [0] * (len(self.bounds_ms) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, latency_ms: float):
+        index = next((i for i, bound in enumerate(self.bounds_ms) if latency_ms <= bound), len(self.bounds_ms))
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total_ms += latency_ms
+            self.max_ms = max(self.max_ms, latency_ms)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile (max for the open bucket)"""
+        if not self.count:
+            return None
+        target, running = q * self.count, 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target and count:
+                return float(self.bounds_ms[index]) if index < len(self.bounds_ms) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            labels = [f"le_{bound}" for bound in self.bounds_ms] + ['inf']
+            return {
+                'count': self.count,
+                'mean_ms': self.total_ms / self.count if self.count else None,
+                'max_ms': self.max_ms,
+                'p50_ms': self.quantile(0.5),
+                'p95_ms': self.quantile(0.95),
+                'buckets': dict(zip(labels, self.counts))
+            }
+
+class MetricsRegistry:
+    """Named SlidingCounters shared by everything in the process"""
+
+    WINDOWS = {'1h': 3600, '24h': 86400}
+
+    def __init__(self):
+        self._counters: Dict[str, SlidingCounter] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str) -> SlidingCounter:
+        counter = self._counters.get(name)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(name, SlidingCounter())
+        return counter
+
+    def increment(self, name: str, n: int = 1):
+        if n:
+            self.counter(name).increment(n)
+
+    def total(self, name: str, window_seconds: float) -> int:
+        counter = self._counters.get(name)
+        return counter.total(window_seconds) if counter else 0
+
+    def last_update(self, name: str) -> Optional[datetime]:
+        counter = self._counters.get(name)
+        return datetime.fromtimestamp(counter.last_update) if counter and counter.last_update else None
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        return {
+            name: {**{label: counter.total(seconds, now) for label, seconds in self.WINDOWS.items()},
+                   'last_update': datetime.fromtimestamp(counter.last_update).isoformat()
+                   if counter.last_update else None}
+            for name, counter in list(self._counters.items())
+        }
+
+_registry = MetricsRegistry()
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Process-wide metrics registry"""
+    return _registry
@@ -10,9 +10,8 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
-import time
 import requests
 from pathlib import Path
 import logging
@@ -23,6 +22,14 @@ import os
 import sys
 sys.path.append('/workspaces/Mentalhealth')
 from research_system.analytics import ResearchAnalytics
+from research_system.event_tail import EventTail
+
+@st.cache_resource
+def get_event_tail(data_dir: str) -> EventTail:
+    """One tail follower per dashboard process, shared by every session and rerun"""
+    tail = EventTail(Path(data_dir))
+    tail.start()
+    return tail
 
 class ResearchMonitoring:
     """Real-time monitoring for research system"""
@@ -57,15 +64,15 @@ class ResearchMonitoring:
         except requests.RequestException:
             return {"error": "API not available"}
     
+    def get_event_tail(self) -> EventTail:
+        return get_event_tail(str(self.analytics.data_dir))
+    
     def get_recent_events(self, minutes: int = 60) -> pd.DataFrame:
         """Get recent events from the last N minutes"""
-        df = self.analytics.load_collected_data(days_back=1)
-        if df.empty:
-            return df
-        
-        cutoff_time = datetime.now() - timedelta(minutes=minutes)
-        recent_df = df[df['timestamp'] >= cutoff_time]
-        return recent_df.sort_values('timestamp', ascending=False)
+        tail = self.get_event_tail()
+        # Only lines appended since the last poll are parsed
+        tail.poll()
+        return tail.recent(minutes=minutes)
 
 def render_system_status():
     """Render system status section"""
@@ -166,15 +173,15 @@ def render_analytics_dashboard():
     
     # Load data for analytics
     days_back = st.slider("Analysis Period (days)", 1, 30, 7)
-    df = monitor.analytics.load_collected_data(days_back=days_back)
+    aggregates = monitor.analytics.get_dashboard_aggregates(days_back=days_back)
     
-    if df.empty:
+    if not aggregates:
         st.warning(f"No data available for the last {days_back} days")
         return
     
-    # Generate analytics
-    usage_stats = monitor.analytics.generate_usage_statistics(df)
-    behavior_patterns = monitor.analytics.analyze_user_behavior_patterns(df)
+    # Shared with the other dashboard workers until new events arrive
+    usage_stats = aggregates['usage_statistics']
+    behavior_patterns = aggregates['behavior_patterns']
     
     # Overview metrics
     st.subheader("📊 Overview")
@@ -245,13 +252,48 @@ def render_analytics_dashboard():
         with col2:
             st.metric("Min Events/Session", session_data.get('min_events_per_session', 0))
             st.metric("Total Sessions", session_data.get('total_sessions', 0))
+    
+    render_funnels(monitor, days_back)
+
+def render_funnels(monitor: ResearchMonitoring, days_back: int):
+    """Render per instrument and cohort funnels from the cached funnel engine"""
+    st.subheader("🔻 Questionnaire Funnels")
+    
+    monitor.analytics.update_state()
+    funnels = monitor.analytics.get_funnels(days_back=days_back)
+    if not funnels:
+        st.info("No questionnaire activity in this period")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        cohort = st.selectbox("Cohort Version", sorted(funnels.keys()))
+    with col2:
+        instrument = st.selectbox("Instrument", sorted(funnels[cohort].keys()))
+    
+    funnel = funnels[cohort][instrument]
+    stages = pd.DataFrame(funnel['stages'])
+    
+    fig = go.Figure(go.Funnel(y=stages['stage'], x=stages['count'], textinfo="value+percent initial"))
+    fig.update_layout(title=f"{instrument} ({cohort}) - completion {funnel['completion_rate']:.1f}%", height=500)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    question_drop_off = funnel['question_drop_off']
+    if question_drop_off:
+        fig = px.bar(
+            x=list(question_drop_off.keys()),
+            y=list(question_drop_off.values()),
+            title="Drop-off per Question",
+            labels={'x': 'Question', 'y': 'Sessions Lost'}
+        )
+        st.plotly_chart(fig, use_container_width=True)
 
 def render_privacy_compliance():
     """Render privacy compliance section"""
     st.header("🔐 Privacy Compliance")
     
     monitor = ResearchMonitoring()
-    df = monitor.analytics.load_collected_data(days_back=30)
+    df = monitor.analytics.load_window(days_back=30)
     
     privacy_report = monitor.analytics.generate_privacy_compliance_report(df)
     
@@ -315,13 +357,9 @@ def main():
     # Auto-refresh toggle
     auto_refresh = st.sidebar.checkbox("Auto Refresh (30s)", value=False)
     
-    if auto_refresh:
-        time.sleep(30)
-        st.experimental_rerun()
-    
     # Manual refresh button
     if st.sidebar.button("🔄 Refresh Now"):
-        st.experimental_rerun()
+        st.rerun()
     
     # Render selected page
     if page == "System Status":
@@ -337,6 +375,12 @@ def main():
     st.sidebar.markdown("---")
     st.sidebar.markdown("**Research System Monitor v1.0**")
     st.sidebar.markdown(f"Last updated: {datetime.now().strftime('%H:%M:%S')}")
+    
+    if auto_refresh:
+        # Rerun as soon as new events are pushed by the tail follower, at the latest after 30s
+        tail = ResearchMonitoring().get_event_tail()
+        tail.wait_for_update(tail.version, timeout=30)
+        st.rerun()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,331 @@
+"""
+Population Norms from Mergeable Score Sketches
+Chuẩn dân số từ các bản phác thảo điểm số có thể gộp
+
+One sketch per (instrument, subscale, cohort) plus an all-cohort sketch,
+updated as questionnaire_completed events are ingested. Instrument scores live
+on small bounded grids (integers, or half points after DASS-style adjustment),
+so the sketch is an exact histogram at 0.5 resolution: it merges by adding
+counts, stays a few hundred bytes per instrument, and gives exact mid-rank
+percentiles. Each ingest process accumulates a delta and merges it into the
+shared norms file under a lock; readers reload the file only when it changes
+and answer percentile lookups from a precomputed cumulative table in O(1).
+Trang kết quả hiển thị bách phân vị thật của người dùng.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+from .event_files import list_event_files, read_records_from
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NORMS_PATH = Path(__file__).resolve().parent.parent / "research_data" / "norms.json"
+
+# Scores are bucketed to this resolution
+SCORE_RESOLUTION = 0.5
+# Norms are not shown until a sketch holds this many scores
+MIN_NORM_SAMPLES = 30
+ALL_COHORTS = '*'
+TOTAL = 'total'
+
+def normalize_instrument(name: str) -> str:
+    """'PHQ-9', 'phq_9' and 'phq9' all name the same instrument"""
+    return re.sub(r'[^a-z0-9]', '', str(name).lower())
+
+def _sketch_key(instrument: str, subscale: str, cohort: str) -> str:
+    return f"{normalize_instrument(instrument)}|{subscale or TOTAL}|{cohort or ALL_COHORTS}"
+
+def _bucket(score: float) -> int:
+    return int(round(float(score) / SCORE_RESOLUTION))
+
+class ScoreSketch:
+    """Exact, mergeable histogram of scores on a SCORE_RESOLUTION grid"""
+
+    __slots__ = ('counts', 'n', 'total', '_table')
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.n = 0
+        self.total = 0.0
+        # (lowest bucket, cumulative count below each bucket) built on first lookup
+        self._table: Optional[Tuple[int, List[int]]] = None
+
+    def add(self, score: float, count: int = 1):
+        bucket = _bucket(score)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.n += count
+        self.total += float(score) * count
+        self._table = None
+
+    def merge(self, other: 'ScoreSketch'):
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.n += other.n
+        self.total += other.total
+        self._table = None
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.n if self.n else None
+
+    def _cumulative(self) -> Tuple[int, List[int]]:
+        if self._table is None:
+            low, high = min(self.counts), max(self.counts)
+            below, running = [], 0
+            for bucket in range(low, high + 2):
+                below.append(running)
+                running += self.counts.get(bucket, 0)
+            self._table = (low, below)
+        return self._table
+
+    def percentile(self, score: float) -> Optional[float]:
+        """Mid-rank percentile: share of scores below plus half of the ties, in %"""
+        if not self.n:
+            return None
+        low, below = self._cumulative()
+        index = _bucket(score) - low
+        if index < 0:
+            return 0.0
+        if index >= len(below) - 1:
+            return 100.0
+        equal = below[index + 1] - below[index]
+        return (below[index] + 0.5 * equal) / self.n * 100
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Smallest score whose cumulative share reaches q (0..1)"""
+        if not self.n:
+            return None
+        target, running = q * self.n, 0
+        for bucket in sorted(self.counts):
+            running += self.counts[bucket]
+            if running >= target:
+                return bucket * SCORE_RESOLUTION
+        return max(self.counts) * SCORE_RESOLUTION
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'n': self.n, 'sum': self.total,
+                'counts': {str(bucket): count for bucket, count in sorted(self.counts.items())}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ScoreSketch':
+        sketch = cls()
+        sketch.counts = {int(bucket): int(count) for bucket, count in data.get('counts', {}).items()}
+        sketch.n = int(data.get('n', sum(sketch.counts.values())))
+        sketch.total = float(data.get('sum', 0.0))
+        return sketch
+
+class PopulationNorms:
+    """Score sketches keyed by instrument, subscale and cohort"""
+
+    def __init__(self):
+        self.sketches: Dict[str, ScoreSketch] = {}
+        self.events = 0
+
+    def add_scores(self, instrument: str, scores: Dict[str, float], cohort: Optional[str] = None):
+        """Add one completed questionnaire; `scores` maps subscale (or 'total') to score"""
+        cohorts = [ALL_COHORTS] + ([cohort] if cohort and cohort != ALL_COHORTS else [])
+        for subscale, score in scores.items():
+            try:
+                score = float(score)
+            except (TypeError, ValueError):
+                continue
+            for name in cohorts:
+                key = _sketch_key(instrument, subscale, name)
+                sketch = self.sketches.get(key)
+                if sketch is None:
+                    sketch = self.sketches[key] = ScoreSketch()
+                sketch.add(score)
+        self.events += 1
+
+    def add_event(self, record: Dict[str, Any]) -> bool:
+        """Fold a questionnaire_completed record (collection API or analytics format)"""
+        if (record.get('event_name') or record.get('event_type')) != 'questionnaire_completed':
+            return False
+        payload = record.get('payload', record.get('event_data'))
+        if isinstance(payload, str):
+            try:
+                payload = json.loads(payload)
+            except ValueError:
+                return False
+        if not isinstance(payload, dict) or not payload.get('questionnaire_type'):
+            return False
+
+        scores = {}
+        if payload.get('total_score') is not None:
+            scores[TOTAL] = payload['total_score']
+        for subscale, score in (payload.get('subscale_scores') or {}).items():
+            if subscale != TOTAL:
+                scores[subscale] = score
+        if not scores:
+            return False
+        self.add_scores(payload['questionnaire_type'], scores, record.get('cohort_version'))
+        return True
+
+    def sketch(self, instrument: str, subscale: str = TOTAL, cohort: str = ALL_COHORTS) -> Optional[ScoreSketch]:
+        return self.sketches.get(_sketch_key(instrument, subscale, cohort))
+
+    def merge(self, other: 'PopulationNorms'):
+        for key, sketch in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = ScoreSketch.from_dict(sketch.to_dict())
+        self.events += other.events
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'events': self.events, 'sketches': {key: s.to_dict() for key, s in sorted(self.sketches.items())}}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'PopulationNorms':
+        norms = cls()
+        norms.events = int(data.get('events', 0))
+        norms.sketches = {key: ScoreSketch.from_dict(s) for key, s in data.get('sketches', {}).items()}
+        return norms
+
+class NormsStore:
+    """Shared, persisted PopulationNorms: ingest processes flush deltas, readers cache by mtime"""
+
+    def __init__(self, path: Path = DEFAULT_NORMS_PATH, flush_every: int = 50,
+                 flush_interval_seconds: float = 30.0, min_samples: int = MIN_NORM_SAMPLES):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self.flush_interval_seconds = flush_interval_seconds
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._delta = PopulationNorms()
+        self._last_flush = time.monotonic()
+        self._cached: Optional[PopulationNorms] = None
+        self._cached_stamp: Optional[Tuple[int, int]] = None
+
+    # Ingest
+
+    def record_event(self, record: Dict[str, Any]) -> bool:
+        with self._lock:
+            added = self._delta.add_event(record)
+            due = self._delta.events >= self.flush_every or \
+                time.monotonic() - self._last_flush >= self.flush_interval_seconds
+        if added and due:
+            self.flush()
+        return added
+
+    def flush(self) -> int:
+        """Merge this process's delta into the norms file; returns the events written"""
+        with self._lock:
+            delta, self._delta = self._delta, PopulationNorms()
+            self._last_flush = time.monotonic()
+        if not delta.events:
+            return 0
+        try:
+            self._merge_into_file(delta)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not persist population norms: {e}")
+            with self._lock:
+                # Keep the delta for the next attempt
+                delta.merge(self._delta)
+                self._delta = delta
+            return 0
+        return delta.events
+
+    def _merge_into_file(self, delta: PopulationNorms):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path.with_suffix('.lock'), 'a') as lock:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                norms = self._read_file() or PopulationNorms()
+                norms.merge(delta)
+                temporary = self.path.with_suffix(f".{os.getpid()}.tmp")
+                with open(temporary, 'w', encoding='utf-8') as f:
+                    json.dump({**norms.to_dict(), 'updated_at': datetime.now().isoformat()}, f)
+                temporary.replace(self.path)
+            finally:
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_file(self) -> Optional[PopulationNorms]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return PopulationNorms.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+
+    # Lookup
+
+    def norms(self) -> PopulationNorms:
+        """Persisted norms, reloaded only when the file has changed"""
+        try:
+            stat = self.path.stat()
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            return PopulationNorms()
+        with self._lock:
+            if stamp != self._cached_stamp:
+                try:
+                    self._cached = self._read_file() or PopulationNorms()
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not read population norms: {e}")
+                    return self._cached or PopulationNorms()
+                self._cached_stamp = stamp
+            return self._cached
+
+    def _usable(self, instrument: str, subscale: str, cohort: str) -> Optional[ScoreSketch]:
+        sketch = self.norms().sketch(instrument, subscale, cohort)
+        return sketch if sketch is not None and sketch.n >= self.min_samples else None
+
+    def percentile(self, instrument: str, score: float, subscale: str = TOTAL,
+                   cohort: str = ALL_COHORTS) -> Optional[float]:
+        """User's percentile among stored scores, or None while there are too few"""
+        sketch = self._usable(instrument, subscale, cohort)
+        return sketch.percentile(score) if sketch else None
+
+    def summary(self, instrument: str, subscale: str = TOTAL, cohort: str = ALL_COHORTS) -> Optional[Dict[str, Any]]:
+        sketch = self._usable(instrument, subscale, cohort)
+        if sketch is None:
+            return None
+        return {'n': sketch.n, 'mean': sketch.mean(), 'median': sketch.quantile(0.5),
+                'p25': sketch.quantile(0.25), 'p75': sketch.quantile(0.75)}
+
+def build_norms(data_dir: Path, path: Optional[Path] = None,
+                start: Optional[datetime] = None, end: Optional[datetime] = None) -> PopulationNorms:
+    """Backfill: rebuild the norms file from the stored event partitions"""
+    norms = PopulationNorms()
+    for _, partition in list_event_files(data_dir, start, end, prefer_raw=True):
+        try:
+            records, _ = read_records_from(partition, closed=True)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read {partition}: {e}")
+            continue
+        for record in records:
+            norms.add_event(record)
+
+    target = Path(path) if path else Path(data_dir) / "norms.json"
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temporary = target.with_suffix(f".{os.getpid()}.tmp")
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump({**norms.to_dict(), 'updated_at': datetime.now().isoformat()}, f)
+    temporary.replace(target)
+    return norms
+
+_store: Optional[NormsStore] = None
+
+def get_norms_store(path: Optional[Path] = None) -> NormsStore:
+    """Process-wide NormsStore for the default norms file"""
+    global _store
+    if path is not None:
+        return NormsStore(path)
+    if _store is None:
+        _store = NormsStore()
+    return _store
@@ -0,0 +1,222 @@
+"""
+Multi-core Map-Reduce Aggregation over Daily Event Files
+Tổng hợp Map-Reduce đa lõi trên các tệp sự kiện theo ngày
+
+Each worker process aggregates one daily partition (JSONL or parquet) into a
+small partial result: event/day/hour counters, users, questionnaire starts and
+one segment per session (first/last timestamp, event count, ordered journey).
+The driver merges partials strictly in partition order, so the result does not
+depend on which worker finishes first, and closes sessions that can no longer
+receive events so memory stays bounded over long backfills.
+Dùng cho backfill dài (ví dụ một năm) trên máy nhiều lõi.
+"""
+
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from .event_files import iter_event_chunks, list_event_files
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:  # Windows
+    RESOURCE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKER_MEMORY_MB = 2048
+# A session may still receive events from the next partition (late uploads, UTC slack)
+OPEN_SESSION_PARTITIONS = 2
+
+def _limit_worker_memory(max_memory_mb: Optional[int]):
+    """Pool initializer: cap the worker's heap so one oversized partition fails alone"""
+    if not max_memory_mb or not RESOURCE_AVAILABLE:
+        return
+    limit = int(max_memory_mb) * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_DATA, (limit, limit))
+    except (ValueError, OSError) as e:
+        logger.warning(f"Could not cap worker memory: {e}")
+
+def aggregate_partition(path: str, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+    """Map step: partial aggregates for one daily partition"""
+    frames = []
+    for chunk in iter_event_chunks(Path(path), start, end):
+        chunk = chunk.dropna(subset=['session_id', 'event_type', 'timestamp'])
+        if not chunk.empty:
+            frames.append(chunk[['session_id', 'user_id', 'event_type', 'questionnaire_type', 'timestamp']]
+                          .astype({'session_id': object, 'user_id': object, 'event_type': object,
+                                   'questionnaire_type': object}))
+
+    partial = {
+        'path': str(path), 'events': Counter(), 'daily': Counter(), 'hourly': Counter(),
+        'users': set(), 'questionnaires': Counter(), 'sessions': {}, 'first': None, 'last': None
+    }
+    if not frames:
+        return partial
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    partial['events'].update(df['event_type'].value_counts().to_dict())
+    partial['daily'].update({str(k): int(v) for k, v in df['timestamp'].dt.date.value_counts().items()})
+    partial['hourly'].update({int(k): int(v) for k, v in df['timestamp'].dt.hour.value_counts().items()})
+    partial['users'] = set(df['user_id'].dropna())
+    started = df.loc[df['event_type'] == 'questionnaire_started', 'questionnaire_type']
+    partial['questionnaires'].update(started.fillna('unknown').value_counts().to_dict())
+    partial['first'], partial['last'] = df['timestamp'].min(), df['timestamp'].max()
+
+    ordered = df.sort_values(['session_id', 'timestamp'], kind='stable')
+    grouped = ordered.groupby('session_id', sort=False)
+    summary = grouped['timestamp'].agg(['min', 'max', 'size'])
+    journeys = grouped['event_type'].agg(' -> '.join)
+    partial['sessions'] = {
+        session_id: (first, last, int(size), journeys[session_id])
+        for session_id, first, last, size in zip(summary.index, summary['min'], summary['max'], summary['size'])
+    }
+    return partial
+
+class AggregationMerger:
+    """Reduce step: folds partials in partition order into the final report"""
+
+    def __init__(self, top_n: int = 10):
+        self.top_n = top_n
+        self.events: Counter = Counter()
+        self.daily: Counter = Counter()
+        self.hourly: Counter = Counter()
+        self.users: set = set()
+        self.questionnaires: Counter = Counter()
+        self.first = None
+        self.last = None
+        # session_id -> [partition, segments[(first, last, n, journey)]]
+        self.open_sessions: Dict[Any, List[Any]] = {}
+        self.durations: List[float] = []
+        self.session_sizes: List[int] = []
+        self.journeys: Counter = Counter()
+        self.partitions = 0
+
+    def merge(self, partial: Dict[str, Any]):
+        index = self.partitions
+        self.partitions += 1
+        self.events.update(partial['events'])
+        self.daily.update(partial['daily'])
+        self.hourly.update(partial['hourly'])
+        self.users |= partial['users']
+        self.questionnaires.update(partial['questionnaires'])
+        if partial['first'] is not None:
+            self.first = partial['first'] if self.first is None else min(self.first, partial['first'])
+            self.last = partial['last'] if self.last is None else max(self.last, partial['last'])
+
+        for session_id, segment in partial['sessions'].items():
+            entry = self.open_sessions.setdefault(session_id, [index, []])
+            entry[0] = index
+            entry[1].append(segment)
+        self._close_sessions(before=index - OPEN_SESSION_PARTITIONS + 1)
+
+    def _close_sessions(self, before: Optional[int] = None):
+        closed = [session_id for session_id, (partition, _) in self.open_sessions.items()
+                  if before is None or partition < before]
+        for session_id in closed:
+            segments = sorted(self.open_sessions.pop(session_id)[1], key=lambda s: (s[0], s[1], s[3]))
+            first = min(s[0] for s in segments)
+            last = max(s[1] for s in segments)
+            self.durations.append((last - first).total_seconds() / 60)
+            self.session_sizes.append(sum(s[2] for s in segments))
+            self.journeys[" -> ".join(s[3] for s in segments)] += 1
+
+    def result(self) -> Dict[str, Any]:
+        self._close_sessions()
+        if not self.session_sizes:
+            return {"usage_statistics": {"error": "No data available"},
+                    "behavior_patterns": {"error": "No data available"}, "partitions": self.partitions}
+
+        sizes = np.asarray(self.session_sizes)
+        durations = np.asarray(self.durations)
+        total_events = int(sizes.sum())
+        usage = {
+            "overview": {
+                "total_events": total_events,
+                "unique_sessions": len(sizes),
+                "unique_users": len(self.users),
+                "date_range": {"start": self.first.isoformat(), "end": self.last.isoformat()},
+                "data_collection_days": (self.last - self.first).days if total_events > 1 else 0
+            },
+            "event_distribution": _ordered_counts(self.events),
+            "daily_usage": dict(sorted(self.daily.items())),
+            "hourly_patterns": dict(sorted(self.hourly.items())),
+            "session_analysis": {
+                "avg_events_per_session": float(sizes.mean()),
+                "max_events_per_session": int(sizes.max()),
+                "min_events_per_session": int(sizes.min()),
+                "total_sessions": len(sizes)
+            }
+        }
+        if any('questionnaire' in name for name in self.events):
+            started = self.events.get('questionnaire_started', 0)
+            completed = self.events.get('questionnaire_completed', 0)
+            usage["completion_rates"] = {
+                "questionnaires_started": started,
+                "questionnaires_completed": completed,
+                "completion_rate": (completed / started * 100) if started > 0 else 0
+            }
+
+        behavior = {
+            "session_duration": {
+                "avg_duration_minutes": float(durations.mean()),
+                "median_duration_minutes": float(np.median(durations)),
+                "max_duration_minutes": float(durations.max()),
+                "sessions_over_5_min": int((durations > 5).sum()),
+                "sessions_over_15_min": int((durations > 15).sum())
+            },
+            "common_user_journeys": dict(list(_ordered_counts(self.journeys).items())[:self.top_n])
+        }
+        if self.questionnaires:
+            behavior["popular_questionnaires"] = _ordered_counts(self.questionnaires)
+
+        return {"usage_statistics": usage, "behavior_patterns": behavior, "partitions": self.partitions}
+
+def _ordered_counts(counter: Counter) -> Dict[str, int]:
+    """Counts by descending frequency, ties broken by key so the order is deterministic"""
+    return {str(k): int(v) for k, v in sorted(counter.items(), key=lambda item: (-item[1], str(item[0])))}
+
+def aggregate_event_files(data_dir: Path, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          workers: Optional[int] = None, max_worker_memory_mb: Optional[int] = DEFAULT_WORKER_MEMORY_MB,
+                          top_n: int = 10) -> Dict[str, Any]:
+    """Usage statistics and behaviour patterns over [start, end] using a process pool
+
+    workers=1 runs in-process. A partition whose worker fails (including
+    MemoryError from the cap) is skipped and listed under failed_partitions.
+    """
+    paths = [str(path) for _, path in list_event_files(data_dir, start, end)]
+    workers = workers or os.cpu_count() or 1
+    merger = AggregationMerger(top_n=top_n)
+    failed = []
+
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            try:
+                merger.merge(aggregate_partition(path, start, end))
+            except (OSError, ValueError, MemoryError) as e:
+                logger.warning(f"Could not aggregate {path}: {e}")
+                failed.append(path)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths)), initializer=_limit_worker_memory,
+                                 initargs=(max_worker_memory_mb,), max_tasks_per_child=32) as pool:
+            futures = [pool.submit(aggregate_partition, path, start, end) for path in paths]
+            # Merge in partition order regardless of completion order
+            for path, future in zip(paths, futures):
+                try:
+                    merger.merge(future.result())
+                except Exception as e:
+                    logger.warning(f"Could not aggregate {path}: {e}")
+                    failed.append(path)
+
+    result = merger.result()
+    result["failed_partitions"] = failed
+    return result
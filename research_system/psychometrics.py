@@ -0,0 +1,270 @@
+"""
+Streaming Item-level Psychometrics
+Đo lường tâm lý cấp câu hỏi dạng luồng
+
+Per instrument running moments of complete responses: count, item means and
+the co-moment matrix, updated with Welford's multivariate recurrence as each
+questionnaire_completed event closes a session's question_answered items.
+Cronbach's alpha, alpha-if-item-deleted, corrected item-total correlations and
+item means are read from the moments in O(items^2), with no pass over
+historical data. Moments from different shards merge exactly (Chan et al.).
+Dùng để đánh giá độ tin cậy của các bản chuyển ngữ tiếng Việt.
+
+Answers are recorded as the option values shown; items listed under
+scoring.reverse_scoring (or flagged reverse_scored) in the instrument config,
+such as PSS-10 items 4, 5, 7 and 8, are reversed before they are folded.
+"""
+
+import json
+import re
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+# data/<instrument>_enhanced_vi.json, relative to the project root
+INSTRUMENT_CONFIG_DIR = Path(__file__).resolve().parent.parent / "data"
+
+# Answers of sessions that never complete are dropped after this long (event time)
+PENDING_TTL = timedelta(days=1)
+
+_ITEM_INDEX_PATTERN = re.compile(r'_Q(\d+)$')
+# "4 - original_score"
+_REVERSE_METHOD_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*-\s*original_score\s*$')
+
+def _instrument_config(instrument: str, config_dir: Path) -> Optional[Dict[str, Any]]:
+    """The instrument's Vietnamese config with a non-empty item list, if there is one"""
+    for name in (f"{instrument}_enhanced_vi.json", f"{instrument}_vi_enhanced.json", f"{instrument}_vi.json"):
+        path = Path(config_dir) / name
+        if path.exists():
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    config = json.load(f)
+                items = config.get('items') or config.get('questions')
+            except (OSError, ValueError, AttributeError):
+                continue
+            if items:
+                return config
+    return None
+
+def instrument_item_count(instrument: str, config_dir: Path = INSTRUMENT_CONFIG_DIR) -> Optional[int]:
+    """Number of items in the instrument's Vietnamese config, if there is one"""
+    config = _instrument_config(instrument, config_dir)
+    return len(config.get('items') or config.get('questions')) if config else None
+
+def _option_mirror(options: Any) -> Optional[float]:
+    """min + max of the option values, so c - answer mirrors an answer across the range"""
+    values = [float(o['value']) for o in options or [] if isinstance(o, dict) and 'value' in o]
+    return min(values) + max(values) if values else None
+
+def instrument_reverse_items(instrument: str, config_dir: Path = INSTRUMENT_CONFIG_DIR) -> Dict[int, float]:
+    """Reverse-scored item index -> c, scored as c - answer (PSS-10: {4: 4, 5: 4, 7: 4, 8: 4}; EPDS: {1: 3, 2: 3})"""
+    config = _instrument_config(instrument, config_dir)
+    if not config:
+        return {}
+    items = config.get('items') or config.get('questions')
+    by_id = {int(item['id']): item for item in items if isinstance(item, dict) and 'id' in item}
+    reverse = (config.get('scoring') or {}).get('reverse_scoring') or {}
+    indices = {int(i) for i in reverse.get('items', [])}
+    indices |= {index for index, item in by_id.items() if item.get('reverse_scored')}
+
+    match = _REVERSE_METHOD_PATTERN.match(str(reverse.get('method', '')))
+    constants = {}
+    for index in sorted(indices):
+        if match:
+            constant = float(match.group(1))
+        else:
+            # An item's own options (EPDS) take precedence over the shared scale
+            constant = _option_mirror(by_id.get(index, {}).get('options'))
+            if constant is None:
+                constant = _option_mirror(config.get('options'))
+        if constant is not None:
+            constants[index] = constant
+    return constants
+
+def _question_index(payload: Dict[str, Any]) -> Optional[int]:
+    index = payload.get('question_index')
+    if index is None and isinstance(payload.get('item_id'), str):
+        match = _ITEM_INDEX_PATTERN.search(payload['item_id'])
+        index = match.group(1) if match else None
+    try:
+        return int(index) if index is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class ItemMoments:
+    """Running mean vector and co-moment matrix of complete k-item responses"""
+
+    def __init__(self, k: int):
+        self.k = k
+        self.n = 0
+        self.mean = np.zeros(k)
+        self.comoment = np.zeros((k, k))
+
+    def add(self, x: np.ndarray):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.comoment += np.outer(delta, x - self.mean)
+
+    def merge(self, other: 'ItemMoments'):
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge moments of {other.k} items into {self.k}")
+        if not other.n:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.comoment += other.comoment + np.outer(delta, delta) * (self.n * other.n / n)
+        self.mean += delta * (other.n / n)
+        self.n = n
+
+    def covariance(self) -> np.ndarray:
+        return self.comoment / (self.n - 1)
+
+    def statistics(self) -> Dict[str, Any]:
+        """Alpha, alpha-if-deleted, corrected item-total correlations and item means"""
+        result: Dict[str, Any] = {
+            'responses': self.n,
+            'items': self.k,
+            'item_means': {i + 1: float(m) for i, m in enumerate(self.mean)}
+        }
+        if self.n < 2 or self.k < 2:
+            result['cronbach_alpha'] = None
+            return result
+
+        cov = self.covariance()
+        variances = np.diag(cov)
+        total_variance = cov.sum()
+        row_sums = cov.sum(axis=1)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = self.k / (self.k - 1) * (1 - variances.sum() / total_variance)
+            # Item i against the total of the other items
+            rest_variance = total_variance - 2 * row_sums + variances
+            item_rest = (row_sums - variances) / np.sqrt(variances * rest_variance)
+            alpha_if_deleted = ((self.k - 1) / (self.k - 2) * (1 - (variances.sum() - variances) / rest_variance)
+                                if self.k > 2 else np.full(self.k, np.nan))
+
+        def clean(value):
+            return float(value) if np.isfinite(value) else None
+
+        result.update({
+            'cronbach_alpha': clean(alpha),
+            'total_score_variance': float(total_variance),
+            'item_variances': {i + 1: float(v) for i, v in enumerate(variances)},
+            'item_total_correlations': {i + 1: clean(r) for i, r in enumerate(item_rest)},
+            'alpha_if_item_deleted': {i + 1: clean(a) for i, a in enumerate(alpha_if_deleted)}
+        })
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'k': self.k, 'n': self.n, 'mean': self.mean.tolist(), 'comoment': self.comoment.tolist()}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ItemMoments':
+        moments = cls(int(data['k']))
+        moments.n = int(data['n'])
+        moments.mean = np.asarray(data['mean'], dtype=float)
+        moments.comoment = np.asarray(data['comoment'], dtype=float)
+        return moments
+
+class PsychometricsEngine:
+    """Folds answered/completed events into per-instrument ItemMoments"""
+
+    def __init__(self, config_dir: Path = INSTRUMENT_CONFIG_DIR):
+        self.config_dir = Path(config_dir)
+        self._lock = threading.RLock()
+        self.instruments: Dict[str, ItemMoments] = {}
+        # "session|instrument" -> {'answers': {index: value}, 'last': timestamp}
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.incomplete = 0
+        self._item_counts: Dict[str, Optional[int]] = {}
+        self._reverse_items: Dict[str, Dict[int, float]] = {}
+
+    def fold_event(self, session_id: Optional[str], event_type: Optional[str],
+                   payload: Dict[str, Any], timestamp: Optional[str]):
+        if not session_id or event_type not in ('question_answered', 'questionnaire_completed'):
+            return
+        instrument = payload.get('questionnaire_type')
+        if not instrument:
+            return
+        key = f"{session_id}|{instrument}"
+
+        with self._lock:
+            if event_type == 'question_answered':
+                index = _question_index(payload)
+                value = payload.get('response_value', payload.get('score'))
+                if index is None or value is None:
+                    return
+                try:
+                    value = float(value)
+                except (TypeError, ValueError):
+                    return
+                entry = self.pending.setdefault(key, {'answers': {}, 'last': timestamp or ''})
+                # A changed answer replaces the earlier one
+                entry['answers'][str(index)] = value
+                entry['last'] = max(entry['last'], timestamp or '')
+                return
+
+            entry = self.pending.pop(key, None)
+            if entry is not None:
+                self._fold_response(instrument, entry['answers'])
+
+    def _fold_response(self, instrument: str, answers: Dict[str, float]):
+        k = self._item_count(instrument, answers)
+        if not k or len(answers) != k or any(str(i) not in answers for i in range(1, k + 1)):
+            # Listwise deletion: only complete responses enter the moments
+            self.incomplete += 1
+            return
+        moments = self.instruments.get(instrument)
+        if moments is None:
+            moments = self.instruments[instrument] = ItemMoments(k)
+        if instrument not in self._reverse_items:
+            self._reverse_items[instrument] = instrument_reverse_items(instrument, self.config_dir)
+        reverse = self._reverse_items[instrument]
+        moments.add(np.array([reverse[i] - answers[str(i)] if i in reverse else answers[str(i)]
+                              for i in range(1, k + 1)], dtype=float))
+
+    def _item_count(self, instrument: str, answers: Dict[str, float]) -> Optional[int]:
+        if instrument in self.instruments:
+            return self.instruments[instrument].k
+        if instrument not in self._item_counts:
+            self._item_counts[instrument] = instrument_item_count(instrument, self.config_dir)
+        # Without a config, the first complete response defines the instrument length
+        return self._item_counts[instrument] or max(int(i) for i in answers)
+
+    def expire_pending(self, now: datetime):
+        cutoff = (now - PENDING_TTL).isoformat()
+        with self._lock:
+            self.pending = {key: entry for key, entry in self.pending.items() if entry['last'] >= cutoff}
+
+    def statistics(self, instrument: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Reliability statistics per instrument (or for one instrument)"""
+        with self._lock:
+            names = [instrument] if instrument else sorted(self.instruments)
+            return {name: self.instruments[name].statistics() for name in names if name in self.instruments}
+
+    def merge(self, other: 'PsychometricsEngine'):
+        with self._lock:
+            for name, moments in other.instruments.items():
+                if name in self.instruments:
+                    self.instruments[name].merge(moments)
+                else:
+                    self.instruments[name] = ItemMoments.from_dict(moments.to_dict())
+            self.incomplete += other.incomplete
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'instruments': {name: moments.to_dict() for name, moments in self.instruments.items()},
+                'pending': self.pending,
+                'incomplete': self.incomplete
+            }
+
+    def load_dict(self, data: Dict[str, Any]):
+        with self._lock:
+            self.instruments = {name: ItemMoments.from_dict(m) for name, m in data.get('instruments', {}).items()}
+            self.pending = data.get('pending', {})
+            self.incomplete = data.get('incomplete', 0)
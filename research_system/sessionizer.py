@@ -0,0 +1,247 @@
+"""
+Streaming Sessionizer for research_sessions
+Bộ tạo phiên dạng luồng cho bảng research_sessions
+
+Consumes ingested events, reorders them within a bounded out-of-order window
+(watermark = latest event time - allowed lateness), keeps per-session state
+(start, end, questionnaire types, completion status, event count) and closes
+sessions after an inactivity gap. Changes are written in batches through a
+sink whose upsert merges deltas (min start, max end, summed counts, union of
+instruments), so flushing an open session twice or receiving a very late
+event for a closed one never double counts.
+Live collection API records are fed as they are written; research_sessions
+can be rebuilt from the daily event partitions with
+`python -m research_system.sessionizer`.
+Phiên được đóng sau một khoảng không hoạt động và được ghi theo lô.
+"""
+
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Callable, Iterable
+
+from .event_files import iter_event_chunks, list_event_files, normalize_event
+
+DEFAULT_INACTIVITY_GAP = timedelta(minutes=30)
+DEFAULT_ALLOWED_LATENESS = timedelta(minutes=5)
+
+# Where the collection API writes its daily partitions
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent.parent / "research_data"
+
+# Completion status ranks; merging keeps the furthest one reached
+COMPLETION_RANK = {'browsing': 0, 'in_progress': 1, 'completed': 2}
+
+def _event_time(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        parsed = value
+    elif value:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    else:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def _questionnaire_type(event: Dict[str, Any]) -> Optional[str]:
+    if event.get('questionnaire_type'):
+        return event['questionnaire_type']
+    payload = event.get('event_data', event.get('payload'))
+    if isinstance(payload, str):
+        try:
+            payload = json.loads(payload)
+        except ValueError:
+            return None
+    return payload.get('questionnaire_type') if isinstance(payload, dict) else None
+
+def api_record_event(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Sessionizer event for a raw collection API record (client_ts, event_name, user_pseudo_id, payload)"""
+    _, timestamp, session_id, user_id, event_type, _, questionnaire_type, _ = normalize_event(record)
+    return {'session_id': session_id, 'timestamp': timestamp, 'user_id': user_id,
+            'event_type': event_type, 'questionnaire_type': questionnaire_type}
+
+def replay_event_files(sessionizer: "Sessionizer", data_dir: Path,
+                       start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+    """Feed every event in the daily partitions (oldest first) to a sessionizer; returns events fed"""
+    fed = 0
+    for _, path in list_event_files(Path(data_dir), start, end):
+        for frame in iter_event_chunks(path, start, end):
+            frame = frame[['session_id', 'timestamp', 'user_id', 'event_type', 'questionnaire_type']]
+            fed += sessionizer.feed(frame.astype(object).where(frame.notna(), None).to_dict('records'))
+    return fed
+
+class SessionState:
+    """Mutable per-session aggregate; `flushed_events` is what the sink has already counted"""
+
+    __slots__ = ('session_id', 'user_id', 'start', 'end', 'consent_status',
+                 'questionnaire_types', 'completion_status', 'event_count', 'flushed_events')
+
+    def __init__(self, session_id: str, timestamp: datetime):
+        self.session_id = session_id
+        self.user_id: Optional[str] = None
+        self.start = timestamp
+        self.end = timestamp
+        self.consent_status = 'unknown'
+        self.questionnaire_types: set = set()
+        self.completion_status = 'browsing'
+        self.event_count = 0
+        self.flushed_events = 0
+
+    def apply(self, event: Dict[str, Any], timestamp: datetime):
+        self.start = min(self.start, timestamp)
+        self.end = max(self.end, timestamp)
+        self.event_count += 1
+        self.user_id = self.user_id or event.get('anonymized_user_id') or event.get('user_id')
+        if event.get('consent_status'):
+            self.consent_status = event['consent_status']
+
+        questionnaire_type = _questionnaire_type(event)
+        if questionnaire_type:
+            self.questionnaire_types.add(questionnaire_type)
+        event_type = event.get('event_type')
+        status = ('completed' if event_type == 'questionnaire_completed'
+                  else 'in_progress' if event_type == 'questionnaire_started' else None)
+        if status and COMPLETION_RANK[status] > COMPLETION_RANK[self.completion_status]:
+            self.completion_status = status
+
+    def to_row(self) -> Dict[str, Any]:
+        """Delta row for the sink: everything since the last flush"""
+        return {
+            'session_id': self.session_id,
+            'anonymized_user_id': self.user_id,
+            'start_time': self.start.isoformat(),
+            'end_time': self.end.isoformat(),
+            'consent_status': self.consent_status,
+            'questionnaire_types': sorted(self.questionnaire_types),
+            'completion_status': self.completion_status,
+            'event_count': self.event_count - self.flushed_events
+        }
+
+class Sessionizer:
+    """Event-time sessionization with bounded reordering and batched upserts"""
+
+    def __init__(self, sink: Callable[[List[Dict[str, Any]]], int],
+                 inactivity_gap: timedelta = DEFAULT_INACTIVITY_GAP,
+                 allowed_lateness: timedelta = DEFAULT_ALLOWED_LATENESS,
+                 batch_size: int = 500, flush_interval_seconds: float = 30.0):
+        self.sink = sink
+        self.inactivity_gap = inactivity_gap
+        self.allowed_lateness = allowed_lateness
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.RLock()
+        self._pending: List[Any] = []  # heap of (timestamp, sequence, event)
+        self._sequence = itertools.count()
+        self._max_seen: Optional[datetime] = None
+        self._released_until: Optional[datetime] = None
+        self.open_sessions: Dict[str, SessionState] = {}
+        self._dirty: Dict[str, SessionState] = {}
+        self._last_flush = time.monotonic()
+        self.stats = {'events': 0, 'late_events': 0, 'skipped_events': 0, 'sessions_closed': 0, 'rows_written': 0}
+
+    @property
+    def watermark(self) -> Optional[datetime]:
+        return self._max_seen - self.allowed_lateness if self._max_seen else None
+
+    def feed(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Buffer events and process everything at or before the watermark"""
+        accepted = 0
+        with self._lock:
+            for event in events:
+                timestamp = _event_time(event.get('timestamp'))
+                if timestamp is None or not event.get('session_id'):
+                    self.stats['skipped_events'] += 1
+                    continue
+                heapq.heappush(self._pending, (timestamp, next(self._sequence), event))
+                if self._max_seen is None or timestamp > self._max_seen:
+                    self._max_seen = timestamp
+                accepted += 1
+
+            self._release(self.watermark)
+            if len(self._dirty) >= self.batch_size or \
+                    time.monotonic() - self._last_flush >= self.flush_interval_seconds:
+                self._flush_dirty()
+        return accepted
+
+    def flush(self, final: bool = False) -> int:
+        """Write dirty sessions; with final=True drain the reorder buffer and close everything"""
+        with self._lock:
+            if final:
+                self._release(None)
+                for session_id in list(self.open_sessions):
+                    self._close(session_id)
+            return self._flush_dirty()
+
+    def _release(self, until: Optional[datetime]):
+        while self._pending and (until is None or self._pending[0][0] <= until):
+            timestamp, _, event = heapq.heappop(self._pending)
+            if self._released_until is not None and timestamp < self._released_until:
+                # Later than the tolerance allows; merged into the stored row by the upsert
+                self.stats['late_events'] += 1
+            else:
+                self._released_until = timestamp
+
+            session_id = str(event['session_id'])
+            # A closed session that has not been flushed yet is reopened rather than replaced
+            state = self.open_sessions.get(session_id) or self._dirty.get(session_id)
+            if state is None:
+                state = SessionState(session_id, timestamp)
+            self.open_sessions[session_id] = state
+            state.apply(event, timestamp)
+            self._dirty[session_id] = state
+            self.stats['events'] += 1
+
+        # Nothing at or before the watermark can still arrive in order, so it is the stream clock
+        clock = until or self._released_until
+        if clock is not None:
+            self._close_inactive(clock - self.inactivity_gap)
+
+    def _close_inactive(self, before: datetime):
+        for session_id in [sid for sid, state in self.open_sessions.items() if state.end < before]:
+            self._close(session_id)
+
+    def _close(self, session_id: str):
+        state = self.open_sessions.pop(session_id)
+        self._dirty[session_id] = state
+        self.stats['sessions_closed'] += 1
+
+    def _flush_dirty(self) -> int:
+        self._last_flush = time.monotonic()
+        if not self._dirty:
+            return 0
+        states = list(self._dirty.values())
+        rows = [state.to_row() for state in states]
+        written = self.sink(rows)
+        if written != len(rows):
+            # Keep them dirty; the deltas are retried with the next batch
+            self.logger.warning(f"Session sink wrote {written} of {len(rows)} rows")
+            return 0
+        for state in states:
+            state.flushed_events = state.event_count
+        self._dirty.clear()
+        self.stats['rows_written'] += written
+        return written
+
+def main():
+    """Backfill research_sessions from the collection API's event partitions"""
+    import argparse
+    from .database import ResearchDatabase
+
+    parser = argparse.ArgumentParser(description="Rebuild research_sessions from the daily event files")
+    parser.add_argument('--data-dir', default=str(DEFAULT_DATA_DIR), help="directory with events_YYYYMMDD.jsonl")
+    args = parser.parse_args()
+
+    closed = ResearchDatabase().rebuild_sessions(data_dir=args.data_dir)
+    print(f"✅ Rebuilt {closed} sessions from {args.data_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Embedded Columnar SQL Engine for Research Analytics
+Bộ máy SQL dạng cột nhúng cho Phân tích Nghiên cứu
+
+Optional DuckDB backend (in-process, no server) that queries the daily event
+partitions (JSONL, legacy JSON and parquet) and the SQLite research store in
+place. Files are pruned by partition date before the scan, time predicates are
+pushed into the scan, and DuckDB parallelises the scan across threads.
+Chỉ dùng khi đã cài duckdb; nếu không, phân tích dùng pandas như trước.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Callable
+
+import pandas as pd
+
+from .event_files import list_event_files
+from .funnels import CONSENT_EVENTS, QUESTION_EVENT, UNKNOWN_COHORT, compute_funnels
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+ENGINE_ENV = "RESEARCH_ANALYTICS_ENGINE"
+
+# Every key either record layout can carry; missing keys read as NULL
+RAW_JSON_COLUMNS = {
+    'event_id': 'VARCHAR', 'timestamp': 'VARCHAR', 'client_ts': 'VARCHAR', 'received_at': 'VARCHAR',
+    'session_id': 'VARCHAR', 'user_id': 'VARCHAR', 'user_pseudo_id': 'VARCHAR',
+    'event_type': 'VARCHAR', 'event_name': 'VARCHAR', 'payload': 'JSON', 'event_data': 'JSON',
+    'questionnaire_type': 'VARCHAR', 'cohort_version': 'VARCHAR'
+}
+
+_RAW_SELECT = """
+    SELECT
+        event_id,
+        TRY_CAST(COALESCE("timestamp", client_ts, received_at) AS TIMESTAMPTZ) AT TIME ZONE 'UTC' AS "timestamp",
+        session_id,
+        COALESCE(user_id, user_pseudo_id) AS user_id,
+        COALESCE(event_type, event_name) AS event_type,
+        CAST(COALESCE(payload, event_data) AS VARCHAR) AS event_data,
+        COALESCE(questionnaire_type, json_extract_string(COALESCE(payload, event_data), '$.questionnaire_type'))
+            AS questionnaire_type,
+        cohort_version
+    FROM read_json({files}, columns={columns}, format='auto', ignore_errors=true)
+"""
+
+_PARQUET_SELECT = """
+    SELECT event_id, "timestamp", session_id, user_id, event_type, event_data, questionnaire_type, cohort_version
+    FROM read_parquet({files})
+"""
+
+def engine_requested() -> bool:
+    """Whether RESEARCH_ANALYTICS_ENGINE asks for the SQL engine (and it can be used)"""
+    return os.getenv(ENGINE_ENV, "pandas").lower() == "duckdb" and DUCKDB_AVAILABLE
+
+def _sql_list(paths: List[Path]) -> str:
+    return "[" + ", ".join("'" + str(path).replace("'", "''") + "'" for path in paths) + "]"
+
+class ResearchSQLEngine:
+    """DuckDB queries over the research event files and SQLite store"""
+
+    def __init__(self, data_dir: Path, sqlite_path: Optional[str] = None, threads: Optional[int] = None):
+        if not DUCKDB_AVAILABLE:
+            raise RuntimeError("duckdb is not installed")
+
+        self.data_dir = Path(data_dir)
+        self.sqlite_path = sqlite_path
+        self.logger = logging.getLogger(__name__)
+        self._connection = duckdb.connect(database=':memory:')
+        self._connection.execute("SET TimeZone = 'UTC'")
+        if threads:
+            self._connection.execute(f"SET threads = {int(threads)}")
+        self._local = threading.local()
+        self._sqlite_scanner: Optional[bool] = None
+
+    def _cursor(self):
+        # DuckDB connections are not thread-safe; each thread gets its own cursor
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._connection.cursor()
+        return cursor
+
+    # Sources
+
+    def events_source(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Optional[str]:
+        """SQL subquery over the partitions overlapping [start, end], or None if there are none"""
+        files = list_event_files(self.data_dir, start, end)
+        raw = [path for _, path in files if path.suffix in ('.jsonl', '.json')]
+        parquet = [path for _, path in files if path.suffix == '.parquet']
+
+        parts = []
+        if raw:
+            columns = "{" + ", ".join(f"'{name}': '{kind}'" for name, kind in RAW_JSON_COLUMNS.items()) + "}"
+            parts.append(_RAW_SELECT.format(files=_sql_list(raw), columns=columns))
+        if parquet:
+            parts.append(_PARQUET_SELECT.format(files=_sql_list(parquet)))
+        if not parts:
+            return None
+
+        conditions = ['"timestamp" IS NOT NULL', 'session_id IS NOT NULL', 'event_type IS NOT NULL']
+        if start is not None:
+            conditions.append(f"\"timestamp\" >= TIMESTAMP '{start.isoformat(sep=' ')}'")
+        if end is not None:
+            conditions.append(f"\"timestamp\" <= TIMESTAMP '{end.isoformat(sep=' ')}'")
+        return f"(SELECT * FROM ({' UNION ALL '.join(parts)}) WHERE {' AND '.join(conditions)})"
+
+    def query_events(self, sql: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                     params: Optional[List[Any]] = None, materialize: bool = False) -> pd.DataFrame:
+        """Run SQL in which the table name `events` is the windowed event source
+
+        With materialize=True the window is scanned once even when the query
+        references `events` several times (e.g. GROUPING SETS).
+        """
+        source = self.events_source(start, end)
+        if source is None:
+            return pd.DataFrame()
+        hint = "MATERIALIZED " if materialize else ""
+        return self._cursor().execute(f"WITH events AS {hint}{source} {sql}", params or []).df()
+
+    def query_frame(self, sql: str, frames: Dict[str, pd.DataFrame], params: Optional[List[Any]] = None) -> pd.DataFrame:
+        """Run SQL over in-memory DataFrames registered under the given names"""
+        cursor = self._cursor()
+        for name, frame in frames.items():
+            cursor.register(name, frame)
+        try:
+            return cursor.execute(sql, params or []).df()
+        finally:
+            for name in frames:
+                cursor.unregister(name)
+
+    def query_sqlite(self, table: str, where: str = "", params: Optional[List[Any]] = None,
+                     columns: str = "*") -> pd.DataFrame:
+        """Read a table of the SQLite store, scanned in place when the sqlite extension loads"""
+        if not self.sqlite_path or not os.path.exists(self.sqlite_path):
+            return pd.DataFrame()
+
+        where_clause = f" WHERE {where}" if where else ""
+        if self._sqlite_scanner_available():
+            path = str(self.sqlite_path).replace("'", "''")
+            return self._cursor().execute(
+                f"SELECT {columns} FROM sqlite_scan('{path}', '{table}'){where_clause}", params or []
+            ).df()
+
+        with sqlite3.connect(self.sqlite_path) as conn:
+            return pd.read_sql_query(f"SELECT {columns} FROM {table}{where_clause}", conn, params=params or [])
+
+    def _sqlite_scanner_available(self) -> bool:
+        if self._sqlite_scanner is None:
+            try:
+                self._connection.execute("LOAD sqlite")
+                self._sqlite_scanner = True
+            except Exception:
+                try:
+                    self._connection.execute("INSTALL sqlite")
+                    self._connection.execute("LOAD sqlite")
+                    self._sqlite_scanner = True
+                except Exception as e:
+                    self.logger.info(f"DuckDB sqlite extension unavailable, reading SQLite via sqlite3: {e}")
+                    self._sqlite_scanner = False
+        return self._sqlite_scanner
+
+    # Analytics (same result layout as the pandas implementations in ResearchAnalytics)
+
+    def usage_statistics(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Any]:
+        # One scan: every breakdown is a grouping set over the materialised window
+        grouped = self.query_events("""
+            SELECT GROUPING(event_type, day, hour, session_id) AS level,
+                   event_type, day, hour, session_id, COUNT(*) AS n,
+                   COUNT(DISTINCT user_id) AS users, MIN("timestamp") AS first_event, MAX("timestamp") AS last_event
+            FROM (SELECT *, CAST("timestamp" AS DATE) AS day, hour("timestamp") AS hour FROM events)
+            GROUP BY GROUPING SETS ((event_type), (day), (hour), (session_id), ())
+        """, start, end, materialize=True)
+        if grouped.empty:
+            return {"error": "No data available"}
+        total = grouped[grouped['level'] == 15].iloc[0]
+        if not total['n']:
+            return {"error": "No data available"}
+
+        event_counts = grouped[grouped['level'] == 7].sort_values(['n', 'event_type'], ascending=[False, True])
+        daily = grouped[grouped['level'] == 11].sort_values('day')
+        hourly = grouped[grouped['level'] == 13].sort_values('hour')
+        per_session = grouped.loc[grouped['level'] == 14, 'n']
+
+        first, last = total['first_event'], total['last_event']
+        stats = {
+            "overview": {
+                "total_events": int(total['n']),
+                "unique_sessions": int(len(per_session)),
+                "unique_users": int(total['users']),
+                "date_range": {"start": first.isoformat(), "end": last.isoformat()},
+                "data_collection_days": (last - first).days if total['n'] > 1 else 0
+            },
+            "event_distribution": dict(zip(event_counts['event_type'], event_counts['n'].astype(int))),
+            "daily_usage": {str(day.date() if hasattr(day, 'date') else day): int(n)
+                            for day, n in zip(daily['day'], daily['n'])},
+            "hourly_patterns": dict(zip(hourly['hour'].astype(int), hourly['n'].astype(int))),
+            "session_analysis": {
+                "avg_events_per_session": float(per_session.mean()),
+                "max_events_per_session": int(per_session.max()),
+                "min_events_per_session": int(per_session.min()),
+                "total_sessions": int(len(per_session))
+            }
+        }
+
+        started = stats["event_distribution"].get('questionnaire_started', 0)
+        completed = stats["event_distribution"].get('questionnaire_completed', 0)
+        if any('questionnaire' in name for name in stats["event_distribution"]):
+            stats["completion_rates"] = {
+                "questionnaires_started": started,
+                "questionnaires_completed": completed,
+                "completion_rate": (completed / started * 100) if started > 0 else 0
+            }
+
+        funnels = self.completion_funnels(start, end)
+        if funnels:
+            stats["completion_funnels"] = funnels
+        return stats
+
+    def completion_funnels(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+        """Same funnels as funnels.build_funnels, from one grouped scan per (cohort, instrument, session)"""
+        consent = ", ".join(f"'{name}'" for name in CONSENT_EVENTS)
+        grouped = self.query_events(f"""
+            SELECT COALESCE(cohort_version, '{UNKNOWN_COHORT}') AS cohort_version,
+                   questionnaire_type AS instrument, session_id,
+                   bool_or(event_type IN ({consent})) AS consented,
+                   bool_or(event_type = 'results_viewed') AS results,
+                   bool_or(event_type = 'questionnaire_completed') AS completed,
+                   MAX(CASE WHEN event_type = '{QUESTION_EVENT}' THEN COALESCE(
+                       TRY_CAST(json_extract_string(event_data, '$.question_index') AS INTEGER),
+                       TRY_CAST(regexp_extract(json_extract_string(event_data, '$.item_id'), '_Q(\\d+)$', 1) AS INTEGER)
+                   ) END) AS max_question,
+                   CAST(MAX("timestamp") AS VARCHAR) AS last_seen
+            FROM events
+            GROUP BY 1, 2, 3
+        """, start, end)
+        if grouped.empty:
+            return {}
+
+        sessions = grouped.groupby(['cohort_version', 'session_id'], sort=False).agg(
+            consented=('consented', 'any'), results=('results', 'any'), last_seen=('last_seen', 'max')
+        ).reset_index()
+        pairs = grouped[grouped['instrument'].notna()].assign(
+            max_question=lambda frame: frame['max_question'].fillna(0).astype(int)
+        )[['cohort_version', 'instrument', 'session_id', 'max_question', 'completed', 'last_seen']]
+        return compute_funnels(sessions, pairs.reset_index(drop=True))
+
+    def behavior_patterns(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                          top_n: int = 10) -> Dict[str, Any]:
+        sessions = self.query_events("""
+            SELECT epoch(MAX("timestamp")) / 60.0 - epoch(MIN("timestamp")) / 60.0 AS minutes,
+                   string_agg(event_type, ' -> ' ORDER BY "timestamp") AS journey,
+                   COUNT(*) FILTER (WHERE event_type = 'questionnaire_started' AND questionnaire_type IS NULL) AS unknown,
+                   list(questionnaire_type) FILTER (WHERE event_type = 'questionnaire_started'
+                                                    AND questionnaire_type IS NOT NULL) AS started
+            FROM events GROUP BY session_id
+        """, start, end)
+        if sessions.empty:
+            return {"error": "No data available"}
+        minutes = sessions['minutes']
+
+        journeys = sessions['journey'].value_counts()
+        journeys = journeys.sort_index(kind='stable').sort_values(ascending=False, kind='stable').head(top_n)
+        started = sessions['started'].dropna().explode().dropna()
+        popularity = started.astype(object).value_counts()
+        unknown = int(sessions['unknown'].sum())
+        if unknown:
+            popularity['unknown'] = popularity.get('unknown', 0) + unknown
+
+        patterns = {
+            "session_duration": {
+                "avg_duration_minutes": float(minutes.mean()),
+                "median_duration_minutes": float(minutes.median()),
+                "max_duration_minutes": float(minutes.max()),
+                "sessions_over_5_min": int((minutes > 5).sum()),
+                "sessions_over_15_min": int((minutes > 15).sum())
+            },
+            "common_user_journeys": {str(k): int(v) for k, v in journeys.items()}
+        }
+        if len(popularity):
+            patterns["popular_questionnaires"] = {
+                str(k): int(v) for k, v in popularity.sort_values(ascending=False, kind='stable').items()
+            }
+        return patterns
+
+    def close(self):
+        self._connection.close()
+
+def benchmark_against_pandas(analytics, days_back: int = 30, repeats: int = 3,
+                             now: Optional[datetime] = None) -> Dict[str, Dict[str, Any]]:
+    """Time each analytics method on the pandas path and the SQL engine, and compare results
+
+    Returns {method: {'pandas_ms', 'duckdb_ms', 'speedup', 'compatible'}}; compatible
+    compares the deterministic parts of the output (journey ties may order differently).
+    """
+    engine = analytics.sql_engine or ResearchSQLEngine(analytics.data_dir)
+    end = now or datetime.now()
+    start = end - timedelta(days=days_back)
+
+    def timed(func: Callable[[], Any]):
+        samples = []
+        result = None
+        for _ in range(repeats):
+            started = time.perf_counter()
+            result = func()
+            samples.append((time.perf_counter() - started) * 1000)
+        return result, sorted(samples)[len(samples) // 2]
+
+    load = lambda: analytics.load_collected_data(days_back=days_back, end_date=end)
+    cases = {
+        'generate_usage_statistics': (
+            lambda: analytics.generate_usage_statistics(load()),
+            lambda: engine.usage_statistics(start, end),
+            _comparable_usage
+        ),
+        'analyze_user_behavior_patterns': (
+            lambda: analytics.analyze_user_behavior_patterns(load()),
+            lambda: engine.behavior_patterns(start, end),
+            _comparable_behavior
+        ),
+    }
+
+    report = {}
+    for name, (pandas_call, sql_call, comparable) in cases.items():
+        pandas_result, pandas_ms = timed(pandas_call)
+        sql_result, sql_ms = timed(sql_call)
+        report[name] = {
+            'pandas_ms': round(pandas_ms, 2),
+            'duckdb_ms': round(sql_ms, 2),
+            'speedup': round(pandas_ms / sql_ms, 2) if sql_ms else None,
+            'compatible': comparable(pandas_result) == comparable(sql_result)
+        }
+    return report
+
+def _comparable_usage(stats: Dict[str, Any]) -> Dict[str, Any]:
+    if "error" in stats:
+        return stats
+    overview = dict(stats["overview"])
+    overview.pop("date_range", None)
+    return {
+        "overview": overview,
+        "event_distribution": {k: int(v) for k, v in stats.get("event_distribution", {}).items()},
+        "daily_usage": {str(k): int(v) for k, v in stats.get("daily_usage", {}).items()},
+        "hourly_patterns": {int(k): int(v) for k, v in stats.get("hourly_patterns", {}).items()},
+        "session_analysis": {k: round(float(v), 6) for k, v in stats.get("session_analysis", {}).items()},
+        "completion_rates": stats.get("completion_rates"),
+        "completion_funnels": stats.get("completion_funnels")
+    }
+
+def _comparable_behavior(patterns: Dict[str, Any]) -> Dict[str, Any]:
+    if "error" in patterns:
+        return patterns
+    return {
+        "session_duration": {k: round(float(v), 6) for k, v in patterns.get("session_duration", {}).items()},
+        "popular_questionnaires": {k: int(v) for k, v in patterns.get("popular_questionnaires", {}).items()},
+        "journey_counts": sorted(int(v) for v in patterns.get("common_user_journeys", {}).values())
+    }
@@ -0,0 +1,251 @@
+"""
+Memory-mapped Arrow Cache of the Loaded Event Window
+Bộ nhớ đệm Arrow ánh xạ bộ nhớ cho cửa sổ sự kiện đã tải
+
+The last loaded window is persisted as Arrow IPC (Feather v2) segments keyed by
+an ingest watermark: the byte offset consumed in every daily JSONL partition.
+Readers memory-map the segments, so Streamlit reruns and every dashboard
+process share the same OS pages instead of re-parsing JSON. When the watermark
+advances only the appended tail is parsed and written as a new segment; the
+cache is rebuilt when files are rewritten or the window moves past its start.
+Updates are serialised across dashboard processes with a lock file next to
+the cache (as the shared norms file is); files are written under per-process
+temporary names and moved into place atomically.
+Dashboard chỉ đọc phần dữ liệu mới được ghi thêm.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+import pandas as pd
+
+from .event_files import (
+    CATEGORICAL_COLUMNS, PYARROW_AVAILABLE, finalize_frame, iter_event_chunks, list_event_files,
+    read_records_from, records_to_frame
+)
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:  # Windows
+    FCNTL_AVAILABLE = False
+
+if PYARROW_AVAILABLE:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.feather as feather
+
+# Segments are merged into one file once there are more than this many
+MAX_SEGMENTS = 16
+# A wider cached window keeps serving narrower requests until it holds this
+# much history before the requested start; then it is rebuilt (trimmed)
+RETAIN_EXTRA = timedelta(days=31)
+# Orphaned segments from interrupted writers are removed after this long
+ORPHAN_AGE_SECONDS = 3600
+
+class WindowCache:
+    """Watermark-keyed, tail-appended Arrow IPC cache for ResearchAnalytics windows"""
+
+    VERSION = 1
+
+    def __init__(self, data_dir: Path, cache_dir: Optional[Path] = None):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("pyarrow is required for the window cache")
+
+        self.data_dir = Path(data_dir)
+        self.cache_dir = Path(cache_dir) if cache_dir else self.data_dir / "cache"
+        self.meta_path = self.cache_dir / "window.json"
+        self.lock_path = self.cache_dir / "window.lock"
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        # Tables already mapped by this process, keyed by segment file name
+        self._mapped: Dict[str, Any] = {}
+
+    def load(self, days_back: int = 30, now: Optional[datetime] = None) -> pd.DataFrame:
+        """Events from the last `days_back` days, served from the cache where possible"""
+        now = now or datetime.now()
+        start = now - timedelta(days=days_back)
+
+        with self._lock, self._file_lock():
+            meta = self._read_meta()
+            files = list_event_files(self.data_dir, start, prefer_raw=True)
+            if meta is None or not self._covers(meta, start):
+                meta = self._rebuild(start, files, meta)
+            else:
+                meta = self._append_tail(meta, start, files)
+            try:
+                table = self._read_segments(meta['segments'])
+            except OSError:
+                # Another process replaced the segments between our meta read and the mapping
+                meta = self._rebuild(start, files, meta)
+                table = self._read_segments(meta['segments'])
+
+        if not table.num_rows:
+            return pd.DataFrame()
+        timestamps = table.column('timestamp')
+        table = table.filter(pc.greater_equal(timestamps, pa.scalar(start, type=timestamps.type)))
+        frame = table.to_pandas()
+        for name in CATEGORICAL_COLUMNS:
+            if not isinstance(frame[name].dtype, pd.CategoricalDtype):
+                frame[name] = frame[name].astype('category')
+        return frame
+
+    def watermark(self) -> Dict[str, int]:
+        meta = self._read_meta()
+        return dict(meta['watermark']) if meta else {}
+
+    def invalidate(self):
+        with self._lock, self._file_lock():
+            if self.meta_path.exists():
+                self.meta_path.unlink()
+            self._mapped.clear()
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive across processes sharing cache_dir (no-op where fcntl is unavailable)"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, 'a') as lock:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if FCNTL_AVAILABLE:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # Building
+
+    def _covers(self, meta: Dict[str, Any], start: datetime) -> bool:
+        if meta.get('version') != self.VERSION:
+            return False
+        base_start = datetime.fromisoformat(meta['start'])
+        # Narrower windows are served from a wider cache, within a bounded amount of extra history
+        return base_start <= start <= base_start + RETAIN_EXTRA
+
+    def _rebuild(self, start: datetime, files: List[Tuple[Any, Path]],
+                 previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        watermark, chunks = {}, []
+        for _, path in files:
+            try:
+                frame, watermark[path.name] = self._read_partition(path, 0, start)
+                chunks.append(frame)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Could not read {path}: {e}")
+
+        segment = self._write_segment(finalize_frame(chunks))
+        meta = self._write_meta({
+            'version': self.VERSION, 'start': start.isoformat(), 'watermark': watermark, 'segments': [segment]
+        })
+        self._remove_stale(superseded=previous['segments'] if previous else [], keep={segment})
+        return meta
+
+    def _append_tail(self, meta: Dict[str, Any], start: datetime, files: List[Tuple[Any, Path]]) -> Dict[str, Any]:
+        watermark = dict(meta['watermark'])
+        chunks = []
+        for _, path in files:
+            offset = watermark.get(path.name)
+            size = path.stat().st_size
+            if offset is not None and size == offset:
+                continue
+            if offset is not None and (path.suffix != '.jsonl' or size < offset):
+                # Rewritten or truncated partition: the cached rows are no longer valid
+                return self._rebuild(datetime.fromisoformat(meta['start']), files, meta)
+            frame, watermark[path.name] = self._read_partition(path, offset or 0, datetime.fromisoformat(meta['start']))
+            chunks.append(frame)
+
+        tail = finalize_frame(chunks)
+        if tail.empty:
+            if watermark == meta['watermark']:
+                return meta
+            return self._write_meta({**meta, 'watermark': watermark})
+
+        segments = meta['segments'] + [self._write_segment(tail)]
+        if len(segments) <= MAX_SEGMENTS:
+            return self._write_meta({**meta, 'watermark': watermark, 'segments': segments})
+
+        merged = self._write_table(self._read_segments(segments))
+        meta = self._write_meta({**meta, 'watermark': watermark, 'segments': [merged]})
+        self._remove_stale(superseded=segments, keep={merged})
+        return meta
+
+    def _read_partition(self, path: Path, offset: int, start: datetime) -> Tuple[pd.DataFrame, int]:
+        if path.suffix == '.jsonl':
+            records, offset = read_records_from(path, offset)
+            frame = records_to_frame(records)
+            frame = frame[frame['timestamp'].notna() & (frame['timestamp'] >= start)]
+            return frame, offset
+        chunks = list(iter_event_chunks(path, start))
+        frame = pd.concat(chunks, ignore_index=True) if chunks else records_to_frame([])
+        return frame, path.stat().st_size
+
+    # Storage
+
+    def _write_segment(self, frame: pd.DataFrame) -> str:
+        return self._write_table(pa.Table.from_pandas(frame, preserve_index=False) if not frame.empty else None)
+
+    def _write_table(self, table) -> str:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        name = f"window-{uuid.uuid4().hex[:12]}.arrow"
+        temporary = self.cache_dir / f"{name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if table is None:
+            table = pa.table({})
+        # Uncompressed so readers can memory-map the buffers without copying
+        feather.write_feather(table, temporary, compression='uncompressed')
+        temporary.replace(self.cache_dir / name)
+        return name
+
+    def _read_segments(self, segments: List[str]):
+        tables = []
+        for name in segments:
+            table = self._mapped.get(name)
+            if table is None:
+                table = feather.read_table(self.cache_dir / name, memory_map=True)
+                self._mapped[name] = table
+            if table.num_columns:
+                tables.append(table)
+        self._mapped = {name: self._mapped[name] for name in segments}
+        if not tables:
+            return pa.table({})
+        return pa.concat_tables(tables, promote_options='permissive') if len(tables) > 1 else tables[0]
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not all((self.cache_dir / name).exists() for name in meta.get('segments', [])):
+            return None
+        return meta
+
+    def _write_meta(self, meta: Dict[str, Any]) -> Dict[str, Any]:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        temporary = self.meta_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        temporary.replace(self.meta_path)
+        return meta
+
+    def _remove_stale(self, superseded: List[str], keep: set):
+        """Delete replaced segments and orphans left by interrupted writers
+
+        Processes that still have a deleted segment mapped keep reading it (POSIX
+        unlink semantics); processes that have not opened it yet rebuild.
+        """
+        cutoff = time.time() - ORPHAN_AGE_SECONDS
+        for path in self.cache_dir.glob("window-*.arrow*"):
+            if path.name in keep:
+                continue
+            try:
+                if path.name in superseded or path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                pass
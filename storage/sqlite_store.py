@@ -0,0 +1,473 @@
+"""
+SOULFRIEND V2.0 - Shared SQLite Storage Layer
+Lớp lưu trữ SQLite dùng chung: đường dẫn cấu hình, pool kết nối WAL, migration, đo thời gian truy vấn
+
+Query profiling is opt-in (SOULFRIEND_SQL_PROFILE=1): every statement's
+fingerprint, time and affected rows are aggregated per interval into the performance
+database's query_performance table, and statements slower than
+SOULFRIEND_SLOW_QUERY_MS get their EXPLAIN QUERY PLAN logged and stored.
+"""
+import atexit
+import hashlib
+import os
+import re
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Callable
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Pragma profile applied to every pooled connection
+DEFAULT_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",  # 16MB
+    "PRAGMA mmap_size=268435456"  # 256MB
+]
+
+DEFAULT_SLOW_QUERY_MS = 100.0
+# Statements that have a query plan (EXPLAIN QUERY PLAN rejects PRAGMA/DDL)
+_PLANNABLE_PATTERN = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def fingerprint_sql(sql: str) -> str:
+    """Normalize a statement so executions that differ only in literals share one key"""
+    normalized = _LITERAL_PATTERN.sub("?", sql)
+    return _WHITESPACE_PATTERN.sub(" ", normalized).strip()
+
+def _add_rows_affected(stats: Dict[str, Any], rowcount: int):
+    # cursor.rowcount is -1 for SELECT and DDL; such statements keep NULL rather than 0
+    if rowcount >= 0:
+        stats["rows_affected"] = (stats["rows_affected"] or 0) + rowcount
+
+def profiling_enabled() -> bool:
+    return os.getenv("SOULFRIEND_SQL_PROFILE", "").lower() in ("1", "true", "yes")
+
+def ensure_query_performance_schema(conn):
+    """query_performance with the profiler's columns (idempotent; older tables gain the new columns)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS query_performance (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            query_type TEXT NOT NULL,
+            execution_time REAL,
+            rows_affected INTEGER,
+            query_hash TEXT,
+            optimization_applied TEXT
+        )
+    ''')
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(query_performance)").fetchall()}
+    for column, column_type in (("store_name", "TEXT"), ("statement", "TEXT"), ("calls", "INTEGER"),
+                                ("max_time", "REAL"), ("slow_calls", "INTEGER"), ("query_plan", "TEXT")):
+        if column not in existing:
+            conn.execute(f"ALTER TABLE query_performance ADD COLUMN {column} {column_type}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_query_hash_time ON query_performance(query_hash, timestamp)")
+
+class QueryProfiler:
+    """Per-interval statement statistics and slow-query plans, flushed to query_performance
+
+    Rows are one per (store, fingerprint, interval): query_type is 'slow' when
+    any call exceeded the threshold, execution_time the total milliseconds,
+    max_time the slowest call and rows_affected the rows written (NULL for
+    SELECT, whose cursor reports no count). A background thread flushes every
+    flush_interval, so a statement never waits on the performance database
+    (possibly locked by the caller's own transaction); a failed flush keeps
+    its interval for the next attempt.
+    """
+
+    def __init__(self, slow_query_ms: Optional[float] = None, flush_interval: float = 60.0,
+                 sink: Optional[Callable[[], "PooledConnection"]] = None):
+        if slow_query_ms is None:
+            slow_query_ms = float(os.getenv("SOULFRIEND_SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS))
+        self.slow_query_ms = slow_query_ms
+        self.flush_interval = flush_interval
+        self._sink = sink or (lambda: get_store("performance").connect())
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._window: Dict[tuple, Dict[str, Any]] = {}
+        # Plans are captured once per (store, fingerprint) per process
+        self._plans: Dict[tuple, str] = {}
+        self._flusher: Optional[threading.Thread] = None
+
+    def record(self, store_name: str, sql: str, parameters, elapsed_ms: float, rows: int,
+               connection: Optional[sqlite3.Connection] = None):
+        fingerprint = fingerprint_sql(sql)
+        key = (store_name, fingerprint)
+        slow = elapsed_ms >= self.slow_query_ms
+        plan = None
+        if slow and key not in self._plans and connection is not None:
+            plan = self._plans[key] = self.explain(connection, sql, parameters)
+            logger.warning(f"🐢 Slow query on {store_name} ({elapsed_ms:.1f} ms): {fingerprint}"
+                           + (f"\n{plan}" if plan else ""))
+
+        with self._lock:
+            stats = self._window.get(key)
+            if stats is None:
+                stats = self._window[key] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows_affected": None,
+                                                "slow_calls": 0}
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            _add_rows_affected(stats, rows)
+            stats["slow_calls"] += slow
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="query-profile-flush", daemon=True)
+                self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(max(self.flush_interval, 0.1))
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Query profile flush failed: {e}")
+
+    @staticmethod
+    def explain(connection: sqlite3.Connection, sql: str, parameters=()) -> Optional[str]:
+        """EXPLAIN QUERY PLAN as indented lines, or None for statements without a plan"""
+        if not _PLANNABLE_PATTERN.match(sql):
+            return None
+        try:
+            # Base-class execute, so a profiling connection does not record the EXPLAIN itself
+            rows = sqlite3.Connection.execute(connection, "EXPLAIN QUERY PLAN " + sql, parameters).fetchall()
+        except sqlite3.Error as e:
+            return f"(no plan: {e})"
+        depth = {0: 0}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            depth[node_id] = depth.get(parent, 0) + 1
+            lines.append("  " * (depth[node_id] - 1) + str(detail))
+        return "\n".join(lines)
+
+    def flush(self) -> int:
+        """Write the current interval to query_performance; returns the number of rows"""
+        with self._flush_lock:
+            with self._lock:
+                window, self._window = self._window, {}
+            if not window:
+                return 0
+            rows = [
+                ("slow" if stats["slow_calls"] else "profile", stats["total_ms"], stats["rows_affected"],
+                 hashlib.sha1(f"{store}:{fingerprint}".encode("utf-8")).hexdigest()[:16],
+                 store, fingerprint, stats["calls"], stats["max_ms"], stats["slow_calls"],
+                 self._plans.get((store, fingerprint)))
+                for (store, fingerprint), stats in window.items()
+            ]
+            conn = None
+            try:
+                conn = self._sink()
+                # Raw connection: the profiler's own writes are not profiled
+                raw = conn._raw
+                ensure_query_performance_schema(raw)
+                raw.executemany('''
+                    INSERT INTO query_performance
+                    (query_type, execution_time, rows_affected, query_hash, store_name, statement,
+                     calls, max_time, slow_calls, query_plan)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                raw.commit()
+            except Exception:
+                self._restore(window)
+                raise
+            finally:
+                if conn is not None:
+                    conn.close()
+            return len(rows)
+
+    def _restore(self, window: Dict[tuple, Dict[str, Any]]):
+        """Merge an interval that could not be written back into the current one"""
+        with self._lock:
+            for key, stats in window.items():
+                current = self._window.get(key)
+                if current is None:
+                    self._window[key] = stats
+                    continue
+                current["calls"] += stats["calls"]
+                current["total_ms"] += stats["total_ms"]
+                current["max_ms"] = max(current["max_ms"], stats["max_ms"])
+                if stats["rows_affected"] is not None:
+                    _add_rows_affected(current, stats["rows_affected"])
+                current["slow_calls"] += stats["slow_calls"]
+
+    def top_queries(self, limit: int = 10, days: int = 7, by: str = "total_ms") -> List[Dict[str, Any]]:
+        """Statements ranked by total time, slowest call or slow-call count over the last `days`"""
+        order = {"total_ms": "total_ms", "max_ms": "max_ms", "slow_calls": "slow_calls"}[by]
+        conn = self._sink()
+        try:
+            raw = conn._raw
+            ensure_query_performance_schema(raw)
+            cursor = raw.execute(f'''
+                SELECT store_name, statement, SUM(calls), SUM(execution_time) AS total_ms,
+                       MAX(max_time) AS max_ms, SUM(slow_calls) AS slow_calls, SUM(rows_affected), MAX(query_plan)
+                FROM query_performance
+                WHERE statement IS NOT NULL AND timestamp >= datetime('now', ?)
+                GROUP BY query_hash
+                ORDER BY {order} DESC
+                LIMIT ?
+            ''', (f"-{int(days)} days", limit))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        return [{
+            "store": store, "statement": statement, "calls": calls, "total_ms": total_ms,
+            "avg_ms": total_ms / calls if calls else 0.0, "max_ms": max_ms, "slow_calls": slow_calls,
+            "rows_affected": rows_affected, "query_plan": plan
+        } for store, statement, calls, total_ms, max_ms, slow_calls, rows_affected, plan in rows]
+
+_profiler: Optional[QueryProfiler] = None
+_profiler_lock = threading.Lock()
+
+def get_query_profiler() -> QueryProfiler:
+    """Process-wide profiler; pending statistics are flushed at exit"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = QueryProfiler()
+            atexit.register(lambda: _profiler.flush())
+        return _profiler
+
+class ProfilingCursor(sqlite3.Cursor):
+    """sqlite3 cursor reporting each statement to the query profiler"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            (self.connection.profiler or get_query_profiler()).record(self.connection.store_name, sql, parameters,
+                                        (time.perf_counter() - started) * 1000, self.rowcount, self.connection)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            (self.connection.profiler or get_query_profiler()).record(self.connection.store_name, sql, seq_of_parameters[0] if seq_of_parameters else (),
+                                        (time.perf_counter() - started) * 1000, self.rowcount, self.connection)
+
+class ProfilingConnection(sqlite3.Connection):
+    """Drop-in sqlite3 connection (via `factory=`) whose statements are profiled"""
+
+    store_name = "sqlite"
+    profiler: Optional[QueryProfiler] = None  # the process-wide profiler when unset
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connect(database, store_name: str, **kwargs) -> sqlite3.Connection:
+    """sqlite3.connect for modules outside the pooled stores; profiled when profiling is enabled"""
+    if not profiling_enabled():
+        return sqlite3.connect(database, **kwargs)
+    conn = sqlite3.connect(database, factory=ProfilingConnection, **kwargs)
+    conn.store_name = store_name
+    return conn
+
+def resolve_db_path(name: str, filename: Optional[str] = None) -> Path:
+    """Database file for a store: SOULFRIEND_<NAME>_DB_PATH, else SOULFRIEND_DATA_DIR/<name>.db"""
+    override = os.getenv(f"SOULFRIEND_{name.upper()}_DB_PATH")
+    if override:
+        return Path(override)
+
+    data_dir = Path(os.getenv("SOULFRIEND_DATA_DIR", PROJECT_ROOT / "data" / "db"))
+    return data_dir / (filename or f"{name}.db")
+
+class TimedCursor:
+    """Cursor proxy that records execution time per statement fingerprint"""
+
+    def __init__(self, cursor: sqlite3.Cursor, store: "SQLiteStore"):
+        self._cursor = cursor
+        self._store = store
+
+    def execute(self, sql: str, parameters=()):
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(sql, parameters)
+            return self
+        finally:
+            self._store.record_query(sql, (time.perf_counter() - started) * 1000, self._cursor.rowcount,
+                                     parameters, self._cursor.connection)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        profiled = self._store.profiler is not None
+        if profiled:
+            # Keep the first parameter set for EXPLAIN QUERY PLAN
+            seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, seq_of_parameters)
+            return self
+        finally:
+            first = seq_of_parameters[0] if profiled and seq_of_parameters else ()
+            self._store.record_query(sql, (time.perf_counter() - started) * 1000, self._cursor.rowcount,
+                                     first, self._cursor.connection)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class PooledConnection:
+    """Connection handle from a SQLiteStore; close() returns it to the pool"""
+
+    def __init__(self, raw: sqlite3.Connection, store: "SQLiteStore"):
+        self._raw = raw
+        self._store = store
+
+    def cursor(self) -> TimedCursor:
+        return TimedCursor(self._raw.cursor(), self._store)
+
+    def execute(self, sql: str, parameters=()) -> TimedCursor:
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters) -> TimedCursor:
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        if self._raw is not None:
+            self._store._release(self._raw)
+            self._raw = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Same semantics as sqlite3.Connection: commit or roll back, do not close
+        if exc_type is None:
+            self._raw.commit()
+        else:
+            self._raw.rollback()
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        if name in ("_raw", "_store"):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._raw, name, value)
+
+class SQLiteStore:
+    """One SQLite database file with a small pool of WAL connections"""
+
+    def __init__(self, name: str, path: Optional[str] = None, pool_size: int = 4,
+                 pragmas: Optional[List[str]] = None, profile: Optional[bool] = None):
+        self.name = name
+        self.path = Path(path) if path else resolve_db_path(name)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.pool_size = pool_size
+        self.pragmas = pragmas if pragmas is not None else DEFAULT_PRAGMAS
+        self._pool: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=pool_size)
+        self._stats_lock = threading.Lock()
+        self._migrate_lock = threading.Lock()
+        self.query_stats: Dict[str, Dict[str, Any]] = {}
+        # Opt-in persistent profiling (defaults to SOULFRIEND_SQL_PROFILE)
+        self.profiler: Optional[QueryProfiler] = (
+            get_query_profiler() if (profiling_enabled() if profile is None else profile) else None
+        )
+
+    @property
+    def db_path(self) -> str:
+        return str(self.path)
+
+    def _open(self) -> sqlite3.Connection:
+        raw = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        for pragma in self.pragmas:
+            raw.execute(pragma)
+        return raw
+
+    def connect(self) -> PooledConnection:
+        """Borrow a connection (opened with the pragma profile on first use)"""
+        try:
+            raw = self._pool.get_nowait()
+        except queue.Empty:
+            raw = self._open()
+        return PooledConnection(raw, self)
+
+    def _release(self, raw: sqlite3.Connection):
+        if raw.in_transaction:
+            raw.rollback()
+        raw.row_factory = None
+        try:
+            self._pool.put_nowait(raw)
+        except queue.Full:
+            raw.close()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for a block; commits on success, rolls back on error"""
+        conn = self.connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def migrate(self, migrations: List[Callable[[PooledConnection], None]]) -> int:
+        """Apply pending schema migrations; migrations[i] brings the file to version i + 1"""
+        with self._migrate_lock, self.connection() as conn:
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            for version, migration in enumerate(migrations[current:], start=current + 1):
+                migration(conn)
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+                logger.info(f"✅ {self.name} database migrated to version {version}")
+            return max(current, len(migrations))
+
+    def record_query(self, sql: str, elapsed_ms: float, rows: int, parameters=(),
+                     connection: Optional[sqlite3.Connection] = None):
+        if self.profiler is not None:
+            self.profiler.record(self.name, sql, parameters, elapsed_ms, rows, connection)
+        key = fingerprint_sql(sql)
+        with self._stats_lock:
+            stats = self.query_stats.get(key)
+            if stats is None:
+                stats = self.query_stats[key] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "rows_affected": None}
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            _add_rows_affected(stats, rows)
+
+    def get_query_stats(self, top_n: int = 10) -> List[Dict[str, Any]]:
+        """Statements with the highest total execution time"""
+        with self._stats_lock:
+            items = [dict(stats, statement=key) for key, stats in self.query_stats.items()]
+        for item in items:
+            item["avg_ms"] = item["total_ms"] / item["calls"] if item["calls"] else 0.0
+        return sorted(items, key=lambda item: item["total_ms"], reverse=True)[:top_n]
+
+    def close_all(self):
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+_stores: Dict[str, SQLiteStore] = {}
+_stores_lock = threading.Lock()
+
+def get_store(name: str, path: Optional[str] = None, **kwargs) -> SQLiteStore:
+    """Process-wide store for a logical database name"""
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = SQLiteStore(name, path=path, **kwargs)
+        return _stores[name]
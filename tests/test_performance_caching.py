@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for the thread-safe caching primitives behind PerformanceOptimizer.cached
+"""
+
+import sys
+import subprocess
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from performance.caching import MISSING, AtomicCounters, SingleFlight, StripedCache, make_cache_key, memoize
+
+
+def test_keys_are_canonical_and_process_stable():
+    key = make_cache_key("ns.f", (1, "a", {"b": 2, "a": [1.5, None]}), {"when": datetime(2025, 1, 1)})
+    assert key == make_cache_key("ns.f", (1, "a", {"a": [1.5, None], "b": 2}), {"when": datetime(2025, 1, 1)})
+    # 1, 1.0, True and "1" are different arguments
+    assert len({make_cache_key("ns.f", (v,)) for v in (1, 1.0, True, "1")}) == 4
+    assert make_cache_key("ns.f", ((1, 2),)) != make_cache_key("ns.f", ([1, 2],))
+    assert make_cache_key("ns.f", (1,)) != make_cache_key("ns.g", (1,))
+
+    code = ("from datetime import datetime; from performance.caching import make_cache_key; "
+            "print(make_cache_key('ns.f', (1, 'a', {'b': 2, 'a': [1.5, None]}), {'when': datetime(2025, 1, 1)}))")
+    other = subprocess.run([sys.executable, "-c", code], cwd=project_root, capture_output=True, text=True,
+                           env={"PYTHONHASHSEED": "123", "PATH": ""}, check=True)
+    assert other.stdout.strip() == key
+
+
+def test_striped_cache_lru_and_ttl():
+    cache = StripedCache(maxsize=4, stripes=1)
+    for i in range(5):
+        cache.set(f"k{i}", i)
+    assert cache.get("k0") is MISSING and len(cache) == 4
+    assert cache.get("k1") == 1
+
+    cache.set("none", None, ttl=0.05)
+    assert cache.get("none") is None
+    time.sleep(0.06)
+    assert cache.get("none") is MISSING
+
+
+def test_concurrent_misses_run_once_and_no_updates_are_lost():
+    cache = StripedCache(maxsize=1000)
+    counters = AtomicCounters(["hits", "misses", "requests", "shared", "uncacheable"])
+    calls = AtomicCounters(["calls"])
+
+    @memoize(cache.get, cache.set, counters, SingleFlight())
+    def slow_square(n):
+        calls.increment("calls")
+        time.sleep(0.05)
+        return n * n
+
+    barrier = threading.Barrier(32)
+    results = []
+
+    def worker(i):
+        barrier.wait()
+        for n in range(10):
+            results.append(slow_square(n % 5))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = counters.snapshot()
+    assert sorted(set(results)) == [0, 1, 4, 9, 16]
+    assert calls.snapshot()["calls"] == 5
+    assert stats["requests"] == 320
+    assert stats["hits"] + stats["misses"] + stats["shared"] == 320
+    assert stats["misses"] == 5
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the request latency histograms and spans
+"""
+
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import pytest
+
+from performance.instrumentation import HdrHistogram, LatencyRecorder
+from storage.sqlite_store import SQLiteStore
+
+
+def test_quantiles_are_within_the_histogram_precision():
+    histogram = HdrHistogram()
+    for us in range(1, 100001):
+        histogram.record_us(us)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['count'] == 100000 and snapshot['max_ms'] == 100.0
+    for q, exact in ((0.5, 50.0), (0.95, 95.0), (0.99, 99.0)):
+        assert snapshot[f"p{int(q * 100)}_ms"] == pytest.approx(exact, rel=1 / 32)
+    assert histogram.cumulative((1, 10, 1000))[-1] == 100000
+
+
+def test_spans_are_cheap_and_exported_as_deltas(tmp_path):
+    recorder = LatencyRecorder()
+    span = recorder.span
+
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(20000):
+            with span("page.scoring"):
+                pass
+        best = min(best, (time.perf_counter() - started) / 20000)
+    assert best < 5e-6
+
+    @recorder.timed("page.pdf")
+    def build_pdf():
+        raise ValueError("render failed")
+
+    with pytest.raises(ValueError):
+        build_pdf()
+
+    store = SQLiteStore("performance", path=str(tmp_path / "performance.db"))
+    assert recorder.export(store) == 2
+    recorder.observe("page.charts", 12.5)
+    assert recorder.export(store) == 1  # only labels with new requests
+    with store.connection() as conn:
+        rows = conn.execute("SELECT label, request_count, p99_ms FROM request_latency ORDER BY id").fetchall()
+    assert [(label, count) for label, count, _ in rows] == [("page.scoring", 60000), ("page.pdf", 1), ("page.charts", 1)]
+    assert rows[-1][2] == pytest.approx(12.5, rel=1 / 32)
+
+    text = recorder.prometheus()
+    assert 'soulfriend_request_latency_seconds_count{label="page.scoring"} 60000' in text
+    assert 'soulfriend_request_latency_seconds_quantile{label="page.charts",quantile="0.99"}' in text
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the opt-in sampling profiler and its collapsed-stack profiles
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from performance.sampling_profiler import SamplingProfiler, flamegraph_nodes, profile_fastapi, read_collapsed
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def hot_path():
+    _busy(0.15)
+
+
+def test_selected_runs_are_stored_as_capped_flamegraph_profiles(tmp_path):
+    profiler = SamplingProfiler(directory=str(tmp_path), interval_ms=1, sample_rate=0,
+                                routes=["page.scoring"], max_profiles=2)
+    assert profiler.start("page.charts") is profiler.start("page.pdf")  # not picked: shared no-op
+
+    with profiler.start("page.scoring"):
+        hot_path()
+    session = profiler.start("page.rerun", force=True)
+    _busy(0.05)
+    session.stop()
+    assert profiler.flush() == 2
+
+    profiles = {p["label"]: p for p in profiler.list_profiles()}
+    assert set(profiles) == {"page.scoring", "page.rerun"}
+    stacks = read_collapsed(profiles["page.scoring"]["path"])
+    assert sum(stacks.values()) == profiles["page.scoring"]["samples"] > 20
+    # Rooted at the profiled block, with the hot function beneath it
+    assert all(stack.startswith("test_selected_runs") for stack in stacks)
+    assert any("hot_path" in stack for stack in stacks)
+
+    nodes = flamegraph_nodes(stacks, root="page.scoring")
+    assert nodes["parents"][0] == "" and nodes["values"][0] == sum(stacks.values())
+
+    with profiler.start("page.consent", force=True):
+        _busy(0.02)
+    time.sleep(0.01)
+    profiler.flush()
+    # Retention keeps the newest max_profiles files
+    assert len(list(tmp_path.glob("*.folded"))) == 2
+
+
+def test_async_requests_are_profiled_per_route_template(tmp_path):
+    from fastapi import FastAPI
+
+    profiler = SamplingProfiler(directory=str(tmp_path), interval_ms=1, sample_rate=0)
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def read_item(item_id: int):
+        hot_path()
+        return {"item_id": item_id}
+
+    profile_fastapi(app, profiler, prefix="test_api")
+
+    async def call(headers):
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        await app({"type": "http", "method": "GET", "path": "/items/7", "raw_path": b"/items/7",
+                   "query_string": b"", "headers": headers, "scheme": "http", "server": ("test", 80),
+                   "client": ("test", 1), "root_path": "", "http_version": "1.1", "asgi": {"version": "3.0"}},
+                  receive, send)
+        return messages[0]["status"]
+
+    assert asyncio.run(call([])) == 200
+    assert asyncio.run(call([(b"x-soulfriend-profile", b"1")])) == 200
+    profiler.flush()
+
+    profiles = profiler.list_profiles()
+    assert [p["label"] for p in profiles] == ["test_api GET /items/{item_id}"]
+    assert any("read_item" in stack and "hot_path" in stack for stack in read_collapsed(profiles[0]["path"]))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for the two-tier cache with a SQLite L2 shared by two "processes"
+"""
+
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from performance.caching import MISSING
+from performance.tiered_cache import SQLiteL2, TieredCache
+from storage.sqlite_store import SQLiteStore
+
+
+def _pair(tmp_path):
+    """Two caches over one L2 file, as two workers would see it"""
+    path = tmp_path / "cache.db"
+    first = TieredCache(l2=SQLiteL2(SQLiteStore("cache", path=path), origin="a"), poll_interval=60)
+    second = TieredCache(l2=SQLiteL2(SQLiteStore("cache", path=path), origin="b"), poll_interval=60)
+    return first, second
+
+
+def test_values_are_shared_through_l2(tmp_path):
+    first, second = _pair(tmp_path)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {"items": [1, 2, 3]}
+
+    assert first.get_or_load("questionnaire_config", "phq9_vi.json", load) == {"items": [1, 2, 3]}
+    assert second.get_or_load("questionnaire_config", "phq9_vi.json", load) == {"items": [1, 2, 3]}
+    assert second.get_or_load("questionnaire_config", "phq9_vi.json", load) == {"items": [1, 2, 3]}
+    assert len(loads) == 1
+    assert second.stats()["l2_hits"] == 1 and second.stats()["l1_hits"] == 1
+
+    # Process-local entries never reach L2
+    first.set("model_artifacts", "scaler", object(), shared=False)
+    assert second.get("model_artifacts", "scaler") is MISSING
+
+
+def test_invalidation_reaches_other_processes(tmp_path):
+    first, second = _pair(tmp_path)
+    first.set("questionnaire_config", "gad7.json", "old")
+    first.set("dashboard_aggregates", "30d", "old")
+    assert second.get("questionnaire_config", "gad7.json") == "old"
+    assert second.get("dashboard_aggregates", "30d") == "old"
+
+    first.invalidate("questionnaire_config", "gad7.json")
+    first.invalidate("dashboard_aggregates")
+    # Until it polls, the other process may serve its L1 copy
+    assert second.get("dashboard_aggregates", "30d") == "old"
+    second.sync(force=True)
+    assert second.get("questionnaire_config", "gad7.json") is MISSING
+    assert second.get("dashboard_aggregates", "30d") is MISSING
+    assert second.versioned_key("dashboard_aggregates", "30d") == "dashboard_aggregates:v1:30d"
+    assert second.stats()["invalidations_received"] == 2
+
+    # A new process starts at the current version
+    _, third = _pair(tmp_path)
+    assert third.versioned_key("dashboard_aggregates", "30d") == "dashboard_aggregates:v1:30d"
+
+
+def test_missed_namespace_announcement_is_caught_by_version_refresh(tmp_path):
+    first, second = _pair(tmp_path)
+    first.set("dashboard_aggregates", "30d", "old")
+    assert second.get("dashboard_aggregates", "30d") == "old"
+
+    # A bump whose pub/sub message was lost: the version moves, nothing is announced
+    first.l2.bump_version("dashboard_aggregates")
+    second.sync(force=True)
+    assert second.stats()["invalidations_received"] == 0
+    assert second.versioned_key("dashboard_aggregates", "30d") == "dashboard_aggregates:v1:30d"
+    assert second.get("dashboard_aggregates", "30d") is MISSING
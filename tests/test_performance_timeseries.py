@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Tests for the downsampled system-metrics time series
+"""
+
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from performance.timeseries import MetricsTimeSeries, RingBuffer, create_rollup_schema
+from storage.sqlite_store import SQLiteStore
+
+NOW = 1_756_728_000.0  # 2025-09-01 12:00:00 UTC
+
+
+def _series(tmp_path, **kwargs):
+    store = SQLiteStore("performance", path=str(tmp_path / "performance.db"))
+
+    def raw_table(conn):
+        conn.execute("CREATE TABLE system_resources (timestamp TEXT, cpu_percent REAL, memory_percent REAL, network_io TEXT)")
+
+    store.migrate([raw_table, create_rollup_schema])
+    series = MetricsTimeSeries(store, ["cpu_percent", "memory_percent"], "system_resources",
+                               raw_extra_columns=["network_io"], **kwargs)
+    return store, series
+
+
+def test_ring_buffer_keeps_the_newest_rows_in_order():
+    ring = RingBuffer(capacity=3, width=1)
+    for t in range(5):
+        ring.append(float(t), [t * 10.0])
+    timestamps, values = ring.since(0)
+    assert timestamps.tolist() == [2.0, 3.0, 4.0]
+    assert values[:, 0].tolist() == [20.0, 30.0, 40.0]
+    assert ring.oldest == 2.0 and len(ring) == 3
+
+
+def test_samples_are_batched_rolled_up_and_pruned(tmp_path):
+    store, series = _series(tmp_path, batch_size=50, flush_interval=1e9)
+    series.started_at = NOW - 3 * 86400
+    # One sample a minute for two days: cpu alternates 10/30, memory is constant
+    for i in range(2 * 1440):
+        series.record({"cpu_percent": 10.0 if i % 2 else 30.0, "memory_percent": 50.0},
+                      timestamp=NOW - (2 * 1440 - i) * 60, network_io="{}")
+
+    # Written in whole batches so far
+    assert len(series._pending) == 2 * 1440 % 50
+
+    day = series.summary(hours=24, now=NOW)
+    assert day["resolution"] == "1m" and day["sample_count"] == 1440
+    assert day["metrics"]["cpu_percent"] == {"avg": 20.0, "min": 10.0, "max": 30.0}
+    assert series.summary(hours=24 * 30, now=NOW)["resolution"] == "1h"
+
+    # The last hour is answered from the ring buffer, without the database
+    hour = series.summary(hours=1, now=NOW)
+    assert hour["resolution"] == "memory" and hour["sample_count"] == 60
+
+    with store.connection() as conn:
+        # Raw rows older than an hour were pruned; 1m and 1h rollups stay within retention
+        assert conn.execute("SELECT COUNT(*) FROM system_resources").fetchone()[0] <= 61
+        buckets = dict(conn.execute("SELECT resolution, COUNT(*) FROM metric_rollups GROUP BY resolution").fetchall())
+    assert buckets == {60: 2 * 2 * 1440, 3600: 2 * 48}
+    assert len(series.series("memory_percent", hours=6, now=NOW)) == 6 * 60
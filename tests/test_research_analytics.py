@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the vectorised research analytics
+"""
+
+import sys
+import json
+import random
+from pathlib import Path
+
+import pandas as pd
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.analytics import ResearchAnalytics, count_session_journeys, extract_payload_field
+
+EVENT_TYPES = ['session_started', 'questionnaire_started', 'question_answered',
+               'questionnaire_completed', 'results_viewed']
+
+
+def _random_events(sessions=200, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for session in range(sessions):
+        for step in range(rng.randrange(1, 8)):
+            rows.append({
+                'session_id': f"s{session}",
+                'event_type': rng.choice(EVENT_TYPES),
+                'timestamp': pd.Timestamp('2025-09-01') + pd.Timedelta(seconds=rng.randrange(3600)),
+                'event_data': json.dumps({'questionnaire_type': rng.choice(['phq9', 'gad7'])})
+            })
+    rng.shuffle(rows)
+    return pd.DataFrame(rows)
+
+
+def _naive_journeys(df):
+    journeys = {}
+    for session_id in df['session_id'].unique():
+        session_events = df[df['session_id'] == session_id].sort_values('timestamp', kind='stable')
+        journey = " -> ".join(session_events['event_type'].tolist())
+        journeys[journey] = journeys.get(journey, 0) + 1
+    return journeys
+
+
+def test_journey_counts_match_per_session_scan():
+    df = _random_events()
+    assert count_session_journeys(df, top_n=len(df)) == _naive_journeys(df)
+
+
+def test_journeys_with_categorical_columns():
+    df = _random_events()
+    categorical = df.astype({'session_id': 'category', 'event_type': 'category'})
+    assert count_session_journeys(categorical, top_n=len(df)) == _naive_journeys(df)
+
+
+def test_extract_payload_field_handles_text_and_dicts():
+    series = pd.Series([
+        '{"questionnaire_type": "phq9", "score": 3}',
+        {'questionnaire_type': 'gad7'},
+        '{"other": 1}',
+        None
+    ])
+    assert extract_payload_field(series, 'questionnaire_type').tolist()[:2] == ['phq9', 'gad7']
+    assert extract_payload_field(series, 'questionnaire_type')[2:].isna().all()
+
+
+def test_popularity_from_event_data_only_frames():
+    df = pd.DataFrame({
+        'session_id': ['a', 'b', 'c'],
+        'event_type': ['questionnaire_started'] * 3,
+        'timestamp': pd.to_datetime(['2025-09-01'] * 3),
+        'event_data': ['{"questionnaire_type": "phq9"}', '{"questionnaire_type": "phq9"}', '{}']
+    })
+    patterns = ResearchAnalytics().analyze_user_behavior_patterns(df)
+    assert patterns['popular_questionnaires'] == {'phq9': 2, 'unknown': 1}
+
+
+def test_extract_payload_field_keeps_index_alignment():
+    payloads = ['{"item_id": "phq9_Q01"}', '{}', '{"item_id": "phq9_Q03", "question_index": 3}']
+    for dtype in (object, 'string'):
+        series = pd.Series(payloads, index=[10, 20, 30], dtype=dtype).iloc[[0, 2]]
+        assert extract_payload_field(series, 'item_id').tolist() == ['phq9_Q01', 'phq9_Q03']
+        assert extract_payload_field(series, 'question_index')[30] == 3
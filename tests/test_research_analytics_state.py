@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for the checkpointed incremental analytics state
+"""
+
+import sys
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.analytics import ResearchAnalytics
+from research_system.analytics_state import AnalyticsState
+
+NOW = datetime.now().replace(microsecond=0)
+JOURNEY = ['session_started', 'questionnaire_started', 'questionnaire_completed', 'results_viewed']
+
+
+def _session_records(session_id, started, steps=JOURNEY):
+    return [{
+        'event_id': f"{session_id}-{i}",
+        'client_ts': (started + timedelta(minutes=i)).isoformat(),
+        'received_at': (started + timedelta(minutes=i)).isoformat(),
+        'session_id': session_id,
+        'user_pseudo_id': f"user-{session_id}",
+        'event_name': name,
+        'payload': {'questionnaire_type': 'phq9'} if name.startswith('questionnaire') else {},
+        'cohort_version': 'soulfriend_v2.0'
+    } for i, name in enumerate(steps)]
+
+
+def _append(data_dir, day, records, partial=None):
+    path = data_dir / f"events_{day.strftime('%Y%m%d')}.jsonl"
+    with open(path, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+        if partial:
+            f.write(partial)
+    return path
+
+
+def test_only_new_events_are_folded(tmp_path):
+    _append(tmp_path, NOW, _session_records('a', NOW - timedelta(hours=2)))
+    state = AnalyticsState(tmp_path)
+
+    assert state.update(now=NOW) == 4
+    assert state.update(now=NOW) == 0
+
+    _append(tmp_path, NOW, _session_records('b', NOW - timedelta(hours=1)))
+    assert state.update(now=NOW) == 4
+    assert state.usage_statistics(now=NOW)['overview']['total_events'] == 8
+
+
+def test_partial_trailing_line_waits_for_newline(tmp_path):
+    record = _session_records('a', NOW - timedelta(hours=1))[0]
+    line = json.dumps(record)
+    path = _append(tmp_path, NOW, [], partial=line[:20])
+    state = AnalyticsState(tmp_path)
+
+    assert state.update(now=NOW) == 0
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(line[20:] + '\n')
+    assert state.update(now=NOW) == 1
+
+
+def test_checkpoint_restores_state_and_offsets(tmp_path):
+    _append(tmp_path, NOW, _session_records('a', NOW - timedelta(hours=2)))
+    AnalyticsState(tmp_path).update(now=NOW)
+
+    restored = AnalyticsState(tmp_path)
+    assert restored.update(now=NOW) == 0
+    assert restored.behavior_patterns(now=NOW)['common_user_journeys'] == {" -> ".join(JOURNEY): 1}
+
+
+def test_incremental_matches_full_recompute(tmp_path):
+    for day in range(5):
+        started = NOW - timedelta(days=day, hours=1)
+        _append(tmp_path, started, _session_records(f"s{day}", started))
+        _append(tmp_path, started, _session_records(f"t{day}", started, JOURNEY[:2]))
+
+    analytics = ResearchAnalytics(data_dir=str(tmp_path))
+    analytics.update_state()
+    df = analytics.load_collected_data(days_back=30)
+
+    full = analytics.generate_usage_statistics(df)
+    incremental = analytics.state.usage_statistics(days_back=30)
+    for key in ('total_events', 'unique_sessions', 'unique_users'):
+        assert incremental['overview'][key] == full['overview'][key]
+    assert incremental['event_distribution'] == full['event_distribution']
+    assert incremental['completion_rates'] == full['completion_rates']
+
+    patterns = analytics.state.behavior_patterns(days_back=30)
+    assert patterns['common_user_journeys'] == analytics.analyze_user_behavior_patterns(df)['common_user_journeys']
+    assert patterns['completion_funnel']['questionnaire_started'] == 10
+    assert patterns['completion_funnel']['results_viewed'] == 5
+
+
+def test_sliding_window_expires_old_sessions(tmp_path):
+    _append(tmp_path, NOW - timedelta(days=2), _session_records('old', NOW - timedelta(days=2)))
+    _append(tmp_path, NOW, _session_records('new', NOW - timedelta(hours=1)))
+    state = AnalyticsState(tmp_path, window_days=30)
+    state.update(now=NOW)
+
+    state.expire(now=NOW + timedelta(days=29))
+    assert set(state.sessions) == {'new'}
+    assert sum(state.journey_counts.values()) == 1
+    assert all(key >= (NOW - timedelta(days=1)).strftime('%Y-%m-%dT%H') for key in state.buckets)
+
+
+def test_session_state_stays_fixed_size_and_checkpoints_are_throttled(tmp_path):
+    long_journey = JOURNEY[:2] + ['question_answered'] * 200 + JOURNEY[2:]
+    for session in range(50):
+        _append(tmp_path, NOW, _session_records(f"long{session}", NOW - timedelta(hours=4), long_journey))
+    state = AnalyticsState(tmp_path, checkpoint_interval=3600)
+    state.update(now=NOW)
+
+    # One summary per session and one shared trie path for the common journey
+    assert all(len(session) == 6 and session['count'] == len(long_journey) for session in state.sessions.values())
+    assert len(state.journey_nodes) == len(long_journey)
+    patterns = state.behavior_patterns(now=NOW)
+    assert patterns['common_user_journeys'] == {" -> ".join(long_journey): 50}
+    assert patterns['completion_funnel']['results_viewed'] == 50
+
+    checkpointed = state.checkpoint_path.stat().st_mtime_ns
+    _append(tmp_path, NOW, _session_records('late', NOW - timedelta(hours=1)))
+    assert state.update(now=NOW) == 4
+    assert state.checkpoint_path.stat().st_mtime_ns == checkpointed
+    state.update(now=NOW, force_checkpoint=True)
+    assert AnalyticsState(tmp_path).update(now=NOW) == 0
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Research database tests
+Tests retention and storage behaviour of the research SQLite store
+"""
+
+import sys
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.database import SQLiteDatabase
+
+
+def _seed_events(db, days_ago_list):
+    for i, days_ago in enumerate(days_ago_list):
+        db.store_event({
+            'session_id': f'session_{i % 7}',
+            'event_type': 'question_answered',
+            'event_data': {'questionnaire_type': 'phq9', 'question_index': i % 9, 'score': i % 4},
+            'timestamp': (datetime.now() - timedelta(days=days_ago)).isoformat(),
+            'anonymized_user_id': f'user_{i % 5}',
+            'consent_status': 'given'
+        })
+
+
+def test_purge_deletes_only_expired_rows_in_batches(tmp_path):
+    """Retention purge removes expired events in bounded batches"""
+    db = SQLiteDatabase(str(tmp_path / 'research.db'))
+    _seed_events(db, [120] * 25 + [1] * 10 + [100] * 5)
+
+    stats = db.purge_old_events(retention_days=90, batch_size=4, pause_seconds=0)
+
+    assert stats['deleted_rows'] == 30
+    assert stats['batches'] >= 8
+    assert stats['rows_per_second'] > 0
+    assert len(db.get_events(limit=100)) == 10
+    assert db.last_purge_stats is stats
+
+
+def test_cleanup_old_data_reclaims_pages(tmp_path):
+    """cleanup_old_data keeps its count return and frees pages incrementally"""
+    db = SQLiteDatabase(str(tmp_path / 'research.db'))
+    _seed_events(db, [200] * 400)
+
+    deleted = db.cleanup_old_data(retention_days=90, batch_size=50, pause_seconds=0)
+
+    assert deleted == 400
+    assert db.last_purge_stats['vacuum_pages_freed'] > 0
+    with sqlite3.connect(db.db_path) as conn:
+        assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+
+def test_payload_columns_are_typed_and_backfilled(tmp_path):
+    """Hot payload fields land in typed columns, including rows from before the migration"""
+    db_path = tmp_path / 'research.db'
+    with sqlite3.connect(db_path) as conn:
+        conn.execute('''CREATE TABLE research_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, event_type TEXT NOT NULL,
+            event_data TEXT, timestamp DATETIME NOT NULL, anonymized_user_id TEXT,
+            consent_status TEXT, data_hash TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+        conn.execute(
+            "INSERT INTO research_events (session_id, event_type, event_data, timestamp) VALUES (?, ?, ?, ?)",
+            ('s1', 'question_answered',
+             '{"questionnaire_type": "gad7", "item_id": "gad7_Q03", "response_value": 2}',
+             datetime.now().isoformat())
+        )
+
+    db = SQLiteDatabase(str(db_path))
+    # Opening never scans the table; the backfill is a separate, resumable step
+    assert db.payload_backfill_pending()
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT questionnaire_type FROM research_events').fetchone() == (None,)
+    assert db.backfill_payload_columns() == 1
+    assert not db.payload_backfill_pending()
+    db.store_event({
+        'session_id': 's2',
+        'event_type': 'questionnaire_started',
+        'event_data': {'questionnaire_type': 'phq9'},
+        'timestamp': datetime.now().isoformat()
+    })
+
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            'SELECT questionnaire_type, question_index, score FROM research_events ORDER BY id'
+        ).fetchall()
+        assert conn.execute('PRAGMA user_version').fetchone()[0] >= 1
+    assert rows == [('gad7', 3, 2.0), ('phq9', None, None)]
+    assert db.get_questionnaire_popularity() == {'phq9': 1}
+    assert db.get_item_statistics('gad7') == [{'question_index': 3, 'answers': 1, 'mean_score': 2.0}]
+    assert len(db.get_events(questionnaire_types=['gad7'])) == 1
+
+
+def test_batches_are_sealed_and_tampering_is_pinpointed(tmp_path, monkeypatch):
+    """Merkle-sealed batches verify cleanly; edits and deletions are reported per row"""
+    monkeypatch.setenv('RESEARCH_DB_PATH', str(tmp_path / 'research.db'))
+    monkeypatch.setenv('RESEARCH_DB_TYPE', 'sqlite')
+    from research_system.database import ResearchDatabase
+    from research_system.integrity import IntegrityVerifier, verify_merkle_proof
+
+    database = ResearchDatabase()
+    for batch in range(4):
+        events = [{
+            'session_id': f'session_{batch}',
+            'event_type': 'question_answered',
+            'event_data': {'questionnaire_type': 'phq9', 'item_id': f'phq9_Q0{i + 1}', 'response_value': i % 4},
+            'timestamp': (datetime.now() - timedelta(hours=batch, minutes=i)).isoformat(),
+            'anonymized_user_id': f'user_{batch}',
+            'consent_status': 'given'
+        } for i in range(9)]
+        assert database.store_events(events) == 9
+    assert database.store_event(events[0])
+
+    clean = database.verify_integrity(workers=2)
+    assert clean['valid'] and clean['batches_checked'] == 5 and clean['events_checked'] == 37
+
+    proof = IntegrityVerifier(database.db.db_path, database.config.encryption_key).get_inclusion_proof(12)
+    assert verify_merkle_proof(proof['leaf'], proof['proof'], proof['merkle_root'])
+
+    with sqlite3.connect(database.db.db_path) as conn:
+        conn.execute("UPDATE research_events SET score = 3 WHERE id = 12")
+        conn.execute("DELETE FROM research_events WHERE id = 30")
+
+    report = database.verify_integrity(workers=2)
+    assert not report['valid']
+    assert report['tampered_event_ids'] == [12]
+    assert report['missing_event_ids'] == [30]
+    assert report['invalid_batch_ids'] == [2, 4]
+
+    with sqlite3.connect(database.db.db_path) as conn:
+        conn.execute("UPDATE integrity_batches SET merkle_root = ? WHERE batch_id = 3", ('0' * 64,))
+    assert 3 in database.verify_integrity(workers=1)['broken_chain_batch_ids']
+
+
+def test_live_events_are_sealed_in_batches_over_stored_values(tmp_path, monkeypatch):
+    """Buffered single events form one batch; leaves match what SQLite stored"""
+    monkeypatch.setenv('RESEARCH_DB_PATH', str(tmp_path / 'research.db'))
+    monkeypatch.setenv('RESEARCH_DB_TYPE', 'sqlite')
+    monkeypatch.setenv('RESEARCH_SEAL_INTERVAL_SECONDS', '3600')
+    from research_system.database import ResearchDatabase
+
+    database = ResearchDatabase()
+    for i in range(20):
+        assert database.store_event({
+            'session_id': 'session_live',
+            'event_type': 'question_answered',
+            # A string question_index and numeric item_id are coerced by column affinity
+            'event_data': {'questionnaire_type': 'gad7', 'item_id': i, 'question_index': str(i),
+                           'response_value': i % 4},
+            'timestamp': (datetime.now() - timedelta(minutes=i)).isoformat(),
+            'anonymized_user_id': 'user_live',
+            'consent_status': 'given'
+        }, wait=False)
+    assert database.flush_events() == 20
+
+    report = database.verify_integrity(workers=1)
+    assert report['valid'] and report['batches_checked'] == 1 and report['events_checked'] == 20
+
+
+def _live_event(i):
+    return {
+        'session_id': 'session_live',
+        'event_type': 'question_answered',
+        'event_data': {'questionnaire_type': 'gad7', 'item_id': f'gad7_Q0{i % 7 + 1}', 'response_value': i % 4},
+        'timestamp': (datetime.now() - timedelta(minutes=i)).isoformat(),
+        'anonymized_user_id': 'user_live',
+        'consent_status': 'given'
+    }
+
+
+def test_failed_seal_keeps_accepted_events_and_reports_waiting_callers(tmp_path, monkeypatch):
+    """A failed write is retried for buffered events; synchronous callers get the real outcome"""
+    monkeypatch.setenv('RESEARCH_DB_PATH', str(tmp_path / 'research.db'))
+    monkeypatch.setenv('RESEARCH_DB_TYPE', 'sqlite')
+    monkeypatch.setenv('RESEARCH_SEAL_INTERVAL_SECONDS', '3600')
+    from research_system.database import ResearchDatabase
+
+    database = ResearchDatabase()
+    write = database.db.store_events
+    monkeypatch.setattr(database.db, 'store_events', lambda events, key=None: 0)
+    for i in range(3):
+        assert database.store_event(_live_event(i), wait=False)
+    assert not database.store_event(_live_event(3))
+    assert database.flush_events() == 0
+
+    monkeypatch.setattr(database.db, 'store_events', write)
+    assert database.flush_events() == 3
+    assert database.store_event(_live_event(4))
+    assert len(database.get_events(limit=100)) == 4
+    assert database.verify_integrity(workers=1)['valid']
+
+
+def test_truncating_the_newest_batches_is_detected(tmp_path):
+    """The chain head outside the database catches a shorter but consistent chain"""
+    from research_system.integrity import IntegrityVerifier
+
+    db = SQLiteDatabase(str(tmp_path / 'research.db'), integrity_key='k')
+    for batch in range(3):
+        assert db.store_events([_live_event(batch * 3 + i) for i in range(3)]) == 3
+    verifier = IntegrityVerifier(db.db_path, 'k')
+    report = verifier.verify_range(workers=1)
+    assert report['valid'] and report['chain_head_matches']
+
+    with sqlite3.connect(db.db_path) as conn:
+        conn.execute('DELETE FROM research_events WHERE id > 6')
+        conn.execute('DELETE FROM integrity_batches WHERE batch_id = 3')
+    report = verifier.verify_range(workers=1)
+    assert report['broken_chain_batch_ids'] == [] and report['invalid_batch_ids'] == []
+    assert report['chain_head_matches'] is False and not report['valid']
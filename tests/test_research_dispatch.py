@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Tests for the asynchronous event dispatcher
+"""
+
+import sys
+import json
+import threading
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.dispatch import EventDispatcher
+
+
+def test_slow_and_failing_handlers_are_dead_lettered(tmp_path):
+    release = threading.Event()
+    seen = []
+
+    def slow(data):
+        release.wait(5)
+
+    def failing(data):
+        raise ValueError("handler bug")
+
+    dispatcher = EventDispatcher(max_workers=2, handler_timeout=0.2, coalesce_seconds=0,
+                                 dead_letter_path=tmp_path / "dead_letters.jsonl")
+    dispatcher.register('system_alert', slow)
+    dispatcher.register('system_alert', failing)
+    dispatcher.register('system_alert', seen.append)
+
+    started = time.monotonic()
+    assert dispatcher.dispatch('system_alert', {'type': 'high_load'})
+    assert time.monotonic() - started < 0.1  # the caller never waits for handlers
+    assert dispatcher.join(timeout=2)
+    release.set()
+
+    stats = dispatcher.stats()
+    assert stats['completed'] == 1 and stats['failed'] == 1 and stats['timed_out'] == 1
+    assert stats['queue_depth'] == 0
+    assert seen == [{'type': 'high_load'}]
+    letters = [json.loads(line) for line in (tmp_path / "dead_letters.jsonl").read_text().splitlines()]
+    assert sorted(letter['error'] for letter in letters) == ['handler bug', 'timed out after 0.2s']
+    assert len(stats['handler_latency']) == 3
+    dispatcher.shutdown()
+
+
+def test_repeated_alerts_are_coalesced():
+    received = []
+    dispatcher = EventDispatcher(max_workers=1, coalesce_seconds=0.3)
+    dispatcher.listeners.append(lambda event_type, data: received.append((event_type, data)))
+
+    assert dispatcher.dispatch('system_alert', {'type': 'high_load'})
+    for _ in range(4):
+        assert not dispatcher.dispatch('system_alert', {'type': 'high_load'})
+    # A different alert type is not coalesced with it
+    assert dispatcher.dispatch('system_alert', {'type': 'high_error_rate'})
+    time.sleep(0.35)
+    assert dispatcher.dispatch('system_alert', {'type': 'high_load'})
+    dispatcher.join(timeout=2)
+
+    assert [data.get('coalesced_count') for _, data in received] == [None, None, 4]
+    assert dispatcher.stats()['coalesced'] == 4
+    dispatcher.shutdown()
+
+
+def test_hung_handlers_cannot_exhaust_the_handler_pool():
+    release = threading.Event()
+    received = []
+    dispatcher = EventDispatcher(max_workers=1, handler_timeout=0.1, coalesce_seconds=0, max_stuck=1)
+    dispatcher.register('hang', lambda data: release.wait(5))
+    dispatcher.register('alert', received.append)
+
+    dispatcher.dispatch('hang', {})
+    assert dispatcher.join(timeout=2)
+    # The timed-out call still holds its thread; the spare absorbs it and further work is refused
+    assert dispatcher.stats()['stuck'] == 1
+    dispatcher.dispatch('alert', {'type': 'first'})
+    assert dispatcher.join(timeout=2)
+    assert received == [] and dispatcher.stats()['rejected'] == 1
+
+    release.set()
+    deadline = time.monotonic() + 2
+    while dispatcher.stats()['stuck'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    dispatcher.dispatch('alert', {'type': 'second'})
+    assert dispatcher.join(timeout=2)
+    assert received == [{'type': 'second'}]
+    stats = dispatcher.stats()
+    assert stats['timed_out'] == 1 and stats['completed'] == 1 and stats['stuck'] == 0
+    dispatcher.shutdown()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming, partition-pruned research event loader
+"""
+
+import sys
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system import event_files
+from research_system.analytics import ResearchAnalytics
+from research_system.event_files import compact_event_file, list_event_files, load_events
+
+NOW = datetime(2025, 9, 1, 12, 0, 0)
+
+
+def _api_record(ts, session_id, event_name, payload):
+    """Record shaped like collection_api.save_event_safely output"""
+    return {
+        'event_id': f"{session_id}-{event_name}-{ts.isoformat()}",
+        'received_at': ts.isoformat(),
+        'client_ts': ts.isoformat(),
+        'session_id': session_id,
+        'user_pseudo_id': f"user-{session_id}",
+        'event_name': event_name,
+        'payload': payload,
+        'cohort_version': 'soulfriend_v2.0'
+    }
+
+
+def _write_day(data_dir, day, records, legacy_separator=False):
+    path = data_dir / f"events_{day.strftime('%Y%m%d')}.jsonl"
+    separator = '\\n' if legacy_separator else '\n'
+    path.write_text(''.join(json.dumps(r) + separator for r in records), encoding='utf-8')
+    return path
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for offset in range(40):
+        day = NOW - timedelta(days=offset)
+        records = [
+            _api_record(day - timedelta(minutes=i), f"s{offset}-{i % 3}", name,
+                        {'questionnaire_type': 'phq9'} if name.startswith('questionnaire') else {})
+            for i, name in enumerate(['session_started', 'questionnaire_started', 'questionnaire_completed'])
+        ]
+        _write_day(tmp_path, day, records, legacy_separator=(offset == 3))
+    return tmp_path
+
+
+def test_files_outside_window_are_pruned(data_dir):
+    files = list_event_files(data_dir, start=NOW - timedelta(days=7), end=NOW)
+    days = [day for day, _ in files]
+
+    assert min(days) == (NOW - timedelta(days=8)).date()
+    assert max(days) == NOW.date()
+
+
+def test_files_outside_window_are_not_opened(data_dir, monkeypatch):
+    opened = []
+    original = event_files.iter_event_chunks
+
+    def tracking(path, *args, **kwargs):
+        opened.append(Path(path).name)
+        return original(path, *args, **kwargs)
+
+    monkeypatch.setattr(event_files, 'iter_event_chunks', tracking)
+    load_events(data_dir, start=NOW - timedelta(days=2), end=NOW)
+
+    assert len(opened) <= 4
+
+
+def test_jsonl_is_normalised_with_compact_dtypes(data_dir):
+    df = load_events(data_dir, start=NOW - timedelta(days=7), end=NOW, chunk_size=2)
+
+    assert len(df) == 3 * 8 - 2  # eight days, the oldest day partly outside the window
+    assert df['timestamp'].min() >= NOW - timedelta(days=7)
+    assert isinstance(df['event_type'].dtype, pd.CategoricalDtype)
+    assert isinstance(df['session_id'].dtype, pd.CategoricalDtype)
+    assert str(df['event_data'].dtype).startswith('string')
+    assert set(df['event_type'].cat.categories) == {
+        'session_started', 'questionnaire_started', 'questionnaire_completed'
+    }
+    assert df.loc[df['event_type'] == 'questionnaire_started', 'questionnaire_type'].eq('phq9').all()
+
+
+def test_legacy_literal_newline_files_are_read(data_dir):
+    day = NOW - timedelta(days=3)
+    df = load_events(data_dir, start=day - timedelta(hours=1), end=day)
+
+    assert len(df) == 3
+
+
+@pytest.mark.skipif(not event_files.PYARROW_AVAILABLE, reason="pyarrow not installed")
+def test_partitions_mixing_naive_and_offset_timestamps_are_read(tmp_path):
+    day = NOW - timedelta(days=1)
+    records = [_api_record(day - timedelta(minutes=i), f"mixed-{i}", 'session_started', {}) for i in range(4)]
+    records[1]['client_ts'] = (day - timedelta(minutes=1)).isoformat() + '+07:00'
+    records[3]['client_ts'] = (day - timedelta(minutes=3)).isoformat() + 'Z'
+    _write_day(tmp_path, day, records)
+
+    df = load_events(tmp_path, start=day - timedelta(days=1), end=NOW)
+
+    assert len(df) == 4 and df['timestamp'].dt.tz is None
+    # Offsets are converted to UTC; naive values are taken as UTC
+    assert sorted(df['timestamp'])[0] == day - timedelta(minutes=1, hours=7)
+
+
+def test_compacted_partitions_match_raw(data_dir):
+    start, end = NOW - timedelta(days=10), NOW - timedelta(days=1)
+    raw = load_events(data_dir, start=start, end=end)
+
+    for day, path in list_event_files(data_dir, start=start, end=end):
+        compact_event_file(path)
+    compacted = load_events(data_dir, start=start, end=end)
+
+    assert all(path.suffix == '.parquet' for _, path in list_event_files(data_dir, start=start, end=end))
+    pd.testing.assert_frame_equal(
+        raw.sort_values('event_id').reset_index(drop=True),
+        compacted.sort_values('event_id').reset_index(drop=True),
+        check_categorical=False
+    )
+
+
+def test_analytics_loader_uses_days_back(data_dir):
+    analytics = ResearchAnalytics(data_dir=str(data_dir))
+    df = analytics.load_collected_data(days_back=30, end_date=NOW)
+    stats = analytics.generate_usage_statistics(df)
+
+    assert stats['overview']['total_events'] == len(df)
+    assert stats['completion_rates']['questionnaires_started'] == 30
+    assert analytics.analyze_user_behavior_patterns(df)['popular_questionnaires'] == {'phq9': 30}
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for the tail-following recent-events feed
+"""
+
+import sys
+import json
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system import event_tail
+from research_system.event_tail import EventTail
+
+NOW = datetime(2025, 9, 1, 12, 0, 0)
+
+
+def _append(path, minutes_ago, count=1, event_name='question_answered'):
+    with open(path, 'a', encoding='utf-8') as f:
+        for i in range(count):
+            ts = (NOW - timedelta(minutes=minutes_ago)).isoformat()
+            f.write(json.dumps({'event_id': f"{ts}-{i}", 'client_ts': ts, 'session_id': f"s{i}",
+                                'event_name': event_name, 'payload': {}}) + "\n")
+
+
+def test_poll_parses_only_appended_lines(tmp_path, monkeypatch):
+    path = tmp_path / "events_20250901.jsonl"
+    _append(path, minutes_ago=300, count=3)  # outside the 4h window
+    _append(path, minutes_ago=30, count=2)
+
+    tail = EventTail(tmp_path, window=timedelta(hours=4))
+    parsed = []
+    original = event_tail.records_to_frame
+    monkeypatch.setattr(event_tail, 'records_to_frame', lambda records: parsed.append(len(records)) or original(records))
+
+    assert tail.poll(now=NOW) == 2
+    assert tail.poll(now=NOW) == 0
+    _append(path, minutes_ago=1, count=4)
+    assert tail.poll(now=NOW) == 4
+    assert parsed == [5, 4]
+
+    recent = tail.recent(minutes=10, now=NOW)
+    assert len(recent) == 4
+    assert len(tail.recent(minutes=60, now=NOW)) == 6
+    assert recent['timestamp'].is_monotonic_decreasing
+
+
+def test_failed_parse_keeps_the_offset_for_a_retry(tmp_path, monkeypatch):
+    path = tmp_path / "events_20250901.jsonl"
+    _append(path, minutes_ago=10, count=3)
+    tail = EventTail(tmp_path, window=timedelta(hours=4))
+    original = event_tail.records_to_frame
+
+    def broken(records):
+        raise ValueError("bad batch")
+
+    monkeypatch.setattr(event_tail, 'records_to_frame', broken)
+    assert tail.poll(now=NOW) == 0
+    assert tail.offsets.get(path.name, 0) == 0
+
+    monkeypatch.setattr(event_tail, 'records_to_frame', original)
+    assert tail.poll(now=NOW) == 3
+
+
+def test_window_expires_and_truncated_files_are_reread(tmp_path):
+    path = tmp_path / "events_20250901.jsonl"
+    _append(path, minutes_ago=50, count=2)
+    tail = EventTail(tmp_path, window=timedelta(hours=1))
+    tail.poll(now=NOW)
+    _append(path, minutes_ago=5)
+    tail.poll(now=NOW)
+
+    # Twenty minutes later the first batch has left the window
+    tail.poll(now=NOW + timedelta(minutes=20))
+    assert len(tail.recent(minutes=60, now=NOW + timedelta(minutes=20))) == 1
+
+    path.write_text('')
+    _append(path, minutes_ago=0)
+    assert tail.poll(now=NOW) == 1
+
+
+def test_subscribers_and_waiters_are_pushed_new_events(tmp_path):
+    path = tmp_path / "events_20250901.jsonl"
+    tail = EventTail(tmp_path)
+    pushed = []
+    tail.subscribe(lambda frame: pushed.append(len(frame)))
+
+    version = tail.version
+    woke = []
+    waiter = threading.Thread(target=lambda: woke.append(tail.wait_for_update(version, timeout=5)))
+    waiter.start()
+    _append(path, minutes_ago=1, count=3)
+    tail.poll(now=NOW)
+    waiter.join(timeout=5)
+
+    assert pushed == [3]
+    assert woke == [version + 1]
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for the questionnaire funnel engine
+"""
+
+import sys
+import json
+from pathlib import Path
+
+import pandas as pd
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.funnels import FunnelEngine, build_funnels
+
+
+def _session(session_id, instrument, answered, completed=False, results=False, consent=True, cohort='v2'):
+    rows = [('session_started', {})]
+    if consent:
+        rows.append(('consent_given', {}))
+    if instrument:
+        rows.append(('questionnaire_started', {'questionnaire_type': instrument}))
+        rows += [('question_answered', {'questionnaire_type': instrument, 'item_id': f"{instrument}_Q{i:02d}"})
+                 for i in range(1, answered + 1)]
+        if completed:
+            rows.append(('questionnaire_completed', {'questionnaire_type': instrument, 'total_score': 5}))
+    if results:
+        rows.append(('results_viewed', {}))
+    start = pd.Timestamp('2025-09-01 10:00:00')
+    return [{
+        'session_id': session_id,
+        'event_type': event_type,
+        'timestamp': start + pd.Timedelta(seconds=i),
+        'event_data': json.dumps(payload),
+        'cohort_version': cohort
+    } for i, (event_type, payload) in enumerate(rows)]
+
+
+def _frame(*sessions):
+    return pd.DataFrame([row for session in sessions for row in session])
+
+
+def _counts(funnel):
+    return {stage['stage']: stage['count'] for stage in funnel['stages']}
+
+
+def test_funnel_counts_and_question_drop_off():
+    df = _frame(
+        _session('a', 'phq9', 3, completed=True, results=True),
+        _session('b', 'phq9', 3, completed=True),
+        _session('c', 'phq9', 2),
+        _session('d', 'phq9', 0),
+        _session('e', None, 0),
+        _session('f', None, 0, consent=False)
+    )
+    funnel = build_funnels(df)['v2']['phq9']
+    counts = _counts(funnel)
+
+    assert counts['session_started'] == 6
+    assert counts['consent'] == 5
+    assert counts['questionnaire_started'] == 4
+    assert [counts[f"question_{i}"] for i in (1, 2, 3)] == [3, 3, 2]
+    assert counts['questionnaire_completed'] == 2
+    assert counts['results_viewed'] == 1
+    assert funnel['question_drop_off'] == {1: 1, 2: 0, 3: 1}
+    assert funnel['completion_rate'] == 50.0
+
+
+def test_funnels_split_by_instrument_and_cohort():
+    df = _frame(
+        _session('a', 'phq9', 1, cohort='v1'),
+        _session('b', 'gad7', 2, completed=True, cohort='v2'),
+        _session('c', 'phq9', 1, cohort='v2')
+    )
+    funnels = build_funnels(df)
+
+    assert set(funnels) == {'v1', 'v2'}
+    assert set(funnels['v2']) == {'gad7', 'phq9'}
+    assert funnels['v2']['gad7']['completed'] == 1
+    assert funnels['v1']['phq9']['started'] == 1
+
+
+def test_incremental_folds_match_single_pass():
+    sessions = [_session(f"s{i}", 'phq9', i % 4, completed=i % 3 == 0, results=i % 2 == 0) for i in range(20)]
+    rows = [row for session in sessions for row in session]
+    single = build_funnels(pd.DataFrame(rows))
+
+    engine = FunnelEngine()
+    for start in range(0, len(rows), 7):
+        engine.fold(pd.DataFrame(rows[start:start + 7]))
+
+    assert engine.compute() == single
+
+
+def test_compute_is_cached_until_next_fold():
+    engine = FunnelEngine()
+    engine.fold(_frame(_session('a', 'phq9', 1)))
+    first = engine.compute()
+
+    assert engine.compute() is first
+    engine.fold(_frame(_session('b', 'phq9', 2)))
+    assert engine.compute()['v2']['phq9']['started'] == 2
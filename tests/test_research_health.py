@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the concurrent, cached health probes
+"""
+
+import sys
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.database import SQLiteDatabase
+from research_system.health import HealthMonitor, HealthProbe
+
+
+def test_slow_probe_times_out_without_blocking_others():
+    release = threading.Event()
+    calls = {'fast': 0, 'slow': 0}
+
+    def fast():
+        calls['fast'] += 1
+        return 'healthy', {}, {}
+
+    def slow():
+        calls['slow'] += 1
+        release.wait(5)
+        return 'healthy', {}, {}
+
+    monitor = HealthMonitor([HealthProbe('fast', fast, timeout=1, ttl=0),
+                             HealthProbe('slow', slow, timeout=0.2, ttl=0, timeout_status='offline')])
+    started = time.monotonic()
+    results = monitor.run()
+    assert time.monotonic() - started < 1
+    assert results['fast'].status == 'healthy'
+    assert results['slow'].status == 'offline'
+
+    # Still running: not started a second time
+    monitor.run()
+    assert calls == {'fast': 2, 'slow': 1}
+
+    release.set()
+    time.sleep(0.1)
+    assert monitor.results()['slow'].status == 'healthy'
+    assert monitor.latency_snapshot()['slow']['count'] == 1
+    monitor.shutdown()
+
+
+def test_results_are_cached_for_the_ttl():
+    calls = []
+
+    def probe():
+        calls.append(1)
+        if len(calls) > 1:
+            raise RuntimeError("boom")
+        return 'healthy', {'ok': True}, {}
+
+    monitor = HealthMonitor([HealthProbe('db', probe, ttl=60)])
+    for _ in range(5):
+        assert monitor.run()['db'].status == 'healthy'
+    assert len(calls) == 1
+
+    result = monitor.run(force=True)['db']
+    assert result.status == 'error' and result.details['error'] == 'boom'
+    assert monitor.latency_snapshot()['db']['count'] == 2
+    monitor.shutdown()
+
+
+def test_database_health_check_is_read_only(tmp_path):
+    db = SQLiteDatabase(str(tmp_path / 'research.db'))
+    with sqlite3.connect(db.db_path) as conn:
+        before = conn.execute('SELECT COUNT(*), MAX(rowid) FROM research_events').fetchone()
+
+    assert db.health_check()
+    with sqlite3.connect(db.db_path) as conn:
+        assert conn.execute('SELECT COUNT(*), MAX(rowid) FROM research_events').fetchone() == before
+
+    # Read-only mode does not create a missing database file
+    Path(db.db_path).unlink()
+    assert not db.health_check()
+    assert not Path(db.db_path).exists()
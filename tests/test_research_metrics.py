@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the sliding-window in-process metrics
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.metrics import MetricsRegistry, SlidingCounter
+
+
+def test_windows_expire_old_buckets():
+    counter = SlidingCounter()
+    now = 1_700_000_000.0
+    counter.increment(5, now=now - 7200)      # two hours ago
+    counter.increment(3, now=now - 1800)      # half an hour ago
+    counter.increment(2, now=now - 30)
+    counter.increment(1, now=now)
+
+    assert counter.total(60, now=now) == 3
+    assert counter.total(3600, now=now) == 6
+    assert counter.total(86400, now=now) == 11
+    # A day later everything has left the window, even though the slots were reused
+    counter.increment(4, now=now + 86400)
+    assert counter.total(86400, now=now + 86400) == 4
+
+
+def test_increments_from_finished_threads_are_kept():
+    counter = SlidingCounter()
+    threads = [threading.Thread(target=lambda: [counter.increment() for _ in range(1000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.total(3600) == 8000
+    assert not counter._shards  # folded into the retired shard on read
+    counter.increment()
+    assert counter.total(86400) == 8001
+
+
+def test_registry_snapshot():
+    registry = MetricsRegistry()
+    registry.increment('events_ingested', 4)
+    registry.increment('ingest_errors', 0)
+
+    snapshot = registry.snapshot()
+    assert snapshot['events_ingested']['1h'] == 4
+    assert snapshot['events_ingested']['24h'] == 4
+    assert snapshot['events_ingested']['last_update']
+    assert 'ingest_errors' not in snapshot
+    assert registry.total('missing', 3600) == 0
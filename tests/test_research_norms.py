@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the population norm sketches
+"""
+
+import sys
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.norms import NormsStore, PopulationNorms, ScoreSketch, build_norms
+
+
+def _completed(score, instrument='PHQ-9', cohort='soulfriend_v2.0', subscales=None):
+    payload = {'questionnaire_type': instrument, 'total_score': score}
+    if subscales:
+        payload['subscale_scores'] = subscales
+    return {'event_name': 'questionnaire_completed', 'session_id': 's', 'received_at': '2025-09-01T10:00:00',
+            'payload': payload, 'cohort_version': cohort}
+
+
+def test_percentile_matches_mid_rank_of_raw_scores():
+    scores = np.random.default_rng(5).integers(0, 28, size=500)
+    sketch = ScoreSketch()
+    for score in scores:
+        sketch.add(score)
+
+    for probe in (0, 4, 9.5, 13, 27, 40, -1):
+        expected = ((scores < probe).sum() + 0.5 * (scores == probe).sum()) / len(scores) * 100
+        assert abs(sketch.percentile(probe) - expected) < 1e-9
+    assert abs(sketch.mean() - scores.mean()) < 1e-9
+    assert sketch.quantile(0.5) == np.sort(scores)[249]
+
+
+def test_merged_workers_equal_single_pass():
+    rng = np.random.default_rng(11)
+    events = [_completed(int(s), cohort=c, subscales={'depression': int(s) // 2})
+              for s, c in zip(rng.integers(0, 28, 300), rng.choice(['v1', 'v2'], 300))]
+
+    single, left, right = PopulationNorms(), PopulationNorms(), PopulationNorms()
+    for event in events:
+        single.add_event(event)
+    for i, event in enumerate(events):
+        (left if i % 2 else right).add_event(event)
+    left.merge(right)
+
+    assert left.to_dict() == single.to_dict()
+    assert single.sketch('phq9').n == 300
+    assert single.sketch('PHQ-9', cohort='v1').n + single.sketch('PHQ-9', cohort='v2').n == 300
+    assert single.sketch('PHQ-9', subscale='depression').n == 300
+
+
+def test_store_flushes_deltas_into_shared_file(tmp_path):
+    path = tmp_path / "norms.json"
+    first = NormsStore(path, flush_every=10, flush_interval_seconds=3600, min_samples=5)
+    second = NormsStore(path, flush_every=1000, flush_interval_seconds=3600, min_samples=5)
+
+    for score in range(20):
+        first.record_event(_completed(score))
+    for score in range(20):
+        second.record_event(_completed(score))
+    assert first.norms().sketch('PHQ-9').n == 20  # second has not flushed yet
+    assert second.flush() == 20
+
+    reader = NormsStore(path, min_samples=5)
+    assert reader.norms().sketch('PHQ-9').n == 40
+    assert reader.percentile('PHQ-9', 10) == 52.5
+    assert reader.summary('GAD-7') is None
+    assert NormsStore(path, min_samples=100).percentile('PHQ-9', 10) is None
+
+
+def test_build_norms_backfills_from_event_files(tmp_path):
+    with open(tmp_path / "events_20250901.jsonl", 'w', encoding='utf-8') as f:
+        for score in (3, 6, 9):
+            f.write(json.dumps(_completed(score, instrument='GAD-7')) + "\n")
+        f.write(json.dumps({'event_name': 'questionnaire_started', 'payload': {'questionnaire_type': 'GAD-7'}}) + "\n")
+
+    norms = build_norms(tmp_path)
+    assert norms.sketch('GAD-7').n == 3
+    assert NormsStore(tmp_path / "norms.json", min_samples=1).percentile('GAD-7', 6) == 50.0
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Tests for the map-reduce aggregation over daily event files
+"""
+
+import sys
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.analytics import ResearchAnalytics
+from research_system.event_files import compact_event_file
+from research_system.parallel_aggregation import aggregate_event_files
+
+NOW = datetime(2025, 9, 20, 12, 0, 0)
+STEPS = ['session_started', 'questionnaire_started', 'question_answered', 'questionnaire_completed', 'results_viewed']
+
+
+def _write_days(data_dir, days=5, sessions=12):
+    """Sessions start late in the evening so some of them continue in the next day's file"""
+    files = {}
+    for day in range(days):
+        for s in range(sessions):
+            started = datetime(2025, 9, 15 + day, 23, 30) + timedelta(minutes=s * 3)
+            for i, name in enumerate(STEPS[:1 + (s + day) % len(STEPS)]):
+                ts = started + timedelta(minutes=7 * i)
+                files.setdefault(ts.strftime('%Y%m%d'), []).append({
+                    'event_id': f"{day}-{s}-{i}",
+                    'client_ts': ts.isoformat(),
+                    'session_id': f"{day}-{s}",
+                    'user_pseudo_id': f"user-{s % 5}",
+                    'event_name': name,
+                    'payload': {'questionnaire_type': ['phq9', 'gad7'][s % 2]} if 'questionnaire' in name else {}
+                })
+    for stamp, records in files.items():
+        with open(data_dir / f"events_{stamp}.jsonl", 'w', encoding='utf-8') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+
+
+def _expected(data_dir):
+    analytics = ResearchAnalytics(data_dir=str(data_dir))
+    df = analytics.load_collected_data(days_back=30, end_date=NOW)
+    usage = analytics.generate_usage_statistics(df.copy())
+    usage.pop('completion_funnels', None)
+    return usage, analytics.analyze_user_behavior_patterns(df)
+
+
+def test_parallel_matches_single_process_pandas(tmp_path):
+    _write_days(tmp_path)
+    compact_event_file(tmp_path / "events_20250917.jsonl")
+    usage, behavior = _expected(tmp_path)
+
+    for workers in (1, 2):
+        result = aggregate_event_files(tmp_path, start=NOW - timedelta(days=30), end=NOW, workers=workers)
+        assert result['failed_partitions'] == []
+        assert result['usage_statistics'] == usage
+        assert result['behavior_patterns']['session_duration'] == behavior['session_duration']
+        assert result['behavior_patterns']['popular_questionnaires'] == behavior['popular_questionnaires']
+        assert result['behavior_patterns']['common_user_journeys'] == behavior['common_user_journeys']
+
+
+def test_merge_is_deterministic(tmp_path):
+    _write_days(tmp_path, days=4)
+    runs = [ResearchAnalytics(data_dir=str(tmp_path)).aggregate_history(days_back=30, end_date=NOW, workers=workers)
+            for workers in (1, 3, 3)]
+    dumps = [json.dumps(run, sort_keys=True, default=str) for run in runs]
+    assert dumps[0] == dumps[1] == dumps[2]
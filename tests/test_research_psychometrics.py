@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming item-level psychometrics
+"""
+
+import sys
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.analytics_state import AnalyticsState
+from research_system.psychometrics import ItemMoments, PsychometricsEngine, instrument_item_count, instrument_reverse_items
+
+
+def _responses(n=200, k=7, seed=3):
+    rng = np.random.default_rng(seed)
+    trait = rng.normal(size=(n, 1))
+    return np.clip(np.rint(1.5 + trait + rng.normal(scale=0.8, size=(n, k))), 0, 3)
+
+
+def _batch_alpha(x):
+    k = x.shape[1]
+    return k / (k - 1) * (1 - x.var(axis=0, ddof=1).sum() / x.sum(axis=1).var(ddof=1))
+
+
+def _feed(engine, responses, instrument='gad7', prefix='s'):
+    for row, answers in enumerate(responses):
+        session = f"{prefix}{row}"
+        for index, value in enumerate(answers, start=1):
+            engine.fold_event(session, 'question_answered', {
+                'questionnaire_type': instrument, 'item_id': f"{instrument}_Q{index:02d}", 'response_value': int(value)
+            }, '2025-09-01T10:00:00')
+        engine.fold_event(session, 'questionnaire_completed', {'questionnaire_type': instrument}, '2025-09-01T10:05:00')
+
+
+def test_streaming_statistics_match_batch_formulas():
+    x = _responses()
+    engine = PsychometricsEngine()
+    _feed(engine, x)
+    stats = engine.statistics('gad7')['gad7']
+
+    assert instrument_item_count('gad7') == 7
+    assert stats['responses'] == len(x)
+    assert np.isclose(stats['cronbach_alpha'], _batch_alpha(x))
+    assert np.allclose(list(stats['item_means'].values()), x.mean(axis=0))
+
+    rest = x.sum(axis=1) - x[:, 0]
+    assert np.isclose(stats['item_total_correlations'][1], np.corrcoef(x[:, 0], rest)[0, 1])
+    assert np.isclose(stats['alpha_if_item_deleted'][1], _batch_alpha(x[:, 1:]))
+
+
+def test_incomplete_responses_are_excluded_and_answers_replaced():
+    engine = PsychometricsEngine()
+    _feed(engine, _responses(n=5))
+    engine.fold_event('partial', 'question_answered',
+                      {'questionnaire_type': 'gad7', 'item_id': 'gad7_Q01', 'response_value': 2}, '2025-09-01T10:00:00')
+    engine.fold_event('partial', 'questionnaire_completed', {'questionnaire_type': 'gad7'}, '2025-09-01T10:01:00')
+
+    assert engine.statistics()['gad7']['responses'] == 5
+    assert engine.incomplete == 1
+
+
+def test_pss10_reverse_scored_items_are_reversed_before_folding():
+    scored = np.clip(_responses(n=150, k=10) + 1, 0, 4)
+    # Positively worded items 4, 5, 7 and 8 are answered on the opposite direction
+    recorded = scored.copy()
+    recorded[:, [3, 4, 6, 7]] = 4 - scored[:, [3, 4, 6, 7]]
+    engine = PsychometricsEngine()
+    _feed(engine, recorded, instrument='pss10')
+    stats = engine.statistics('pss10')['pss10']
+
+    assert instrument_reverse_items('pss10') == {4: 4.0, 5: 4.0, 7: 4.0, 8: 4.0}
+    assert instrument_reverse_items('gad7') == {}
+    assert np.isclose(stats['cronbach_alpha'], _batch_alpha(scored))
+    assert np.allclose(list(stats['item_means'].values()), scored.mean(axis=0))
+    assert stats['cronbach_alpha'] > _batch_alpha(recorded)
+
+
+def test_epds_reverse_items_use_their_own_options():
+    scored = _responses(n=150, k=10)
+    # EPDS items 1 and 2 have per-item options 0-3 and are scored 3 - answer
+    recorded = scored.copy()
+    recorded[:, [0, 1]] = 3 - scored[:, [0, 1]]
+    engine = PsychometricsEngine()
+    _feed(engine, recorded, instrument='epds')
+    stats = engine.statistics('epds')['epds']
+
+    assert instrument_reverse_items('epds') == {1: 3.0, 2: 3.0}
+    assert np.isclose(stats['cronbach_alpha'], _batch_alpha(scored))
+    assert np.allclose(list(stats['item_means'].values()), scored.mean(axis=0))
+
+
+def test_sharded_moments_merge_exactly():
+    x = _responses(n=120)
+    whole, left, right = ItemMoments(7), ItemMoments(7), ItemMoments(7)
+    for i, row in enumerate(x):
+        whole.add(row)
+        (left if i % 3 else right).add(row)
+    left.merge(right)
+
+    assert left.n == whole.n
+    assert np.allclose(left.comoment, whole.comoment)
+    assert np.isclose(left.statistics()['cronbach_alpha'], whole.statistics()['cronbach_alpha'])
+
+
+def test_analytics_state_checkpoints_moments(tmp_path):
+    now = datetime.now().replace(microsecond=0)
+    x = _responses(n=20)
+    path = tmp_path / f"events_{now.strftime('%Y%m%d')}.jsonl"
+    with open(path, 'w', encoding='utf-8') as f:
+        for row, answers in enumerate(x):
+            events = [('question_answered', {'questionnaire_type': 'gad7', 'item_id': f"gad7_Q{i:02d}",
+                                             'response_value': int(v)}) for i, v in enumerate(answers, start=1)]
+            events.append(('questionnaire_completed', {'questionnaire_type': 'gad7'}))
+            for step, (name, payload) in enumerate(events):
+                f.write(json.dumps({
+                    'client_ts': (now - timedelta(minutes=30) + timedelta(seconds=step)).isoformat(),
+                    'session_id': f"s{row}", 'event_name': name, 'payload': payload
+                }) + '\n')
+
+    AnalyticsState(tmp_path).update(now=now)
+    restored = AnalyticsState(tmp_path)
+    restored.load()
+    assert np.isclose(restored.psychometrics.statistics()['gad7']['cronbach_alpha'], _batch_alpha(x))
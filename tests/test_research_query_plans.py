@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression suite for the research schema
+Seeds a realistic research_events store and checks that the canonical
+queries are served by indexes (EXPLAIN QUERY PLAN). Comparing latency against
+the committed baselines is opt-in: wall-clock times only mean something on the
+machine that recorded them, not on shared CI runners.
+
+Environment:
+    RESEARCH_PLAN_TEST_EVENTS      number of seeded events (default 50000; use 10000000 for a full run)
+    RESEARCH_QUERY_LATENCY_CHECK   set to 1 to compare latencies with tests/query_baselines.json
+    RESEARCH_QUERY_BASELINES_UPDATE  set to 1 to overwrite tests/query_baselines.json with this run
+    RESEARCH_QUERY_SLOWDOWN_FACTOR allowed slowdown versus baseline (default 3.0)
+"""
+
+import os
+import sys
+import json
+import random
+import sqlite3
+import statistics
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.database import SQLiteDatabase
+
+SEED_EVENTS = int(os.getenv('RESEARCH_PLAN_TEST_EVENTS', '50000'))
+BASELINE_FILE = Path(__file__).parent / 'query_baselines.json'
+UPDATE_BASELINES = os.getenv('RESEARCH_QUERY_BASELINES_UPDATE') == '1'
+CHECK_LATENCY = os.getenv('RESEARCH_QUERY_LATENCY_CHECK') == '1'
+SLOWDOWN_FACTOR = float(os.getenv('RESEARCH_QUERY_SLOWDOWN_FACTOR', '3.0'))
+
+NOW = datetime(2025, 9, 1, 12, 0, 0)
+
+# Roughly the event mix produced by the collector helpers for one session
+EVENT_MIX = [
+    ('session_started', 1),
+    ('questionnaire_started', 1),
+    ('question_answered', 14),
+    ('questionnaire_completed', 1),
+    ('results_viewed', 1),
+]
+QUESTIONNAIRES = {'dass21': 21, 'phq9': 9, 'gad7': 7, 'epds': 10, 'pss10': 10}
+
+# name -> (sql, params, index that must serve it)
+CANONICAL_QUERIES = {
+    'events_by_type_window': (
+        "SELECT * FROM research_events WHERE event_type = ? AND timestamp >= ? AND timestamp <= ? "
+        "ORDER BY timestamp DESC LIMIT 1000",
+        ('questionnaire_completed', (NOW - timedelta(days=7)).isoformat(), NOW.isoformat()),
+        'idx_events_type_timestamp'
+    ),
+    'sessions_by_consent': (
+        "SELECT * FROM research_sessions WHERE consent_status = ? AND start_time >= ?",
+        ('withdrawn', (NOW - timedelta(days=30)).isoformat()),
+        'idx_sessions_'
+    ),
+    'user_history': (
+        "SELECT * FROM research_events WHERE anonymized_user_id = ? ORDER BY timestamp",
+        ('user_42',),
+        'idx_events_user_timestamp'
+    ),
+    'retention_range': (
+        "SELECT MIN(id), MAX(id) FROM research_events WHERE timestamp < ?",
+        ((NOW - timedelta(days=80)).isoformat(),),
+        'idx_events_timestamp'
+    ),
+    'retention_delete_batch': (
+        "DELETE FROM research_events WHERE id >= ? AND id < ? AND timestamp < ?",
+        (1, 5001, (NOW - timedelta(days=80)).isoformat()),
+        'INTEGER PRIMARY KEY'
+    ),
+    'questionnaire_popularity': (
+        "SELECT COALESCE(questionnaire_type, 'unknown'), COUNT(*) FROM research_events "
+        "WHERE event_type = 'questionnaire_started' AND timestamp >= ? GROUP BY questionnaire_type",
+        ((NOW - timedelta(days=30)).isoformat(),),
+        'idx_events_type_'
+    ),
+}
+
+
+def _generate_rows(total_events):
+    """Yield research_events rows shaped like real sessions spread over 90 days"""
+    rng = random.Random(1234)
+    produced = 0
+    session_number = 0
+    while produced < total_events:
+        session_number += 1
+        user_id = f"user_{rng.randrange(max(total_events // 40, 1))}"
+        session_id = f"session_{session_number}"
+        questionnaire = rng.choice(list(QUESTIONNAIRES))
+        started = NOW - timedelta(seconds=rng.randrange(90 * 24 * 3600))
+        offset = 0
+        for event_type, repeats in EVENT_MIX:
+            for question in range(min(repeats, QUESTIONNAIRES[questionnaire])):
+                offset += rng.randrange(3, 40)
+                is_answer = event_type == 'question_answered'
+                yield (
+                    session_id, event_type, '{}',
+                    (started + timedelta(seconds=offset)).isoformat(),
+                    user_id, 'given',
+                    questionnaire if event_type.startswith('question') else None,
+                    question + 1 if is_answer else None,
+                    rng.randrange(4) if is_answer else None
+                )
+                produced += 1
+                if produced >= total_events:
+                    return
+
+
+@pytest.fixture(scope='module')
+def seeded_db(tmp_path_factory):
+    db = SQLiteDatabase(str(tmp_path_factory.mktemp('plans') / 'research.db'))
+    with sqlite3.connect(db.db_path) as conn:
+        conn.executemany(
+            '''INSERT INTO research_events
+               (session_id, event_type, event_data, timestamp, anonymized_user_id, consent_status,
+                questionnaire_type, question_index, score)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            _generate_rows(SEED_EVENTS)
+        )
+        conn.execute(
+            '''INSERT INTO research_sessions (session_id, anonymized_user_id, start_time, end_time, consent_status)
+               SELECT session_id, MIN(anonymized_user_id), MIN(timestamp), MAX(timestamp),
+                      CASE WHEN abs(random()) % 50 = 0 THEN 'withdrawn' ELSE 'given' END
+               FROM research_events GROUP BY session_id'''
+        )
+        conn.execute('ANALYZE')
+    return db
+
+
+def _time_query(db, sql, params, repeats=5):
+    with sqlite3.connect(db.db_path) as conn:
+        samples = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            if sql.lstrip().upper().startswith('DELETE'):
+                # Measure the delete without changing the seeded data
+                conn.execute('SAVEPOINT plan_probe')
+                conn.execute(sql, params)
+                conn.execute('ROLLBACK TO plan_probe')
+                conn.execute('RELEASE plan_probe')
+            else:
+                conn.execute(sql, params).fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+@pytest.mark.parametrize('name', sorted(CANONICAL_QUERIES))
+def test_canonical_query_uses_index(seeded_db, name):
+    """Every canonical query is answered by a SEARCH on the expected index, never a full scan"""
+    sql, params, expected_index = CANONICAL_QUERIES[name]
+    plan = seeded_db.explain_query_plan(sql, params)
+    plan_text = ' | '.join(plan)
+
+    assert not any(line.startswith('SCAN research_') for line in plan), f"{name}: full scan: {plan_text}"
+    assert expected_index in plan_text, f"{name}: expected {expected_index}: {plan_text}"
+    if 'ORDER BY' in sql:
+        assert 'TEMP B-TREE' not in plan_text, f"{name}: sort not served by index: {plan_text}"
+
+
+@pytest.mark.skipif(not (CHECK_LATENCY or UPDATE_BASELINES),
+                    reason="latency baselines are machine-specific; set RESEARCH_QUERY_LATENCY_CHECK=1")
+def test_latency_within_baselines(seeded_db):
+    """Median latency per canonical query stays within the committed baselines"""
+    results = {
+        name: round(_time_query(seeded_db, sql, params), 3)
+        for name, (sql, params, _) in CANONICAL_QUERIES.items()
+    }
+    report = {'seed_events': SEED_EVENTS, 'median_ms': results}
+
+    if UPDATE_BASELINES:
+        BASELINE_FILE.write_text(json.dumps(report, indent=2) + '\n', encoding='utf-8')
+        return
+
+    assert BASELINE_FILE.exists(), "missing baselines: run with RESEARCH_QUERY_BASELINES_UPDATE=1"
+    baseline = json.loads(BASELINE_FILE.read_text(encoding='utf-8'))
+    if baseline.get('seed_events') != SEED_EVENTS:
+        pytest.skip(f"baselines were recorded with {baseline.get('seed_events')} events")
+    for name, median_ms in results.items():
+        previous = baseline['median_ms'].get(name)
+        assert previous is not None, f"{name}: no baseline, run with RESEARCH_QUERY_BASELINES_UPDATE=1"
+        # 1ms floor keeps sub-millisecond timer noise from failing the run
+        assert median_ms <= max(previous, 1.0) * SLOWDOWN_FACTOR, (
+            f"{name}: {median_ms}ms vs baseline {previous}ms"
+        )
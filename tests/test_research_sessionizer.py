@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming sessionizer and the research_sessions upserts
+"""
+
+import sys
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.database import ResearchDatabase, SQLiteDatabase
+from research_system.sessionizer import Sessionizer
+
+START = datetime(2025, 9, 1, 10, 0, 0)
+
+
+def _event(session_id, minutes, event_type='question_answered', questionnaire_type=None):
+    return {
+        'session_id': session_id,
+        'event_type': event_type,
+        'timestamp': (START + timedelta(minutes=minutes)).isoformat(),
+        'anonymized_user_id': f"user-{session_id}",
+        'consent_status': 'granted',
+        'event_data': {'questionnaire_type': questionnaire_type} if questionnaire_type else {}
+    }
+
+
+def _sessions(db_path):
+    with sqlite3.connect(db_path) as conn:
+        conn.row_factory = sqlite3.Row
+        return {row['session_id']: dict(row) for row in conn.execute('SELECT * FROM research_sessions')}
+
+
+def test_reorders_within_tolerance_and_closes_after_gap(tmp_path):
+    rows = []
+    sessionizer = Sessionizer(lambda batch: rows.extend(batch) or len(batch),
+                              inactivity_gap=timedelta(minutes=30), allowed_lateness=timedelta(minutes=5))
+
+    sessionizer.feed([_event('a', 3), _event('a', 0, 'session_started'), _event('a', 1)])
+    assert sessionizer.stats['late_events'] == 0
+    sessionizer.feed([_event('b', 60)])
+
+    assert 'a' not in sessionizer.open_sessions
+    sessionizer.flush()
+    row = next(r for r in rows if r['session_id'] == 'a')
+    assert row['start_time'] == START.isoformat()
+    assert row['end_time'] == (START + timedelta(minutes=3)).isoformat()
+    assert row['event_count'] == 3
+
+
+def test_batched_deltas_merge_without_double_counting(tmp_path):
+    db = SQLiteDatabase(str(tmp_path / 'research.db'))
+    sessionizer = Sessionizer(db.upsert_sessions, allowed_lateness=timedelta(0))
+
+    sessionizer.feed([_event('a', 0, 'questionnaire_started', 'phq9'), _event('a', 2)])
+    sessionizer.flush()
+    sessionizer.feed([_event('a', 4, 'questionnaire_started', 'gad7'), _event('a', 5, 'questionnaire_completed', 'gad7')])
+    sessionizer.flush(final=True)
+    # A straggler for the closed session is merged into the stored row
+    sessionizer.feed([_event('a', 1)])
+    sessionizer.flush(final=True)
+
+    row = _sessions(db.db_path)['a']
+    assert row['event_count'] == 5
+    assert sorted(json.loads(row['questionnaire_types'])) == ['gad7', 'phq9']
+    assert row['completion_status'] == 'completed'
+    assert row['start_time'] == START.isoformat()
+    assert row['end_time'] == (START + timedelta(minutes=5)).isoformat()
+
+
+def test_ingest_populates_sessions_and_rebuild_matches(tmp_path, monkeypatch):
+    monkeypatch.setenv('RESEARCH_DB_PATH', str(tmp_path / 'research.db'))
+    database = ResearchDatabase()
+    events = [_event(f"s{i}", i * 45 + step * (i + 1), event_type)
+              for i in range(6)
+              for step, event_type in enumerate(['session_started', 'questionnaire_started', 'question_answered'])]
+    database.store_events(events)
+    database.flush_sessions(final=True)
+    live = _sessions(tmp_path / 'research.db')
+
+    assert len(live) == 6
+    assert sum(row['event_count'] for row in live.values()) == len(events)
+
+    assert database.rebuild_sessions() == 6
+    rebuilt = _sessions(tmp_path / 'research.db')
+    strip = lambda rows: {k: {c: v for c, v in r.items() if c != 'created_at'} for k, r in rows.items()}
+    assert strip(rebuilt) == strip(live)
+
+    stats = database.db.get_session_statistics()
+    assert stats['total_sessions'] == 6
+    assert stats['session_duration']['max_duration_minutes'] == 12.0
+
+
+def test_collection_api_records_feed_sessions_and_partitions_backfill(tmp_path, monkeypatch):
+    from research_system.sessionizer import api_record_event
+
+    monkeypatch.setenv('RESEARCH_DB_PATH', str(tmp_path / 'research.db'))
+    data_dir = tmp_path / 'research_data'
+    data_dir.mkdir()
+    records = [{
+        'event_id': f"e{i}-{step}",
+        'received_at': (START + timedelta(minutes=i * 45 + step)).isoformat() + 'Z',
+        'client_ts': (START + timedelta(minutes=i * 45 + step)).isoformat() + '+00:00',
+        'session_id': f"s{i}",
+        'user_pseudo_id': f"user-s{i}",
+        'event_name': event_name,
+        'payload': {'questionnaire_type': 'phq9'},
+        'cohort_version': 'v1'
+    } for i in range(4) for step, event_name in enumerate(['questionnaire_started', 'questionnaire_completed'])]
+    with open(data_dir / f"events_{START:%Y%m%d}.jsonl", 'w', encoding='utf-8') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records)
+
+    database = ResearchDatabase()
+    for record in records:
+        database.sessionize([api_record_event(record)])
+    database.close()
+    live = _sessions(tmp_path / 'research.db')
+
+    assert len(live) == 4
+    assert all(row['completion_status'] == 'completed' for row in live.values())
+    assert json.loads(live['s0']['questionnaire_types']) == ['phq9']
+
+    assert database.rebuild_sessions(data_dir=str(data_dir)) == 4
+    strip = lambda rows: {k: {c: v for c, v in r.items() if c != 'created_at'} for k, r in rows.items()}
+    assert strip(_sessions(tmp_path / 'research.db')) == strip(live)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the optional DuckDB analytics engine
+"""
+
+import sys
+import json
+import sqlite3
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.analytics import ResearchAnalytics
+from research_system.event_files import compact_event_file
+from research_system.sql_engine import DUCKDB_AVAILABLE
+
+pytestmark = pytest.mark.skipif(not DUCKDB_AVAILABLE, reason="duckdb not installed")
+
+NOW = datetime(2025, 9, 20, 12, 0, 0)
+STEPS = ['session_started', 'questionnaire_started', 'question_answered', 'questionnaire_completed', 'results_viewed']
+
+
+def _write_day(data_dir, day, sessions):
+    path = data_dir / f"events_{day.strftime('%Y%m%d')}.jsonl"
+    with open(path, 'w', encoding='utf-8') as f:
+        for s in range(sessions):
+            started = day + timedelta(hours=s % 12, minutes=s)
+            for i, name in enumerate(STEPS[:1 + (s % len(STEPS))]):
+                f.write(json.dumps({
+                    'event_id': f"{day:%d}-{s}-{i}",
+                    'client_ts': (started + timedelta(minutes=3 * i)).isoformat() + '+00:00',
+                    'session_id': f"{day:%d}-{s}",
+                    'user_pseudo_id': f"user-{s % 7}",
+                    'event_name': name,
+                    'payload': {'questionnaire_type': ['phq9', 'gad7'][s % 2]} if 'questionnaire' in name else {},
+                    'cohort_version': 'soulfriend_v2.0'
+                }) + '\n')
+    return path
+
+
+def _analytics(tmp_path, monkeypatch):
+    monkeypatch.setenv('RESEARCH_ANALYTICS_ENGINE', 'duckdb')
+    return ResearchAnalytics(data_dir=str(tmp_path))
+
+
+def test_sql_results_match_pandas(tmp_path, monkeypatch):
+    for day in range(6):
+        path = _write_day(tmp_path, NOW - timedelta(days=day, hours=13), sessions=15)
+        if day % 2:
+            compact_event_file(path)
+    analytics = _analytics(tmp_path, monkeypatch)
+
+    from research_system.sql_engine import benchmark_against_pandas
+    report = benchmark_against_pandas(analytics, days_back=4, repeats=1, now=NOW)
+
+    assert set(report) == {'generate_usage_statistics', 'analyze_user_behavior_patterns'}
+    assert all(entry['compatible'] for entry in report.values()), report
+
+
+def test_engine_backs_public_getters(tmp_path, monkeypatch):
+    _write_day(tmp_path, NOW - timedelta(hours=13), sessions=10)
+    analytics = _analytics(tmp_path, monkeypatch)
+
+    assert analytics.sql_engine is not None
+    stats = analytics.get_usage_statistics(days_back=2, end_date=NOW)
+    assert stats['overview']['unique_sessions'] == 10
+    # Same keys as the pandas path
+    assert set(stats) == set(analytics.generate_usage_statistics(analytics.load_collected_data(days_back=2, end_date=NOW)))
+    assert analytics.get_behavior_patterns(days_back=2, end_date=NOW)['popular_questionnaires'] == {'gad7': 4, 'phq9': 4}
+    assert 'error' in analytics.get_usage_statistics(days_back=2, end_date=NOW - timedelta(days=30))
+
+
+def test_query_sqlite_pushes_filter(tmp_path, monkeypatch):
+    db_path = tmp_path / 'research.db'
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE assessment_results (id INTEGER, created_at TEXT)")
+        conn.executemany("INSERT INTO assessment_results VALUES (?, ?)",
+                         [(1, '2025-09-01 10:00:00'), (2, '2025-09-19 10:00:00')])
+
+    from research_system.sql_engine import ResearchSQLEngine
+    engine = ResearchSQLEngine(tmp_path, sqlite_path=str(db_path))
+    df = engine.query_sqlite('assessment_results', where='created_at >= ?', params=['2025-09-10'])
+    assert df['id'].tolist() == [2]
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for the memory-mapped Arrow window cache
+"""
+
+import sys
+import json
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from research_system.analytics import ResearchAnalytics
+from research_system.event_files import PYARROW_AVAILABLE
+
+pytestmark = pytest.mark.skipif(not PYARROW_AVAILABLE, reason="pyarrow not installed")
+
+NOW = datetime.now().replace(microsecond=0)
+
+
+def _append(data_dir, when, session_id, count=3):
+    path = data_dir / f"events_{when.strftime('%Y%m%d')}.jsonl"
+    with open(path, 'a', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(json.dumps({
+                'event_id': f"{session_id}-{i}",
+                'client_ts': (when + timedelta(seconds=i)).isoformat(),
+                'session_id': session_id,
+                'event_name': 'question_answered',
+                'payload': {'questionnaire_type': 'phq9'}
+            }) + '\n')
+    return path
+
+
+def _sorted(df):
+    return df.sort_values('event_id').reset_index(drop=True)
+
+
+def test_cache_matches_direct_load_and_appends_tail(tmp_path):
+    _append(tmp_path, NOW - timedelta(days=2), 'a')
+    _append(tmp_path, NOW - timedelta(hours=3), 'b')
+    analytics = ResearchAnalytics(data_dir=str(tmp_path))
+
+    first = analytics.load_window(days_back=7)
+    assert len(first) == 6
+    segments = json.loads((tmp_path / 'cache' / 'window.json').read_text())['segments']
+
+    _append(tmp_path, NOW - timedelta(hours=1), 'c')
+    second = analytics.load_window(days_back=7)
+    meta = json.loads((tmp_path / 'cache' / 'window.json').read_text())
+
+    assert meta['segments'][:1] == segments and len(meta['segments']) == 2
+    direct = analytics.load_collected_data(days_back=7)
+    assert _sorted(second)[['event_id', 'session_id', 'event_type']].astype(str).equals(
+        _sorted(direct)[['event_id', 'session_id', 'event_type']].astype(str))
+    assert isinstance(second['session_id'].dtype, type(direct['session_id'].dtype))
+
+
+def test_unchanged_watermark_reuses_segments(tmp_path):
+    _append(tmp_path, NOW - timedelta(hours=3), 'a')
+    analytics = ResearchAnalytics(data_dir=str(tmp_path))
+    analytics.load_window(days_back=7)
+    watermark = analytics.window_cache.watermark()
+
+    analytics.load_window(days_back=1)
+    assert analytics.window_cache.watermark() == watermark
+    assert len(list((tmp_path / 'cache').glob('window-*.arrow'))) == 1
+
+
+def test_narrower_window_is_filtered_and_rewrites_rebuild(tmp_path):
+    _append(tmp_path, NOW - timedelta(days=3), 'old')
+    recent = _append(tmp_path, NOW - timedelta(hours=2), 'new')
+    analytics = ResearchAnalytics(data_dir=str(tmp_path))
+
+    assert len(analytics.load_window(days_back=7)) == 6
+    assert set(analytics.load_window(days_back=1)['session_id']) == {'new'}
+
+    recent.write_text('')
+    _append(tmp_path, NOW - timedelta(hours=2), 'replaced', count=1)
+    assert set(analytics.load_window(days_back=1)['session_id']) == {'replaced'}
+
+
+def _load_repeatedly(data_dir, rounds):
+    from research_system.window_cache import WindowCache
+    cache = WindowCache(Path(data_dir))
+    sizes = []
+    for i in range(rounds):
+        if i % 3 == 0:
+            cache.invalidate()
+        sizes.append(len(cache.load(days_back=7)))
+    return sizes
+
+
+def test_processes_sharing_the_cache_directory_see_complete_windows(tmp_path):
+    from concurrent.futures import ProcessPoolExecutor
+
+    for i in range(20):
+        _append(tmp_path, NOW - timedelta(hours=i), f"s{i}")
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(_load_repeatedly, [str(tmp_path)] * 4, [6] * 4))
+
+    assert all(size == 60 for sizes in results for size in sizes)
+    meta = json.loads((tmp_path / 'cache' / 'window.json').read_text())
+    assert all((tmp_path / 'cache' / name).exists() for name in meta['segments'])
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for the opt-in SQLite query profiler and slow-query log
+"""
+
+import sys
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from storage.sqlite_store import ProfilingConnection, QueryProfiler, SQLiteStore, ensure_query_performance_schema
+
+
+def test_statements_are_fingerprinted_and_slow_plans_logged(tmp_path):
+    sink = SQLiteStore("performance", path=str(tmp_path / "performance.db"), profile=False)
+    profiler = QueryProfiler(slow_query_ms=0, flush_interval=1e9, sink=sink.connect)
+    store = SQLiteStore("research", path=str(tmp_path / "research.db"), profile=False)
+    store.profiler = profiler
+
+    with store.connection() as conn:
+        conn.execute("CREATE TABLE sessions (id INTEGER PRIMARY KEY, user_id TEXT)")
+        conn.executemany("INSERT INTO sessions (user_id) VALUES (?)", [(f"u{i}",) for i in range(50)])
+        for i in range(3):
+            conn.execute("SELECT * FROM sessions WHERE user_id = ?", (f"u{i}",)).fetchall()
+
+    assert profiler.flush() == 3
+    top = profiler.top_queries(limit=10)
+    select = next(q for q in top if q["statement"].startswith("SELECT"))
+    assert select["store"] == "research" and select["calls"] == 3 and select["slow_calls"] == 3
+    assert "SCAN sessions" in select["query_plan"]
+    # rowcount is -1 for SELECT: no count is stored rather than zero
+    assert select["rows_affected"] is None
+    assert next(q for q in top if q["statement"].startswith("INSERT"))["rows_affected"] == 50
+    assert [q["total_ms"] for q in top] == sorted((q["total_ms"] for q in top), reverse=True)
+
+
+def test_raw_connections_are_profiled_below_the_threshold_without_plans(tmp_path):
+    sink = SQLiteStore("performance", path=str(tmp_path / "performance.db"), profile=False)
+    profiler = QueryProfiler(slow_query_ms=1e9, flush_interval=1e9, sink=sink.connect)
+    conn = ProfilingConnection(str(tmp_path / "raw.db"))
+    conn.store_name = "raw"
+    conn.profiler = profiler
+    conn.execute("CREATE TABLE t (x)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.close()
+
+    profiler.flush()
+    with sink.connection() as db:
+        rows = db.execute("SELECT store_name, query_type, calls, query_plan FROM query_performance").fetchall()
+    assert len(rows) == 2
+    assert all(store == "raw" and kind == "profile" and calls == 1 and plan is None
+               for store, kind, calls, plan in rows)
+
+
+def test_flush_never_runs_inside_the_callers_transaction(tmp_path):
+    path = str(tmp_path / "performance.db")
+    sink = SQLiteStore("performance", path=path, profile=False)
+    profiler = QueryProfiler(slow_query_ms=1e9, flush_interval=0, sink=sink.connect)
+    store = SQLiteStore("performance", path=path, profile=False)
+    store.profiler = profiler
+
+    started = time.monotonic()
+    with store.connection() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS t (x)")
+        conn.execute("INSERT INTO t VALUES (1)")
+        conn.execute("INSERT INTO t VALUES (2)")
+    assert time.monotonic() - started < 1.0
+
+    deadline = time.monotonic() + 5
+    calls = 0
+    while calls < 3 and time.monotonic() < deadline:
+        time.sleep(0.05)
+        with sink.connection() as db:
+            ensure_query_performance_schema(db._raw)
+            calls = db.execute("SELECT COALESCE(SUM(calls), 0) FROM query_performance").fetchone()[0]
+    assert calls == 3
+
+
+def test_failed_flush_keeps_the_interval(tmp_path):
+    sink = SQLiteStore("performance", path=str(tmp_path / "performance.db"), profile=False)
+
+    def unavailable():
+        raise sqlite3.OperationalError("database is locked")
+
+    profiler = QueryProfiler(slow_query_ms=1e9, flush_interval=1e9, sink=unavailable)
+    profiler.record("research", "SELECT 1", (), 2.0, -1)
+    with pytest.raises(sqlite3.OperationalError):
+        profiler.flush()
+    profiler.record("research", "SELECT 1", (), 3.0, -1)
+
+    profiler._sink = sink.connect
+    assert profiler.flush() == 1
+    top = profiler.top_queries(limit=10)
+    assert top[0]["calls"] == 2 and top[0]["total_ms"] == 5.0 and top[0]["max_ms"] == 3.0
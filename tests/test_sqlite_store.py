@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared SQLite storage layer
+"""
+
+import sys
+from pathlib import Path
+
+# Add project root to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from storage.sqlite_store import SQLiteStore, fingerprint_sql, resolve_db_path
+
+
+def test_resolve_db_path_uses_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv('SOULFRIEND_DATA_DIR', str(tmp_path / 'data'))
+    assert resolve_db_path('chatbot') == tmp_path / 'data' / 'chatbot.db'
+
+    monkeypatch.setenv('SOULFRIEND_CHATBOT_DB_PATH', str(tmp_path / 'custom.db'))
+    assert resolve_db_path('chatbot') == tmp_path / 'custom.db'
+
+
+def test_connections_are_pooled_with_wal(tmp_path):
+    store = SQLiteStore('pooled', path=str(tmp_path / 'pooled.db'), pool_size=2)
+
+    conn = store.connect()
+    raw = conn._raw
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn.close()
+
+    reused = store.connect()
+    assert reused._raw is raw
+    reused.close()
+    store.close_all()
+
+
+def test_migrations_apply_once_in_order(tmp_path):
+    store = SQLiteStore('migrated', path=str(tmp_path / 'migrated.db'))
+    applied = []
+
+    def v1(conn):
+        applied.append(1)
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+
+    def v2(conn):
+        applied.append(2)
+        conn.execute('CREATE INDEX idx_items_name ON items(name)')
+
+    assert store.migrate([v1]) == 1
+    assert store.migrate([v1, v2]) == 2
+    assert store.migrate([v1, v2]) == 2
+    assert applied == [1, 2]
+
+    with store.connection() as conn:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == 2
+    store.close_all()
+
+
+def test_query_timing_groups_by_fingerprint(tmp_path):
+    store = SQLiteStore('timed', path=str(tmp_path / 'timed.db'))
+    with store.connection() as conn:
+        conn.execute('CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)')
+        conn.execute("INSERT INTO items (name) VALUES ('a')")
+        conn.execute("INSERT INTO items (name) VALUES ('b')")
+        conn.execute('SELECT name FROM items').fetchall()
+
+    stats = {item['statement']: item for item in store.get_query_stats(top_n=10)}
+    insert = fingerprint_sql("INSERT INTO items (name) VALUES ('x')")
+    assert stats[insert]['calls'] == 2
+    assert stats[insert]['rows_affected'] == 2
+    assert stats[fingerprint_sql('SELECT name FROM items')]['rows_affected'] is None
+    assert stats[insert]['avg_ms'] >= 0
+    store.close_all()